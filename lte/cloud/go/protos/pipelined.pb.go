@@ -230,7 +230,7 @@ func (x DeactivateFlowsResult_Result) String() string {
 }
 
 func (DeactivateFlowsResult_Result) EnumDescriptor() ([]byte, []int) {
-	return fileDescriptor_e17e923ef6f5752e, []int{13, 0}
+	return fileDescriptor_e17e923ef6f5752e, []int{17, 0}
 }
 
 type FlowRequest_FlowState int32
@@ -261,7 +261,7 @@ func (x FlowRequest_FlowState) String() string {
 }
 
 func (FlowRequest_FlowState) EnumDescriptor() ([]byte, []int) {
-	return fileDescriptor_e17e923ef6f5752e, []int{14, 0}
+	return fileDescriptor_e17e923ef6f5752e, []int{18, 0}
 }
 
 type FlowResponse_Result int32
@@ -289,7 +289,7 @@ func (x FlowResponse_Result) String() string {
 }
 
 func (FlowResponse_Result) EnumDescriptor() ([]byte, []int) {
-	return fileDescriptor_e17e923ef6f5752e, []int{15, 0}
+	return fileDescriptor_e17e923ef6f5752e, []int{19, 0}
 }
 
 type SubscriberQuotaUpdate_Type int32
@@ -317,7 +317,7 @@ func (x SubscriberQuotaUpdate_Type) String() string {
 }
 
 func (SubscriberQuotaUpdate_Type) EnumDescriptor() ([]byte, []int) {
-	return fileDescriptor_e17e923ef6f5752e, []int{17, 0}
+	return fileDescriptor_e17e923ef6f5752e, []int{21, 0}
 }
 
 type FsmState_FsmState int32
@@ -363,7 +363,7 @@ func (x FsmState_FsmState) String() string {
 }
 
 func (FsmState_FsmState) EnumDescriptor() ([]byte, []int) {
-	return fileDescriptor_e17e923ef6f5752e, []int{23, 0}
+	return fileDescriptor_e17e923ef6f5752e, []int{27, 0}
 }
 
 type RedirectInfo_RedirectAddrType int32
@@ -397,7 +397,7 @@ func (x RedirectInfo_RedirectAddrType) String() string {
 }
 
 func (RedirectInfo_RedirectAddrType) EnumDescriptor() ([]byte, []int) {
-	return fileDescriptor_e17e923ef6f5752e, []int{27, 0}
+	return fileDescriptor_e17e923ef6f5752e, []int{31, 0}
 }
 
 // 15.8, Table 8.2.1-1
@@ -465,7 +465,7 @@ func (x CauseIE_CauseValues) String() string {
 }
 
 func (CauseIE_CauseValues) EnumDescriptor() ([]byte, []int) {
-	return fileDescriptor_e17e923ef6f5752e, []int{36, 0}
+	return fileDescriptor_e17e923ef6f5752e, []int{40, 0}
 }
 
 type UESessionState_UEConfigState int32
@@ -502,7 +502,7 @@ func (x UESessionState_UEConfigState) String() string {
 }
 
 func (UESessionState_UEConfigState) EnumDescriptor() ([]byte, []int) {
-	return fileDescriptor_e17e923ef6f5752e, []int{40, 0}
+	return fileDescriptor_e17e923ef6f5752e, []int{44, 0}
 }
 
 // Deprecated
@@ -1220,6 +1220,165 @@ func (m *ActivateFlowsResult) GetPolicyResults() []*RuleModResult {
 	return nil
 }
 
+// Batch of ActivateFlowsRequests, installed with one barrier per app
+type ActivateFlowsBatchRequest struct {
+	Requests             []*ActivateFlowsRequest `protobuf:"bytes,1,rep,name=requests,proto3" json:"requests,omitempty"`
+	XXX_NoUnkeyedLiteral struct{}                `json:"-"`
+	XXX_unrecognized     []byte                  `json:"-"`
+	XXX_sizecache        int32                   `json:"-"`
+}
+
+func (m *ActivateFlowsBatchRequest) Reset()         { *m = ActivateFlowsBatchRequest{} }
+func (m *ActivateFlowsBatchRequest) String() string { return proto.CompactTextString(m) }
+func (*ActivateFlowsBatchRequest) ProtoMessage()    {}
+func (*ActivateFlowsBatchRequest) Descriptor() ([]byte, []int) {
+	return fileDescriptor_e17e923ef6f5752e, []int{13}
+}
+
+func (m *ActivateFlowsBatchRequest) XXX_Unmarshal(b []byte) error {
+	return xxx_messageInfo_ActivateFlowsBatchRequest.Unmarshal(m, b)
+}
+func (m *ActivateFlowsBatchRequest) XXX_Marshal(b []byte, deterministic bool) ([]byte, error) {
+	return xxx_messageInfo_ActivateFlowsBatchRequest.Marshal(b, m, deterministic)
+}
+func (m *ActivateFlowsBatchRequest) XXX_Merge(src proto.Message) {
+	xxx_messageInfo_ActivateFlowsBatchRequest.Merge(m, src)
+}
+func (m *ActivateFlowsBatchRequest) XXX_Size() int {
+	return xxx_messageInfo_ActivateFlowsBatchRequest.Size(m)
+}
+func (m *ActivateFlowsBatchRequest) XXX_DiscardUnknown() {
+	xxx_messageInfo_ActivateFlowsBatchRequest.DiscardUnknown(m)
+}
+
+var xxx_messageInfo_ActivateFlowsBatchRequest proto.InternalMessageInfo
+
+func (m *ActivateFlowsBatchRequest) GetRequests() []*ActivateFlowsRequest {
+	if m != nil {
+		return m.Requests
+	}
+	return nil
+}
+
+// Results in the same order as the batch requests
+type ActivateFlowsBatchResult struct {
+	Results              []*ActivateFlowsResult `protobuf:"bytes,1,rep,name=results,proto3" json:"results,omitempty"`
+	XXX_NoUnkeyedLiteral struct{}               `json:"-"`
+	XXX_unrecognized     []byte                 `json:"-"`
+	XXX_sizecache        int32                  `json:"-"`
+}
+
+func (m *ActivateFlowsBatchResult) Reset()         { *m = ActivateFlowsBatchResult{} }
+func (m *ActivateFlowsBatchResult) String() string { return proto.CompactTextString(m) }
+func (*ActivateFlowsBatchResult) ProtoMessage()    {}
+func (*ActivateFlowsBatchResult) Descriptor() ([]byte, []int) {
+	return fileDescriptor_e17e923ef6f5752e, []int{14}
+}
+
+func (m *ActivateFlowsBatchResult) XXX_Unmarshal(b []byte) error {
+	return xxx_messageInfo_ActivateFlowsBatchResult.Unmarshal(m, b)
+}
+func (m *ActivateFlowsBatchResult) XXX_Marshal(b []byte, deterministic bool) ([]byte, error) {
+	return xxx_messageInfo_ActivateFlowsBatchResult.Marshal(b, m, deterministic)
+}
+func (m *ActivateFlowsBatchResult) XXX_Merge(src proto.Message) {
+	xxx_messageInfo_ActivateFlowsBatchResult.Merge(m, src)
+}
+func (m *ActivateFlowsBatchResult) XXX_Size() int {
+	return xxx_messageInfo_ActivateFlowsBatchResult.Size(m)
+}
+func (m *ActivateFlowsBatchResult) XXX_DiscardUnknown() {
+	xxx_messageInfo_ActivateFlowsBatchResult.DiscardUnknown(m)
+}
+
+var xxx_messageInfo_ActivateFlowsBatchResult proto.InternalMessageInfo
+
+func (m *ActivateFlowsBatchResult) GetResults() []*ActivateFlowsResult {
+	if m != nil {
+		return m.Results
+	}
+	return nil
+}
+
+type DeactivateFlowsBatchRequest struct {
+	Requests             []*DeactivateFlowsRequest `protobuf:"bytes,1,rep,name=requests,proto3" json:"requests,omitempty"`
+	XXX_NoUnkeyedLiteral struct{}                  `json:"-"`
+	XXX_unrecognized     []byte                    `json:"-"`
+	XXX_sizecache        int32                     `json:"-"`
+}
+
+func (m *DeactivateFlowsBatchRequest) Reset()         { *m = DeactivateFlowsBatchRequest{} }
+func (m *DeactivateFlowsBatchRequest) String() string { return proto.CompactTextString(m) }
+func (*DeactivateFlowsBatchRequest) ProtoMessage()    {}
+func (*DeactivateFlowsBatchRequest) Descriptor() ([]byte, []int) {
+	return fileDescriptor_e17e923ef6f5752e, []int{15}
+}
+
+func (m *DeactivateFlowsBatchRequest) XXX_Unmarshal(b []byte) error {
+	return xxx_messageInfo_DeactivateFlowsBatchRequest.Unmarshal(m, b)
+}
+func (m *DeactivateFlowsBatchRequest) XXX_Marshal(b []byte, deterministic bool) ([]byte, error) {
+	return xxx_messageInfo_DeactivateFlowsBatchRequest.Marshal(b, m, deterministic)
+}
+func (m *DeactivateFlowsBatchRequest) XXX_Merge(src proto.Message) {
+	xxx_messageInfo_DeactivateFlowsBatchRequest.Merge(m, src)
+}
+func (m *DeactivateFlowsBatchRequest) XXX_Size() int {
+	return xxx_messageInfo_DeactivateFlowsBatchRequest.Size(m)
+}
+func (m *DeactivateFlowsBatchRequest) XXX_DiscardUnknown() {
+	xxx_messageInfo_DeactivateFlowsBatchRequest.DiscardUnknown(m)
+}
+
+var xxx_messageInfo_DeactivateFlowsBatchRequest proto.InternalMessageInfo
+
+func (m *DeactivateFlowsBatchRequest) GetRequests() []*DeactivateFlowsRequest {
+	if m != nil {
+		return m.Requests
+	}
+	return nil
+}
+
+// Results in the same order as the batch requests
+type DeactivateFlowsBatchResult struct {
+	Results              []*DeactivateFlowsResult `protobuf:"bytes,1,rep,name=results,proto3" json:"results,omitempty"`
+	XXX_NoUnkeyedLiteral struct{}                 `json:"-"`
+	XXX_unrecognized     []byte                   `json:"-"`
+	XXX_sizecache        int32                    `json:"-"`
+}
+
+func (m *DeactivateFlowsBatchResult) Reset()         { *m = DeactivateFlowsBatchResult{} }
+func (m *DeactivateFlowsBatchResult) String() string { return proto.CompactTextString(m) }
+func (*DeactivateFlowsBatchResult) ProtoMessage()    {}
+func (*DeactivateFlowsBatchResult) Descriptor() ([]byte, []int) {
+	return fileDescriptor_e17e923ef6f5752e, []int{16}
+}
+
+func (m *DeactivateFlowsBatchResult) XXX_Unmarshal(b []byte) error {
+	return xxx_messageInfo_DeactivateFlowsBatchResult.Unmarshal(m, b)
+}
+func (m *DeactivateFlowsBatchResult) XXX_Marshal(b []byte, deterministic bool) ([]byte, error) {
+	return xxx_messageInfo_DeactivateFlowsBatchResult.Marshal(b, m, deterministic)
+}
+func (m *DeactivateFlowsBatchResult) XXX_Merge(src proto.Message) {
+	xxx_messageInfo_DeactivateFlowsBatchResult.Merge(m, src)
+}
+func (m *DeactivateFlowsBatchResult) XXX_Size() int {
+	return xxx_messageInfo_DeactivateFlowsBatchResult.Size(m)
+}
+func (m *DeactivateFlowsBatchResult) XXX_DiscardUnknown() {
+	xxx_messageInfo_DeactivateFlowsBatchResult.DiscardUnknown(m)
+}
+
+var xxx_messageInfo_DeactivateFlowsBatchResult proto.InternalMessageInfo
+
+func (m *DeactivateFlowsBatchResult) GetResults() []*DeactivateFlowsResult {
+	if m != nil {
+		return m.Results
+	}
+	return nil
+}
+
 type DeactivateFlowsResult struct {
 	Result               DeactivateFlowsResult_Result `protobuf:"varint,1,opt,name=result,proto3,enum=magma.lte.DeactivateFlowsResult_Result" json:"result,omitempty"`
 	XXX_NoUnkeyedLiteral struct{}                     `json:"-"`
@@ -1231,7 +1390,7 @@ func (m *DeactivateFlowsResult) Reset()         { *m = DeactivateFlowsResult{} }
 func (m *DeactivateFlowsResult) String() string { return proto.CompactTextString(m) }
 func (*DeactivateFlowsResult) ProtoMessage()    {}
 func (*DeactivateFlowsResult) Descriptor() ([]byte, []int) {
-	return fileDescriptor_e17e923ef6f5752e, []int{13}
+	return fileDescriptor_e17e923ef6f5752e, []int{17}
 }
 
 func (m *DeactivateFlowsResult) XXX_Unmarshal(b []byte) error {
@@ -1276,7 +1435,7 @@ func (m *FlowRequest) Reset()         { *m = FlowRequest{} }
 func (m *FlowRequest) String() string { return proto.CompactTextString(m) }
 func (*FlowRequest) ProtoMessage()    {}
 func (*FlowRequest) Descriptor() ([]byte, []int) {
-	return fileDescriptor_e17e923ef6f5752e, []int{14}
+	return fileDescriptor_e17e923ef6f5752e, []int{18}
 }
 
 func (m *FlowRequest) XXX_Unmarshal(b []byte) error {
@@ -1357,7 +1516,7 @@ func (m *FlowResponse) Reset()         { *m = FlowResponse{} }
 func (m *FlowResponse) String() string { return proto.CompactTextString(m) }
 func (*FlowResponse) ProtoMessage()    {}
 func (*FlowResponse) Descriptor() ([]byte, []int) {
-	return fileDescriptor_e17e923ef6f5752e, []int{15}
+	return fileDescriptor_e17e923ef6f5752e, []int{19}
 }
 
 func (m *FlowResponse) XXX_Unmarshal(b []byte) error {
@@ -1407,7 +1566,7 @@ func (m *UEMacFlowRequest) Reset()         { *m = UEMacFlowRequest{} }
 func (m *UEMacFlowRequest) String() string { return proto.CompactTextString(m) }
 func (*UEMacFlowRequest) ProtoMessage()    {}
 func (*UEMacFlowRequest) Descriptor() ([]byte, []int) {
-	return fileDescriptor_e17e923ef6f5752e, []int{16}
+	return fileDescriptor_e17e923ef6f5752e, []int{20}
 }
 
 func (m *UEMacFlowRequest) XXX_Unmarshal(b []byte) error {
@@ -1484,7 +1643,7 @@ func (m *SubscriberQuotaUpdate) Reset()         { *m = SubscriberQuotaUpdate{} }
 func (m *SubscriberQuotaUpdate) String() string { return proto.CompactTextString(m) }
 func (*SubscriberQuotaUpdate) ProtoMessage()    {}
 func (*SubscriberQuotaUpdate) Descriptor() ([]byte, []int) {
-	return fileDescriptor_e17e923ef6f5752e, []int{17}
+	return fileDescriptor_e17e923ef6f5752e, []int{21}
 }
 
 func (m *SubscriberQuotaUpdate) XXX_Unmarshal(b []byte) error {
@@ -1537,7 +1696,7 @@ func (m *UpdateSubscriberQuotaStateRequest) Reset()         { *m = UpdateSubscri
 func (m *UpdateSubscriberQuotaStateRequest) String() string { return proto.CompactTextString(m) }
 func (*UpdateSubscriberQuotaStateRequest) ProtoMessage()    {}
 func (*UpdateSubscriberQuotaStateRequest) Descriptor() ([]byte, []int) {
-	return fileDescriptor_e17e923ef6f5752e, []int{18}
+	return fileDescriptor_e17e923ef6f5752e, []int{22}
 }
 
 func (m *UpdateSubscriberQuotaStateRequest) XXX_Unmarshal(b []byte) error {
@@ -1578,7 +1737,7 @@ func (m *TableAssignment) Reset()         { *m = TableAssignment{} }
 func (m *TableAssignment) String() string { return proto.CompactTextString(m) }
 func (*TableAssignment) ProtoMessage()    {}
 func (*TableAssignment) Descriptor() ([]byte, []int) {
-	return fileDescriptor_e17e923ef6f5752e, []int{19}
+	return fileDescriptor_e17e923ef6f5752e, []int{23}
 }
 
 func (m *TableAssignment) XXX_Unmarshal(b []byte) error {
@@ -1631,7 +1790,7 @@ func (m *AllTableAssignments) Reset()         { *m = AllTableAssignments{} }
 func (m *AllTableAssignments) String() string { return proto.CompactTextString(m) }
 func (*AllTableAssignments) ProtoMessage()    {}
 func (*AllTableAssignments) Descriptor() ([]byte, []int) {
-	return fileDescriptor_e17e923ef6f5752e, []int{20}
+	return fileDescriptor_e17e923ef6f5752e, []int{24}
 }
 
 func (m *AllTableAssignments) XXX_Unmarshal(b []byte) error {
@@ -1671,7 +1830,7 @@ func (m *SerializedRyuPacket) Reset()         { *m = SerializedRyuPacket{} }
 func (m *SerializedRyuPacket) String() string { return proto.CompactTextString(m) }
 func (*SerializedRyuPacket) ProtoMessage()    {}
 func (*SerializedRyuPacket) Descriptor() ([]byte, []int) {
-	return fileDescriptor_e17e923ef6f5752e, []int{21}
+	return fileDescriptor_e17e923ef6f5752e, []int{25}
 }
 
 func (m *SerializedRyuPacket) XXX_Unmarshal(b []byte) error {
@@ -1717,7 +1876,7 @@ func (m *PacketDropTableId) Reset()         { *m = PacketDropTableId{} }
 func (m *PacketDropTableId) String() string { return proto.CompactTextString(m) }
 func (*PacketDropTableId) ProtoMessage()    {}
 func (*PacketDropTableId) Descriptor() ([]byte, []int) {
-	return fileDescriptor_e17e923ef6f5752e, []int{22}
+	return fileDescriptor_e17e923ef6f5752e, []int{26}
 }
 
 func (m *PacketDropTableId) XXX_Unmarshal(b []byte) error {
@@ -1757,7 +1916,7 @@ func (m *FsmState) Reset()         { *m = FsmState{} }
 func (m *FsmState) String() string { return proto.CompactTextString(m) }
 func (*FsmState) ProtoMessage()    {}
 func (*FsmState) Descriptor() ([]byte, []int) {
-	return fileDescriptor_e17e923ef6f5752e, []int{23}
+	return fileDescriptor_e17e923ef6f5752e, []int{27}
 }
 
 func (m *FsmState) XXX_Unmarshal(b []byte) error {
@@ -1800,7 +1959,7 @@ func (m *SdfFilters) Reset()         { *m = SdfFilters{} }
 func (m *SdfFilters) String() string { return proto.CompactTextString(m) }
 func (*SdfFilters) ProtoMessage()    {}
 func (*SdfFilters) Descriptor() ([]byte, []int) {
-	return fileDescriptor_e17e923ef6f5752e, []int{24}
+	return fileDescriptor_e17e923ef6f5752e, []int{28}
 }
 
 func (m *SdfFilters) XXX_Unmarshal(b []byte) error {
@@ -1868,7 +2027,7 @@ func (m *FlowDescriptor) Reset()         { *m = FlowDescriptor{} }
 func (m *FlowDescriptor) String() string { return proto.CompactTextString(m) }
 func (*FlowDescriptor) ProtoMessage()    {}
 func (*FlowDescriptor) Descriptor() ([]byte, []int) {
-	return fileDescriptor_e17e923ef6f5752e, []int{25}
+	return fileDescriptor_e17e923ef6f5752e, []int{29}
 }
 
 func (m *FlowDescriptor) XXX_Unmarshal(b []byte) error {
@@ -1918,7 +2077,7 @@ func (m *FlowMatchNew) Reset()         { *m = FlowMatchNew{} }
 func (m *FlowMatchNew) String() string { return proto.CompactTextString(m) }
 func (*FlowMatchNew) ProtoMessage()    {}
 func (*FlowMatchNew) Descriptor() ([]byte, []int) {
-	return fileDescriptor_e17e923ef6f5752e, []int{26}
+	return fileDescriptor_e17e923ef6f5752e, []int{30}
 }
 
 func (m *FlowMatchNew) XXX_Unmarshal(b []byte) error {
@@ -1986,7 +2145,7 @@ func (m *RedirectInfo) Reset()         { *m = RedirectInfo{} }
 func (m *RedirectInfo) String() string { return proto.CompactTextString(m) }
 func (*RedirectInfo) ProtoMessage()    {}
 func (*RedirectInfo) Descriptor() ([]byte, []int) {
-	return fileDescriptor_e17e923ef6f5752e, []int{27}
+	return fileDescriptor_e17e923ef6f5752e, []int{31}
 }
 
 func (m *RedirectInfo) XXX_Unmarshal(b []byte) error {
@@ -2034,7 +2193,7 @@ func (m *OuterHeaderCreation) Reset()         { *m = OuterHeaderCreation{} }
 func (m *OuterHeaderCreation) String() string { return proto.CompactTextString(m) }
 func (*OuterHeaderCreation) ProtoMessage()    {}
 func (*OuterHeaderCreation) Descriptor() ([]byte, []int) {
-	return fileDescriptor_e17e923ef6f5752e, []int{28}
+	return fileDescriptor_e17e923ef6f5752e, []int{32}
 }
 
 func (m *OuterHeaderCreation) XXX_Unmarshal(b []byte) error {
@@ -2091,7 +2250,7 @@ func (m *FwdParam) Reset()         { *m = FwdParam{} }
 func (m *FwdParam) String() string { return proto.CompactTextString(m) }
 func (*FwdParam) ProtoMessage()    {}
 func (*FwdParam) Descriptor() ([]byte, []int) {
-	return fileDescriptor_e17e923ef6f5752e, []int{29}
+	return fileDescriptor_e17e923ef6f5752e, []int{33}
 }
 
 func (m *FwdParam) XXX_Unmarshal(b []byte) error {
@@ -2152,7 +2311,7 @@ func (m *DupParam) Reset()         { *m = DupParam{} }
 func (m *DupParam) String() string { return proto.CompactTextString(m) }
 func (*DupParam) ProtoMessage()    {}
 func (*DupParam) Descriptor() ([]byte, []int) {
-	return fileDescriptor_e17e923ef6f5752e, []int{30}
+	return fileDescriptor_e17e923ef6f5752e, []int{34}
 }
 
 func (m *DupParam) XXX_Unmarshal(b []byte) error {
@@ -2198,7 +2357,7 @@ func (m *PDI) Reset()         { *m = PDI{} }
 func (m *PDI) String() string { return proto.CompactTextString(m) }
 func (*PDI) ProtoMessage()    {}
 func (*PDI) Descriptor() ([]byte, []int) {
-	return fileDescriptor_e17e923ef6f5752e, []int{31}
+	return fileDescriptor_e17e923ef6f5752e, []int{35}
 }
 
 func (m *PDI) XXX_Unmarshal(b []byte) error {
@@ -2289,7 +2448,7 @@ func (m *SetGroupPDR) Reset()         { *m = SetGroupPDR{} }
 func (m *SetGroupPDR) String() string { return proto.CompactTextString(m) }
 func (*SetGroupPDR) ProtoMessage()    {}
 func (*SetGroupPDR) Descriptor() ([]byte, []int) {
-	return fileDescriptor_e17e923ef6f5752e, []int{32}
+	return fileDescriptor_e17e923ef6f5752e, []int{36}
 }
 
 func (m *SetGroupPDR) XXX_Unmarshal(b []byte) error {
@@ -2395,7 +2554,7 @@ func (m *SetGroupFAR) Reset()         { *m = SetGroupFAR{} }
 func (m *SetGroupFAR) String() string { return proto.CompactTextString(m) }
 func (*SetGroupFAR) ProtoMessage()    {}
 func (*SetGroupFAR) Descriptor() ([]byte, []int) {
-	return fileDescriptor_e17e923ef6f5752e, []int{33}
+	return fileDescriptor_e17e923ef6f5752e, []int{37}
 }
 
 func (m *SetGroupFAR) XXX_Unmarshal(b []byte) error {
@@ -2461,7 +2620,7 @@ func (m *SessionSet) Reset()         { *m = SessionSet{} }
 func (m *SessionSet) String() string { return proto.CompactTextString(m) }
 func (*SessionSet) ProtoMessage()    {}
 func (*SessionSet) Descriptor() ([]byte, []int) {
-	return fileDescriptor_e17e923ef6f5752e, []int{34}
+	return fileDescriptor_e17e923ef6f5752e, []int{38}
 }
 
 func (m *SessionSet) XXX_Unmarshal(b []byte) error {
@@ -2539,7 +2698,7 @@ func (m *UPFSessionContextState) Reset()         { *m = UPFSessionContextState{}
 func (m *UPFSessionContextState) String() string { return proto.CompactTextString(m) }
 func (*UPFSessionContextState) ProtoMessage()    {}
 func (*UPFSessionContextState) Descriptor() ([]byte, []int) {
-	return fileDescriptor_e17e923ef6f5752e, []int{35}
+	return fileDescriptor_e17e923ef6f5752e, []int{39}
 }
 
 func (m *UPFSessionContextState) XXX_Unmarshal(b []byte) error {
@@ -2593,7 +2752,7 @@ func (m *CauseIE) Reset()         { *m = CauseIE{} }
 func (m *CauseIE) String() string { return proto.CompactTextString(m) }
 func (*CauseIE) ProtoMessage()    {}
 func (*CauseIE) Descriptor() ([]byte, []int) {
-	return fileDescriptor_e17e923ef6f5752e, []int{36}
+	return fileDescriptor_e17e923ef6f5752e, []int{40}
 }
 
 func (m *CauseIE) XXX_Unmarshal(b []byte) error {
@@ -2633,7 +2792,7 @@ func (m *FailureRuleInformation) Reset()         { *m = FailureRuleInformation{}
 func (m *FailureRuleInformation) String() string { return proto.CompactTextString(m) }
 func (*FailureRuleInformation) ProtoMessage()    {}
 func (*FailureRuleInformation) Descriptor() ([]byte, []int) {
-	return fileDescriptor_e17e923ef6f5752e, []int{37}
+	return fileDescriptor_e17e923ef6f5752e, []int{41}
 }
 
 func (m *FailureRuleInformation) XXX_Unmarshal(b []byte) error {
@@ -2676,7 +2835,7 @@ func (m *OffendingIE) Reset()         { *m = OffendingIE{} }
 func (m *OffendingIE) String() string { return proto.CompactTextString(m) }
 func (*OffendingIE) ProtoMessage()    {}
 func (*OffendingIE) Descriptor() ([]byte, []int) {
-	return fileDescriptor_e17e923ef6f5752e, []int{38}
+	return fileDescriptor_e17e923ef6f5752e, []int{42}
 }
 
 func (m *OffendingIE) XXX_Unmarshal(b []byte) error {
@@ -2745,7 +2904,7 @@ func (m *IPFlowDL) Reset()         { *m = IPFlowDL{} }
 func (m *IPFlowDL) String() string { return proto.CompactTextString(m) }
 func (*IPFlowDL) ProtoMessage()    {}
 func (*IPFlowDL) Descriptor() ([]byte, []int) {
-	return fileDescriptor_e17e923ef6f5752e, []int{39}
+	return fileDescriptor_e17e923ef6f5752e, []int{43}
 }
 
 func (m *IPFlowDL) XXX_Unmarshal(b []byte) error {
@@ -2840,7 +2999,7 @@ func (m *UESessionState) Reset()         { *m = UESessionState{} }
 func (m *UESessionState) String() string { return proto.CompactTextString(m) }
 func (*UESessionState) ProtoMessage()    {}
 func (*UESessionState) Descriptor() ([]byte, []int) {
-	return fileDescriptor_e17e923ef6f5752e, []int{40}
+	return fileDescriptor_e17e923ef6f5752e, []int{44}
 }
 
 func (m *UESessionState) XXX_Unmarshal(b []byte) error {
@@ -2890,7 +3049,7 @@ func (m *UESessionSet) Reset()         { *m = UESessionSet{} }
 func (m *UESessionSet) String() string { return proto.CompactTextString(m) }
 func (*UESessionSet) ProtoMessage()    {}
 func (*UESessionSet) Descriptor() ([]byte, []int) {
-	return fileDescriptor_e17e923ef6f5752e, []int{41}
+	return fileDescriptor_e17e923ef6f5752e, []int{45}
 }
 
 func (m *UESessionSet) XXX_Unmarshal(b []byte) error {
@@ -3002,7 +3161,7 @@ func (m *UESessionContextResponse) Reset()         { *m = UESessionContextRespon
 func (m *UESessionContextResponse) String() string { return proto.CompactTextString(m) }
 func (*UESessionContextResponse) ProtoMessage()    {}
 func (*UESessionContextResponse) Descriptor() ([]byte, []int) {
-	return fileDescriptor_e17e923ef6f5752e, []int{42}
+	return fileDescriptor_e17e923ef6f5752e, []int{46}
 }
 
 func (m *UESessionContextResponse) XXX_Unmarshal(b []byte) error {
@@ -3063,7 +3222,7 @@ func (m *GetStatsRequest) Reset()         { *m = GetStatsRequest{} }
 func (m *GetStatsRequest) String() string { return proto.CompactTextString(m) }
 func (*GetStatsRequest) ProtoMessage()    {}
 func (*GetStatsRequest) Descriptor() ([]byte, []int) {
-	return fileDescriptor_e17e923ef6f5752e, []int{43}
+	return fileDescriptor_e17e923ef6f5752e, []int{47}
 }
 
 func (m *GetStatsRequest) XXX_Unmarshal(b []byte) error {
@@ -3126,6 +3285,10 @@ func init() {
 	proto.RegisterType((*DeactivateFlowsRequest)(nil), "magma.lte.DeactivateFlowsRequest")
 	proto.RegisterType((*RuleModResult)(nil), "magma.lte.RuleModResult")
 	proto.RegisterType((*ActivateFlowsResult)(nil), "magma.lte.ActivateFlowsResult")
+	proto.RegisterType((*ActivateFlowsBatchRequest)(nil), "magma.lte.ActivateFlowsBatchRequest")
+	proto.RegisterType((*ActivateFlowsBatchResult)(nil), "magma.lte.ActivateFlowsBatchResult")
+	proto.RegisterType((*DeactivateFlowsBatchRequest)(nil), "magma.lte.DeactivateFlowsBatchRequest")
+	proto.RegisterType((*DeactivateFlowsBatchResult)(nil), "magma.lte.DeactivateFlowsBatchResult")
 	proto.RegisterType((*DeactivateFlowsResult)(nil), "magma.lte.DeactivateFlowsResult")
 	proto.RegisterType((*FlowRequest)(nil), "magma.lte.FlowRequest")
 	proto.RegisterType((*FlowResponse)(nil), "magma.lte.FlowResponse")
@@ -3162,255 +3325,261 @@ func init() {
 func init() { proto.RegisterFile("lte/protos/pipelined.proto", fileDescriptor_e17e923ef6f5752e) }
 
 var fileDescriptor_e17e923ef6f5752e = []byte{
-	// 3967 bytes of a gzipped FileDescriptorProto
-	0x1f, 0x8b, 0x08, 0x00, 0x00, 0x00, 0x00, 0x00, 0x02, 0xff, 0xb4, 0x3a, 0x4b, 0x6f, 0x1b, 0x49,
-	0x7a, 0xe2, 0x43, 0x7c, 0x7c, 0x7c, 0xa8, 0x5d, 0xb6, 0x25, 0x4a, 0x33, 0xf6, 0xc8, 0x3d, 0x3b,
-	0x19, 0xdb, 0x9b, 0x91, 0xb3, 0x5a, 0x43, 0xb3, 0x3b, 0xb3, 0xc8, 0x6e, 0x9b, 0xdd, 0x94, 0xdb,
-	0x4b, 0x91, 0x74, 0x35, 0xa9, 0xf1, 0x04, 0x41, 0x0a, 0x2d, 0x76, 0x51, 0xd3, 0x31, 0xd9, 0xdd,
-	0xae, 0x6e, 0xfa, 0x11, 0x04, 0x39, 0x04, 0x79, 0x00, 0x39, 0xe5, 0x9e, 0x43, 0x6e, 0xb9, 0x07,
-	0xc8, 0x25, 0x7f, 0x20, 0x08, 0x90, 0x00, 0xb9, 0xe4, 0xb6, 0xc9, 0x1f, 0x08, 0x10, 0x20, 0x87,
-	0x20, 0xe7, 0xa0, 0x1e, 0x4d, 0x35, 0x29, 0xda, 0xf2, 0xec, 0xcc, 0x9e, 0x58, 0xfd, 0xd5, 0x57,
-	0x5f, 0x7d, 0xf5, 0xbd, 0xbf, 0x2a, 0xc2, 0xde, 0x34, 0xa1, 0x0f, 0x22, 0x16, 0x26, 0x61, 0xfc,
-	0x20, 0xf2, 0x23, 0x3a, 0xf5, 0x03, 0xea, 0x1d, 0x08, 0x00, 0xaa, 0xce, 0xdc, 0xf3, 0x99, 0x7b,
-	0x30, 0x4d, 0xe8, 0xde, 0x6e, 0xc8, 0xc6, 0x3f, 0x61, 0x29, 0xe2, 0x38, 0x9c, 0xcd, 0xc2, 0x40,
-	0x62, 0xed, 0xdd, 0xc8, 0x50, 0x70, 0xa3, 0x14, 0xba, 0x9b, 0xa5, 0x1b, 0x4e, 0xfd, 0xf1, 0x1b,
-	0xef, 0x4c, 0x4d, 0xed, 0x67, 0xa6, 0x62, 0x1a, 0xc7, 0x7e, 0x18, 0x90, 0x99, 0x1b, 0xb8, 0xe7,
-	0x94, 0x29, 0x8c, 0x5b, 0x59, 0x8c, 0xf9, 0x59, 0x3c, 0x66, 0xfe, 0x19, 0x65, 0x0b, 0x02, 0x59,
-	0x9e, 0x67, 0xe1, 0x99, 0x3f, 0xf5, 0x93, 0x37, 0x8a, 0x67, 0xfd, 0x1f, 0x73, 0x70, 0xcd, 0xa1,
-	0xc9, 0x3c, 0xea, 0x4c, 0xc3, 0x57, 0x31, 0xa6, 0x2f, 0xe6, 0x34, 0x4e, 0xd0, 0x97, 0x50, 0x61,
-	0x72, 0x18, 0xb7, 0x72, 0xfb, 0x85, 0xbb, 0xb5, 0xc3, 0x8f, 0x0e, 0x16, 0x87, 0x3b, 0x30, 0xc6,
-	0x89, 0xff, 0xd2, 0x4d, 0x68, 0x76, 0x09, 0x5e, 0x2c, 0x40, 0x37, 0x60, 0x93, 0x46, 0xe1, 0xf8,
-	0x9b, 0x56, 0x7e, 0x3f, 0x77, 0xb7, 0x88, 0xe5, 0x07, 0x7a, 0x0a, 0x8d, 0x17, 0xf3, 0x30, 0x71,
-	0xc9, 0x3c, 0xf2, 0xdc, 0x84, 0xc6, 0xad, 0xc2, 0x7e, 0xee, 0x6e, 0xed, 0xf0, 0xb7, 0x33, 0x74,
-	0x47, 0x62, 0xc6, 0x59, 0x1c, 0xe0, 0x29, 0xc7, 0x77, 0x12, 0x37, 0xa1, 0xe9, 0x26, 0x75, 0x41,
-	0x42, 0xe2, 0xc5, 0xfa, 0x0f, 0xe1, 0xba, 0x60, 0xdd, 0xa4, 0x13, 0x77, 0x3e, 0x4d, 0x52, 0xe6,
-	0x17, 0xfb, 0xe7, 0x32, 0xfb, 0xeb, 0x67, 0xea, 0x9c, 0x23, 0xeb, 0xc4, 0x1d, 0xa7, 0xa8, 0x9f,
-	0x5f, 0x3a, 0xe7, 0x07, 0x59, 0x7e, 0x38, 0x2a, 0x3f, 0xe4, 0x7b, 0x9e, 0x51, 0x3f, 0x07, 0x24,
-	0xf6, 0x18, 0x08, 0x05, 0xfe, 0xe6, 0x84, 0xa9, 0xff, 0xb1, 0x3a, 0x8c, 0x90, 0x50, 0xba, 0xcf,
-	0x25, 0x09, 0xe7, 0xbe, 0xab, 0x84, 0xdf, 0xb2, 0xfb, 0x5f, 0xe4, 0x40, 0xcb, 0xda, 0x4c, 0x3c,
-	0x9f, 0x26, 0xe8, 0x0b, 0x28, 0x31, 0x31, 0x12, 0xdb, 0x36, 0x0f, 0xf5, 0xcc, 0xb6, 0xab, 0xc8,
-	0x07, 0xf2, 0x07, 0xab, 0x15, 0xfa, 0x11, 0x94, 0x14, 0x95, 0x1a, 0x94, 0x9d, 0x51, 0xbb, 0x6d,
-	0x39, 0x8e, 0xb6, 0xc1, 0x3f, 0x3a, 0x86, 0xdd, 0x1d, 0x61, 0x4b, 0xcb, 0x21, 0x04, 0xcd, 0xfe,
-	0x68, 0x68, 0x1a, 0x43, 0xcb, 0x24, 0xd6, 0xa0, 0xdf, 0x7e, 0xac, 0xe5, 0xf5, 0x3f, 0xcb, 0xc1,
-	0x35, 0xc5, 0x78, 0x9f, 0xf9, 0xe7, 0x7e, 0x30, 0x7c, 0x13, 0x51, 0xf4, 0x25, 0x14, 0x93, 0x37,
-	0x11, 0x55, 0x7c, 0x7c, 0x9a, 0xe1, 0xe3, 0x12, 0xee, 0xc1, 0xc5, 0x10, 0x8b, 0x45, 0xfa, 0x21,
-	0x40, 0x86, 0x54, 0x09, 0xf2, 0xc7, 0xcf, 0xb4, 0x0d, 0xf1, 0xfb, 0xb5, 0x96, 0xe3, 0xbf, 0xbd,
-	0x87, 0x5a, 0x1e, 0xd5, 0xa1, 0xf2, 0x95, 0xdd, 0x35, 0xdb, 0x06, 0x36, 0xb5, 0x82, 0x7e, 0x0a,
-	0x5b, 0xa7, 0x94, 0x71, 0xbf, 0xa4, 0x9e, 0x54, 0x3d, 0xba, 0x07, 0x45, 0x36, 0x9f, 0x52, 0xa5,
-	0x82, 0x9b, 0x19, 0x1e, 0x94, 0x6d, 0xcc, 0xa7, 0x14, 0x0b, 0x14, 0xd4, 0x82, 0xf2, 0x4b, 0xb9,
-	0x5a, 0x48, 0xb9, 0x81, 0xd3, 0x4f, 0xfd, 0xef, 0x0a, 0x70, 0x63, 0x9d, 0x79, 0xa0, 0x7b, 0x50,
-	0x88, 0x7d, 0x4f, 0x11, 0xdf, 0xc9, 0x0a, 0x7a, 0xa1, 0x59, 0xdb, 0xc4, 0x1c, 0x07, 0xed, 0x40,
-	0xd9, 0x8f, 0x88, 0xeb, 0x79, 0x4c, 0x50, 0xaf, 0xe2, 0x92, 0x1f, 0x19, 0x9e, 0xc7, 0x50, 0x1b,
-	0x9a, 0xca, 0xc8, 0x48, 0x28, 0x0e, 0xdc, 0xda, 0x14, 0xe4, 0x3e, 0x7c, 0x97, 0xbc, 0x70, 0x83,
-	0x65, 0x41, 0xe8, 0x77, 0xa1, 0xe2, 0x46, 0x01, 0x71, 0x67, 0x67, 0xac, 0x55, 0x12, 0xcb, 0x3f,
-	0xce, 0x9a, 0xf6, 0xf9, 0x39, 0xa3, 0xe7, 0x6e, 0x42, 0xbd, 0x13, 0xf7, 0xb5, 0x3f, 0x9b, 0xcf,
-	0x1e, 0xf9, 0x09, 0xe3, 0xb6, 0x56, 0x76, 0xa3, 0xc0, 0x98, 0x9d, 0x31, 0xf4, 0x01, 0x54, 0xfd,
-	0xe8, 0xe5, 0x91, 0xe4, 0xaf, 0xbc, 0x9f, 0xbb, 0x5b, 0xc7, 0x15, 0x0e, 0x10, 0x1c, 0x6e, 0x43,
-	0x69, 0x16, 0xfb, 0xb1, 0x17, 0xb4, 0x2a, 0x62, 0x46, 0x7d, 0xa1, 0x8f, 0xa1, 0x31, 0x8f, 0xa6,
-	0x7e, 0xf0, 0x9c, 0x24, 0xf3, 0x20, 0xa0, 0xd3, 0x56, 0x55, 0x88, 0xad, 0x2e, 0x81, 0x43, 0x01,
-	0x43, 0x9f, 0xc2, 0x96, 0x17, 0xbe, 0x0a, 0xb2, 0x68, 0x20, 0xd0, 0x9a, 0x29, 0x58, 0x21, 0x1e,
-	0x41, 0x45, 0xc4, 0x5b, 0x9f, 0xc6, 0xad, 0x9a, 0xf0, 0xce, 0xbd, 0xcc, 0x11, 0x56, 0xf4, 0x8a,
-	0x17, 0xb8, 0x4f, 0x8a, 0x95, 0x82, 0x56, 0x7c, 0x52, 0xac, 0x14, 0xb5, 0x4d, 0xbd, 0x03, 0xd7,
-	0x56, 0x10, 0x6d, 0x93, 0x4b, 0x9e, 0xeb, 0x97, 0x28, 0x45, 0x55, 0x71, 0x89, 0x7f, 0xda, 0xde,
-	0x3b, 0x14, 0xfe, 0x97, 0x05, 0xd8, 0x36, 0xa9, 0xfb, 0x1d, 0x55, 0x7e, 0x59, 0xb3, 0x85, 0x6f,
-	0xaf, 0xd9, 0x8c, 0xdd, 0x14, 0x97, 0xec, 0x66, 0x49, 0x65, 0x9b, 0x2b, 0x2a, 0xfb, 0x29, 0xec,
-	0x32, 0x3a, 0x0b, 0x5f, 0x52, 0xe2, 0xc9, 0x98, 0x4c, 0x3c, 0x16, 0x46, 0x64, 0xc2, 0x4f, 0x22,
-	0x0c, 0xa4, 0x82, 0xb7, 0x25, 0x82, 0x8a, 0xd9, 0x26, 0x0b, 0x65, 0x60, 0xb8, 0xac, 0xd5, 0xf2,
-	0xfb, 0x69, 0xb5, 0xb2, 0x56, 0xab, 0x3f, 0xc9, 0x68, 0xb5, 0x2a, 0xb4, 0xfa, 0xe1, 0xdb, 0xb5,
-	0x6a, 0x9b, 0x4b, 0x7a, 0xcd, 0x6b, 0x05, 0xfd, 0x1f, 0x72, 0xd0, 0xe0, 0x3e, 0x7a, 0x12, 0x7a,
-	0x2a, 0x32, 0xbd, 0x55, 0x9d, 0x9f, 0x2f, 0x02, 0x5f, 0x5e, 0x04, 0x9c, 0x6c, 0x70, 0x5f, 0x22,
-	0xb1, 0x12, 0xf5, 0xb2, 0x76, 0x50, 0x10, 0xe1, 0x75, 0x61, 0x07, 0x9f, 0xaf, 0x8f, 0x87, 0xd7,
-	0x61, 0x6b, 0x60, 0xe0, 0xa1, 0x6d, 0x74, 0x49, 0x0a, 0xcc, 0x65, 0x83, 0x64, 0x5e, 0xff, 0x7d,
-	0xb8, 0xbe, 0x12, 0x30, 0x04, 0x95, 0x9f, 0x43, 0x53, 0xd6, 0x14, 0x44, 0x6e, 0x1d, 0xb7, 0xf2,
-	0x42, 0x26, 0xad, 0xb7, 0xb1, 0x8a, 0x1b, 0x91, 0x4a, 0x61, 0x02, 0xfd, 0x49, 0xb1, 0x92, 0xd3,
-	0xf2, 0xfa, 0x5f, 0xe7, 0xe0, 0xe6, 0x25, 0xf3, 0x54, 0x1b, 0x2c, 0x07, 0xff, 0x6c, 0xd0, 0x5d,
-	0xbb, 0xe2, 0xfb, 0xca, 0x00, 0xff, 0x9d, 0x87, 0x5a, 0x26, 0x43, 0xa3, 0xfb, 0xb0, 0x39, 0x73,
-	0x13, 0x95, 0xfb, 0x6b, 0x87, 0x37, 0x32, 0x7c, 0x70, 0xb4, 0x13, 0x3e, 0x87, 0x25, 0x0a, 0xda,
-	0xe5, 0xc1, 0x2b, 0x22, 0x81, 0x3b, 0xa3, 0x2a, 0x36, 0x96, 0xdd, 0x28, 0xea, 0xb9, 0x33, 0xca,
-	0xa7, 0xce, 0xde, 0x24, 0x34, 0x26, 0xec, 0x75, 0xaa, 0x1b, 0xf1, 0x8d, 0x5f, 0xa3, 0x3b, 0x50,
-	0x8f, 0x29, 0x7b, 0xe9, 0x8f, 0x29, 0x11, 0x59, 0x46, 0x7a, 0x47, 0x4d, 0xc1, 0x44, 0xd6, 0xd8,
-	0x81, 0x72, 0xcc, 0xc6, 0x64, 0xe6, 0x8e, 0x85, 0x83, 0x54, 0x71, 0x29, 0x66, 0xe3, 0x13, 0x77,
-	0xcc, 0x27, 0xbc, 0x38, 0x11, 0x13, 0x25, 0x39, 0xe1, 0xc5, 0x09, 0x9f, 0x38, 0x82, 0xcd, 0x98,
-	0x67, 0x61, 0x61, 0xf4, 0xcd, 0xc3, 0xfd, 0x15, 0xb6, 0xd5, 0xe9, 0xc4, 0x58, 0x66, 0x6b, 0x89,
-	0xae, 0x87, 0x50, 0x5d, 0xc0, 0x90, 0x06, 0xf5, 0x4e, 0xb7, 0xff, 0x15, 0x69, 0x63, 0x8b, 0xcb,
-	0x48, 0xdb, 0x40, 0x1f, 0xc1, 0x07, 0x02, 0x92, 0x5a, 0x4d, 0xbb, 0x6b, 0x38, 0x8e, 0xdd, 0xb1,
-	0xdb, 0xc6, 0xd0, 0xee, 0xf7, 0xb4, 0x1c, 0xba, 0x05, 0xbb, 0x02, 0xa1, 0x63, 0xf7, 0x2e, 0x4f,
-	0xe7, 0x17, 0x14, 0xad, 0x67, 0x03, 0x1b, 0x5b, 0x3c, 0xd5, 0xfd, 0x09, 0xd4, 0x25, 0x43, 0x71,
-	0x14, 0x06, 0x31, 0x45, 0x47, 0x2b, 0x8a, 0xbf, 0x7d, 0x89, 0x73, 0x89, 0xf8, 0x7d, 0xe9, 0xfb,
-	0xdf, 0x72, 0xa0, 0xad, 0x96, 0x65, 0xdf, 0x26, 0x36, 0xee, 0x42, 0x65, 0xe6, 0x8e, 0xb3, 0xf9,
-	0xb0, 0x3c, 0x73, 0xc7, 0x2b, 0xe9, 0xa6, 0x20, 0x75, 0xa3, 0xd2, 0xcd, 0x6d, 0xa8, 0xb9, 0x11,
-	0x59, 0xac, 0x92, 0xfa, 0xae, 0xba, 0xd1, 0x89, 0x5a, 0xb7, 0x03, 0x65, 0x57, 0x59, 0x91, 0xd2,
-	0xb6, 0x2b, 0x8d, 0xe8, 0x07, 0xd0, 0x8c, 0xbc, 0x88, 0xc4, 0x89, 0xcb, 0x12, 0x92, 0xf8, 0x33,
-	0x2a, 0x94, 0x5e, 0xc4, 0xf5, 0xc8, 0x8b, 0x1c, 0x0e, 0x1c, 0xfa, 0x33, 0xaa, 0xff, 0x2a, 0x07,
-	0x37, 0x57, 0x0a, 0x32, 0x59, 0x7d, 0x7d, 0x4f, 0xc7, 0xea, 0x40, 0x4d, 0xd6, 0x83, 0xd2, 0x5c,
-	0x0b, 0x42, 0x4d, 0x9f, 0xac, 0xa5, 0x96, 0xd9, 0xfc, 0x40, 0xe4, 0x04, 0x90, 0x2b, 0xf9, 0x58,
-	0x7f, 0x08, 0x45, 0x61, 0xdc, 0x5b, 0x50, 0x3b, 0x35, 0xba, 0xb6, 0x49, 0x9e, 0x8e, 0xfa, 0x43,
-	0x43, 0xdb, 0xe0, 0xb5, 0x50, 0xaf, 0xaf, 0xbe, 0x72, 0xa8, 0x01, 0xd5, 0xa1, 0x85, 0x4f, 0xec,
-	0x9e, 0x31, 0xe4, 0x01, 0x89, 0xc0, 0x9d, 0x2b, 0x6b, 0x4e, 0xf4, 0x05, 0x94, 0x2f, 0x4a, 0x56,
-	0x1e, 0x97, 0xf6, 0xaf, 0x62, 0x0f, 0xa7, 0x0b, 0x74, 0x06, 0x5b, 0x43, 0xf7, 0x6c, 0x4a, 0x8d,
-	0x38, 0xf6, 0xcf, 0x83, 0x19, 0x0d, 0x92, 0x25, 0xbf, 0xce, 0x2d, 0xfb, 0xf5, 0x2d, 0x80, 0x99,
-	0xeb, 0x07, 0x24, 0xe1, 0x4b, 0x54, 0x51, 0x5b, 0xe5, 0x10, 0x41, 0x03, 0x7d, 0x02, 0xcd, 0x78,
-	0xcc, 0x78, 0x70, 0x90, 0x18, 0xbc, 0x49, 0x29, 0xdc, 0x2d, 0xe2, 0x86, 0x82, 0x0a, 0xac, 0x58,
-	0xff, 0x03, 0xb8, 0x6e, 0x4c, 0xa7, 0x2b, 0xdb, 0xc6, 0xe8, 0x18, 0xae, 0x89, 0x55, 0xc4, 0xbd,
-	0x00, 0xaa, 0x03, 0x65, 0x4b, 0x8a, 0x95, 0x75, 0x58, 0x4b, 0x56, 0x08, 0xe9, 0x5f, 0xf2, 0xbe,
-	0x86, 0xf9, 0xee, 0xd4, 0xff, 0x23, 0xea, 0xe1, 0x37, 0xf3, 0x81, 0x3b, 0x7e, 0x4e, 0x13, 0xa4,
-	0x41, 0x21, 0x7a, 0x2e, 0x1d, 0xad, 0x8e, 0xf9, 0x10, 0x21, 0x28, 0xfa, 0xb3, 0xd8, 0x57, 0x2a,
-	0x17, 0x63, 0xfd, 0x00, 0xae, 0x49, 0x7c, 0x9e, 0x5a, 0xc5, 0x5e, 0xb6, 0xb0, 0x0f, 0xc9, 0x9a,
-	0xb2, 0xa7, 0x4d, 0x5c, 0x4e, 0xe4, 0x94, 0xfe, 0xbf, 0x39, 0xa8, 0x76, 0xe2, 0x19, 0x11, 0x01,
-	0x05, 0xfd, 0x38, 0x0d, 0x44, 0xd2, 0x9d, 0x6f, 0x65, 0xdd, 0x39, 0x45, 0xe2, 0xa3, 0xa5, 0x28,
-	0xf4, 0xf7, 0x39, 0xa8, 0xa4, 0x30, 0xee, 0xb5, 0x8e, 0xe5, 0x38, 0x76, 0xbf, 0x47, 0x8c, 0xf6,
-	0xd0, 0x3e, 0xb5, 0xb4, 0x0d, 0xb4, 0x0d, 0x28, 0x85, 0x2d, 0x8c, 0xc3, 0xd4, 0x8a, 0xe8, 0x0e,
-	0xdc, 0x5a, 0x85, 0xf3, 0xb1, 0xd3, 0x7e, 0x6c, 0x99, 0xa3, 0xae, 0x65, 0x6a, 0x9b, 0xe8, 0x06,
-	0x68, 0x29, 0x0a, 0xb6, 0xba, 0x96, 0xe1, 0x58, 0xa6, 0x56, 0xe2, 0x36, 0x27, 0xa2, 0x9c, 0xdd,
-	0x3b, 0xd6, 0xca, 0x3c, 0x6a, 0xa4, 0x31, 0xaf, 0x82, 0x00, 0x4a, 0x6a, 0xdf, 0x2a, 0x47, 0xb3,
-	0x7b, 0xea, 0x0b, 0x38, 0x9a, 0x22, 0xa1, 0xd5, 0xf4, 0x3f, 0xcd, 0x01, 0x38, 0xde, 0xa4, 0xe3,
-	0x4f, 0x13, 0xca, 0x62, 0x74, 0x0f, 0xf2, 0x93, 0xd4, 0xd5, 0x76, 0x57, 0x62, 0x98, 0x49, 0xb9,
-	0x01, 0x46, 0x49, 0xc8, 0x70, 0x7e, 0xe2, 0x71, 0x35, 0x24, 0xc9, 0x58, 0xc8, 0xbc, 0x8e, 0xf9,
-	0x90, 0x43, 0xe2, 0xc8, 0x17, 0xae, 0x55, 0xc7, 0x7c, 0x88, 0x9a, 0x90, 0x9f, 0x4c, 0x45, 0xa8,
-	0xa8, 0xe3, 0xfc, 0x64, 0x8a, 0x6e, 0x42, 0x29, 0xf6, 0x26, 0x5c, 0xfa, 0x9b, 0xa2, 0x5c, 0xd9,
-	0x8c, 0xbd, 0x89, 0xed, 0xe9, 0x7f, 0x08, 0xcd, 0xe5, 0x0d, 0xd0, 0x67, 0xcb, 0xf9, 0x6b, 0x67,
-	0x5d, 0xfe, 0xea, 0xd1, 0x57, 0x69, 0x0a, 0xbb, 0x07, 0x25, 0x9e, 0x5c, 0x55, 0x25, 0xd9, 0x3c,
-	0xbc, 0xb6, 0xd2, 0x58, 0x86, 0x01, 0x56, 0x08, 0xfa, 0xdf, 0xe6, 0x64, 0xe8, 0x4e, 0x49, 0x70,
-	0x9b, 0xf0, 0xa3, 0x97, 0x0f, 0x49, 0xcc, 0xc6, 0xa9, 0x9b, 0xf0, 0x6f, 0x87, 0x8d, 0x17, 0x53,
-	0x5e, 0x9c, 0xa4, 0xe1, 0x84, 0x7f, 0x9b, 0x71, 0xc2, 0xcb, 0x34, 0x71, 0x71, 0x30, 0x0e, 0xa7,
-	0x17, 0x01, 0xa5, 0x8a, 0xeb, 0x29, 0x50, 0xc4, 0x88, 0x5d, 0xa8, 0xf0, 0x3c, 0x17, 0x85, 0x2c,
+	// 4059 bytes of a gzipped FileDescriptorProto
+	0x1f, 0x8b, 0x08, 0x00, 0x00, 0x00, 0x00, 0x00, 0x02, 0xff, 0xb4, 0x3a, 0x4d, 0x8f, 0xdb, 0x48,
+	0x76, 0xad, 0x8f, 0xd6, 0xc7, 0xd3, 0x47, 0xd3, 0x65, 0xbb, 0xad, 0x6e, 0x8f, 0x3d, 0x36, 0x67,
+	0x66, 0xc7, 0x9e, 0xcd, 0xb4, 0xb3, 0x5e, 0xa3, 0x67, 0x76, 0x66, 0x93, 0x59, 0x5a, 0xa4, 0xda,
+	0xf4, 0xaa, 0x25, 0xb9, 0x28, 0xf5, 0x78, 0x82, 0x45, 0x0a, 0x6c, 0xb1, 0xd4, 0x66, 0x2c, 0x91,
+	0x74, 0x91, 0xf2, 0x47, 0x10, 0xe4, 0x10, 0x04, 0x09, 0x90, 0x53, 0xee, 0x39, 0xe4, 0x96, 0x7b,
+	0x80, 0x5c, 0xf2, 0x07, 0x82, 0x00, 0x09, 0x10, 0x04, 0xc8, 0x6d, 0x93, 0x3f, 0x10, 0x20, 0x40,
+	0x0e, 0x41, 0xce, 0x41, 0x7d, 0x50, 0x4d, 0xa9, 0xd5, 0x6e, 0xcf, 0x8e, 0x73, 0x52, 0xf1, 0xd5,
+	0xab, 0x57, 0xaf, 0xde, 0xf7, 0xab, 0x12, 0xec, 0x4e, 0x13, 0x7a, 0x2f, 0x62, 0x61, 0x12, 0xc6,
+	0xf7, 0x22, 0x3f, 0xa2, 0x53, 0x3f, 0xa0, 0xde, 0x9e, 0x00, 0xa0, 0xea, 0xcc, 0x3d, 0x99, 0xb9,
+	0x7b, 0xd3, 0x84, 0xee, 0xee, 0x84, 0x6c, 0xfc, 0x25, 0x4b, 0x11, 0xc7, 0xe1, 0x6c, 0x16, 0x06,
+	0x12, 0x6b, 0xf7, 0x4a, 0x86, 0x82, 0x1b, 0xa5, 0xd0, 0x9d, 0x2c, 0xdd, 0x70, 0xea, 0x8f, 0xdf,
+	0x78, 0xc7, 0x6a, 0xea, 0x56, 0x66, 0x2a, 0xa6, 0x71, 0xec, 0x87, 0x01, 0x99, 0xb9, 0x81, 0x7b,
+	0x42, 0x99, 0xc2, 0xb8, 0x91, 0xc5, 0x98, 0x1f, 0xc7, 0x63, 0xe6, 0x1f, 0x53, 0xb6, 0x20, 0x90,
+	0xe5, 0x79, 0x16, 0x1e, 0xfb, 0x53, 0x3f, 0x79, 0xa3, 0x78, 0xd6, 0xff, 0x3e, 0x07, 0x97, 0x1c,
+	0x9a, 0xcc, 0xa3, 0xce, 0x34, 0x7c, 0x15, 0x63, 0xfa, 0x62, 0x4e, 0xe3, 0x04, 0x7d, 0x0d, 0x15,
+	0x26, 0x87, 0x71, 0x2b, 0x77, 0xab, 0x70, 0xa7, 0x76, 0xff, 0xc3, 0xbd, 0xc5, 0xe1, 0xf6, 0x8c,
+	0x71, 0xe2, 0xbf, 0x74, 0x13, 0x9a, 0x5d, 0x82, 0x17, 0x0b, 0xd0, 0x15, 0xd8, 0xa4, 0x51, 0x38,
+	0x7e, 0xd6, 0xca, 0xdf, 0xca, 0xdd, 0x29, 0x62, 0xf9, 0x81, 0x9e, 0x40, 0xe3, 0xc5, 0x3c, 0x4c,
+	0x5c, 0x32, 0x8f, 0x3c, 0x37, 0xa1, 0x71, 0xab, 0x70, 0x2b, 0x77, 0xa7, 0x76, 0xff, 0xb7, 0x32,
+	0x74, 0x47, 0x62, 0xc6, 0x59, 0x1c, 0xe0, 0x09, 0xc7, 0x77, 0x12, 0x37, 0xa1, 0xe9, 0x26, 0x75,
+	0x41, 0x42, 0xe2, 0xc5, 0xfa, 0x8f, 0xe1, 0xb2, 0x60, 0xdd, 0xa4, 0x13, 0x77, 0x3e, 0x4d, 0x52,
+	0xe6, 0x17, 0xfb, 0xe7, 0x32, 0xfb, 0xeb, 0xc7, 0xea, 0x9c, 0x23, 0xeb, 0xd0, 0x1d, 0xa7, 0xa8,
+	0x5f, 0x9c, 0x39, 0xe7, 0xf5, 0x2c, 0x3f, 0x1c, 0x95, 0x1f, 0xf2, 0x1d, 0xcf, 0xa8, 0x9f, 0x00,
+	0x12, 0x7b, 0x0c, 0x84, 0x02, 0xff, 0xff, 0x84, 0xa9, 0xff, 0x91, 0x3a, 0x8c, 0x90, 0x50, 0xba,
+	0xcf, 0x19, 0x09, 0xe7, 0x7e, 0xa8, 0x84, 0xcf, 0xd9, 0xfd, 0xcf, 0x72, 0xa0, 0x65, 0x6d, 0x26,
+	0x9e, 0x4f, 0x13, 0xf4, 0x15, 0x94, 0x98, 0x18, 0x89, 0x6d, 0x9b, 0xf7, 0xf5, 0xcc, 0xb6, 0xab,
+	0xc8, 0x7b, 0xf2, 0x07, 0xab, 0x15, 0xfa, 0x3e, 0x94, 0x14, 0x95, 0x1a, 0x94, 0x9d, 0x51, 0xbb,
+	0x6d, 0x39, 0x8e, 0xb6, 0xc1, 0x3f, 0x3a, 0x86, 0xdd, 0x1d, 0x61, 0x4b, 0xcb, 0x21, 0x04, 0xcd,
+	0xfe, 0x68, 0x68, 0x1a, 0x43, 0xcb, 0x24, 0xd6, 0xa0, 0xdf, 0x7e, 0xa4, 0xe5, 0xf5, 0x3f, 0xcd,
+	0xc1, 0x25, 0xc5, 0x78, 0x9f, 0xf9, 0x27, 0x7e, 0x30, 0x7c, 0x13, 0x51, 0xf4, 0x35, 0x14, 0x93,
+	0x37, 0x11, 0x55, 0x7c, 0x7c, 0x9a, 0xe1, 0xe3, 0x0c, 0xee, 0xde, 0xe9, 0x10, 0x8b, 0x45, 0xfa,
+	0x7d, 0x80, 0x0c, 0xa9, 0x12, 0xe4, 0x0f, 0x9e, 0x6a, 0x1b, 0xe2, 0xf7, 0x3b, 0x2d, 0xc7, 0x7f,
+	0x7b, 0x0f, 0xb4, 0x3c, 0xaa, 0x43, 0xe5, 0x5b, 0xbb, 0x6b, 0xb6, 0x0d, 0x6c, 0x6a, 0x05, 0xfd,
+	0x08, 0xb6, 0x8e, 0x28, 0xe3, 0x7e, 0x49, 0x3d, 0xa9, 0x7a, 0x74, 0x17, 0x8a, 0x6c, 0x3e, 0xa5,
+	0x4a, 0x05, 0x57, 0x33, 0x3c, 0x28, 0xdb, 0x98, 0x4f, 0x29, 0x16, 0x28, 0xa8, 0x05, 0xe5, 0x97,
+	0x72, 0xb5, 0x90, 0x72, 0x03, 0xa7, 0x9f, 0xfa, 0xdf, 0x14, 0xe0, 0xca, 0x3a, 0xf3, 0x40, 0x77,
+	0xa1, 0x10, 0xfb, 0x9e, 0x22, 0x7e, 0x2d, 0x2b, 0xe8, 0x85, 0x66, 0x6d, 0x13, 0x73, 0x1c, 0x74,
+	0x0d, 0xca, 0x7e, 0x44, 0x5c, 0xcf, 0x63, 0x82, 0x7a, 0x15, 0x97, 0xfc, 0xc8, 0xf0, 0x3c, 0x86,
+	0xda, 0xd0, 0x54, 0x46, 0x46, 0x42, 0x71, 0xe0, 0xd6, 0xa6, 0x20, 0xf7, 0xc1, 0xdb, 0xe4, 0x85,
+	0x1b, 0x2c, 0x0b, 0x42, 0xbf, 0x0b, 0x15, 0x37, 0x0a, 0x88, 0x3b, 0x3b, 0x66, 0xad, 0x92, 0x58,
+	0xfe, 0x51, 0xd6, 0xb4, 0x4f, 0x4e, 0x18, 0x3d, 0x71, 0x13, 0xea, 0x1d, 0xba, 0xaf, 0xfd, 0xd9,
+	0x7c, 0xf6, 0xd0, 0x4f, 0x18, 0xb7, 0xb5, 0xb2, 0x1b, 0x05, 0xc6, 0xec, 0x98, 0xa1, 0xeb, 0x50,
+	0xf5, 0xa3, 0x97, 0xfb, 0x92, 0xbf, 0xf2, 0xad, 0xdc, 0x9d, 0x3a, 0xae, 0x70, 0x80, 0xe0, 0x70,
+	0x1b, 0x4a, 0xb3, 0xd8, 0x8f, 0xbd, 0xa0, 0x55, 0x11, 0x33, 0xea, 0x0b, 0x7d, 0x04, 0x8d, 0x79,
+	0x34, 0xf5, 0x83, 0xe7, 0x24, 0x99, 0x07, 0x01, 0x9d, 0xb6, 0xaa, 0x42, 0x6c, 0x75, 0x09, 0x1c,
+	0x0a, 0x18, 0xfa, 0x14, 0xb6, 0xbc, 0xf0, 0x55, 0x90, 0x45, 0x03, 0x81, 0xd6, 0x4c, 0xc1, 0x0a,
+	0x71, 0x1f, 0x2a, 0x22, 0xde, 0xfa, 0x34, 0x6e, 0xd5, 0x84, 0x77, 0xee, 0x66, 0x8e, 0xb0, 0xa2,
+	0x57, 0xbc, 0xc0, 0x7d, 0x5c, 0xac, 0x14, 0xb4, 0xe2, 0xe3, 0x62, 0xa5, 0xa8, 0x6d, 0xea, 0x1d,
+	0xb8, 0xb4, 0x82, 0x68, 0x9b, 0x5c, 0xf2, 0x5c, 0xbf, 0x44, 0x29, 0xaa, 0x8a, 0x4b, 0xfc, 0xd3,
+	0xf6, 0xde, 0xa2, 0xf0, 0x3f, 0x2f, 0xc0, 0xb6, 0x49, 0xdd, 0x1f, 0xa8, 0xf2, 0xb3, 0x9a, 0x2d,
+	0x7c, 0x7f, 0xcd, 0x66, 0xec, 0xa6, 0xb8, 0x64, 0x37, 0x4b, 0x2a, 0xdb, 0x5c, 0x51, 0xd9, 0xcf,
+	0x60, 0x87, 0xd1, 0x59, 0xf8, 0x92, 0x12, 0x4f, 0xc6, 0x64, 0xe2, 0xb1, 0x30, 0x22, 0x13, 0x7e,
+	0x12, 0x61, 0x20, 0x15, 0xbc, 0x2d, 0x11, 0x54, 0xcc, 0x36, 0x59, 0x28, 0x03, 0xc3, 0x59, 0xad,
+	0x96, 0xdf, 0x4d, 0xab, 0x95, 0xb5, 0x5a, 0xfd, 0x32, 0xa3, 0xd5, 0xaa, 0xd0, 0xea, 0x07, 0xe7,
+	0x6b, 0xd5, 0x36, 0x97, 0xf4, 0x9a, 0xd7, 0x0a, 0xfa, 0xdf, 0xe5, 0xa0, 0xc1, 0x7d, 0xf4, 0x30,
+	0xf4, 0x54, 0x64, 0x3a, 0x57, 0x9d, 0x5f, 0x2c, 0x02, 0x5f, 0x5e, 0x04, 0x9c, 0x6c, 0x70, 0x5f,
+	0x22, 0xb1, 0x12, 0xf5, 0xb2, 0x76, 0x50, 0x10, 0xe1, 0x75, 0x61, 0x07, 0x5f, 0xac, 0x8f, 0x87,
+	0x97, 0x61, 0x6b, 0x60, 0xe0, 0xa1, 0x6d, 0x74, 0x49, 0x0a, 0xcc, 0x65, 0x83, 0x64, 0x5e, 0xff,
+	0x15, 0x5c, 0x5e, 0x09, 0x18, 0x82, 0xca, 0x37, 0xd0, 0x94, 0x35, 0x05, 0x91, 0x5b, 0xc7, 0xad,
+	0xbc, 0x90, 0x49, 0xeb, 0x3c, 0x56, 0x71, 0x23, 0x52, 0x29, 0x4c, 0xa0, 0x3f, 0x2e, 0x56, 0x72,
+	0x5a, 0x5e, 0x7f, 0x0a, 0x3b, 0x4b, 0xd4, 0x1f, 0xba, 0xc9, 0xf8, 0xd9, 0xfb, 0xc8, 0x72, 0xfa,
+	0x10, 0x5a, 0xeb, 0x28, 0x0b, 0xe6, 0xbf, 0x84, 0x72, 0xca, 0xb5, 0xa4, 0x7b, 0xf3, 0x7c, 0xba,
+	0x82, 0xf7, 0x14, 0x5d, 0xff, 0x15, 0x5c, 0x5f, 0xf1, 0xa6, 0x25, 0x8e, 0x7f, 0xe7, 0x0c, 0xc7,
+	0xb7, 0x33, 0x94, 0xd7, 0xfb, 0x61, 0x86, 0xe7, 0xa7, 0xb0, 0xbb, 0x9e, 0xba, 0x4a, 0x87, 0x2b,
+	0x5c, 0xdf, 0x7a, 0x1b, 0xed, 0x65, 0xbe, 0xff, 0x32, 0x07, 0x57, 0xd7, 0xa2, 0xa0, 0x6f, 0x56,
+	0x92, 0xec, 0xa7, 0x17, 0x11, 0x7d, 0x5f, 0x99, 0xf6, 0xbf, 0xf2, 0x50, 0xcb, 0x54, 0x42, 0xe8,
+	0x33, 0xd8, 0x9c, 0xf1, 0xd3, 0xaa, 0x80, 0x74, 0x25, 0xc3, 0x07, 0x47, 0x3b, 0x14, 0x92, 0x90,
+	0x28, 0x68, 0x87, 0x27, 0x89, 0x88, 0x04, 0xee, 0x8c, 0xaa, 0x1c, 0x54, 0x76, 0xa3, 0xa8, 0xe7,
+	0xce, 0x28, 0x9f, 0x3a, 0x7e, 0x93, 0xd0, 0x98, 0xb0, 0xd7, 0xa9, 0x0f, 0x88, 0x6f, 0xfc, 0x1a,
+	0xdd, 0x86, 0x7a, 0x4c, 0xd9, 0x4b, 0x7f, 0x4c, 0x89, 0xc8, 0xe6, 0x32, 0x0a, 0xd5, 0x14, 0x4c,
+	0x64, 0xe7, 0x6b, 0x50, 0x8e, 0xd9, 0x98, 0xcc, 0xdc, 0xb1, 0x08, 0x44, 0x55, 0x5c, 0x8a, 0xd9,
+	0xf8, 0xd0, 0x1d, 0xf3, 0x09, 0x2f, 0x4e, 0xc4, 0x44, 0x49, 0x4e, 0x78, 0x71, 0xc2, 0x27, 0xf6,
+	0x61, 0x33, 0xe6, 0xd5, 0x8e, 0x08, 0x2e, 0xcd, 0x25, 0x9d, 0x64, 0x4e, 0x27, 0xc6, 0xb2, 0x2a,
+	0x92, 0xe8, 0x7a, 0x08, 0xd5, 0x05, 0x0c, 0x69, 0x50, 0xef, 0x74, 0xfb, 0xdf, 0x92, 0x36, 0xb6,
+	0xb8, 0x8c, 0xb4, 0x0d, 0xf4, 0x21, 0x5c, 0x17, 0x90, 0xd4, 0x3b, 0xdb, 0x5d, 0xc3, 0x71, 0xec,
+	0x8e, 0xdd, 0x36, 0x86, 0x76, 0xbf, 0xa7, 0xe5, 0xd0, 0x0d, 0xd8, 0x11, 0x08, 0x1d, 0xbb, 0x77,
+	0x76, 0x3a, 0xbf, 0xa0, 0x68, 0x3d, 0x1d, 0xd8, 0xd8, 0xe2, 0x25, 0xc5, 0x1f, 0x43, 0x5d, 0x32,
+	0x14, 0x47, 0x61, 0x10, 0x53, 0xb4, 0xbf, 0xa2, 0xf8, 0x9b, 0x67, 0x38, 0x97, 0x88, 0xef, 0x4b,
+	0xdf, 0xff, 0x92, 0x03, 0x6d, 0xb5, 0xfc, 0xfd, 0x3e, 0x39, 0x68, 0x07, 0x2a, 0x33, 0x77, 0x9c,
+	0xad, 0x3b, 0xca, 0x33, 0x77, 0xbc, 0x92, 0xd6, 0x0b, 0x52, 0x37, 0x2a, 0xad, 0xdf, 0x84, 0x9a,
+	0x1b, 0x91, 0xc5, 0x2a, 0xa9, 0xef, 0xaa, 0x1b, 0x1d, 0xaa, 0x75, 0xd7, 0xa0, 0xec, 0x2a, 0x2b,
+	0x52, 0xda, 0x76, 0xa5, 0x11, 0x7d, 0x0c, 0xcd, 0xc8, 0x8b, 0x48, 0x9c, 0xb8, 0x2c, 0x21, 0x89,
+	0x3f, 0xa3, 0x42, 0xe9, 0x45, 0x5c, 0x8f, 0xbc, 0xc8, 0xe1, 0xc0, 0xa1, 0x3f, 0xa3, 0xfa, 0xaf,
+	0x73, 0x70, 0x75, 0xa5, 0xf0, 0x95, 0x55, 0xee, 0x7b, 0x3a, 0x56, 0x07, 0x6a, 0xb2, 0xee, 0x96,
+	0xe6, 0x5a, 0x10, 0x6a, 0xfa, 0x64, 0x2d, 0xb5, 0xcc, 0xe6, 0x7b, 0x22, 0xf7, 0x82, 0x5c, 0xc9,
+	0xc7, 0xfa, 0x03, 0x28, 0x0a, 0xe3, 0xde, 0x82, 0xda, 0x91, 0xd1, 0xb5, 0x4d, 0xf2, 0x64, 0xd4,
+	0x1f, 0x1a, 0xda, 0x06, 0xaf, 0x39, 0x7b, 0x7d, 0xf5, 0x95, 0x43, 0x0d, 0xa8, 0x0e, 0x2d, 0x7c,
+	0x68, 0xf7, 0x8c, 0x21, 0x0f, 0xfc, 0x04, 0x6e, 0x5f, 0x58, 0xdb, 0xf3, 0x98, 0x74, 0xda, 0x1a,
+	0xac, 0xc6, 0xa4, 0xb5, 0xec, 0xe1, 0x74, 0x81, 0xce, 0x60, 0x6b, 0xe8, 0x1e, 0x4f, 0xa9, 0x11,
+	0xc7, 0xfe, 0x49, 0x30, 0xa3, 0x41, 0xb2, 0xe4, 0xd7, 0xb9, 0x65, 0xbf, 0xbe, 0x01, 0x30, 0x73,
+	0xfd, 0x80, 0x24, 0x7c, 0x89, 0x6a, 0x1e, 0xaa, 0x1c, 0x22, 0x68, 0xa0, 0x4f, 0xa0, 0x19, 0x8f,
+	0x19, 0x0f, 0x0e, 0x12, 0x83, 0x37, 0x83, 0x85, 0x3b, 0x45, 0xdc, 0x50, 0x50, 0x81, 0x15, 0xeb,
+	0xbf, 0x0f, 0x97, 0x8d, 0xe9, 0x74, 0x65, 0xdb, 0x18, 0x1d, 0xc0, 0x25, 0xb1, 0x8a, 0xb8, 0xa7,
+	0x40, 0x75, 0xa0, 0x6c, 0xe9, 0xb6, 0xb2, 0x0e, 0x6b, 0xc9, 0x0a, 0x21, 0xfd, 0x6b, 0xde, 0x3f,
+	0x32, 0xdf, 0x9d, 0xfa, 0x7f, 0x48, 0x3d, 0xfc, 0x66, 0x3e, 0x70, 0xc7, 0xcf, 0x69, 0x82, 0x34,
+	0x28, 0x44, 0xcf, 0xa5, 0xa3, 0xd5, 0x31, 0x1f, 0x22, 0x04, 0x45, 0x7f, 0x16, 0xfb, 0x4a, 0xe5,
+	0x62, 0xac, 0xef, 0xc1, 0x25, 0x89, 0xcf, 0x4b, 0x18, 0xb1, 0x97, 0x2d, 0xec, 0x43, 0xb2, 0xa6,
+	0xec, 0x69, 0x13, 0x97, 0x13, 0x39, 0xa5, 0xff, 0x4f, 0x0e, 0xaa, 0x9d, 0x78, 0x46, 0x44, 0x40,
+	0x41, 0x3f, 0x4d, 0x03, 0x91, 0x74, 0xe7, 0x1b, 0x59, 0x77, 0x4e, 0x91, 0xf8, 0x68, 0x29, 0x0a,
+	0xfd, 0x6d, 0x0e, 0x2a, 0x29, 0x8c, 0x7b, 0xad, 0x63, 0x39, 0x8e, 0xdd, 0xef, 0x11, 0xa3, 0x3d,
+	0xb4, 0x8f, 0x2c, 0x6d, 0x03, 0x6d, 0x03, 0x4a, 0x61, 0x0b, 0xe3, 0x30, 0xb5, 0x22, 0xba, 0x0d,
+	0x37, 0x56, 0xe1, 0x7c, 0xec, 0xb4, 0x1f, 0x59, 0xe6, 0xa8, 0x6b, 0x99, 0xda, 0x26, 0xba, 0x02,
+	0x5a, 0x8a, 0x82, 0xad, 0xae, 0x65, 0x38, 0x96, 0xa9, 0x95, 0xb8, 0xcd, 0x89, 0x28, 0x67, 0xf7,
+	0x0e, 0xb4, 0x32, 0x8f, 0x1a, 0x69, 0xcc, 0xab, 0x20, 0x80, 0x92, 0xda, 0xb7, 0xca, 0xd1, 0xec,
+	0x9e, 0xfa, 0x02, 0x8e, 0xa6, 0x48, 0x68, 0x35, 0xfd, 0x4f, 0x72, 0x00, 0x8e, 0x37, 0xe9, 0xf8,
+	0xd3, 0x84, 0xb2, 0x18, 0xdd, 0x85, 0xfc, 0x24, 0x75, 0xb5, 0x9d, 0x95, 0x18, 0x66, 0x52, 0x6e,
+	0x80, 0x51, 0x12, 0x32, 0x9c, 0x9f, 0x78, 0x5c, 0x0d, 0x49, 0x32, 0x16, 0x32, 0xaf, 0x63, 0x3e,
+	0xe4, 0x90, 0x38, 0xf2, 0x85, 0x6b, 0xd5, 0x31, 0x1f, 0xa2, 0x26, 0xe4, 0x27, 0x53, 0x11, 0x2a,
+	0xea, 0x38, 0x3f, 0x99, 0xa2, 0xab, 0x50, 0x8a, 0xbd, 0x09, 0x97, 0xfe, 0xa6, 0x28, 0x0b, 0x37,
+	0x63, 0x6f, 0x62, 0x7b, 0xfa, 0x1f, 0x40, 0x73, 0x79, 0x03, 0xf4, 0xf9, 0x72, 0xfe, 0xba, 0xb6,
+	0x2e, 0x7f, 0xf5, 0xe8, 0xab, 0x34, 0x85, 0xdd, 0x85, 0x12, 0x4f, 0xae, 0xaa, 0x62, 0x6f, 0xde,
+	0xbf, 0xb4, 0x52, 0x82, 0x84, 0x01, 0x56, 0x08, 0xfa, 0x5f, 0xe7, 0x64, 0xe8, 0x4e, 0x49, 0x70,
+	0x9b, 0xf0, 0xa3, 0x97, 0x0f, 0x48, 0xcc, 0xc6, 0xa9, 0x9b, 0xf0, 0x6f, 0x87, 0x8d, 0x17, 0x53,
+	0x5e, 0x9c, 0xa4, 0xe1, 0x84, 0x7f, 0x9b, 0x71, 0xc2, 0xcb, 0x61, 0x71, 0x41, 0x33, 0x0e, 0xa7,
+	0xa7, 0x01, 0xa5, 0x8a, 0xeb, 0x29, 0x50, 0xc4, 0x88, 0x1d, 0xa8, 0xf0, 0x3c, 0x17, 0x85, 0x2c,
 	0x11, 0x42, 0x68, 0x60, 0x9e, 0xf7, 0x06, 0x21, 0x13, 0xce, 0xc9, 0x73, 0xa3, 0x98, 0x92, 0xb2,
-	0xe0, 0xb9, 0x92, 0x4f, 0xe9, 0xff, 0x92, 0x83, 0x3a, 0xa6, 0x9e, 0xcf, 0xe8, 0x38, 0xb1, 0x83,
-	0x49, 0x88, 0x9e, 0x40, 0x9d, 0x51, 0x8f, 0x47, 0x35, 0x92, 0x69, 0xe8, 0xee, 0x2e, 0x95, 0xb1,
-	0x17, 0xe8, 0x8b, 0x0f, 0x1e, 0xf6, 0x64, 0xf8, 0x62, 0xd4, 0x33, 0x3c, 0x4f, 0xb0, 0xf4, 0x5b,
-	0xb0, 0xc5, 0x69, 0xf1, 0x34, 0x4d, 0x59, 0x36, 0x50, 0x36, 0x18, 0xf5, 0x1c, 0x01, 0xe5, 0xeb,
-	0xf4, 0x63, 0xd0, 0x56, 0xe9, 0xa0, 0x0a, 0x14, 0xed, 0xc1, 0xe9, 0x43, 0x6d, 0x43, 0x8d, 0x8e,
-	0xb4, 0x1c, 0x2a, 0x43, 0x61, 0x84, 0xbb, 0x5a, 0x9e, 0xdb, 0x9b, 0x63, 0x0f, 0x46, 0xd8, 0xd6,
-	0x0a, 0x7c, 0xcc, 0x11, 0x4f, 0x8f, 0xb4, 0xa2, 0x7e, 0x0e, 0xd7, 0xfb, 0xf3, 0x84, 0xb2, 0xc7,
-	0xd4, 0xf5, 0x28, 0x6b, 0x33, 0xea, 0x72, 0x35, 0x70, 0x4b, 0x08, 0x49, 0x42, 0x95, 0x1f, 0x36,
-	0xf0, 0x66, 0x38, 0xa4, 0xbe, 0x87, 0xf6, 0xa1, 0x7e, 0x1e, 0x9c, 0x11, 0x21, 0x75, 0x77, 0xc1,
-	0x1b, 0x9c, 0x07, 0x67, 0x76, 0xf4, 0xf2, 0xa1, 0x21, 0xd3, 0x0c, 0x17, 0x1a, 0x09, 0x42, 0x21,
-	0xf2, 0x06, 0x2e, 0xf1, 0xcf, 0x5e, 0xa8, 0xff, 0x2b, 0xf7, 0xbe, 0x57, 0xde, 0xc0, 0x65, 0xee,
-	0x8c, 0x07, 0x38, 0x8f, 0x17, 0xfe, 0xfe, 0xc4, 0x1d, 0x53, 0xb5, 0x45, 0x95, 0x43, 0x6c, 0x0e,
+	0xe0, 0xb9, 0x92, 0x4f, 0xe9, 0xff, 0x94, 0x83, 0x3a, 0xa6, 0x9e, 0xcf, 0xe8, 0x38, 0xb1, 0x83,
+	0x49, 0x88, 0x1e, 0x43, 0x9d, 0x51, 0x8f, 0x47, 0x35, 0x92, 0x69, 0x9c, 0xef, 0x2c, 0xb5, 0x0b,
+	0xa7, 0xe8, 0x8b, 0x0f, 0x1e, 0xf6, 0x64, 0xf8, 0x62, 0xd4, 0x33, 0x3c, 0x4f, 0xb0, 0xf4, 0x23,
+	0xd8, 0xe2, 0xb4, 0x78, 0x9a, 0xa6, 0x2c, 0x1b, 0x28, 0x1b, 0x8c, 0x7a, 0x8e, 0x80, 0xf2, 0x75,
+	0xfa, 0x01, 0x68, 0xab, 0x74, 0x50, 0x05, 0x8a, 0xf6, 0xe0, 0xe8, 0x81, 0xb6, 0xa1, 0x46, 0xfb,
+	0x5a, 0x0e, 0x95, 0xa1, 0x30, 0xc2, 0x5d, 0x2d, 0xcf, 0xed, 0xcd, 0xb1, 0x07, 0x23, 0x6c, 0x6b,
+	0x05, 0x3e, 0xe6, 0x88, 0x47, 0xfb, 0x5a, 0x51, 0x3f, 0x81, 0xcb, 0xfd, 0x79, 0x42, 0xd9, 0x23,
+	0xea, 0x7a, 0x94, 0xb5, 0x19, 0x75, 0xb9, 0x1a, 0xb8, 0x25, 0x84, 0x24, 0xa1, 0xca, 0x0f, 0x1b,
+	0x78, 0x33, 0x1c, 0x52, 0xdf, 0x43, 0xb7, 0xa0, 0x7e, 0x12, 0x1c, 0x13, 0x21, 0x75, 0x77, 0xc1,
+	0x1b, 0x9c, 0x04, 0xc7, 0x76, 0xf4, 0xf2, 0x81, 0x21, 0xd3, 0x0c, 0x17, 0x1a, 0x09, 0x42, 0x21,
+	0xf2, 0x06, 0x2e, 0xf1, 0xcf, 0x5e, 0xa8, 0xff, 0x33, 0xf7, 0xbe, 0x57, 0xde, 0xc0, 0x65, 0xee,
+	0x8c, 0x07, 0x38, 0x8f, 0x37, 0x58, 0xfe, 0xc4, 0x1d, 0x53, 0xb5, 0x45, 0x95, 0x43, 0x6c, 0x0e,
 	0xe0, 0xc5, 0x4b, 0x40, 0x13, 0xe2, 0x07, 0x71, 0xe2, 0x06, 0xe3, 0xb4, 0xec, 0xa9, 0x05, 0x34,
-	0xb1, 0x15, 0x08, 0xfd, 0x0c, 0xb8, 0x44, 0x84, 0x00, 0x88, 0x1f, 0x4c, 0x42, 0xd5, 0x3c, 0xec,
-	0xbc, 0x45, 0xea, 0xb8, 0xce, 0xb2, 0x2a, 0xfb, 0x05, 0xd4, 0xc3, 0x79, 0xc2, 0xc8, 0x37, 0xd4,
-	0xf5, 0xc8, 0x58, 0x66, 0xcb, 0xda, 0x52, 0x55, 0xb0, 0x46, 0x28, 0x18, 0xf8, 0x1a, 0x0e, 0x6b,
-	0x33, 0xfd, 0x1e, 0x54, 0xcc, 0x79, 0xf4, 0x3e, 0xa7, 0xe1, 0xa1, 0xab, 0x30, 0x30, 0x6d, 0x6e,
-	0x93, 0xdc, 0xa6, 0xfc, 0x20, 0xa1, 0x2c, 0x83, 0x59, 0x8f, 0xd9, 0xd8, 0x4e, 0x61, 0x5c, 0xc2,
-	0xd3, 0x70, 0xec, 0x4e, 0xc9, 0x44, 0x8a, 0x5f, 0xb6, 0x5e, 0x20, 0x60, 0x1d, 0xa1, 0x83, 0x55,
-	0xe1, 0x14, 0x2e, 0x0b, 0x67, 0x0f, 0xaa, 0x73, 0x4a, 0x44, 0x63, 0x94, 0x56, 0x02, 0xe5, 0x39,
-	0xb5, 0x23, 0xae, 0xa0, 0x16, 0x54, 0x12, 0x46, 0x68, 0x94, 0x7a, 0x79, 0x1d, 0x97, 0x12, 0x66,
-	0x45, 0xb6, 0x87, 0x8e, 0xa0, 0xc6, 0xbd, 0x7f, 0x22, 0x63, 0x8d, 0x6a, 0x94, 0xb3, 0x77, 0x02,
-	0x17, 0x81, 0x08, 0x43, 0x7c, 0x11, 0x94, 0x6e, 0x42, 0x89, 0x27, 0x32, 0xdf, 0x13, 0x65, 0x61,
-	0x15, 0x6f, 0xba, 0x51, 0x64, 0x7b, 0xfa, 0x7f, 0x14, 0xa0, 0xe6, 0xd0, 0xe4, 0x98, 0x85, 0xf3,
-	0x68, 0x60, 0x62, 0x8e, 0x16, 0x79, 0x8c, 0x5c, 0x98, 0x54, 0xe4, 0x31, 0xdb, 0x43, 0x1f, 0x41,
-	0x8d, 0x83, 0xb3, 0xad, 0xe6, 0x26, 0x86, 0xc8, 0x63, 0xaa, 0xfb, 0x41, 0xb7, 0x01, 0x22, 0x46,
-	0xc7, 0xd4, 0xa3, 0xe9, 0x69, 0x1b, 0x38, 0x03, 0x41, 0xbf, 0x03, 0x55, 0x4e, 0x40, 0xe6, 0x83,
-	0xa2, 0xf0, 0xbd, 0xeb, 0xd9, 0x8b, 0x0c, 0x8f, 0xc9, 0x2c, 0x50, 0x89, 0xd4, 0x08, 0xed, 0x43,
-	0x21, 0xf2, 0x7c, 0x75, 0x91, 0xd0, 0xcc, 0xe2, 0x9a, 0x36, 0xe6, 0x53, 0xe8, 0x0e, 0x34, 0x42,
-	0xf2, 0x0d, 0xe1, 0x3d, 0x20, 0xf1, 0x68, 0x2c, 0xeb, 0xe0, 0x06, 0x86, 0xf0, 0x31, 0xa6, 0xb3,
-	0x90, 0x07, 0x42, 0x74, 0x17, 0x34, 0xd1, 0x30, 0x50, 0x12, 0x71, 0x8f, 0x15, 0xd7, 0x28, 0xf2,
-	0xfc, 0x4d, 0x09, 0x1f, 0x30, 0xea, 0xf1, 0x6e, 0x05, 0x3d, 0x04, 0x88, 0x69, 0x42, 0xce, 0x19,
-	0x99, 0xb8, 0x4c, 0x34, 0x82, 0xb5, 0xc3, 0xed, 0xe5, 0x6b, 0x27, 0x21, 0xa4, 0x8e, 0x81, 0x71,
-	0x25, 0xe6, 0x1f, 0x1d, 0x97, 0xa1, 0xa7, 0x70, 0xdd, 0x5b, 0xb4, 0x24, 0xa2, 0x35, 0x25, 0x8c,
-	0xbe, 0x10, 0x97, 0x08, 0xb5, 0xc3, 0x3b, 0xef, 0x6a, 0x5c, 0xe4, 0x0d, 0xd9, 0x35, 0x6f, 0x09,
-	0x8e, 0xe9, 0x0b, 0xf4, 0x4b, 0xb8, 0x76, 0x99, 0x20, 0x08, 0x82, 0x57, 0x5e, 0xf5, 0x6d, 0xad,
-	0x10, 0xd3, 0xff, 0x29, 0x77, 0xa1, 0xde, 0x8e, 0x21, 0xd4, 0x3b, 0x71, 0xb3, 0xea, 0x9d, 0xb8,
-	0x5c, 0xbd, 0xbf, 0x80, 0xeb, 0x1c, 0x2c, 0xa3, 0x3b, 0x49, 0x42, 0xe2, 0x46, 0xd1, 0xf4, 0x8d,
-	0x68, 0xec, 0xd6, 0xe6, 0x01, 0x6d, 0xe2, 0x32, 0x39, 0x1c, 0x86, 0x06, 0x47, 0x45, 0x07, 0x50,
-	0x99, 0xbc, 0xf2, 0x48, 0xe4, 0xb2, 0x99, 0x72, 0xf2, 0xac, 0x7a, 0xd3, 0x90, 0x82, 0xcb, 0x13,
-	0x31, 0x9a, 0x71, 0x7c, 0x6f, 0xce, 0xd1, 0xdd, 0x99, 0xf2, 0xeb, 0x2c, 0x7e, 0xea, 0xb4, 0xb8,
-	0xec, 0xcd, 0xc5, 0x40, 0xff, 0xab, 0x3c, 0x80, 0x23, 0xef, 0xab, 0x1d, 0x2a, 0x32, 0xc7, 0xc5,
-	0xdd, 0xf4, 0x45, 0x1b, 0x5d, 0xbf, 0x00, 0xda, 0xde, 0x7b, 0x78, 0xe9, 0xa7, 0xb0, 0x95, 0x5e,
-	0x82, 0x67, 0xbb, 0xe7, 0x06, 0x6e, 0x2a, 0x70, 0x6a, 0xde, 0xf7, 0xa1, 0x1c, 0x84, 0x9e, 0x28,
-	0x79, 0x24, 0xb7, 0x59, 0xa1, 0xf4, 0x42, 0x8f, 0xda, 0x26, 0x2e, 0x71, 0x0c, 0xdb, 0xe3, 0x6d,
-	0xa3, 0x34, 0xf3, 0xcd, 0xcb, 0x6d, 0x63, 0x5a, 0xf6, 0xa8, 0x6a, 0x27, 0x63, 0x75, 0x91, 0xc7,
-	0x5a, 0x25, 0x51, 0xdf, 0xad, 0xb3, 0xba, 0x81, 0x99, 0x5a, 0xdd, 0xc0, 0x63, 0xfa, 0x7f, 0xe6,
-	0x60, 0x7b, 0x34, 0xe8, 0x28, 0x79, 0xb4, 0xc3, 0x20, 0xa1, 0xaf, 0x13, 0xe9, 0x35, 0x3f, 0x02,
-	0x18, 0xbb, 0xf3, 0x98, 0xca, 0x70, 0x2b, 0x13, 0x3f, 0xca, 0x10, 0x6c, 0xf3, 0x49, 0xdb, 0xc2,
-	0x55, 0x81, 0x25, 0xc2, 0xac, 0x05, 0x5a, 0x2a, 0x84, 0x38, 0x70, 0xa3, 0xf8, 0x9b, 0x50, 0x26,
-	0xea, 0xe5, 0x4a, 0xf3, 0x62, 0x3f, 0xe9, 0xa8, 0xa9, 0xe0, 0x1c, 0xb5, 0x04, 0xd9, 0xb0, 0x35,
-	0x71, 0xfd, 0xe9, 0x9c, 0x51, 0x92, 0xde, 0x6d, 0x14, 0x2e, 0xb9, 0x41, 0x47, 0x62, 0x70, 0x8f,
-	0xe3, 0x7b, 0xb3, 0x99, 0x8c, 0xd9, 0x8d, 0x49, 0x06, 0xee, 0xe9, 0x7f, 0x53, 0x84, 0xb2, 0x62,
-	0x14, 0xfd, 0x14, 0x2a, 0xea, 0x40, 0x74, 0x4d, 0x5b, 0xa8, 0xb0, 0xe4, 0xef, 0xa9, 0x3b, 0x9d,
-	0xd3, 0x18, 0x97, 0xe5, 0xd1, 0xa8, 0xfe, 0xef, 0x05, 0xa8, 0x65, 0x26, 0x78, 0x05, 0x87, 0x2d,
-	0xc7, 0xc2, 0xa7, 0xa2, 0x9f, 0xbd, 0x01, 0x1a, 0xb6, 0x9e, 0x8e, 0x2c, 0x67, 0x48, 0x8c, 0x76,
-	0xdb, 0x1a, 0xf0, 0x8a, 0x2f, 0x87, 0x6e, 0xc3, 0x5e, 0x0a, 0xc5, 0xd6, 0x13, 0xab, 0xcd, 0xfb,
-	0xc5, 0x5e, 0x9f, 0x60, 0xcb, 0x70, 0x44, 0x17, 0x7b, 0x0b, 0x76, 0xd3, 0x12, 0xb2, 0xdd, 0xef,
-	0x0d, 0xad, 0x67, 0x43, 0xd2, 0xeb, 0x0f, 0x49, 0xa7, 0x3f, 0xea, 0x99, 0x5a, 0x01, 0xb5, 0xe0,
-	0xc6, 0x89, 0xd1, 0x33, 0x8d, 0x61, 0x1f, 0x7f, 0x4d, 0x6c, 0x8b, 0x9c, 0xd8, 0x8e, 0xc3, 0xeb,
-	0xca, 0x22, 0xda, 0x83, 0xed, 0x76, 0xbf, 0x67, 0xda, 0xbc, 0x28, 0x35, 0xba, 0xd9, 0xb9, 0x4d,
-	0x5e, 0xe6, 0xda, 0x3d, 0xd9, 0x08, 0x75, 0xad, 0xde, 0xf1, 0xf0, 0xb1, 0x56, 0xe2, 0xf8, 0x4b,
-	0x94, 0xec, 0x5e, 0xbb, 0x8f, 0xb1, 0xd5, 0x1e, 0x6a, 0x65, 0xce, 0x44, 0x8a, 0xdf, 0xe9, 0xe3,
-	0xaf, 0x0c, 0x6c, 0xda, 0xbd, 0x63, 0x32, 0xe8, 0x77, 0xed, 0xf6, 0xd7, 0x5a, 0x05, 0xfd, 0x00,
-	0xf6, 0x17, 0xd3, 0x64, 0x68, 0xd9, 0x26, 0x31, 0xba, 0xdd, 0xbe, 0x6c, 0xc4, 0x49, 0x7f, 0x20,
-	0xfa, 0xf1, 0x2a, 0xfa, 0x18, 0x3e, 0xea, 0xf5, 0x89, 0xe5, 0x0c, 0x8d, 0x47, 0x5d, 0xdb, 0x79,
-	0x6c, 0x99, 0x64, 0xd0, 0x69, 0x0f, 0x88, 0xe1, 0x38, 0xfd, 0xb6, 0x2d, 0x9b, 0x76, 0x40, 0xf7,
-	0xe0, 0x13, 0x3c, 0xea, 0x5a, 0xf2, 0x1a, 0x40, 0x2c, 0xc7, 0xe4, 0xa4, 0x6f, 0x2e, 0xfa, 0x7a,
-	0x92, 0x76, 0xd8, 0x35, 0xf4, 0x21, 0xb4, 0x04, 0x01, 0xab, 0x37, 0xe4, 0x1c, 0x0b, 0xf9, 0x1c,
-	0x5b, 0x8e, 0x20, 0x54, 0xe7, 0xc7, 0x11, 0x62, 0x74, 0xfa, 0x23, 0xdc, 0xb6, 0x1c, 0x62, 0x9c,
-	0x1a, 0x76, 0xd7, 0x78, 0xd4, 0xb5, 0xb4, 0x06, 0xda, 0x85, 0x9b, 0x5c, 0x2b, 0x76, 0xdb, 0x12,
-	0xb2, 0x74, 0x46, 0x83, 0x41, 0x1f, 0x73, 0x75, 0x34, 0x45, 0x03, 0xf0, 0xb5, 0x33, 0xb4, 0x4e,
-	0x16, 0x1b, 0x6d, 0xe9, 0x8f, 0x60, 0x7b, 0xbd, 0x19, 0xa1, 0xbb, 0x3c, 0x65, 0x30, 0xd5, 0x26,
-	0x65, 0xdd, 0xa8, 0x3f, 0x99, 0xd0, 0xc0, 0xf3, 0x83, 0x73, 0xdb, 0xe2, 0xa9, 0x83, 0xe9, 0xff,
-	0x95, 0x83, 0x5a, 0x06, 0xc8, 0xd3, 0x97, 0xef, 0xd1, 0x20, 0xf1, 0x27, 0x3e, 0x65, 0x2a, 0x36,
-	0x66, 0x20, 0x6f, 0xbf, 0x66, 0x45, 0x5f, 0x41, 0xeb, 0x45, 0x18, 0x13, 0xca, 0xd9, 0x18, 0x2b,
-	0xd3, 0x4f, 0x2f, 0xc6, 0x0a, 0x97, 0x0a, 0x96, 0x35, 0x17, 0x6a, 0xf8, 0xe6, 0x8b, 0x30, 0xb6,
-	0xe4, 0x72, 0x71, 0x93, 0x2f, 0x17, 0xa3, 0xc7, 0xb0, 0xe5, 0xd1, 0x29, 0x79, 0x41, 0xd9, 0x82,
-	0x9e, 0x0c, 0x3d, 0xfb, 0x57, 0xdd, 0x87, 0xe1, 0x86, 0x47, 0xa7, 0x4f, 0x29, 0x53, 0x94, 0xf4,
-	0x7f, 0xce, 0x43, 0xc5, 0x1e, 0x88, 0xe6, 0xa0, 0xcb, 0xcb, 0x20, 0x1e, 0x71, 0x44, 0xe4, 0x8d,
-	0xd3, 0x32, 0x28, 0xa6, 0x89, 0x08, 0xb3, 0x31, 0x8f, 0x99, 0xc9, 0x38, 0x22, 0x8b, 0x8a, 0x5b,
-	0xc5, 0xcc, 0x64, 0x1c, 0x99, 0xaa, 0xe8, 0x56, 0x18, 0x8b, 0xc2, 0xbb, 0xb0, 0xc0, 0x70, 0x64,
-	0xed, 0xcd, 0x31, 0xe6, 0x5e, 0x86, 0x86, 0xac, 0xda, 0x61, 0xee, 0x65, 0x69, 0x70, 0x8c, 0x95,
-	0xe2, 0x9d, 0x63, 0xa4, 0x34, 0x44, 0xd7, 0x40, 0x44, 0x23, 0xa0, 0xd2, 0x7a, 0xd9, 0x8f, 0x06,
-	0xe2, 0x65, 0xf4, 0x87, 0x50, 0x12, 0x15, 0x5a, 0x24, 0x32, 0xf9, 0x72, 0x80, 0xb5, 0x07, 0xbc,
-	0xd0, 0xa6, 0x71, 0x8c, 0x37, 0x79, 0xc1, 0x16, 0xa1, 0xcf, 0xa0, 0x2c, 0xab, 0xbe, 0x48, 0xe5,
-	0xf4, 0xf5, 0xd8, 0x25, 0x51, 0x08, 0x46, 0x2b, 0x65, 0x4c, 0x75, 0xb5, 0x8c, 0xd1, 0x7f, 0x95,
-	0x83, 0xe6, 0xc8, 0xca, 0x06, 0x42, 0xd4, 0x87, 0xad, 0x39, 0x25, 0xe3, 0x30, 0x98, 0xf8, 0xe7,
-	0x24, 0xdb, 0xef, 0x7e, 0xba, 0xf4, 0xfa, 0x97, 0x5d, 0x73, 0x30, 0xb2, 0xda, 0x02, 0x5f, 0x86,
-	0xd2, 0xc6, 0x9c, 0x66, 0x3e, 0xf5, 0xd7, 0xd0, 0x58, 0x9a, 0xcf, 0x74, 0xa1, 0x1b, 0x48, 0x83,
-	0xfa, 0xa8, 0x87, 0xad, 0x63, 0xdb, 0x19, 0x5a, 0x58, 0x44, 0x2c, 0x0d, 0xea, 0x76, 0xcf, 0x19,
-	0x1a, 0xdd, 0x2e, 0xb1, 0xcd, 0xae, 0xa5, 0xe5, 0xb9, 0xd3, 0x8c, 0x7a, 0x4b, 0xb0, 0x82, 0x70,
-	0xa4, 0x91, 0x33, 0xb0, 0x7a, 0xa6, 0x65, 0x12, 0xd3, 0x18, 0x1a, 0x5a, 0x11, 0x6d, 0x41, 0x0d,
-	0x5b, 0xce, 0xe8, 0xc4, 0x92, 0x80, 0x4d, 0xfd, 0xff, 0x0a, 0x50, 0xbf, 0xe0, 0x94, 0x26, 0xbc,
-	0x7e, 0xbf, 0x9c, 0x66, 0xdf, 0x71, 0x7f, 0xb4, 0x9c, 0x7f, 0x97, 0x85, 0x99, 0xbf, 0x54, 0x13,
-	0xfe, 0x4c, 0x48, 0x4e, 0xb5, 0x29, 0x42, 0x0f, 0xca, 0x63, 0xd6, 0xeb, 0xa8, 0xc1, 0x8b, 0x63,
-	0xde, 0xbf, 0x88, 0xcf, 0x8b, 0xd5, 0x47, 0x8b, 0xd5, 0xc5, 0x2b, 0x57, 0x1f, 0xa5, 0xab, 0xbf,
-	0x80, 0x26, 0x15, 0x3d, 0xd2, 0x62, 0xf1, 0xe6, 0x3b, 0x16, 0xd7, 0x29, 0xef, 0x9d, 0xd2, 0xb5,
-	0x1a, 0x14, 0xdc, 0x28, 0x50, 0xb7, 0xae, 0x7c, 0x88, 0x10, 0x14, 0x5f, 0x4e, 0xdd, 0x40, 0x3d,
-	0x33, 0x88, 0xb1, 0x78, 0xf4, 0x08, 0x64, 0xe1, 0x21, 0x9f, 0x15, 0x4a, 0x7e, 0x20, 0x8a, 0x8e,
-	0x5d, 0xa8, 0x84, 0xf3, 0x44, 0xce, 0x48, 0x0b, 0x2b, 0x87, 0xf3, 0x44, 0x4c, 0xb5, 0x41, 0x9b,
-	0x53, 0xb2, 0xc8, 0xc6, 0xc2, 0x98, 0xe0, 0xd2, 0x3d, 0xc2, 0xb2, 0x31, 0xe1, 0xe6, 0x9c, 0x2e,
-	0x19, 0xe4, 0x8f, 0x00, 0x7c, 0xf9, 0x4c, 0x42, 0xbc, 0x69, 0xab, 0x71, 0xa9, 0xb8, 0x4a, 0x43,
-	0x01, 0xae, 0xf8, 0xe2, 0xb9, 0xc4, 0x9c, 0xea, 0xff, 0x93, 0x83, 0xd6, 0x82, 0xaa, 0xaa, 0x27,
-	0x16, 0xd7, 0xb2, 0x6b, 0xd4, 0x94, 0xfb, 0x4e, 0x6a, 0xca, 0xbf, 0xbf, 0x9a, 0x3e, 0x81, 0x66,
-	0x18, 0x51, 0xe6, 0xca, 0xba, 0x34, 0xbd, 0x22, 0x68, 0xe0, 0xc6, 0x02, 0x2a, 0x9a, 0xea, 0xe5,
-	0xaa, 0xa7, 0xf8, 0x1e, 0x55, 0x8f, 0xfe, 0x04, 0xb6, 0x8e, 0xa9, 0x28, 0x9a, 0x16, 0xcf, 0x62,
-	0xdb, 0x50, 0x1a, 0x87, 0xe1, 0x73, 0x3f, 0xed, 0xf9, 0xd4, 0x17, 0x6f, 0x7e, 0xe4, 0x88, 0xcc,
-	0xdc, 0xf8, 0x79, 0x6a, 0xc8, 0x12, 0x74, 0xe2, 0xc6, 0xcf, 0xef, 0x7f, 0x01, 0x25, 0x59, 0x0d,
-	0xf3, 0x9e, 0xde, 0xc4, 0xfd, 0x81, 0xec, 0xee, 0x79, 0x6e, 0xd6, 0x72, 0x7c, 0xf4, 0x68, 0xd4,
-	0xe9, 0x68, 0x79, 0x3e, 0xea, 0xf5, 0xdb, 0x03, 0xad, 0x20, 0xf0, 0x46, 0x83, 0xae, 0x56, 0xbc,
-	0xff, 0x39, 0x5c, 0x77, 0xc2, 0x39, 0x1b, 0xd3, 0x45, 0x77, 0x29, 0x4e, 0x24, 0x7c, 0x5e, 0x5d,
-	0x64, 0x57, 0xa0, 0xd8, 0xee, 0x8b, 0x5b, 0x6c, 0x80, 0x92, 0x73, 0xec, 0x77, 0x8d, 0x9e, 0x96,
-	0xbf, 0xff, 0x19, 0x54, 0xd2, 0xae, 0x09, 0xd5, 0xa0, 0xac, 0xfc, 0x5d, 0xdb, 0xe0, 0x48, 0xd8,
-	0x3a, 0xe9, 0x9f, 0x5a, 0x72, 0x6f, 0x19, 0x14, 0x0e, 0xff, 0xbc, 0x06, 0xd5, 0x41, 0xfa, 0x1f,
-	0x13, 0xf4, 0x0c, 0x76, 0xb2, 0xff, 0x76, 0xe0, 0x2a, 0x67, 0xe1, 0x74, 0xca, 0x1b, 0xc5, 0xdb,
-	0xab, 0x6f, 0xed, 0xcb, 0xff, 0x88, 0xd8, 0xfb, 0xe0, 0x1d, 0x6f, 0xf1, 0xfa, 0x06, 0xea, 0x42,
-	0xd3, 0xa1, 0x89, 0x73, 0x92, 0x56, 0x8b, 0x31, 0x5a, 0x6a, 0x4e, 0x17, 0xb1, 0x65, 0xef, 0xce,
-	0xda, 0xe2, 0x32, 0x5b, 0xcc, 0xea, 0x1b, 0x68, 0xa0, 0xfe, 0x1c, 0x20, 0xdf, 0xd6, 0xe4, 0xe3,
-	0xde, 0xad, 0x55, 0x06, 0x96, 0xfe, 0x21, 0x71, 0x15, 0x7f, 0x18, 0x1a, 0x4b, 0x49, 0x18, 0x5d,
-	0xd5, 0x54, 0xed, 0x5d, 0x91, 0xbf, 0xf5, 0x0d, 0xf4, 0x0c, 0xb6, 0x56, 0x12, 0x31, 0xba, 0xba,
-	0xf7, 0xdb, 0xbb, 0x32, 0x8f, 0xeb, 0x1b, 0xc8, 0x80, 0xe6, 0x31, 0x4d, 0xe4, 0x01, 0x47, 0xb1,
-	0x7b, 0x4e, 0x51, 0xda, 0x78, 0x88, 0xff, 0x04, 0x1d, 0x9c, 0x86, 0xbe, 0xb7, 0xb7, 0xb7, 0xf2,
-	0xf2, 0x86, 0xe9, 0x38, 0x64, 0x9e, 0xb8, 0xae, 0xd5, 0x37, 0x90, 0x09, 0x95, 0xd4, 0xd0, 0x51,
-	0x16, 0x73, 0xc5, 0xfa, 0xaf, 0xa0, 0xf2, 0x73, 0x00, 0x71, 0xc3, 0x22, 0xf8, 0x43, 0xdb, 0xeb,
-	0xdf, 0x94, 0xf6, 0x76, 0xde, 0xf2, 0x62, 0x23, 0x09, 0x60, 0xf1, 0x58, 0xfb, 0xeb, 0x12, 0x30,
-	0x61, 0x4b, 0xde, 0xd7, 0xa7, 0x8f, 0x54, 0xf1, 0xaf, 0x43, 0xa5, 0x07, 0x5b, 0x17, 0x7f, 0x76,
-	0x91, 0xaa, 0xfa, 0x70, 0xd5, 0x60, 0xb2, 0x7f, 0x84, 0xb9, 0xca, 0x9c, 0x28, 0xec, 0xbd, 0xfd,
-	0x4d, 0x02, 0x7d, 0xab, 0xbf, 0xcb, 0xbc, 0x0f, 0xdb, 0x8b, 0xe7, 0xaa, 0x35, 0x6c, 0x67, 0xff,
-	0x8c, 0x74, 0x15, 0xdb, 0x1d, 0xa8, 0x1b, 0x9e, 0xb7, 0xa0, 0x86, 0xde, 0xf5, 0x4f, 0xa5, 0x77,
-	0xf1, 0x65, 0x73, 0xcb, 0x9f, 0xd2, 0x84, 0x7e, 0x2f, 0xa4, 0xa4, 0x88, 0xec, 0x41, 0xc7, 0x7e,
-	0xf6, 0x9d, 0x48, 0xfd, 0x12, 0xb6, 0x8f, 0x69, 0xb2, 0xee, 0x59, 0x65, 0x8d, 0xf7, 0x2c, 0xb9,
-	0xf7, 0x9a, 0x25, 0x27, 0xd0, 0x90, 0x7c, 0x8d, 0x2c, 0xa9, 0xd4, 0x9d, 0xb5, 0xa9, 0x98, 0x26,
-	0x7b, 0x1f, 0xaf, 0x9b, 0x58, 0xc9, 0xa6, 0x8f, 0x3e, 0xf8, 0xbd, 0x5d, 0x81, 0xf5, 0x60, 0x9a,
-	0xd0, 0x07, 0xe3, 0x69, 0x38, 0xf7, 0x1e, 0x9c, 0x87, 0xea, 0x0f, 0x75, 0x67, 0x25, 0xf1, 0xfb,
-	0xe3, 0xff, 0x0f, 0x00, 0x00, 0xff, 0xff, 0x39, 0xd5, 0x29, 0x80, 0x19, 0x28, 0x00, 0x00,
+	0xb1, 0x15, 0x08, 0xfd, 0x1c, 0xb8, 0x44, 0x84, 0x00, 0x88, 0x1f, 0x4c, 0x42, 0xd5, 0xa4, 0x5d,
+	0x3b, 0x47, 0xea, 0xb8, 0xce, 0xb2, 0x2a, 0xfb, 0x05, 0xd4, 0xc3, 0x79, 0xc2, 0xc8, 0x33, 0xea,
+	0x7a, 0x64, 0x2c, 0xb3, 0xe5, 0x72, 0x65, 0xbc, 0x46, 0x28, 0x18, 0xf8, 0x1a, 0x0e, 0x6b, 0x33,
+	0xfd, 0x2e, 0x54, 0xcc, 0x79, 0xf4, 0x2e, 0xa7, 0xe1, 0xa1, 0xab, 0x30, 0x30, 0x6d, 0x6e, 0x93,
+	0xdc, 0xa6, 0xfc, 0x20, 0xa1, 0x2c, 0x83, 0x59, 0x8f, 0xd9, 0xd8, 0x4e, 0x61, 0x5c, 0xc2, 0xd3,
+	0x70, 0xec, 0x4e, 0xc9, 0x44, 0x8a, 0x5f, 0xb6, 0xb8, 0x20, 0x60, 0x1d, 0xa1, 0x83, 0x55, 0xe1,
+	0x14, 0xce, 0x0a, 0x67, 0x17, 0xaa, 0x73, 0x4a, 0x44, 0x03, 0x9a, 0x56, 0x02, 0xe5, 0x39, 0xb5,
+	0x23, 0xae, 0xa0, 0x16, 0x54, 0x12, 0x46, 0x68, 0x94, 0x7a, 0x79, 0x1d, 0x97, 0x12, 0x66, 0x45,
+	0xb6, 0x87, 0xf6, 0xa1, 0xc6, 0xbd, 0x7f, 0x22, 0x63, 0x8d, 0xba, 0x90, 0xc8, 0xde, 0xbd, 0x9c,
+	0x06, 0x22, 0x0c, 0xf1, 0x69, 0x50, 0xba, 0x0a, 0x25, 0x9e, 0xc8, 0x7c, 0x4f, 0x94, 0x85, 0x55,
+	0xbc, 0xe9, 0x46, 0x91, 0xed, 0xe9, 0xff, 0x5e, 0x80, 0x9a, 0x43, 0x93, 0x03, 0x16, 0xce, 0xa3,
+	0x81, 0x89, 0x39, 0x5a, 0xe4, 0x31, 0x72, 0x6a, 0x52, 0x91, 0xc7, 0x6c, 0x0f, 0x7d, 0x08, 0x35,
+	0x0e, 0xce, 0xb6, 0xf4, 0x9b, 0x18, 0x22, 0x8f, 0xa9, 0x2e, 0x13, 0xdd, 0x04, 0x88, 0x18, 0x1d,
+	0x53, 0x8f, 0xa6, 0xa7, 0x6d, 0xe0, 0x0c, 0x04, 0xfd, 0x36, 0x54, 0x39, 0x01, 0x99, 0x0f, 0x8a,
+	0xc2, 0xf7, 0x2e, 0x67, 0x2f, 0x8c, 0x3c, 0x26, 0xb3, 0x40, 0x25, 0x52, 0x23, 0x74, 0x0b, 0x0a,
+	0x91, 0xe7, 0xab, 0x0b, 0x9b, 0x66, 0x16, 0xd7, 0xb4, 0x31, 0x9f, 0x42, 0xb7, 0xa1, 0x11, 0x92,
+	0x67, 0x84, 0xf7, 0xda, 0xc4, 0xa3, 0xb1, 0xac, 0x83, 0x1b, 0x18, 0xc2, 0x47, 0x98, 0xce, 0x42,
+	0x1e, 0x08, 0xd1, 0x1d, 0xd0, 0x44, 0xc3, 0x40, 0x49, 0xc4, 0x3d, 0x56, 0x5c, 0x57, 0xc9, 0xf3,
+	0x37, 0x25, 0x7c, 0xc0, 0xa8, 0xc7, 0xbb, 0x42, 0xf4, 0x00, 0x20, 0xa6, 0x09, 0x39, 0x61, 0x64,
+	0xe2, 0x32, 0xd1, 0x70, 0xd7, 0xee, 0x6f, 0x2f, 0x5f, 0xef, 0x09, 0x21, 0x75, 0x0c, 0x8c, 0x2b,
+	0x31, 0xff, 0xe8, 0xb8, 0x0c, 0x3d, 0x81, 0xcb, 0xde, 0xa2, 0x25, 0x11, 0x57, 0x00, 0x84, 0xd1,
+	0x17, 0xe2, 0xb2, 0xe6, 0x9d, 0x3a, 0xad, 0x4b, 0xde, 0x12, 0x1c, 0xd3, 0x17, 0xe8, 0x97, 0x70,
+	0xe9, 0x2c, 0x41, 0x10, 0x04, 0x2f, 0x6c, 0x36, 0xb7, 0x56, 0x88, 0xe9, 0xff, 0x90, 0x3b, 0x55,
+	0x6f, 0xc7, 0x10, 0xea, 0x9d, 0xb8, 0x59, 0xf5, 0x4e, 0x5c, 0xae, 0xde, 0x5f, 0xc0, 0x65, 0x0e,
+	0x96, 0xd1, 0x9d, 0x24, 0x21, 0x71, 0xa3, 0x68, 0xfa, 0x46, 0x34, 0xd0, 0x6b, 0xf3, 0x80, 0x36,
+	0x71, 0x99, 0x1c, 0x0e, 0x43, 0x83, 0xa3, 0xa2, 0x3d, 0xa8, 0x4c, 0x5e, 0x79, 0x24, 0x72, 0xd9,
+	0x4c, 0x39, 0x79, 0x56, 0xbd, 0x69, 0x48, 0xc1, 0xe5, 0x89, 0x18, 0xcd, 0x38, 0xbe, 0x37, 0xe7,
+	0xe8, 0xee, 0x4c, 0xf9, 0x75, 0x16, 0x3f, 0x75, 0x5a, 0x5c, 0xf6, 0xe6, 0x62, 0xa0, 0xff, 0x45,
+	0x1e, 0xc0, 0x91, 0xef, 0x02, 0x0e, 0x15, 0x99, 0xe3, 0xf4, 0x0d, 0xe0, 0xf4, 0xba, 0xa2, 0x7e,
+	0x0a, 0xb4, 0xbd, 0x77, 0xf0, 0xd2, 0x4f, 0x61, 0x2b, 0x7d, 0x6c, 0xc8, 0xde, 0x52, 0x34, 0x70,
+	0x53, 0x81, 0x53, 0xf3, 0xfe, 0x0c, 0xca, 0x41, 0xe8, 0x89, 0x92, 0x47, 0x72, 0x9b, 0x15, 0x4a,
+	0x2f, 0xf4, 0xa8, 0x6d, 0xe2, 0x12, 0xc7, 0xb0, 0x3d, 0xde, 0x36, 0x4a, 0x33, 0xdf, 0x3c, 0xdb,
+	0x36, 0xa6, 0x65, 0x8f, 0xaa, 0x76, 0x32, 0x56, 0x17, 0x79, 0xac, 0x55, 0x12, 0xf5, 0xdd, 0x3a,
+	0xab, 0x1b, 0x98, 0xa9, 0xd5, 0x0d, 0x3c, 0xa6, 0xff, 0x47, 0x0e, 0xb6, 0x47, 0x83, 0x8e, 0x92,
+	0x47, 0x3b, 0x0c, 0x12, 0xfa, 0x3a, 0x91, 0x5e, 0xf3, 0x13, 0x80, 0xb1, 0x3b, 0x8f, 0xa9, 0x0c,
+	0xb7, 0x32, 0xf1, 0xa3, 0x0c, 0xc1, 0x36, 0x9f, 0xb4, 0x2d, 0x5c, 0x15, 0x58, 0x22, 0xcc, 0x5a,
+	0xa0, 0xa5, 0x42, 0x88, 0x03, 0x37, 0x8a, 0x9f, 0x85, 0x32, 0x51, 0x2f, 0x57, 0x9a, 0xa7, 0xfb,
+	0x49, 0x47, 0x4d, 0x05, 0xe7, 0xa8, 0x25, 0xc8, 0x86, 0xad, 0x89, 0xeb, 0x4f, 0xe7, 0x8c, 0x92,
+	0xf4, 0x0e, 0xa9, 0x70, 0xc6, 0x0d, 0x3a, 0x12, 0x83, 0x7b, 0x1c, 0xdf, 0x9b, 0xcd, 0x64, 0xcc,
+	0x6e, 0x4c, 0x32, 0x70, 0x4f, 0xff, 0xab, 0x22, 0x94, 0x15, 0xa3, 0xe8, 0x67, 0x50, 0x51, 0x07,
+	0xa2, 0x6b, 0xda, 0x42, 0x85, 0x25, 0x7f, 0x8f, 0xdc, 0xe9, 0x9c, 0xc6, 0xb8, 0x2c, 0x8f, 0x46,
+	0xf5, 0x7f, 0x2b, 0x40, 0x2d, 0x33, 0xc1, 0x2b, 0x38, 0x6c, 0x39, 0x16, 0x3e, 0x12, 0xfd, 0xec,
+	0x15, 0xd0, 0xb0, 0xf5, 0x64, 0x64, 0x39, 0x43, 0x62, 0xb4, 0xdb, 0xd6, 0x80, 0x57, 0x7c, 0x39,
+	0x74, 0x13, 0x76, 0x53, 0x28, 0xb6, 0x1e, 0x5b, 0x6d, 0xde, 0x2f, 0xf6, 0xfa, 0x04, 0x5b, 0x86,
+	0x23, 0xba, 0xd8, 0x1b, 0xb0, 0x93, 0x96, 0x90, 0xed, 0x7e, 0x6f, 0x68, 0x3d, 0x1d, 0x92, 0x5e,
+	0x7f, 0x48, 0x3a, 0xfd, 0x51, 0xcf, 0xd4, 0x0a, 0xa8, 0x05, 0x57, 0x0e, 0x8d, 0x9e, 0x69, 0x0c,
+	0xfb, 0xf8, 0x3b, 0x62, 0x5b, 0xe4, 0xd0, 0x76, 0x1c, 0x5e, 0x57, 0x16, 0xd1, 0x2e, 0x6c, 0xb7,
+	0xfb, 0x3d, 0xd3, 0xe6, 0x45, 0xa9, 0xd1, 0xcd, 0xce, 0x6d, 0xf2, 0x32, 0xd7, 0xee, 0xc9, 0x46,
+	0xa8, 0x6b, 0xf5, 0x0e, 0x86, 0x8f, 0xb4, 0x12, 0xc7, 0x5f, 0xa2, 0x64, 0xf7, 0xda, 0x7d, 0x8c,
+	0xad, 0xf6, 0x50, 0x2b, 0x73, 0x26, 0x52, 0xfc, 0x4e, 0x1f, 0x7f, 0x6b, 0x60, 0xd3, 0xee, 0x1d,
+	0x90, 0x41, 0xbf, 0x6b, 0xb7, 0xbf, 0xd3, 0x2a, 0xe8, 0x63, 0xb8, 0xb5, 0x98, 0x26, 0x43, 0xcb,
+	0x36, 0x89, 0xd1, 0xed, 0xf6, 0x65, 0x23, 0x4e, 0xfa, 0x03, 0xd1, 0x8f, 0x57, 0xd1, 0x47, 0xf0,
+	0x61, 0xaf, 0x4f, 0x2c, 0x67, 0x68, 0x3c, 0xec, 0xda, 0xce, 0x23, 0xcb, 0x24, 0x83, 0x4e, 0x7b,
+	0x40, 0x0c, 0xc7, 0xe9, 0xb7, 0x6d, 0xd9, 0xb4, 0x03, 0xba, 0x0b, 0x9f, 0xe0, 0x51, 0xd7, 0x92,
+	0xd7, 0x00, 0x62, 0x39, 0x26, 0x87, 0x7d, 0x73, 0xd1, 0xd7, 0x93, 0xb4, 0xc3, 0xae, 0xa1, 0x0f,
+	0xa0, 0x25, 0x08, 0x58, 0xbd, 0x21, 0xe7, 0x58, 0xc8, 0xe7, 0xc0, 0x72, 0x04, 0xa1, 0x3a, 0x3f,
+	0x8e, 0x10, 0xa3, 0xd3, 0x1f, 0xe1, 0xb6, 0xe5, 0x10, 0xe3, 0xc8, 0xb0, 0xbb, 0xc6, 0xc3, 0xae,
+	0xa5, 0x35, 0xd0, 0x0e, 0x5c, 0xe5, 0x5a, 0xb1, 0xdb, 0x96, 0x90, 0xa5, 0x33, 0x1a, 0x0c, 0xfa,
+	0x98, 0xab, 0xa3, 0x29, 0x1a, 0x80, 0xef, 0x9c, 0xa1, 0x75, 0xb8, 0xd8, 0x68, 0x4b, 0x7f, 0x08,
+	0xdb, 0xeb, 0xcd, 0x08, 0xdd, 0xe1, 0x29, 0x83, 0xa9, 0x36, 0x29, 0xeb, 0x46, 0xfd, 0xc9, 0x84,
+	0x06, 0x9e, 0x1f, 0x9c, 0xd8, 0x16, 0x4f, 0x1d, 0x4c, 0xff, 0xcf, 0x1c, 0xd4, 0x32, 0x40, 0x9e,
+	0xbe, 0x7c, 0x8f, 0x06, 0x89, 0x3f, 0xf1, 0x29, 0x53, 0xb1, 0x31, 0x03, 0x39, 0xff, 0x3a, 0x1b,
+	0x7d, 0x0b, 0xad, 0x17, 0x61, 0x4c, 0x28, 0x67, 0x63, 0xac, 0x4c, 0x3f, 0xbd, 0x14, 0x2b, 0x9c,
+	0x29, 0x58, 0xd6, 0x5d, 0xe5, 0x5d, 0x7d, 0x11, 0xc6, 0x96, 0x5c, 0x2e, 0x5e, 0x4c, 0xe4, 0x62,
+	0xf4, 0x08, 0xb6, 0x3c, 0x3a, 0x25, 0x2f, 0x28, 0x5b, 0xd0, 0x93, 0xa1, 0xe7, 0xe2, 0x4b, 0xb6,
+	0x86, 0x47, 0xa7, 0x4f, 0x28, 0x53, 0x94, 0xf4, 0x7f, 0xcc, 0x43, 0xc5, 0x1e, 0x88, 0xe6, 0xa0,
+	0xcb, 0xcb, 0x20, 0x1e, 0x71, 0x44, 0xe4, 0x8d, 0xd3, 0x32, 0x28, 0xa6, 0x89, 0x08, 0xb3, 0x31,
+	0x8f, 0x99, 0xc9, 0x38, 0x22, 0x8b, 0x8a, 0x5b, 0xc5, 0xcc, 0x64, 0x1c, 0x99, 0xaa, 0xe8, 0x56,
+	0x18, 0x8b, 0xc2, 0xbb, 0xb0, 0xc0, 0x70, 0x64, 0xed, 0xcd, 0x31, 0xe6, 0x5e, 0x86, 0x86, 0xac,
+	0xda, 0x61, 0xee, 0x65, 0x69, 0x70, 0x8c, 0x95, 0xe2, 0x9d, 0x63, 0xa4, 0x34, 0x44, 0xd7, 0x40,
+	0x44, 0x23, 0xa0, 0xd2, 0x7a, 0xd9, 0x8f, 0x06, 0xe2, 0x05, 0xfa, 0xc7, 0x50, 0x12, 0x15, 0x5a,
+	0x24, 0x32, 0xf9, 0x72, 0x80, 0xb5, 0x07, 0xbc, 0xd0, 0xa6, 0x71, 0x8c, 0x37, 0x79, 0xc1, 0x16,
+	0xa1, 0xcf, 0xa1, 0x2c, 0xab, 0xbe, 0x48, 0xe5, 0xf4, 0xf5, 0xd8, 0x25, 0x51, 0x08, 0x46, 0x2b,
+	0x65, 0x4c, 0x75, 0xb5, 0x8c, 0xd1, 0x7f, 0x9d, 0x83, 0xe6, 0xc8, 0xca, 0x06, 0x42, 0xd4, 0x87,
+	0xad, 0x39, 0x25, 0xe3, 0x30, 0x98, 0xf8, 0x27, 0x24, 0xdb, 0xef, 0x7e, 0xba, 0xf4, 0xca, 0x9a,
+	0x5d, 0xb3, 0x37, 0xb2, 0xda, 0x02, 0x5f, 0x86, 0xd2, 0xc6, 0x9c, 0x66, 0x3e, 0xf5, 0xd7, 0xd0,
+	0x58, 0x9a, 0xcf, 0x74, 0xa1, 0x1b, 0x48, 0x83, 0xfa, 0xa8, 0x87, 0xad, 0x03, 0xdb, 0x19, 0x5a,
+	0x58, 0x44, 0x2c, 0x0d, 0xea, 0x76, 0xcf, 0x19, 0x1a, 0xdd, 0x2e, 0xb1, 0xcd, 0xae, 0xa5, 0xe5,
+	0xb9, 0xd3, 0x8c, 0x7a, 0x4b, 0xb0, 0x82, 0x70, 0xa4, 0x91, 0x33, 0xb0, 0x7a, 0xa6, 0x65, 0x12,
+	0xd3, 0x18, 0x1a, 0x5a, 0x11, 0x6d, 0x41, 0x0d, 0x5b, 0xce, 0xe8, 0xd0, 0x92, 0x80, 0x4d, 0xfd,
+	0x7f, 0x0b, 0x50, 0x3f, 0xe5, 0x94, 0x26, 0xbc, 0x7e, 0x3f, 0x9b, 0x66, 0xdf, 0x72, 0x7f, 0xb4,
+	0x9c, 0x7f, 0x97, 0x85, 0x99, 0x3f, 0x53, 0x13, 0xfe, 0x5c, 0x48, 0x4e, 0xb5, 0x29, 0x42, 0x0f,
+	0xca, 0x63, 0xd6, 0xeb, 0xa8, 0xc1, 0x8b, 0x63, 0xde, 0xbf, 0x88, 0xcf, 0xd3, 0xd5, 0xfb, 0x8b,
+	0xd5, 0xc5, 0x0b, 0x57, 0xef, 0xa7, 0xab, 0xbf, 0x82, 0x26, 0x15, 0x3d, 0xd2, 0x62, 0xf1, 0xe6,
+	0x5b, 0x16, 0xd7, 0x29, 0xef, 0x9d, 0xd2, 0xb5, 0x1a, 0x14, 0xdc, 0x28, 0x50, 0xb7, 0xae, 0x7c,
+	0x88, 0x10, 0x14, 0x5f, 0x4e, 0xdd, 0x40, 0x3d, 0xe7, 0x88, 0xb1, 0x78, 0x5c, 0x0a, 0x64, 0xe1,
+	0x21, 0x9f, 0x6f, 0x4a, 0x7e, 0x20, 0x8a, 0x8e, 0x1d, 0xa8, 0x84, 0xf3, 0x44, 0xce, 0x48, 0x0b,
+	0x2b, 0x87, 0xf3, 0x44, 0x4c, 0xb5, 0x41, 0x9b, 0x53, 0xb2, 0xc8, 0xc6, 0xc2, 0x98, 0xe0, 0xcc,
+	0x3d, 0xc2, 0xb2, 0x31, 0xe1, 0xe6, 0x9c, 0x2e, 0x19, 0xe4, 0x4f, 0x00, 0x7c, 0xf9, 0x1c, 0x45,
+	0xbc, 0x69, 0xab, 0x71, 0xa6, 0xb8, 0x4a, 0x43, 0x01, 0xae, 0xf8, 0xe2, 0x59, 0xca, 0x9c, 0xea,
+	0xff, 0x9d, 0x83, 0xd6, 0x82, 0xaa, 0xaa, 0x27, 0x16, 0xd7, 0xb2, 0x6b, 0xd4, 0x94, 0xfb, 0x41,
+	0x6a, 0xca, 0xbf, 0xbb, 0x9a, 0x3e, 0x81, 0x66, 0x18, 0x51, 0xe6, 0xca, 0xba, 0x34, 0xbd, 0x22,
+	0x68, 0xe0, 0xc6, 0x02, 0x2a, 0x9a, 0xea, 0xe5, 0xaa, 0xa7, 0xf8, 0x0e, 0x55, 0x8f, 0xfe, 0x18,
+	0xb6, 0x0e, 0xa8, 0x28, 0x9a, 0x16, 0xcf, 0x8f, 0xdb, 0x50, 0x1a, 0x87, 0xe1, 0x73, 0x3f, 0xed,
+	0xf9, 0xd4, 0x17, 0x6f, 0x7e, 0xe4, 0x88, 0xcc, 0xdc, 0xf8, 0x79, 0x6a, 0xc8, 0x12, 0x74, 0xe8,
+	0xc6, 0xcf, 0x3f, 0xfb, 0x0a, 0x4a, 0xb2, 0x1a, 0xe6, 0x3d, 0xbd, 0x89, 0xfb, 0x03, 0xd9, 0xdd,
+	0xf3, 0xdc, 0xac, 0xe5, 0xf8, 0xe8, 0xe1, 0xa8, 0xd3, 0xd1, 0xf2, 0x7c, 0xd4, 0xeb, 0xb7, 0x07,
+	0x5a, 0x41, 0xe0, 0x8d, 0x06, 0x5d, 0xad, 0xf8, 0xd9, 0x17, 0x70, 0xd9, 0x09, 0xe7, 0x6c, 0x4c,
+	0x17, 0xdd, 0xa5, 0x38, 0x91, 0xf0, 0x79, 0x75, 0x91, 0x5d, 0x81, 0x62, 0xbb, 0x2f, 0x6e, 0xb1,
+	0x01, 0x4a, 0xce, 0x81, 0xdf, 0x35, 0x7a, 0x5a, 0xfe, 0xb3, 0xcf, 0xa1, 0x92, 0x76, 0x4d, 0xa8,
+	0x06, 0x65, 0xe5, 0xef, 0xda, 0x06, 0x47, 0xc2, 0xd6, 0x61, 0xff, 0xc8, 0x92, 0x7b, 0xcb, 0xa0,
+	0x70, 0xff, 0x5f, 0xeb, 0x50, 0x1d, 0xa4, 0xff, 0xe5, 0x41, 0x4f, 0xe1, 0x5a, 0xf6, 0x5f, 0x25,
+	0x5c, 0xe5, 0x2c, 0x9c, 0x4e, 0x79, 0xa3, 0x78, 0x73, 0xf5, 0x3f, 0x0d, 0xcb, 0xff, 0x3c, 0xd9,
+	0xbd, 0xfe, 0x96, 0xff, 0x3c, 0xe8, 0x1b, 0xa8, 0x0b, 0x4d, 0x87, 0x26, 0xce, 0x61, 0x5a, 0x2d,
+	0xc6, 0x68, 0xa9, 0x39, 0x5d, 0xc4, 0x96, 0xdd, 0xdb, 0x6b, 0x8b, 0xcb, 0x6c, 0x31, 0xab, 0x6f,
+	0xa0, 0x81, 0xfa, 0x13, 0x86, 0x7c, 0xc3, 0x94, 0x8f, 0xa8, 0x37, 0x56, 0x19, 0x58, 0xfa, 0x27,
+	0xca, 0x45, 0xfc, 0x61, 0x68, 0x2c, 0x25, 0x61, 0x74, 0x51, 0x53, 0xb5, 0x7b, 0x41, 0xfe, 0xd6,
+	0x37, 0xd0, 0x53, 0xd8, 0x5a, 0x49, 0xc4, 0xe8, 0xe2, 0xde, 0x6f, 0xf7, 0xc2, 0x3c, 0xae, 0x6f,
+	0x20, 0x17, 0xd0, 0xd9, 0x37, 0x43, 0xf4, 0xf1, 0x79, 0x1c, 0x65, 0x9f, 0xfe, 0x76, 0x3f, 0xba,
+	0x00, 0x4b, 0x6d, 0x71, 0x02, 0x57, 0xd6, 0x3d, 0xf1, 0xa1, 0x1f, 0x9d, 0xcf, 0xde, 0xd2, 0x36,
+	0x9f, 0x5c, 0x88, 0xa7, 0x36, 0x32, 0xa0, 0x79, 0x40, 0x13, 0xa9, 0xac, 0x51, 0xec, 0x9e, 0x50,
+	0x94, 0x36, 0x51, 0xe2, 0x7f, 0x64, 0x7b, 0x47, 0xa1, 0xef, 0xed, 0xee, 0xae, 0xbc, 0xd6, 0x62,
+	0x3a, 0x0e, 0x99, 0x27, 0xae, 0x9e, 0xf5, 0x0d, 0x64, 0x42, 0x25, 0x75, 0x5a, 0x94, 0xc5, 0x5c,
+	0xf1, 0xe4, 0x0b, 0xa8, 0x7c, 0x03, 0x20, 0x6e, 0x8b, 0x04, 0x93, 0x68, 0x7b, 0xfd, 0xfb, 0xd8,
+	0xee, 0xb5, 0x73, 0x5e, 0x9f, 0x24, 0x01, 0x2c, 0x1e, 0xf8, 0x7f, 0x53, 0x02, 0x26, 0x6c, 0xc9,
+	0xb7, 0x87, 0xf4, 0xc1, 0x2d, 0xfe, 0x4d, 0xa8, 0xf4, 0x60, 0xeb, 0xf4, 0x0f, 0x52, 0xd2, 0xec,
+	0x3e, 0x58, 0x35, 0xfe, 0xec, 0x9f, 0xa7, 0x2e, 0x72, 0x0d, 0x0a, 0xbb, 0xe7, 0xbf, 0xaf, 0xa0,
+	0xef, 0xf5, 0x17, 0xab, 0x77, 0x61, 0x7b, 0xf1, 0xf4, 0xb6, 0x86, 0xed, 0xec, 0x1f, 0xd8, 0x2e,
+	0x62, 0xbb, 0x03, 0x75, 0xc3, 0xf3, 0x16, 0xd4, 0xd0, 0xdb, 0xfe, 0xdd, 0xf6, 0x36, 0xbe, 0x6c,
+	0xee, 0xc5, 0x53, 0x9a, 0xd0, 0xf7, 0x42, 0x4a, 0x8a, 0xc8, 0x1e, 0x74, 0xec, 0xa7, 0x3f, 0x88,
+	0xd4, 0x2f, 0x61, 0xfb, 0x80, 0x26, 0xeb, 0x9e, 0x88, 0xd6, 0x78, 0xcf, 0x52, 0xa8, 0x5a, 0xb3,
+	0xe4, 0x10, 0x1a, 0x92, 0xaf, 0x91, 0x25, 0x95, 0x7a, 0x6d, 0x6d, 0x59, 0x41, 0x97, 0x83, 0xc7,
+	0x79, 0x95, 0xc1, 0xc3, 0xeb, 0xbf, 0xb7, 0x23, 0xb0, 0xee, 0x4d, 0x13, 0x7a, 0x6f, 0x3c, 0x0d,
+	0xe7, 0xde, 0xbd, 0x93, 0x50, 0xfd, 0x09, 0xf3, 0xb8, 0x24, 0x7e, 0x7f, 0xfa, 0x7f, 0x01, 0x00,
+	0x00, 0xff, 0xff, 0x3e, 0x62, 0xdd, 0x69, 0x4d, 0x2a, 0x00, 0x00,
 }
 
 // Reference imports to suppress errors if they are not otherwise used.
@@ -3434,6 +3603,10 @@ type PipelinedClient interface {
 	ActivateFlows(ctx context.Context, in *ActivateFlowsRequest, opts ...grpc.CallOption) (*ActivateFlowsResult, error)
 	// Deactivate flows for a subscriber
 	DeactivateFlows(ctx context.Context, in *DeactivateFlowsRequest, opts ...grpc.CallOption) (*DeactivateFlowsResult, error)
+	// Activate flows for many subscribers at once
+	ActivateFlowsBatch(ctx context.Context, in *ActivateFlowsBatchRequest, opts ...grpc.CallOption) (*ActivateFlowsBatchResult, error)
+	// Deactivate flows for many subscribers at once
+	DeactivateFlowsBatch(ctx context.Context, in *DeactivateFlowsBatchRequest, opts ...grpc.CallOption) (*DeactivateFlowsBatchResult, error)
 	// Get policy usage stats
 	GetPolicyUsage(ctx context.Context, in *protos.Void, opts ...grpc.CallOption) (*RuleRecordTable, error)
 	GetStats(ctx context.Context, in *GetStatsRequest, opts ...grpc.CallOption) (*RuleRecordTable, error)
@@ -3514,6 +3687,24 @@ func (c *pipelinedClient) DeactivateFlows(ctx context.Context, in *DeactivateFlo
 	return out, nil
 }
 
+func (c *pipelinedClient) ActivateFlowsBatch(ctx context.Context, in *ActivateFlowsBatchRequest, opts ...grpc.CallOption) (*ActivateFlowsBatchResult, error) {
+	out := new(ActivateFlowsBatchResult)
+	err := c.cc.Invoke(ctx, "/magma.lte.Pipelined/ActivateFlowsBatch", in, out, opts...)
+	if err != nil {
+		return nil, err
+	}
+	return out, nil
+}
+
+func (c *pipelinedClient) DeactivateFlowsBatch(ctx context.Context, in *DeactivateFlowsBatchRequest, opts ...grpc.CallOption) (*DeactivateFlowsBatchResult, error) {
+	out := new(DeactivateFlowsBatchResult)
+	err := c.cc.Invoke(ctx, "/magma.lte.Pipelined/DeactivateFlowsBatch", in, out, opts...)
+	if err != nil {
+		return nil, err
+	}
+	return out, nil
+}
+
 func (c *pipelinedClient) GetPolicyUsage(ctx context.Context, in *protos.Void, opts ...grpc.CallOption) (*RuleRecordTable, error) {
 	out := new(RuleRecordTable)
 	err := c.cc.Invoke(ctx, "/magma.lte.Pipelined/GetPolicyUsage", in, out, opts...)
@@ -3642,6 +3833,10 @@ type PipelinedServer interface {
 	ActivateFlows(context.Context, *ActivateFlowsRequest) (*ActivateFlowsResult, error)
 	// Deactivate flows for a subscriber
 	DeactivateFlows(context.Context, *DeactivateFlowsRequest) (*DeactivateFlowsResult, error)
+	// Activate flows for many subscribers at once
+	ActivateFlowsBatch(context.Context, *ActivateFlowsBatchRequest) (*ActivateFlowsBatchResult, error)
+	// Deactivate flows for many subscribers at once
+	DeactivateFlowsBatch(context.Context, *DeactivateFlowsBatchRequest) (*DeactivateFlowsBatchResult, error)
 	// Get policy usage stats
 	GetPolicyUsage(context.Context, *protos.Void) (*RuleRecordTable, error)
 	GetStats(context.Context, *GetStatsRequest) (*RuleRecordTable, error)
@@ -3688,6 +3883,12 @@ func (*UnimplementedPipelinedServer) ActivateFlows(ctx context.Context, req *Act
 func (*UnimplementedPipelinedServer) DeactivateFlows(ctx context.Context, req *DeactivateFlowsRequest) (*DeactivateFlowsResult, error) {
 	return nil, status.Errorf(codes.Unimplemented, "method DeactivateFlows not implemented")
 }
+func (*UnimplementedPipelinedServer) ActivateFlowsBatch(ctx context.Context, req *ActivateFlowsBatchRequest) (*ActivateFlowsBatchResult, error) {
+	return nil, status.Errorf(codes.Unimplemented, "method ActivateFlowsBatch not implemented")
+}
+func (*UnimplementedPipelinedServer) DeactivateFlowsBatch(ctx context.Context, req *DeactivateFlowsBatchRequest) (*DeactivateFlowsBatchResult, error) {
+	return nil, status.Errorf(codes.Unimplemented, "method DeactivateFlowsBatch not implemented")
+}
 func (*UnimplementedPipelinedServer) GetPolicyUsage(ctx context.Context, req *protos.Void) (*RuleRecordTable, error) {
 	return nil, status.Errorf(codes.Unimplemented, "method GetPolicyUsage not implemented")
 }
@@ -3822,6 +4023,42 @@ func _Pipelined_DeactivateFlows_Handler(srv interface{}, ctx context.Context, de
 	return interceptor(ctx, in, info, handler)
 }
 
+func _Pipelined_ActivateFlowsBatch_Handler(srv interface{}, ctx context.Context, dec func(interface{}) error, interceptor grpc.UnaryServerInterceptor) (interface{}, error) {
+	in := new(ActivateFlowsBatchRequest)
+	if err := dec(in); err != nil {
+		return nil, err
+	}
+	if interceptor == nil {
+		return srv.(PipelinedServer).ActivateFlowsBatch(ctx, in)
+	}
+	info := &grpc.UnaryServerInfo{
+		Server:     srv,
+		FullMethod: "/magma.lte.Pipelined/ActivateFlowsBatch",
+	}
+	handler := func(ctx context.Context, req interface{}) (interface{}, error) {
+		return srv.(PipelinedServer).ActivateFlowsBatch(ctx, req.(*ActivateFlowsBatchRequest))
+	}
+	return interceptor(ctx, in, info, handler)
+}
+
+func _Pipelined_DeactivateFlowsBatch_Handler(srv interface{}, ctx context.Context, dec func(interface{}) error, interceptor grpc.UnaryServerInterceptor) (interface{}, error) {
+	in := new(DeactivateFlowsBatchRequest)
+	if err := dec(in); err != nil {
+		return nil, err
+	}
+	if interceptor == nil {
+		return srv.(PipelinedServer).DeactivateFlowsBatch(ctx, in)
+	}
+	info := &grpc.UnaryServerInfo{
+		Server:     srv,
+		FullMethod: "/magma.lte.Pipelined/DeactivateFlowsBatch",
+	}
+	handler := func(ctx context.Context, req interface{}) (interface{}, error) {
+		return srv.(PipelinedServer).DeactivateFlowsBatch(ctx, req.(*DeactivateFlowsBatchRequest))
+	}
+	return interceptor(ctx, in, info, handler)
+}
+
 func _Pipelined_GetPolicyUsage_Handler(srv interface{}, ctx context.Context, dec func(interface{}) error, interceptor grpc.UnaryServerInterceptor) (interface{}, error) {
 	in := new(protos.Void)
 	if err := dec(in); err != nil {
@@ -4080,6 +4317,14 @@ var _Pipelined_serviceDesc = grpc.ServiceDesc{
 			MethodName: "DeactivateFlows",
 			Handler:    _Pipelined_DeactivateFlows_Handler,
 		},
+		{
+			MethodName: "ActivateFlowsBatch",
+			Handler:    _Pipelined_ActivateFlowsBatch_Handler,
+		},
+		{
+			MethodName: "DeactivateFlowsBatch",
+			Handler:    _Pipelined_DeactivateFlowsBatch_Handler,
+		},
 		{
 			MethodName: "GetPolicyUsage",
 			Handler:    _Pipelined_GetPolicyUsage_Handler,
@@ -0,0 +1,260 @@
+#!/usr/bin/env python3
+"""
+Copyright 2020 The Magma Authors.
+
+This source code is licensed under the BSD-style license found in the
+LICENSE file in the root directory of this source tree.
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+
+import argparse
+import http.client
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from load_tests.common import print_latencies, print_result
+from lxml import etree
+from magma.enodebd.state_machines.enb_acs_manager import StateMachineManager
+from magma.enodebd.tests.test_utils.enb_acs_builder import (
+    EnodebAcsStateMachineBuilder,
+)
+from magma.enodebd.tests.test_utils.tr069_msg_builder import Tr069MessageBuilder
+from magma.enodebd.tr069 import models
+from magma.enodebd.tr069.server import make_tr069_server
+from spyne.util.xml import get_object_as_xml
+
+HOST = '127.0.0.1'
+SOAP_ENV_NS = 'http://schemas.xmlsoap.org/soap/envelope/'
+ENVELOPE = (
+    '<soapenv:Envelope xmlns:soapenv="%s" xmlns:cwmp="%s">'
+    '<soapenv:Header>'
+    '<cwmp:ID soapenv:mustUnderstand="1">%d</cwmp:ID>'
+    '</soapenv:Header>'
+    '<soapenv:Body>%s</soapenv:Body>'
+    '</soapenv:Envelope>'
+)
+# Sessions longer than this are counted as failed
+MAX_SESSION_REQUESTS = 50
+
+
+def _encode(message, message_id: int) -> bytes:
+    """ Wrap a CPE->ACS message in a SOAP envelope, like eNodeBs send it """
+    body = get_object_as_xml(message, message.__class__, no_namespace=True)
+    body.tag = '{%s}%s' % (models.CWMP_NS, body.tag)
+    return (
+        ENVELOPE % (
+            SOAP_ENV_NS, models.CWMP_NS, message_id,
+            etree.tostring(body).decode(),
+        )
+    ).encode()
+
+
+def _get_param_values():
+    """ Values the simulated eNodeBs report, by parameter name """
+    values = {}
+    for response in (
+        Tr069MessageBuilder.get_read_only_param_values_response(),
+        Tr069MessageBuilder.get_regular_param_values_response(
+            earfcndl=39150,
+        ),
+        Tr069MessageBuilder.get_object_param_values_response(),
+    ):
+        for param in response.ParameterList.ParameterValueStruct:
+            # The builder fills in some values as Python types, while they
+            # are sent as strings
+            data = param.Value.Data
+            if isinstance(data, bool):
+                data = int(data)
+            param.Value.Data = str(data)
+            values[param.Name] = param
+    return values
+
+
+class _Cpe:
+    """
+    Simulated eNodeB, running TR-069 sessions with the ACS from its own
+    source IP over a keep-alive connection
+    """
+
+    def __init__(self, index: int, port: int, param_values):
+        self.serial = '120200002618AGP%04d' % index
+        self.source_ip = '127.%d.%d.%d' % (
+            1 + (index >> 16) % 254, (index >> 8) & 0xff, index & 0xff,
+        )
+        self._port = port
+        self._param_values = param_values
+        self._message_id = 0
+        self._event_codes = ['2 PERIODIC']
+        self.request_latencies = []
+
+    def run_session(self) -> bool:
+        """ Run a session from Inform to the ACS's empty response """
+        conn = http.client.HTTPConnection(
+            HOST, self._port, source_address=(self.source_ip, 0),
+        )
+        try:
+            inform = Tr069MessageBuilder.get_inform(
+                enb_serial=self.serial, event_codes=self._event_codes,
+            )
+            self._event_codes = ['2 PERIODIC']
+            self._post(conn, inform)
+            acs_request = self._post(conn, None)
+            for _ in range(MAX_SESSION_REQUESTS):
+                if acs_request is None:
+                    return True
+                acs_request = self._post(conn, self._respond(acs_request))
+            return False
+        finally:
+            conn.close()
+
+    def _post(self, conn, message):
+        self._message_id += 1
+        body = b'' if message is None else _encode(message, self._message_id)
+        start = time.perf_counter()
+        conn.request('POST', '/', body)
+        response = conn.getresponse()
+        data = response.read()
+        self.request_latencies.append(time.perf_counter() - start)
+        if not data:
+            return None
+        return etree.fromstring(data).find('{%s}Body' % SOAP_ENV_NS)[0]
+
+    def _respond(self, acs_request):
+        name = etree.QName(acs_request).localname
+        if name == 'GetParameterValues':
+            params = [
+                self._param_values[elem.text]
+                for elem in acs_request.iter('string')
+                if elem.text in self._param_values
+            ]
+            if not params:
+                return Tr069MessageBuilder.get_fault()
+            response = models.GetParameterValuesResponse()
+            response.ParameterList = models.ParameterValueList()
+            response.ParameterList.ParameterValueStruct = params
+            return response
+        if name == 'SetParameterValues':
+            response = models.SetParameterValuesResponse()
+            response.Status = 0
+            return response
+        if name == 'Reboot':
+            self._event_codes = ['1 BOOT', 'M Reboot']
+            return Tr069MessageBuilder.get_reboot_response()
+        return Tr069MessageBuilder.get_fault()
+
+
+def _benchmark_sessions(args):
+    """
+    Time args.sessions TR-069 sessions of each of args.num simulated
+    eNodeBs, args.concurrency eNodeBs at a time, against a TR-069 server
+    with args.workers worker threads. The first session of each eNodeB
+    provisions and reboots it, the next ones are periodic Informs.
+    """
+    logging.getLogger('magma.enodebd.logger').setLevel(args.log_level)
+    service = EnodebAcsStateMachineBuilder.build_magma_service()
+    # The desired configuration points the eNodeBs at these interfaces' IPs
+    service.config['tr069']['interface'] = 'lo'
+    service.config['s1_interface'] = 'lo'
+    manager = StateMachineManager(service)
+    server = make_tr069_server(manager, HOST, 0, args.workers)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    port = server.server_address[1]
+
+    param_values = _get_param_values()
+    cpes = [_Cpe(index, port, param_values) for index in range(args.num)]
+    session_latencies = []
+
+    def run_sessions(cpe):
+        num_failed = 0
+        for _ in range(args.sessions):
+            start = time.perf_counter()
+            if not cpe.run_session():
+                num_failed += 1
+            session_latencies.append(time.perf_counter() - start)
+        return num_failed
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.concurrency) as executor:
+        num_failed = sum(executor.map(run_sessions, cpes))
+    elapsed = time.perf_counter() - start
+    server.shutdown()
+    server.server_close()
+
+    num_sessions = args.num * args.sessions
+    request_latencies = [
+        latency for cpe in cpes for latency in cpe.request_latencies
+    ]
+    print_result('sessions', num_sessions, elapsed)
+    print_result('requests', len(request_latencies), elapsed)
+    print_latencies('session latency', session_latencies)
+    print_latencies('request latency', request_latencies)
+    if num_failed:
+        print('%d sessions did not end within %d requests' % (
+            num_failed, MAX_SESSION_REQUESTS,
+        ))
+
+
+def create_parser():
+    """
+    Creates the argparse parser with all the arguments.
+    """
+    parser = argparse.ArgumentParser(
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter,
+    )
+
+    # Add subcommands
+    subparsers = parser.add_subparsers(title="subcommands", dest="cmd")
+    parser_sessions = subparsers.add_parser(
+        "sessions",
+        help="TR-069 server load test with simulated eNodeBs",
+    )
+
+    # Add arguments
+    parser_sessions.add_argument(
+        "--num", type=int, default=200,
+        help="Number of simulated eNodeBs",
+    )
+    parser_sessions.add_argument(
+        "--sessions", type=int, default=2,
+        help="Number of provisioning sessions each eNodeB runs",
+    )
+    parser_sessions.add_argument(
+        "--concurrency", type=int, default=100,
+        help="Number of eNodeBs running sessions at the same time",
+    )
+    parser_sessions.add_argument(
+        "--workers", type=int, default=16,
+        help="Number of TR-069 server worker threads",
+    )
+    parser_sessions.add_argument(
+        "--log-level", type=str, default='CRITICAL',
+        help="Level of the enodebd logs shown. The eNodeBs are rebooted "
+        "after provisioning, which logs errors",
+    )
+
+    # Add function callbacks
+    parser_sessions.set_defaults(func=_benchmark_sessions)
+    return parser
+
+
+def main():
+    parser = create_parser()
+
+    # Parse the args
+    args = parser.parse_args()
+    if not args.cmd:
+        parser.print_usage()
+        exit(1)
+
+    args.func(args)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,127 @@
+#!/usr/bin/env python3
+"""
+Copyright 2020 The Magma Authors.
+
+This source code is licensed under the BSD-style license found in the
+LICENSE file in the root directory of this source tree.
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+
+import argparse
+import ipaddress
+import time
+
+from load_tests.common import print_result
+from magma.common.redis.client import get_default_client
+from magma.configuration.service_configs import get_service_config_value
+from magma.mobilityd.ip_address_man import IPAddressManager
+from magma.mobilityd.ip_allocator_pool import IpAllocatorPool
+from magma.mobilityd.ip_descriptor import IPState
+from magma.mobilityd.ipv6_allocator_pool import IPv6AllocatorPool
+from magma.mobilityd.mobility_store import MobilityStore
+
+CHECKPOINTS = (1000, 10000, 100000)
+
+
+def _clear_store(store: MobilityStore):
+    """ Remove the IPs, SIDs and IP blocks of the benchmark from Redis """
+    store.sid_ips_map.delete_many(list(store.sid_ips_map))
+    for state in IPState:
+        store.ip_state_map.ip_states[state].clear()
+    store.assigned_ip_blocks.clear()
+
+
+def _benchmark_alloc(args):
+    """
+    Time IPAddressManager.alloc_ip_address with 1k, 10k, ... UEs already
+    allocated, up to args.num UEs, with the state in the gateway's Redis
+    like mobilityd keeps it
+    """
+    store = MobilityStore(
+        get_default_client(), True,
+        get_service_config_value('redis', 'port', 6379),
+    )
+    try:
+        ip_allocator = IpAllocatorPool(store)
+        ipv6_allocator = IPv6AllocatorPool(
+            store,
+            session_prefix_alloc_mode='RANDOM',
+        )
+        manager = IPAddressManager(
+            ip_allocator, ipv6_allocator, store, None,
+        )
+        # Leave room for the addresses the pool reserves in the block
+        prefix_len = 32 - (args.num + args.sample + 16).bit_length()
+        manager.add_ip_block(
+            ipaddress.ip_network('10.0.0.0/%d' % prefix_len),
+        )
+
+        num_allocated = 0
+        for checkpoint in CHECKPOINTS:
+            if checkpoint > args.num:
+                break
+            while num_allocated < checkpoint:
+                manager.alloc_ip_address('IMSI%015d' % num_allocated)
+                num_allocated += 1
+
+            start = time.perf_counter()
+            for _ in range(args.sample):
+                manager.alloc_ip_address('IMSI%015d' % num_allocated)
+                num_allocated += 1
+            print_result(
+                'alloc_ip_address @%d UEs' % checkpoint, args.sample,
+                time.perf_counter() - start,
+            )
+    finally:
+        _clear_store(store)
+
+
+def create_parser():
+    """
+    Creates the argparse parser with all the arguments.
+    """
+    parser = argparse.ArgumentParser(
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter,
+    )
+
+    # Add subcommands
+    subparsers = parser.add_subparsers(title="subcommands", dest="cmd")
+    parser_alloc = subparsers.add_parser(
+        "alloc",
+        help="IPAddressManager IP allocation microbenchmark",
+    )
+
+    # Add arguments
+    parser_alloc.add_argument(
+        "--num", type=int, default=100000,
+        help="Largest number of allocated UEs to measure at",
+    )
+    parser_alloc.add_argument(
+        "--sample", type=int, default=1000,
+        help="Number of allocations timed at each checkpoint",
+    )
+
+    # Add function callbacks
+    parser_alloc.set_defaults(func=_benchmark_alloc)
+    return parser
+
+
+def main():
+    parser = create_parser()
+
+    # Parse the args
+    args = parser.parse_args()
+    if not args.cmd:
+        parser.print_usage()
+        exit(1)
+
+    args.func(args)
+
+
+if __name__ == "__main__":
+    main()
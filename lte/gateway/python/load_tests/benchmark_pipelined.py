@@ -0,0 +1,299 @@
+#!/usr/bin/env python3
+"""
+Copyright 2020 The Magma Authors.
+
+This source code is licensed under the BSD-style license found in the
+LICENSE file in the root directory of this source tree.
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+
+import argparse
+import ipaddress
+import subprocess
+import time
+
+from load_tests.common import print_result
+from magma.pipelined.bridge_util import BridgeTools
+from magma.pipelined.policy_converters import convert_ipv4_str_to_ip_proto
+from magma.pipelined.qos.qos_tc_impl import TrafficClass, run_cmd
+from magma.pipelined.qos.tc_ops_batch import TcOpsBatch
+from magma.pipelined.qos.tc_ops_cmd import TcOpsCmd
+from magma.pipelined.qos.tc_ops_pyroute2 import TcOpsPyRoute2
+from magma.pipelined.rule_mappers import SessionRuleToVersionMapper
+
+RULES_PER_SESSION = 4
+QOS_IFACE = 'qos_bench0'
+QOS_BACKENDS = ('cmd', 'pyroute2', 'netlink_batch')
+# APN-AMBR class, its leaf and a dedicated bearer class
+CLASSES_PER_UE = 3
+APN_AMBR = 1000000
+BEARER_MBR = 500000
+BEARER_GBR = 250000
+
+
+def _benchmark_rule_versions(args):
+    """
+    Time SessionRuleToVersionMapper operations with args.num session/rule
+    entries loaded
+    """
+    num_sessions = max(args.num // RULES_PER_SESSION, 1)
+    ip_network = ipaddress.ip_network('10.0.0.0/8')
+    sessions = [
+        (
+            'IMSI%015d' % i,
+            convert_ipv4_str_to_ip_proto(str(ip_network[i + 1])),
+        ) for i in range(num_sessions)
+    ]
+    rule_ids = ['rule%d' % i for i in range(RULES_PER_SESSION)]
+    mapper = SessionRuleToVersionMapper()
+
+    start = time.perf_counter()
+    for imsi, ip_addr in sessions:
+        for rule_id in rule_ids:
+            mapper.save_version(imsi, ip_addr, rule_id, 1)
+    print_result(
+        'save_version', num_sessions * RULES_PER_SESSION,
+        time.perf_counter() - start,
+    )
+
+    start = time.perf_counter()
+    for imsi, ip_addr in sessions:
+        for rule_id in rule_ids:
+            mapper.get_version(imsi, ip_addr, rule_id)
+    print_result(
+        'get_version', num_sessions * RULES_PER_SESSION,
+        time.perf_counter() - start,
+    )
+
+    # Removal cost shouldn't depend on the number of other subscribers, so
+    # only remove a sample of the sessions
+    sample = sessions[::max(num_sessions // 1000, 1)]
+    start = time.perf_counter()
+    for imsi, ip_addr in sample:
+        mapper.remove_all_ue_versions(imsi, ip_addr)
+    print_result(
+        'remove_all_ue_versions', len(sample),
+        time.perf_counter() - start,
+    )
+
+
+def _get_ue_classes(args):
+    """
+    (qid, max_bw, rate, parent_qid, skip_filter) of the classes of each UE,
+    in creation order
+    """
+    skip_filter = args.skip_filter
+    ue_classes = []
+    for index in range(args.num):
+        ambr_qid = 2 + index * CLASSES_PER_UE
+        ue_classes.append([
+            (ambr_qid, APN_AMBR, None, None, True),
+            (ambr_qid + 1, APN_AMBR, None, ambr_qid, skip_filter),
+            (ambr_qid + 2, BEARER_MBR, BEARER_GBR, ambr_qid, skip_filter),
+        ])
+    return ue_classes
+
+
+def _run_sync_backend(ue_classes, tc_ops):
+    TrafficClass.tc_ops = tc_ops
+    num_errors = 0
+    start = time.perf_counter()
+    for classes in ue_classes:
+        for qid, max_bw, rate, parent_qid, skip_filter in classes:
+            if TrafficClass.create_class(
+                QOS_IFACE, qid, max_bw, rate=rate, parent_qid=parent_qid,
+                skip_filter=skip_filter,
+            ):
+                num_errors += 1
+    install_elapsed = time.perf_counter() - start
+
+    start = time.perf_counter()
+    for classes in ue_classes:
+        for qid, _, _, _, skip_filter in reversed(classes):
+            TrafficClass.delete_class(QOS_IFACE, qid, skip_filter)
+    return install_elapsed, time.perf_counter() - start, num_errors
+
+
+def _run_batch_backend(ue_classes, tc_batch):
+    num_errors = 0
+
+    def on_created(err):
+        nonlocal num_errors
+        if err:
+            num_errors += 1
+
+    start = time.perf_counter()
+    for classes in ue_classes:
+        for qid, max_bw, rate, parent_qid, skip_filter in classes:
+            tc_batch.create_class(
+                QOS_IFACE, qid, max_bw, rate or '12Kbit',
+                parent_qid or 0xfffe, skip_filter=skip_filter,
+                callback=on_created,
+            )
+    tc_batch.flush()
+    install_elapsed = time.perf_counter() - start
+
+    start = time.perf_counter()
+    for classes in ue_classes:
+        for qid, _, _, _, skip_filter in reversed(classes):
+            tc_batch.delete_class(QOS_IFACE, qid, skip_filter)
+    tc_batch.flush()
+    return install_elapsed, time.perf_counter() - start, num_errors
+
+
+def _benchmark_qos(args):
+    """
+    Time installing and removing the QoS classes of args.num UEs with each
+    TC backend, on a veth interface created for the run
+    """
+    ue_classes = _get_ue_classes(args)
+    run_cmd([
+        'ip link add {} type veth peer name {}p'.format(QOS_IFACE, QOS_IFACE),
+    ])
+    try:
+        for backend in args.backends.split(','):
+            TrafficClass.tc_ops = TcOpsCmd()
+            TrafficClass.init_qdisc(QOS_IFACE)
+            if backend == 'cmd':
+                result = _run_sync_backend(ue_classes, TcOpsCmd())
+            elif backend == 'pyroute2':
+                result = _run_sync_backend(ue_classes, TcOpsPyRoute2())
+            elif backend == 'netlink_batch':
+                result = _run_batch_backend(ue_classes, TcOpsBatch())
+            else:
+                raise ValueError('Unknown QoS backend %s' % backend)
+            run_cmd(['tc qdisc del dev {} root'.format(QOS_IFACE)])
+
+            install_elapsed, remove_elapsed, num_errors = result
+            print_result('install %s' % backend, args.num, install_elapsed)
+            print_result('remove %s' % backend, args.num, remove_elapsed)
+            if num_errors:
+                print('%d classes failed to install' % num_errors)
+    finally:
+        run_cmd(['ip link del {}'.format(QOS_IFACE)])
+
+
+def _vsctl_get_ofport(iface):
+    return int(subprocess.check_output(
+        ['ovs-vsctl', 'get', 'interface', iface, 'ofport'],
+    ))
+
+
+def _vsctl_get_datapath_id(bridge):
+    output = subprocess.check_output(
+        ['ovs-vsctl', 'get', 'bridge', bridge, 'datapath_id'],
+    )
+    return int(str(output, 'utf-8').strip()[1:-1], 16)
+
+
+def _benchmark_bridge_tools(args):
+    """
+    Time BridgeTools lookups and flow dumps of a running OVS against the
+    ovs-vsctl and ovs-ofctl commands they used to fork
+    """
+    for name, lookup, param in (
+        ('ofport vsctl', _vsctl_get_ofport, args.iface),
+        ('ofport ovsdb', BridgeTools.get_ofport, args.iface),
+        ('datapath_id vsctl', _vsctl_get_datapath_id, args.bridge),
+        ('datapath_id ovsdb', BridgeTools.get_datapath_id, args.bridge),
+    ):
+        start = time.perf_counter()
+        for _ in range(args.num):
+            lookup(param)
+        print_result(name, args.num, time.perf_counter() - start)
+
+    for name, dump in (
+        ('dump ofctl', BridgeTools.get_flows_for_bridge),
+        ('dump openflow', BridgeTools.iter_flows),
+    ):
+        num_flows = 0
+        start = time.perf_counter()
+        for _ in range(args.dumps):
+            num_flows += sum(1 for _ in dump(args.bridge))
+        print_result(name, num_flows, time.perf_counter() - start)
+
+
+def create_parser():
+    """
+    Creates the argparse parser with all the arguments.
+    """
+    parser = argparse.ArgumentParser(
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter,
+    )
+
+    # Add subcommands
+    subparsers = parser.add_subparsers(title="subcommands", dest="cmd")
+    parser_rule_versions = subparsers.add_parser(
+        "rule_versions",
+        help="SessionRuleToVersionMapper microbenchmark",
+    )
+    parser_qos = subparsers.add_parser(
+        "qos",
+        help="Linux TC QoS class install microbenchmark, needs root",
+    )
+    parser_bridge_tools = subparsers.add_parser(
+        "bridge_tools",
+        help="BridgeTools OVSDB lookup and flow dump microbenchmark, "
+        "needs root",
+    )
+
+    # Add arguments
+    parser_rule_versions.add_argument(
+        "--num", type=int, default=100000,
+        help="Number of session/rule entries",
+    )
+    parser_qos.add_argument(
+        "--num", type=int, default=1000,
+        help="Number of UEs with an APN-AMBR and a dedicated bearer",
+    )
+    parser_qos.add_argument(
+        "--backends", type=str, default=','.join(QOS_BACKENDS),
+        help="Comma separated TC backends to compare",
+    )
+    parser_qos.add_argument(
+        "--skip-filter", action="store_true",
+        help="Don't create fw filters, for kernels without cls_fw",
+    )
+    parser_bridge_tools.add_argument(
+        "--num", type=int, default=200,
+        help="Number of lookups of each kind",
+    )
+    parser_bridge_tools.add_argument(
+        "--dumps", type=int, default=10,
+        help="Number of flow dumps of the bridge",
+    )
+    parser_bridge_tools.add_argument(
+        "--bridge", type=str, default='gtp_br0',
+        help="Bridge looked up and dumped",
+    )
+    parser_bridge_tools.add_argument(
+        "--iface", type=str, default='gtp0',
+        help="Interface whose ofport is looked up",
+    )
+
+    # Add function callbacks
+    parser_rule_versions.set_defaults(func=_benchmark_rule_versions)
+    parser_qos.set_defaults(func=_benchmark_qos)
+    parser_bridge_tools.set_defaults(func=_benchmark_bridge_tools)
+    return parser
+
+
+def main():
+    parser = create_parser()
+
+    # Parse the args
+    args = parser.parse_args()
+    if not args.cmd:
+        parser.print_usage()
+        exit(1)
+
+    args.func(args)
+
+
+if __name__ == "__main__":
+    main()
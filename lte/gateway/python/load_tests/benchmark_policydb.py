@@ -0,0 +1,169 @@
+#!/usr/bin/env python3
+"""
+Copyright 2020 The Magma Authors.
+
+This source code is licensed under the BSD-style license found in the
+LICENSE file in the root directory of this source tree.
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+
+import argparse
+import random
+import time
+
+from load_tests.common import print_latencies, print_result
+from lte.protos.mconfig import mconfigs_pb2
+from lte.protos.policydb_pb2 import (
+    ApnPolicySet,
+    ChargingRuleNameSet,
+    RatingGroup,
+    SubscriberPolicySet,
+)
+from lte.protos.session_manager_pb2 import (
+    CommonSessionContext,
+    CreateSessionRequest,
+)
+from lte.protos.subscriberdb_pb2 import SubscriberID
+from magma.policydb.apn_rule_map_store import ApnRuleAssignmentsDict
+from magma.policydb.basename_store import BaseNameDict
+from magma.policydb.rating_group_store import RatingGroupsDict
+from magma.policydb.servicers.session_servicer import SessionRpcServicer
+
+APNS = ['internet', 'ims']
+NUM_BASENAMES = 10
+
+
+def _fill_stores(args, rating_groups, basenames, apn_rules):
+    limit_types = [
+        RatingGroup.INFINITE_UNMETERED,
+        RatingGroup.INFINITE_METERED,
+    ]
+    for rg_id in range(1, args.rating_groups + 1):
+        rating_groups[rg_id] = RatingGroup(
+            id=rg_id, limit_type=limit_types[rg_id % 2],
+        )
+    for index in range(NUM_BASENAMES):
+        basenames['bn%d' % index] = ChargingRuleNameSet(
+            RuleNames=['bn%d_rule%d' % (index, rule) for rule in range(5)],
+        )
+    for index in range(args.subscribers):
+        apn_rules['IMSI%015d' % index] = SubscriberPolicySet(
+            global_base_names=['bn%d' % (index % NUM_BASENAMES)],
+            rules_per_apn=[
+                ApnPolicySet(
+                    apn=apn,
+                    assigned_base_names=[
+                        'bn%d' % ((index + 1) % NUM_BASENAMES),
+                    ],
+                    assigned_policies=['%s_rule' % apn],
+                )
+                for apn in APNS
+            ],
+        )
+    rating_groups.send_update_notification()
+    basenames.send_update_notification()
+    apn_rules.send_update_notification()
+
+
+def _benchmark_create_session(args):
+    """
+    Time args.num CreateSession calls for random subscribers of
+    args.subscribers, with the stores in the gateway's Redis. A stream
+    update is notified every args.update_every calls.
+    """
+    rating_groups = RatingGroupsDict()
+    basenames = BaseNameDict()
+    apn_rules = ApnRuleAssignmentsDict()
+    try:
+        _fill_stores(args, rating_groups, basenames, apn_rules)
+        servicer = SessionRpcServicer(
+            mconfigs_pb2.PolicyDB(), rating_groups, basenames, apn_rules,
+        )
+        requests = [
+            CreateSessionRequest(
+                session_id='session%d' % index,
+                common_context=CommonSessionContext(
+                    sid=SubscriberID(
+                        id='IMSI%015d' % random.randrange(args.subscribers),
+                    ),
+                    apn=random.choice(APNS),
+                ),
+            )
+            for index in range(args.num)
+        ]
+
+        latencies = []
+        start = time.perf_counter()
+        for index, request in enumerate(requests):
+            if args.update_every and index % args.update_every == 0:
+                rating_groups.send_update_notification()
+            request_start = time.perf_counter()
+            servicer.CreateSession(request, None)
+            latencies.append(time.perf_counter() - request_start)
+        print_result(
+            'CreateSession', args.num, time.perf_counter() - start,
+        )
+        print_latencies('CreateSession latency', latencies)
+    finally:
+        rating_groups.clear()
+        basenames.clear()
+        apn_rules.clear()
+
+
+def create_parser():
+    """
+    Creates the argparse parser with all the arguments.
+    """
+    parser = argparse.ArgumentParser(
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter,
+    )
+
+    # Add subcommands
+    subparsers = parser.add_subparsers(title="subcommands", dest="cmd")
+    parser_create_session = subparsers.add_parser(
+        "create_session",
+        help="SessionRpcServicer CreateSession latency microbenchmark",
+    )
+
+    # Add arguments
+    parser_create_session.add_argument(
+        "--num", type=int, default=10000,
+        help="Number of sessions created",
+    )
+    parser_create_session.add_argument(
+        "--subscribers", type=int, default=10000,
+        help="Number of subscribers with APN rule assignments",
+    )
+    parser_create_session.add_argument(
+        "--rating-groups", type=int, default=100,
+        help="Number of rating groups",
+    )
+    parser_create_session.add_argument(
+        "--update-every", type=int, default=0,
+        help="Number of sessions created between stream updates, 0 for none",
+    )
+
+    # Add function callbacks
+    parser_create_session.set_defaults(func=_benchmark_create_session)
+    return parser
+
+
+def main():
+    parser = create_parser()
+
+    # Parse the args
+    args = parser.parse_args()
+    if not args.cmd:
+        parser.print_usage()
+        exit(1)
+
+    args.func(args)
+
+
+if __name__ == "__main__":
+    main()
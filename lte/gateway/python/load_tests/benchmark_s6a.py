@@ -0,0 +1,273 @@
+#!/usr/bin/env python3
+"""
+Copyright 2020 The Magma Authors.
+
+This source code is licensed under the BSD-style license found in the
+LICENSE file in the root directory of this source tree.
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+
+import argparse
+import time
+
+from load_tests.common import print_result
+from lte.protos.mconfig.mconfigs_pb2 import SubscriberDB
+from magma.subscriberdb.protocols.diameter import avp, message, server
+from magma.subscriberdb.protocols.diameter.application import base, s6a
+
+REALM = 'magma.com'
+HOST = 'hss.magma.com'
+HOST_IP = '127.0.0.1'
+IMSI = '001010000000001'
+
+
+class _Processor:
+    """ Processor answering with fixed vectors and profile """
+
+    def generate_lte_auth_vectors(self, imsi, plmns):
+        return [(b'\x01' * 16, b'\x02' * 8, b'\x03' * 16, b'\x04' * 32)] * \
+            len(plmns)
+
+    def get_sub_profile(self, imsi):
+        return SubscriberDB.SubscriptionProfile(
+            max_ul_bit_rate=100000000, max_dl_bit_rate=200000000,
+        )
+
+
+class _Writer:
+    """ Writer encoding the answers without sending them """
+
+    def __init__(self):
+        self.num_bytes = 0
+
+    def send_msg(self, msg):
+        buf = bytearray(msg.length)
+        self.num_bytes += msg.encode(buf, 0)
+
+
+def _request(application_id, command_code, avps):
+    msg = message.Message()
+    msg.header.application_id = application_id
+    msg.header.command_code = command_code
+    msg.header.request = True
+    for avp_ in avps:
+        msg.append_avp(avp_)
+    buf = bytearray(msg.length)
+    msg.encode(buf, 0)
+    return bytes(buf)
+
+
+def _default_trace():
+    """
+    The requests an MME sends when a UE attaches: a CER and DWR, then an
+    AIR and a ULR, like those OAI sends
+    """
+    session_id = avp.AVP('Session-Id', 'mme.magma.com;1475864727;1;apps6a')
+    cer = _request(
+        base.BaseApplication.APP_ID,
+        base.BaseApplicationCommands.CAPABILITIES_EXCHANGE, [
+            avp.AVP('Origin-Host', 'mme.magma.com'),
+            avp.AVP('Origin-Realm', REALM),
+            avp.AVP('Host-IP-Address', '10.0.0.1'),
+            avp.AVP('Vendor-Id', 0),
+            avp.AVP('Product-Name', 'mme'),
+            avp.AVP('Supported-Vendor-Id', avp.VendorId.TGPP),
+            avp.AVP('Inband-Security-Id', 0),
+            avp.AVP(
+                'Vendor-Specific-Application-Id', [
+                    avp.AVP('Auth-Application-Id', s6a.S6AApplication.APP_ID),
+                    avp.AVP('Vendor-Id', avp.VendorId.TGPP),
+                ],
+            ),
+        ],
+    )
+    dwr = _request(
+        base.BaseApplication.APP_ID,
+        base.BaseApplicationCommands.DEVICE_WATCHDOG, [
+            avp.AVP('Origin-Host', 'mme.magma.com'),
+            avp.AVP('Origin-Realm', REALM),
+        ],
+    )
+    air = _request(
+        s6a.S6AApplication.APP_ID,
+        s6a.S6AApplicationCommands.AUTHENTICATION_INFORMATION, [
+            session_id,
+            avp.AVP('Auth-Session-State', 1),
+            avp.AVP('Origin-Host', 'mme.magma.com'),
+            avp.AVP('Origin-Realm', REALM),
+            avp.AVP('Destination-Realm', REALM),
+            avp.AVP('User-Name', IMSI),
+            avp.AVP('Visited-PLMN-Id', b'\x00\xf1\x10'),
+            avp.AVP(
+                'Requested-EUTRAN-Authentication-Info', [
+                    avp.AVP('Number-Of-Requested-Vectors', 1),
+                    avp.AVP('Immediate-Response-Preferred', 0),
+                ],
+            ),
+        ],
+    )
+    ulr = _request(
+        s6a.S6AApplication.APP_ID,
+        s6a.S6AApplicationCommands.UPDATE_LOCATION, [
+            session_id,
+            avp.AVP('Auth-Session-State', 1),
+            avp.AVP('Origin-Host', 'mme.magma.com'),
+            avp.AVP('Origin-Realm', REALM),
+            avp.AVP('Destination-Realm', REALM),
+            avp.AVP('User-Name', IMSI),
+            avp.AVP('RAT-Type', 1004),
+            avp.AVP('ULR-Flags', 34),
+            avp.AVP('Visited-PLMN-Id', b'\x00\xf1\x10'),
+        ],
+    )
+    return cer + dwr + air + ulr
+
+
+def _load_trace(args):
+    if args.trace:
+        with open(args.trace, 'rb') as trace_file:
+            return trace_file.read()
+    return _default_trace()
+
+
+def _benchmark_decode(args):
+    """
+    Time feeding the trace to S6aServer.data_received in args.chunk byte
+    reads, validating each message and reading its User-Name like the
+    applications do
+    """
+    trace = _load_trace(args)
+    s6a_manager = s6a.S6AApplication(_Processor(), REALM, HOST, HOST_IP)
+    required_fields = dict(base.BaseApplication.REQUIRED_FIELDS)
+    required_fields.update(s6a_manager.REQUIRED_FIELDS)
+    user_name = avp.resolve('User-Name')
+    num_msgs = 0
+
+    def handle_msg(application_id, msg):
+        nonlocal num_msgs
+        num_msgs += 1
+        msg.has_fields(required_fields.get(msg.header.command_code, []))
+        user_name_avp = msg.find_avp(*user_name)
+        if user_name_avp is not None:
+            user_name_avp.value
+
+    diameter_server = server.S6aServer(None, None, REALM, HOST)
+    diameter_server._readbuf = bytearray()
+    diameter_server._handle_msg = handle_msg
+    chunk = args.chunk or len(trace)
+    chunks = [
+        trace[offset:offset + chunk]
+        for offset in range(0, len(trace), chunk)
+    ]
+
+    start = time.perf_counter()
+    for _ in range(args.num):
+        for data in chunks:
+            diameter_server.data_received(data)
+    print_result(
+        'decode %d byte reads' % chunk, num_msgs,
+        time.perf_counter() - start,
+    )
+
+
+def _benchmark_encode(args):
+    """
+    Time generating and encoding CEAs, DWAs, AIAs and ULAs to the requests
+    of the default trace
+    """
+    base_manager = base.BaseApplication(REALM, HOST, HOST_IP)
+    s6a_manager = s6a.S6AApplication(_Processor(), REALM, HOST, HOST_IP)
+    base_manager.register(s6a_manager)
+    writer = _Writer()
+    base_manager.set_writer(writer)
+    s6a_manager.set_writer(writer)
+
+    trace = memoryview(_default_trace())
+    requests = []
+    while trace:
+        msg = message.decode(trace)
+        requests.append(msg)
+        trace = trace[msg.length:]
+    cer, dwr, air, ulr = requests
+
+    def send_aia(state_id, msg):
+        for resp in s6a_manager._gen_auth_answers(IMSI, [(1, msg, writer)]):
+            writer.send_msg(resp)
+
+    for name, send, msg in (
+        ('CEA', base_manager._send_capabilities, cer),
+        ('DWA', base_manager._send_device_watchdog, dwr),
+        ('AIA', send_aia, air),
+        ('ULA', s6a_manager._send_location_request, ulr),
+    ):
+        start = time.perf_counter()
+        for _ in range(args.num):
+            send(1, msg)
+        print_result(
+            'encode %s' % name, args.num, time.perf_counter() - start,
+        )
+
+
+def create_parser():
+    """
+    Creates the argparse parser with all the arguments.
+    """
+    parser = argparse.ArgumentParser(
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter,
+    )
+
+    # Add subcommands
+    subparsers = parser.add_subparsers(title="subcommands", dest="cmd")
+    parser_decode = subparsers.add_parser(
+        "decode",
+        help="S6aServer Diameter decode microbenchmark",
+    )
+    parser_encode = subparsers.add_parser(
+        "encode",
+        help="S6a and base application answer encode microbenchmark",
+    )
+
+    # Add arguments
+    parser_decode.add_argument(
+        "--num", type=int, default=10000,
+        help="Number of times the trace is decoded",
+    )
+    parser_decode.add_argument(
+        "--chunk", type=int, default=0,
+        help="Size of the reads the trace is fed in, 0 for a single read",
+    )
+    parser_decode.add_argument(
+        "--trace", type=str, default=None,
+        help="File of captured Diameter messages, e.g. a TCP stream "
+        "exported as raw bytes. Defaults to the requests of an attach",
+    )
+    parser_encode.add_argument(
+        "--num", type=int, default=10000,
+        help="Number of answers of each command encoded",
+    )
+
+    # Add function callbacks
+    parser_decode.set_defaults(func=_benchmark_decode)
+    parser_encode.set_defaults(func=_benchmark_encode)
+    return parser
+
+
+def main():
+    parser = create_parser()
+
+    # Parse the args
+    args = parser.parse_args()
+    if not args.cmd:
+        parser.print_usage()
+        exit(1)
+
+    args.func(args)
+
+
+if __name__ == "__main__":
+    main()
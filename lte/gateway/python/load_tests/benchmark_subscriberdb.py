@@ -0,0 +1,154 @@
+#!/usr/bin/env python3
+"""
+Copyright 2020 The Magma Authors.
+
+This source code is licensed under the BSD-style license found in the
+LICENSE file in the root directory of this source tree.
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+
+import argparse
+import random
+import sqlite3
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from load_tests.common import print_result
+from lte.protos.subscriberdb_pb2 import LTESubscription, SubscriberData
+from magma.subscriberdb.sid import SIDUtils
+from magma.subscriberdb.store.base import SubscriberNotFoundError
+from magma.subscriberdb.store.sqlite import SqliteStore
+
+CHECKPOINTS = (10000, 1000000)
+
+
+def _sid(index: int) -> str:
+    return 'IMSI%015d' % index
+
+
+def _get_subscriber_data_per_call(store: SqliteStore, subscriber_id: str):
+    """
+    get_subscriber_data as the store used to do it, opening and closing a
+    shared cache connection on every call
+    """
+    db_location = store._db_locations[store._sid2bucket(subscriber_id)]
+    conn = sqlite3.connect(db_location + '?cache=shared', uri=True)
+    try:
+        with conn:
+            res = conn.execute(
+                "SELECT data FROM subscriberdb WHERE "
+                "subscriber_id = ?", (subscriber_id,),
+            )
+            row = res.fetchone()
+            if not row:
+                raise SubscriberNotFoundError(subscriber_id)
+    finally:
+        conn.close()
+    subscriber_data = SubscriberData()
+    subscriber_data.ParseFromString(row[0])
+    return subscriber_data
+
+
+def _time_lookups(name, lookup, sids, num_threads):
+    start = time.perf_counter()
+    if num_threads == 1:
+        for sid in sids:
+            lookup(sid)
+    else:
+        with ThreadPoolExecutor(max_workers=num_threads) as executor:
+            list(executor.map(lookup, sids))
+    print_result(
+        name, len(sids), time.perf_counter() - start, name_width=40,
+    )
+
+
+def _benchmark_lookup(args):
+    """
+    Time SqliteStore.get_subscriber_data against a connection per call with
+    10k and 1M subscribers stored, up to args.num subscribers
+    """
+    with tempfile.TemporaryDirectory() as db_dir:
+        store = SqliteStore(db_dir + '/')
+        num_added = 0
+        for checkpoint in CHECKPOINTS:
+            if checkpoint > args.num:
+                break
+            while num_added < checkpoint:
+                store.add_subscriber(
+                    SubscriberData(
+                        sid=SIDUtils.to_pb(_sid(num_added)),
+                        lte=LTESubscription(auth_key=b'\x00' * 16),
+                    ),
+                )
+                num_added += 1
+
+            sids = [
+                _sid(random.randrange(num_added))
+                for _ in range(args.sample)
+            ]
+            _time_lookups(
+                'per call connect @%d subs' % checkpoint,
+                lambda sid: _get_subscriber_data_per_call(store, sid),
+                sids, args.threads,
+            )
+            _time_lookups(
+                'pooled connections @%d subs' % checkpoint,
+                store.get_subscriber_data, sids, args.threads,
+            )
+        store.close()
+
+
+def create_parser():
+    """
+    Creates the argparse parser with all the arguments.
+    """
+    parser = argparse.ArgumentParser(
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter,
+    )
+
+    # Add subcommands
+    subparsers = parser.add_subparsers(title="subcommands", dest="cmd")
+    parser_lookup = subparsers.add_parser(
+        "lookup",
+        help="SqliteStore subscriber lookup microbenchmark",
+    )
+
+    # Add arguments
+    parser_lookup.add_argument(
+        "--num", type=int, default=1000000,
+        help="Largest number of stored subscribers to measure at",
+    )
+    parser_lookup.add_argument(
+        "--sample", type=int, default=10000,
+        help="Number of lookups timed at each checkpoint",
+    )
+    parser_lookup.add_argument(
+        "--threads", type=int, default=1,
+        help="Number of threads doing the lookups",
+    )
+
+    # Add function callbacks
+    parser_lookup.set_defaults(func=_benchmark_lookup)
+    return parser
+
+
+def main():
+    parser = create_parser()
+
+    # Parse the args
+    args = parser.parse_args()
+    if not args.cmd:
+        parser.print_usage()
+        exit(1)
+
+    args.func(args)
+
+
+if __name__ == "__main__":
+    main()
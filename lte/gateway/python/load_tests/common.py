@@ -97,3 +97,44 @@ def benchmark_grpc_request(
     except subprocess.CalledProcessError as e:
         print(e.output)
         print('Check if gRPC GHZ tool is installed')
+
+
+def print_result(
+    name: str,
+    num_ops: int,
+    elapsed: float,
+    name_width: int = 30,
+):
+    """Print the throughput of a microbenchmark
+
+    Args:
+        name (str): name of the timed operation
+        num_ops (int): number of operations timed
+        elapsed (float): time taken by the operations, in seconds
+        name_width (int): width of the name column
+    """
+    print(
+        '%-*s %8d ops %10.3f s %12.1f ops/s %8.2f us/op' % (
+            name_width, name, num_ops, elapsed, num_ops / elapsed,
+            elapsed * 1e6 / num_ops,
+        ),
+    )
+
+
+def print_latencies(name: str, latencies: List[float]):
+    """Print the median, 99th percentile and max of a microbenchmark's
+    latencies
+
+    Args:
+        name (str): name of the timed operation
+        latencies (List[float]): latency of every operation, in seconds
+    """
+    latencies = sorted(latencies)
+    print(
+        '%-30s p50 %8.2f ms p99 %8.2f ms max %8.2f ms' % (
+            name,
+            latencies[len(latencies) // 2] * 1000,
+            latencies[len(latencies) * 99 // 100] * 1000,
+            latencies[-1] * 1000,
+        ),
+    )
@@ -13,13 +13,45 @@ limitations under the License.
 
 from abc import ABC, abstractmethod
 from collections import namedtuple
-from typing import Any, Callable, Dict, List, Optional
+from typing import Any, Callable, Dict, List, Optional, Type
 
 from magma.enodebd.data_models.data_model_parameters import ParameterName
 
 TrParam = namedtuple('TrParam', ['path', 'is_invasive', 'type', 'is_optional'])
 
 
+class _DataModelIndex:
+    """
+    Lookup tables of a data model, built once from its parameters so
+    looking up a parameter doesn't scan all of them.
+    """
+
+    def __init__(self, data_model: Type['DataModel']):
+        self.param_names = data_model.get_parameter_names()
+        self.optional_param_names = [
+            name for name in self.param_names
+            if data_model.get_parameter(name).is_optional
+        ]
+        # Parameters other than numbered ones, by path. Several names may
+        # share a path.
+        self.names_by_path = {}
+        for name in self.param_names:
+            path = data_model.get_parameter(name).path
+            self.names_by_path.setdefault(path, []).append(name)
+
+        all_param_names = list(self.param_names)
+        for param_name_list in data_model.get_numbered_param_names().values():
+            all_param_names.extend(param_name_list)
+        self.name_by_path = {}
+        for name in all_param_names:
+            param_info = data_model.get_parameter(name)
+            if param_info is not None:
+                self.name_by_path.setdefault(param_info.path, name)
+
+        self.magma_transforms = data_model._get_magma_transforms()
+        self.enb_transforms = data_model._get_enb_transforms()
+
+
 class DataModel(ABC):
     """
     Class to represent relevant data model parameters.
@@ -83,20 +115,25 @@ class DataModel(ABC):
         Return optional params confirmed to be present in data model.
         NOTE: Make sure we already know which parameters are present or not
         """
-        all_optional = self.get_names_of_optional_params()
-        all_present = self.get_parameter_names()
-        for param in all_optional:
-            if not self.is_parameter_present(param):
-                all_present.remove(param)
-        return all_present
+        index = self._get_index()
+        missing = {
+            param for param in index.optional_param_names
+            if not self.is_parameter_present(param)
+        }
+        return [param for param in index.param_names if param not in missing]
 
     @classmethod
     def get_names_of_optional_params(cls) -> List[ParameterName]:
-        all_optional_params = []
-        for name in cls.get_parameter_names():
-            if cls.get_parameter(name).is_optional:
-                all_optional_params.append(name)
-        return all_optional_params
+        return list(cls._get_index().optional_param_names)
+
+    @classmethod
+    def get_parameter_names_by_path(cls) -> Dict[str, List[ParameterName]]:
+        """
+        Returns:
+            The names returned by get_parameter_names, by parameter path.
+            The mapping is shared and must not be modified.
+        """
+        return cls._get_index().names_by_path
 
     @classmethod
     def transform_for_magma(
@@ -119,7 +156,7 @@ class DataModel(ABC):
             Returns the nominal value of the parameter that is understood
             by Magma code.
         """
-        transforms = cls._get_magma_transforms()
+        transforms = cls._get_index().magma_transforms
         if param_name in transforms:
             transform_function = transforms[param_name]
             return transform_function(enb_value)
@@ -147,7 +184,7 @@ class DataModel(ABC):
             Returns the native value of the parameter that will be set in the
             CPE data model configuration.
         """
-        transforms = cls._get_enb_transforms()
+        transforms = cls._get_index().enb_transforms
         if param_name in transforms:
             transform_function = transforms[param_name]
             return transform_function(magma_value)
@@ -165,16 +202,17 @@ class DataModel(ABC):
         Returns:
             ParameterName or None if there is no ParameterName matching
         """
-        all_param_names = cls.get_parameter_names()
-        numbered_param_names = cls.get_numbered_param_names()
-        for _obj_name, param_name_list in numbered_param_names.items():
-            all_param_names = all_param_names + param_name_list
-
-        for param_name in all_param_names:
-            param_info = cls.get_parameter(param_name)
-            if param_info is not None and param_path == param_info.path:
-                return param_name
-        return None
+        return cls._get_index().name_by_path.get(param_path)
+
+    @classmethod
+    def _get_index(cls) -> _DataModelIndex:
+        # Look in the class' own namespace, so subclasses of a data model
+        # don't share its index
+        index = cls.__dict__.get('_index')
+        if index is None:
+            index = _DataModelIndex(cls)
+            cls._index = index
+        return index
 
     @classmethod
     @abstractmethod
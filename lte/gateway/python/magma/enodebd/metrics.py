@@ -11,7 +11,7 @@ See the License for the specific language governing permissions and
 limitations under the License.
 """
 
-from prometheus_client import Counter, Gauge
+from prometheus_client import Counter, Gauge, Histogram
 
 # Gauges for current eNodeB status
 STAT_ENODEB_CONNECTED = Gauge(
@@ -55,6 +55,28 @@ STAT_ENODEB_REBOOTS = Counter(
     'ENodeB reboots by enodebd', ['cause'],
 )
 
+# TR-069 server load
+STAT_TR069_CONNECTIONS = Gauge(
+    'tr069_active_connections',
+    'TR-069 HTTP connections currently open',
+)
+STAT_TR069_REQUESTS_PER_CONNECTION = Histogram(
+    'tr069_requests_per_connection',
+    'TR-069 HTTP requests served over a single keep-alive connection',
+    buckets=[1, 2, 4, 8, 16, 32, 64],
+)
+STAT_TR069_REQUEST_LATENCY = Histogram(
+    'tr069_request_latency_ms',
+    'Latency handling a TR-069 HTTP request in milliseconds',
+    buckets=[1, 5, 10, 25, 50, 100, 250, 500, 1000, 5000],
+)
+STAT_TR069_SESSION_LATENCY = Histogram(
+    'tr069_session_latency_ms',
+    'Duration of a TR-069 session, from connection to close, '
+    'in milliseconds',
+    buckets=[10, 50, 100, 500, 1000, 5000, 10000, 30000, 60000, 240000],
+)
+
 # Metrics that are accumulated by eNodeB. Use gauges to avoid 'double-counting',
 # since eNodeB does accumulation.
 STAT_RRC_ESTAB_ATT = Gauge(
@@ -124,6 +146,20 @@ STAT_ERAB_REL_REQ_OAM_INTV = Gauge(
     'erab_release_requests_oam_intervention',
     'ERAB release requests due to OAM intervention',
 )
+STAT_EQPT_MEAN_LOAD = Gauge(
+    'eqpt_mean_me_load', 'Mean load of the eNodeB equipment',
+)
+STAT_EQPT_MAX_LOAD = Gauge(
+    'eqpt_max_me_load', 'Maximum load of the eNodeB equipment',
+)
+STAT_SCTP_CONGESTION_DURATION = Gauge(
+    'sctp_congestion_duration',
+    'Duration the SCTP association with the MME was congested',
+)
+STAT_SCTP_UNAVAILABLE_DURATION = Gauge(
+    'sctp_unavailable_duration',
+    'Duration the SCTP association with the MME was unavailable',
+)
 STAT_PDCP_USER_PLANE_BYTES_UL = Gauge(
     'pdcp_user_plane_bytes_ul', 'User plane uplink bytes at PDCP', ['enodeb'],
 )
@@ -38,16 +38,10 @@ def process_inform_message(
         device_handler: The state machine we are using for our device
     """
     param_values_by_path = _get_param_values_by_path(inform)
-    param_name_list = data_model.get_parameter_names()
-    name_to_val = {}
-    for name in param_name_list:
-        path = data_model.get_parameter(name).path
-        if path in param_values_by_path:
-            value = param_values_by_path[path]
-            name_to_val[name] = value
-
-    for name, val in name_to_val.items():
-        device_cfg.set_parameter(name, val)
+    names_by_path = data_model.get_parameter_names_by_path()
+    for path, value in param_values_by_path.items():
+        for name in names_by_path.get(path, ()):
+            device_cfg.set_parameter(name, value)
 
 
 def get_device_name_from_inform(
@@ -301,12 +295,10 @@ def parse_get_parameter_values_response(
         param_values_by_path[param_value_struct.Name] = \
             param_value_struct.Value.Data
 
-    param_name_list = data_model.get_parameter_names()
+    names_by_path = data_model.get_parameter_names_by_path()
     name_to_val = {}
-    for name in param_name_list:
-        path = data_model.get_parameter(name).path
-        if path in param_values_by_path:
-            value = param_values_by_path[path]
+    for path, value in param_values_by_path.items():
+        for name in names_by_path.get(path, ()):
             name_to_val[name] = value
 
     return name_to_val
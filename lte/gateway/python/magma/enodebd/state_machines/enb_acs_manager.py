@@ -11,6 +11,7 @@ See the License for the specific language governing permissions and
 limitations under the License.
 """
 
+import threading
 from typing import Any, List, Optional
 
 from magma.common.service import MagmaService
@@ -32,6 +33,11 @@ class StateMachineManager:
     """
     Delegates tr069 message handling to a dedicated state machine for the
     device.
+
+    Messages may be handled from several TR-069 server threads. Messages from
+    the same IP are handled one at a time, in the order they are received, so
+    each device's state machine sees its session in order. Messages from
+    different devices are handled concurrently.
     """
 
     def __init__(
@@ -41,6 +47,9 @@ class StateMachineManager:
         self._ip_serial_mapping = IpToSerialMapping()
         self._service = service
         self._state_machine_by_ip = {}
+        # Guards the IP <-> serial <-> state machine mappings
+        self._lock = threading.Lock()
+        self._lock_by_ip = {}
 
     def handle_tr069_message(
         self,
@@ -49,9 +58,18 @@ class StateMachineManager:
     ) -> Any:
         """ Delegate message handling to the appropriate eNB state machine """
         client_ip = self._get_client_ip(ctx)
+        with self._get_ip_lock(client_ip):
+            return self._handle_tr069_message(client_ip, tr069_message)
+
+    def _handle_tr069_message(
+        self,
+        client_ip: str,
+        tr069_message: ComplexModelBase,
+    ) -> Any:
         if isinstance(tr069_message, models.Inform):
             try:
-                self._update_device_mapping(client_ip, tr069_message)
+                with self._lock:
+                    self._update_device_mapping(client_ip, tr069_message)
             except UnrecognizedEnodebError as err:
                 logger.warning(
                     'Received TR-069 Inform message from an '
@@ -61,7 +79,8 @@ class StateMachineManager:
                 )
                 return models.DummyInput()
 
-        handler = self._get_handler(client_ip)
+        with self._lock:
+            handler = self._get_handler(client_ip)
         if handler is None:
             logger.warning(
                 'Received non-Inform TR-069 message from unknown '
@@ -88,6 +107,14 @@ class StateMachineManager:
         serial = self._ip_serial_mapping.get_serial(client_ip)
         return serial or 'default'
 
+    def _get_ip_lock(self, client_ip: str) -> threading.Lock:
+        with self._lock:
+            lock = self._lock_by_ip.get(client_ip)
+            if lock is None:
+                lock = threading.Lock()
+                self._lock_by_ip[client_ip] = lock
+            return lock
+
     def _get_handler(
         self,
         client_ip: str,
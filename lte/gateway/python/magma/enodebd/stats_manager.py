@@ -24,6 +24,9 @@ from magma.enodebd.state_machines.enb_acs_manager import StateMachineManager
 
 from . import metrics
 
+# Size of the reads of a PM file upload fed to the parser
+PM_FILE_CHUNK_SIZE = 64 * 1024
+
 
 class StatsManager:
     """ HTTP server to receive performance management uploads from eNodeB and
@@ -64,6 +67,20 @@ class StatsManager:
         'PDCP.UpOctUl': metrics.STAT_PDCP_USER_PLANE_BYTES_UL,
         'PDCP.UpOctDl': metrics.STAT_PDCP_USER_PLANE_BYTES_DL,
     }
+    MANAGED_ELEMENT_PM_FILE_TO_METRIC_MAP = {
+        'EQPT.MeanMeLoad': metrics.STAT_EQPT_MEAN_LOAD,
+        'EQPT.MaxMeLoad': metrics.STAT_EQPT_MAX_LOAD,
+    }
+    SCTP_ASSOC_PM_FILE_TO_METRIC_MAP = {
+        'SIG.SctpCongestionDuration': metrics.STAT_SCTP_CONGESTION_DURATION,
+        'SIG.SctpUnavailableDuration': metrics.STAT_SCTP_UNAVAILABLE_DURATION,
+    }
+    # Counters to parse from each type of measured object
+    PM_FILE_TO_METRIC_MAP_BY_OBJECT_TYPE = {
+        'EutranCellTdd': PM_FILE_TO_METRIC_MAP,
+        'ManagedElement': MANAGED_ELEMENT_PM_FILE_TO_METRIC_MAP,
+        'SctpAssoc': SCTP_ASSOC_PM_FILE_TO_METRIC_MAP,
+    }
 
     # Check if radio transmit is turned on every 10 seconds.
     CHECK_RF_TX_PERIOD = 10
@@ -147,37 +164,34 @@ class StatsManager:
     @asyncio.coroutine
     def _post_handler(self, request) -> web.Response:
         """ HTTP POST handler """
-        # Read request body and convert to XML tree
-        body = yield from request.read()
-
-        root = ElementTree.fromstring(body)
-        self._parse_pm_xml(self._get_enb_label_from_request(request), root)
+        # Parse the request body as it arrives. Parsing a large PM file takes
+        # a while, so do it off the event loop.
+        parser = PmFileParser(self, self._get_enb_label_from_request(request))
+        while True:
+            chunk = yield from request.content.read(PM_FILE_CHUNK_SIZE)
+            if not chunk:
+                break
+            yield from self.loop.run_in_executor(None, parser.feed, chunk)
+        yield from self.loop.run_in_executor(None, parser.close)
 
         # Return success response
         return web.Response()
 
-    def _parse_pm_xml(self, enb_label, xml_root) -> None:
+    def _parse_pm(self, enb_label, object_type, name_index_map, pm_el):
         """
-        Parse performance management XML from eNodeB and populate metrics.
-        The schema for this XML document, along with an example, is shown in
-        tests/stats_manager_tests.py.
+        Populate metrics from the counters of a measured object, the 'Pm'
+        element of a PM file. The schema for this XML document, along with an
+        example, is shown in tests/pm_file_example.xml.
         """
-        for measurement in xml_root.findall('Measurements'):
-            object_type = measurement.findtext('ObjectType')
-            names = measurement.find('PmName')
-            data = measurement.find('PmData')
-            if object_type == 'EutranCellTdd':
-                self._parse_tdd_counters(enb_label, names, data)
-            elif object_type == 'ManagedElement':
-                # Currently no counters to parse
-                pass
-            elif object_type == 'SctpAssoc':
-                # Currently no counters to parse
-                pass
-
-    def _parse_tdd_counters(self, enb_label, names, data):
+        metric_map = self.PM_FILE_TO_METRIC_MAP_BY_OBJECT_TYPE.get(object_type)
+        if metric_map is None:
+            logger.debug('No counters to parse for PM object %s', object_type)
+            return
+        self._parse_counters(enb_label, metric_map, name_index_map, pm_el)
+
+    def _parse_counters(self, enb_label, metric_map, name_index_map, pm_el):
         """
-        Parse eNodeB performance management counters from TDD structure.
+        Parse eNodeB performance management counters of a measured object.
         Most of the logic is just to extract the correct counter based on the
         name of the statistic. Each counter is either of type 'V', which is a
         single integer value, or 'CV', which contains multiple integer
@@ -191,14 +205,13 @@ class StatsManager:
           <SN>RRC.AttConnReestab.OTHER</SN>
           <SV>0</SV>
         </CV>
-        See tests/stats_manager_tests.py for a more complete example.
+        See tests/pm_file_example.xml for a more complete example.
         """
-        index_data_map = self._build_index_to_data_map(data)
-        name_index_map = self._build_name_to_index_map(names)
+        index_data_map = self._build_index_to_data_map(pm_el)
 
         # For each performance metric, extract value from XML document and set
         # internal metric to that value.
-        for pm_name, metric in self.PM_FILE_TO_METRIC_MAP.items():
+        for pm_name, metric in metric_map.items():
 
             elements = pm_name.split(':')
             counter = elements.pop(0)
@@ -274,7 +287,7 @@ class StatsManager:
             else:
                 metric.set(value)
 
-    def _build_index_to_data_map(self, data_etree):
+    def _build_index_to_data_map(self, pm_etree):
         """
         Parse XML ElementTree and build a dict mapping index to data XML
         element. The relevant part of XML schema being parsed is:
@@ -312,22 +325,21 @@ class StatsManager:
         </xs:element>
 
         Inputs:
-            - XML elementree element corresponding to 'PmData' in above schema
+            - XML elementree element corresponding to 'Pm' in above schema
         Outputs:
             - Dict mapping index ('i' in above schema) to data elementree
               elements ('V' and 'CV' in above schema)
         """
         # Construct map of index to pm_data XML element
         index_data_map = {}
-        for pm_el in data_etree.findall('Pm'):
-            for data_el in pm_el.findall('V'):
-                index = data_el.get('i')
-                if index is not None:
-                    index_data_map[index] = data_el
-            for data_el in pm_el.findall('CV'):
-                index = data_el.get('i')
-                if index is not None:
-                    index_data_map[index] = data_el
+        for data_el in pm_etree.findall('V'):
+            index = data_el.get('i')
+            if index is not None:
+                index_data_map[index] = data_el
+        for data_el in pm_etree.findall('CV'):
+            index = data_el.get('i')
+            if index is not None:
+                index_data_map[index] = data_el
 
         return index_data_map
 
@@ -370,7 +382,63 @@ class StatsManager:
         """
         logger.info('Clearing performance counter statistics')
         # Set all metrics to 0 if eNodeB not connected
-        for pm_name, metric in self.PM_FILE_TO_METRIC_MAP:
-            # eNB data usage metrics will not be cleared
-            if pm_name not in ('PDCP.UpOctUl', 'PDCP.UpOctDl'):
-                metric.set(0)
+        for metric_map in self.PM_FILE_TO_METRIC_MAP_BY_OBJECT_TYPE.values():
+            for pm_name, metric in metric_map.items():
+                # eNB data usage metrics will not be cleared
+                if pm_name not in ('PDCP.UpOctUl', 'PDCP.UpOctDl'):
+                    metric.set(0)
+
+
+class PmFileParser:
+    """
+    Incremental parser of a performance management file uploaded by an
+    eNodeB. The file is fed in chunks, and the metrics are updated from each
+    measured object ('Pm' element) as soon as it has been read. Parsed
+    elements are then discarded, so the whole file is never held in memory.
+    """
+
+    def __init__(self, stats_manager: StatsManager, enb_label: str):
+        self._stats_manager = stats_manager
+        self._enb_label = enb_label
+        self._parser = ElementTree.XMLPullParser(events=('start', 'end'))
+        # Elements being parsed, from the root down
+        self._open_elements = []
+        self._object_type = None
+        self._name_index_map = {}
+
+    def feed(self, data: bytes) -> None:
+        """ Parse the next chunk of the file """
+        self._parser.feed(data)
+        self._read_events()
+
+    def close(self) -> None:
+        """ Finish parsing, raising ParseError if the file is incomplete """
+        self._parser.close()
+        self._read_events()
+
+    def _read_events(self) -> None:
+        for event, elem in self._parser.read_events():
+            if event == 'start':
+                self._open_elements.append(elem)
+                continue
+            self._open_elements.pop()
+
+            if elem.tag == 'ObjectType':
+                self._object_type = elem.text
+            elif elem.tag == 'PmName':
+                self._name_index_map = \
+                    self._stats_manager._build_name_to_index_map(elem)
+            elif elem.tag == 'Pm':
+                self._stats_manager._parse_pm(
+                    self._enb_label, self._object_type,
+                    self._name_index_map, elem,
+                )
+            elif elem.tag == 'Measurements':
+                self._object_type = None
+                self._name_index_map = {}
+            else:
+                continue
+
+            # Done with the element
+            if self._open_elements:
+                self._open_elements[-1].remove(elem)
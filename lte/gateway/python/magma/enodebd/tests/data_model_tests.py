@@ -117,6 +117,40 @@ class BaicellsTrDataModelTest(TestCase):
             ParameterName.PLMN_N % 6,
         )
 
+    def test_get_parameter_name_from_path(self):
+        name = BaicellsTrDataModel.get_parameter_name_from_path(
+            'Device.DeviceInfo.X_BAICELLS_COM_GPS_Status',
+        )
+        self.assertEqual(name, ParameterName.GPS_STATUS)
+
+        # Numbered parameters are found too
+        path = BaicellsTrDataModel.get_parameter(
+            ParameterName.PLMN_N_PLMNID % 2,
+        ).path
+        name = BaicellsTrDataModel.get_parameter_name_from_path(path)
+        self.assertEqual(name, ParameterName.PLMN_N_PLMNID % 2)
+
+        name = BaicellsTrDataModel.get_parameter_name_from_path(
+            'Device.DeviceInfo.NotAParameter',
+        )
+        self.assertIsNone(name)
+
+    def test_get_parameter_names_by_path(self):
+        names_by_path = BaicellsTrDataModel.get_parameter_names_by_path()
+        self.assertEqual(
+            names_by_path['Device.DeviceInfo.X_BAICELLS_COM_GPS_Status'],
+            [ParameterName.GPS_STATUS],
+        )
+
+        # Only parameters that are not numbered are indexed
+        path = BaicellsTrDataModel.get_parameter(
+            ParameterName.PLMN_N_PLMNID % 1,
+        ).path
+        self.assertNotIn(path, names_by_path)
+        for name in BaicellsTrDataModel.get_parameter_names():
+            path = BaicellsTrDataModel.get_parameter(name).path
+            self.assertIn(name, names_by_path[path])
+
     def test_transform_for_magma(self):
         gps_lat = str(10 * 1000000)
         gps_lat_magma = BaicellsTrDataModel.transform_for_magma(
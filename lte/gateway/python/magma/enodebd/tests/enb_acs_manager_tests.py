@@ -12,6 +12,8 @@ limitations under the License.
 """
 
 # pylint: disable=protected-access
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from unittest import TestCase
 
 from magma.enodebd.state_machines.enb_acs_manager import StateMachineManager
@@ -169,6 +171,60 @@ class StateMachineManagerTests(TestCase):
             'State machine should be requesting param values',
         )
 
+    def test_handle_ips_concurrently(self):
+        """
+        Test that messages from the same IP are handled one at a time, without
+        holding up the messages from other IPs
+        """
+        manager = self._get_manager()
+        ctx1 = get_spyne_context_with_ip("192.168.60.145")
+        ctx2 = get_spyne_context_with_ip("192.168.60.99")
+        for ctx, enb_serial in (
+            (ctx1, '120200002618AGP0001'),
+            (ctx2, '120200002618AGP0002'),
+        ):
+            inform_msg = Tr069MessageBuilder.get_inform(
+                '48BF74',
+                'BaiBS_RTS_3.1.6',
+                enb_serial,
+            )
+            manager.handle_tr069_message(ctx, inform_msg)
+
+        # Hold the first IP's state machine in the middle of a message
+        entered = threading.Event()
+        release = threading.Event()
+        active = []
+
+        def handle_slowly(message):
+            active.append(message)
+            entered.set()
+            release.wait(5)
+            overlapped = len(active) > 1
+            active.remove(message)
+            return overlapped
+
+        handler1 = manager.get_handler_by_ip("192.168.60.145")
+        handler1.handle_tr069_message = handle_slowly
+
+        with ThreadPoolExecutor(max_workers=2) as executor:
+            first = executor.submit(
+                manager.handle_tr069_message, ctx1, models.DummyInput(),
+            )
+            self.assertTrue(entered.wait(5))
+            second = executor.submit(
+                manager.handle_tr069_message, ctx1, models.DummyInput(),
+            )
+
+            resp2 = manager.handle_tr069_message(ctx2, models.DummyInput())
+            self.assertTrue(
+                isinstance(resp2, models.GetParameterValues),
+                'Second IP should be handled while the first one is busy',
+            )
+
+            release.set()
+            self.assertFalse(first.result(5))
+            self.assertFalse(second.result(5))
+
     def test_handle_registered_enb(self):
         """
         When we have a config with eNB registered per serial, we should accept
@@ -12,14 +12,13 @@ limitations under the License.
 """
 
 from unittest import TestCase, mock
-from xml.etree import ElementTree
 
 import pkg_resources
 from magma.enodebd import metrics
 from magma.enodebd.data_models.data_model_parameters import ParameterName
 from magma.enodebd.devices.device_utils import EnodebDeviceName
 from magma.enodebd.state_machines.enb_acs_manager import StateMachineManager
-from magma.enodebd.stats_manager import StatsManager
+from magma.enodebd.stats_manager import PmFileParser, StatsManager
 from magma.enodebd.tests.test_utils.config_builder import EnodebConfigBuilder
 from magma.enodebd.tests.test_utils.enb_acs_builder import (
     EnodebAcsStateMachineBuilder,
@@ -75,8 +74,9 @@ class StatsManagerTest(TestCase):
             'pm_file_example.xml',
         )
 
-        root = ElementTree.fromstring(pm_file_example)
-        self.mgr._parse_pm_xml('1234', root)
+        parser = PmFileParser(self.mgr, '1234')
+        parser.feed(pm_file_example)
+        parser.close()
 
         # Check that metrics were correctly populated
         # See '<V i="5">123</V>' in pm_file_example
@@ -102,3 +102,27 @@ class StatsManagerTest(TestCase):
         self.assertEqual(pdcp_user_plane_bytes_dl[0].samples[0][1], {'enodeb': '1234'})
         self.assertEqual(pdcp_user_plane_bytes_ul[0].samples[0][2], 1000)
         self.assertEqual(pdcp_user_plane_bytes_dl[0].samples[0][2], 500)
+
+    def test_parse_stats_in_chunks(self):
+        """ Test that statistics are parsed from a PM file fed in chunks,
+            including the equipment and SCTP counters """
+        pm_file_example = pkg_resources.resource_string(
+            __name__,
+            'pm_file_example.xml',
+        )
+
+        parser = PmFileParser(self.mgr, '1234')
+        for offset in range(0, len(pm_file_example), 100):
+            parser.feed(pm_file_example[offset:offset + 100])
+        parser.close()
+
+        # See '<V i="7">99</V>' in pm_file_example
+        rrc_estab_successes = metrics.STAT_RRC_ESTAB_SUCC.collect()
+        self.assertEqual(rrc_estab_successes[0].samples[0][2], 99)
+        # See the ManagedElement and SctpAssoc measurements
+        eqpt_mean_load = metrics.STAT_EQPT_MEAN_LOAD.collect()
+        self.assertEqual(eqpt_mean_load[0].samples[0][2], 35)
+        eqpt_max_load = metrics.STAT_EQPT_MAX_LOAD.collect()
+        self.assertEqual(eqpt_max_load[0].samples[0][2], 80)
+        sctp_unavailable = metrics.STAT_SCTP_UNAVAILABLE_DURATION.collect()
+        self.assertEqual(sctp_unavailable[0].samples[0][2], 12)
@@ -458,6 +458,37 @@ class Tr069Test(TestCase):
         self.assertEqual(ctx.in_error, None)
         self.assertEqual(ctx.function, AutoConfigServer.empty_http)
 
+    def test_out_message_name_per_context(self):
+        """
+        Test that naming the output message of a request doesn't rename it
+        for the other requests of the same method
+        """
+        self.p.stop()
+        server = ServerBase(self.app)
+
+        ctx1 = MethodContext(server, MethodContext.SERVER)
+        ctx1.in_string = [b'']
+        ctx1, = server.generate_contexts(ctx1)
+        ctx2 = MethodContext(server, MethodContext.SERVER)
+        ctx2.in_string = [b'']
+        ctx2, = server.generate_contexts(ctx2)
+        out_message = ctx1.descriptor.out_message
+
+        AutoConfigServer._set_out_message_name(ctx1, 'GetParameterValues')
+        AutoConfigServer._set_out_message_name(ctx2, 'EmptyHttp')
+        self.p.start()
+
+        self.assertEqual(
+            ctx1.descriptor.out_message.Attributes.sub_name,
+            'GetParameterValues',
+        )
+        self.assertEqual(
+            ctx2.descriptor.out_message.Attributes.sub_name,
+            'EmptyHttp',
+        )
+        self.assertIsNot(ctx1.descriptor.out_message, out_message)
+        self.assertEqual(ctx1.function, AutoConfigServer.empty_http)
+
     def test_generate_empty_http(self):
         """
         Test that empty HTTP message is generated when setting output message
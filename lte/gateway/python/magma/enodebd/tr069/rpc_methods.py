@@ -11,6 +11,8 @@ See the License for the specific language governing permissions and
 limitations under the License.
 """
 
+import copy
+
 from magma.enodebd.logger import EnodebdLogger as logger
 from magma.enodebd.state_machines.enb_acs_manager import StateMachineManager
 from spyne.decorator import rpc
@@ -77,6 +79,9 @@ class AutoConfigServer(ServiceBase):
     """ Set maxEnvelopes to 1, as per TR-069 spec """
     _max_envelopes = 1
 
+    # (method descriptor, output message name) => descriptor copy
+    _out_descriptors = {}
+
     @classmethod
     def set_state_machine_manager(
         cls,
@@ -111,11 +116,31 @@ class AutoConfigServer(ServiceBase):
         # Set return message name
         if isinstance(req, models.DummyInput):
             # Generate 'empty' request to CPE using empty message name
-            ctx.descriptor.out_message.Attributes.sub_name = 'EmptyHttp'
+            cls._set_out_message_name(ctx, 'EmptyHttp')
             return models.AcsToCpeRequests()
-        ctx.descriptor.out_message.Attributes.sub_name = req.__class__.__name__
+        cls._set_out_message_name(ctx, req.__class__.__name__)
         return cls._generate_acs_to_cpe_request_copy(req)
 
+    @classmethod
+    def _set_out_message_name(
+        cls,
+        ctx: WsgiMethodContext,
+        name: str,
+    ) -> None:
+        """ Point the context at a copy of its method descriptor whose output
+            message is named name. Renaming the output message in place would
+            rename it for the concurrent requests of the same method too.
+        """
+        key = (ctx.descriptor, name)
+        descriptor = cls._out_descriptors.get(key)
+        if descriptor is None:
+            descriptor = copy.copy(ctx.descriptor)
+            descriptor.out_message = ctx.descriptor.out_message.customize(
+                sub_name=name,
+            )
+            descriptor = cls._out_descriptors.setdefault(key, descriptor)
+        ctx.descriptor = descriptor
+
     @classmethod
     def _get_tr069_response_from_sm(
             cls,
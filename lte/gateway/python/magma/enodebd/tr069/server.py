@@ -13,16 +13,23 @@ limitations under the License.
 
 import _thread
 import socket
+import time
+from concurrent.futures import ThreadPoolExecutor
 from wsgiref.simple_server import (
     ServerHandler,
     WSGIRequestHandler,
     WSGIServer,
-    make_server,
 )
 
 from magma.common.misc_utils import get_ip_from_if
 from magma.configuration.service_configs import load_service_config
 from magma.enodebd.logger import EnodebdLogger as logger
+from magma.enodebd.metrics import (
+    STAT_TR069_CONNECTIONS,
+    STAT_TR069_REQUEST_LATENCY,
+    STAT_TR069_REQUESTS_PER_CONNECTION,
+    STAT_TR069_SESSION_LATENCY,
+)
 from magma.enodebd.state_machines.enb_acs_manager import StateMachineManager
 from spyne.server.wsgi import WsgiApplication
 
@@ -36,6 +43,10 @@ from .spyne_mods import Tr069Application, Tr069Soap11
 # to avoid incorrectly detecting eNodeB timeout.
 SOCKET_TIMEOUT = 240
 
+# Number of TR-069 connections served concurrently. Messages of each eNodeB
+# are still handled in order, see StateMachineManager.
+DEFAULT_NUM_WORKERS = 16
+
 
 class tr069_WSGIRequestHandler(WSGIRequestHandler):
     timeout = 10
@@ -55,6 +66,8 @@ class tr069_WSGIRequestHandler(WSGIRequestHandler):
         if not self.parse_request():  # An error code has been sent, just exit
             return
 
+        start = time.perf_counter()
+        self.num_requests += 1
         handler = ServerHandler(
             self.rfile, self.wfile, self.get_stderr(), self.get_environ(),
         )
@@ -73,10 +86,16 @@ class tr069_WSGIRequestHandler(WSGIRequestHandler):
             handler.run(self.server.get_app())
         except BrokenPipeError:
             self.log_error("eNodeB has unexpectedly closed the TCP connection.")
+        STAT_TR069_REQUEST_LATENCY.observe(
+            (time.perf_counter() - start) * 1000,
+        )
 
     def handle(self):
         self.protocol_version = "HTTP/1.1"
         self.close_connection = 0
+        self.num_requests = 0
+        start = time.perf_counter()
+        STAT_TR069_CONNECTIONS.inc()
 
         try:
             while not self.close_connection:
@@ -92,6 +111,13 @@ class tr069_WSGIRequestHandler(WSGIRequestHandler):
             self.close_connection = 1
             return
 
+        finally:
+            STAT_TR069_CONNECTIONS.dec()
+            STAT_TR069_REQUESTS_PER_CONNECTION.observe(self.num_requests)
+            STAT_TR069_SESSION_LATENCY.observe(
+                (time.perf_counter() - start) * 1000,
+            )
+
     # Disable pylint warning because we are using same parameter name as built-in
     # pylint: disable=redefined-builtin
     def log_message(self, format, *args):
@@ -107,17 +133,51 @@ class tr069_WSGIRequestHandler(WSGIRequestHandler):
         logger.warning("%s - %s", self.client_address[0], format % args)
 
 
-def tr069_server(state_machine_manager: StateMachineManager) -> None:
+class tr069_WSGIServer(WSGIServer):
     """
-    TR-069 server
-    Inputs:
-        - acs_to_cpe_queue = instance of Queue
-            containing messages from parent process/thread to be sent to CPE
-        - cpe_to_acs_queue = instance of Queue
-            containing messages from CPE to be sent to parent process/thread
+    WSGI server handing each connection to a pool of worker threads, so a
+    slow or idle keep-alive connection of one eNodeB doesn't hold up the
+    sessions of the others
     """
-    config = load_service_config("enodebd")
+    # Listen backlog, so eNodeBs connecting at the same time, e.g. after a
+    # gateway restart, aren't dropped until they retry
+    request_queue_size = 128
+
+    def __init__(self, *args, num_workers=DEFAULT_NUM_WORKERS, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._executor = ThreadPoolExecutor(
+            max_workers=num_workers,
+            thread_name_prefix='tr069',
+        )
+
+    def process_request(self, request, client_address):
+        self._executor.submit(
+            self._process_request_worker, request, client_address,
+        )
 
+    def _process_request_worker(self, request, client_address):
+        """ Same as socketserver.ThreadingMixIn.process_request_thread """
+        try:
+            self.finish_request(request, client_address)
+        except Exception:  # pylint: disable=broad-except
+            self.handle_error(request, client_address)
+        finally:
+            self.shutdown_request(request)
+
+    def server_close(self):
+        super().server_close()
+        self._executor.shutdown(wait=False)
+
+
+def make_tr069_server(
+    state_machine_manager: StateMachineManager,
+    ip_address: str,
+    port: int,
+    num_workers: int = DEFAULT_NUM_WORKERS,
+) -> tr069_WSGIServer:
+    """
+    Create the TR-069 server, delegating messages to state_machine_manager
+    """
     AutoConfigServer.set_state_machine_manager(state_machine_manager)
 
     app = Tr069Application(
@@ -127,6 +187,25 @@ def tr069_server(state_machine_manager: StateMachineManager) -> None:
     )
     wsgi_app = WsgiApplication(app)
 
+    server = tr069_WSGIServer(
+        (ip_address, port), tr069_WSGIRequestHandler,
+        num_workers=num_workers,
+    )
+    server.set_app(wsgi_app)
+    return server
+
+
+def tr069_server(state_machine_manager: StateMachineManager) -> None:
+    """
+    TR-069 server
+    Inputs:
+        - acs_to_cpe_queue = instance of Queue
+            containing messages from parent process/thread to be sent to CPE
+        - cpe_to_acs_queue = instance of Queue
+            containing messages from CPE to be sent to parent process/thread
+    """
+    config = load_service_config("enodebd")
+
     try:
         ip_address = get_ip_from_if(config['tr069']['interface'])
     except (ValueError, KeyError) as e:
@@ -139,13 +218,11 @@ def tr069_server(state_machine_manager: StateMachineManager) -> None:
         'Starting TR-069 server on %s:%s',
         ip_address, config['tr069']['port'],
     )
-    server = make_server(
-        ip_address,
-        config['tr069']['port'], wsgi_app,
-        WSGIServer, tr069_WSGIRequestHandler,
+    server = make_tr069_server(
+        state_machine_manager, ip_address, config['tr069']['port'],
+        config['tr069'].get('num_workers', DEFAULT_NUM_WORKERS),
     )
 
-    # Note: use single-thread server, to avoid state contention
     try:
         server.serve_forever()
     finally:
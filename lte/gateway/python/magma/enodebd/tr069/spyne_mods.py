@@ -146,8 +146,7 @@ class Tr069Soap11(Soap11):
         # it still has a stale value.
         # Force repopulation of dictionary by deleting entry
         # TODO Remove this code once we have a better fix
-        if (ctx.descriptor.out_message in self._attrcache):
-            del self._attrcache[ctx.descriptor.out_message]  # noqa: WPS529
+        self._attrcache.pop(ctx.descriptor.out_message, None)
 
         super(Tr069Soap11, self).serialize(ctx, message)
 
@@ -33,11 +33,10 @@ To support this semantic, an IP address can have the following states
 during it's life cycle in the IP allocator:
     FREE: IP is available for allocation
     ALLOCATED: IP is allocated for a client.
-    RELEASED: IP is released, but still reserved for the client
-    REAPED: IPs are periodically reaped from the RELEASED state to the
-        REAPED state, and at the same time a timer is set. All REAPED state
-        IPs are freed once the time goes off. The purpose of this state is
-        to age IPs for a certain period of time before freeing.
+    RELEASED: IP is released, but still reserved for the client until its
+        recycle deadline, when it is freed.
+    REAPED: IP was released and is waiting to be freed. No longer entered,
+        but IPs persisted in this state are recycled like RELEASED ones.
 """
 
 from __future__ import (
@@ -47,14 +46,16 @@ from __future__ import (
     unicode_literals,
 )
 
+import heapq
 import ipaddress
 import logging
 import threading
+import time
 from ipaddress import ip_address, ip_network
-from typing import List, Optional, Tuple
+from typing import Dict, List, Optional, Set, Tuple
 
 from lte.protos.mobilityd_pb2 import GWInfo, IPAddress
-from magma.mobilityd.ip_descriptor import IPState
+from magma.mobilityd.ip_descriptor import IPDesc, IPState
 from magma.mobilityd.metrics import IP_ALLOCATED_TOTAL, IP_RELEASED_TOTAL
 
 from .ip_allocator_base import (
@@ -66,6 +67,8 @@ from .ip_allocator_base import (
 from .mobility_store import MobilityStore
 
 DEFAULT_IP_RECYCLE_INTERVAL = 15
+# Maximum number of expired IPs freed per recycle pass
+RECYCLE_SLICE_SIZE = 100
 
 
 class IPAddressManager:
@@ -78,26 +81,27 @@ class IPAddressManager:
     between SID and IP.
 
     IP Recycling:
-        An IP address is periodically recycled for allocation after releasing.
+        An IP address is recycled for allocation some time after releasing.
 
         Constraints:
         1. Define a maturity time T, in seconds. Any IPs that were released
            within the past T seconds cannot be freed.
         2. All released IPs must eventually be freed.
 
-        To achieve these constraints, whenever we release an IP address we try
-        to set a recycle timer if it's not already set. When setting a timer,
-        we move all IPs in the RELEASED state to the REAPED state. Those IPs
-        will be freed once the timer goes off, at which time those IPs are
-        guaranteed to be "matured". Concurrently, newly released IPs are added
-        to the RELEASED state.
-
-        The time between when an IP is released and when it is freed is
-        guaranteed to be between T and 2T seconds. The worst-case occurs when
-        the release happens right after the previous timer has been initiated.
-        This leads to an additional T seconds wait for the existing timer to
-        time out and trigger a callback which initiate a new timer, on top of
-        the T seconds of timeout for the next timer.
+        To achieve these constraints, every released IP gets a recycle
+        deadline T seconds after its release, kept in a heap along with the
+        deadlines of the other released IPs. A single timer goes off at the
+        earliest deadline and frees the expired IPs, at most
+        RECYCLE_SLICE_SIZE of them per pass, then sets itself for the next
+        deadline. Re-allocating a RELEASED IP to the same SID cancels its
+        deadline.
+
+        The Redis updates freeing a slice are batched, a round trip per
+        state and one for the SID mappings, and made without the manager
+        lock: the IPs of the slice are marked as being recycled, and their
+        SIDs wait for them to be freed before getting a new IP. Deadlines
+        aren't persisted: IPs found RELEASED or REAPED at startup get a full
+        T seconds.
 
     Persistence to Redis:
         The IP allocator now by default persists its state to a redis-server
@@ -105,7 +109,7 @@ class IPAddressManager:
         and associated structure:
             - self._assigned_ip_blocks: {ip_block}
             - self.ip_state_map: {state=>{ip=>ip_desc}}
-            - self.sid_ips_map: {SID=>[IPDesc]}
+            - self.sid_ips_map: {SID=>[IPDesc]}, indexed by IP in memory
 
         The utilized redis_containers store a cache of state in local memory,
         so reads are the same speed as without persistence. For writes, state
@@ -134,7 +138,17 @@ class IPAddressManager:
         """
         self._lock = threading.RLock()  # re-entrant locks
         self._recycle_timer = None  # reference to recycle timer
+        self._recycle_timer_deadline = None
         self._recycling_interval_seconds = recycling_interval
+        # Heap of (deadline, IP) of released IPs, and the current deadline
+        # of each IP. Heap entries not matching the current deadline are
+        # stale, and skipped
+        self._recycle_heap = []  # type: List[Tuple[float, ip_address]]
+        self._recycle_deadlines = {}  # type: Dict[ip_address, float]
+        # IPs being freed by a recycle pass, and the condition notified when
+        # a pass is done
+        self._recycling = set()  # type: Set[ip_address]
+        self._recycle_done = threading.Condition(self._lock)
 
         # Load store dependencies
         self._store = store
@@ -142,6 +156,11 @@ class IPAddressManager:
         self.ip_allocator = ipv4_allocator
         self.ipv6_allocator = ipv6_allocator
 
+        with self._lock:
+            for state in (IPState.RELEASED, IPState.REAPED):
+                for ip in self._store.ip_state_map.list_ips(state):
+                    self._schedule_recycle(ip)
+
     def add_ip_block(self, ipblock: ip_network):
         """ Add a block of IP addresses to the free IP list
 
@@ -202,6 +221,10 @@ class IPAddressManager:
         """
 
         with self._lock:
+            # IPs being recycled go back to the allocator before their
+            # block is removed
+            while self._recycling:
+                self._recycle_done.wait()
             ipv4_blocks, ipv6_blocks = [], []
             ipv4_blocks_deleted, ipv6_blocks_deleted = [], []
             for b in ipblocks:
@@ -216,6 +239,10 @@ class IPAddressManager:
                     ipv4_blocks, force=force,
                     ),
                 )
+                # Released IPs of removed blocks are gone, don't recycle them
+                for ip in list(self._recycle_deadlines):
+                    if any(ip in block for block in ipv4_blocks_deleted):
+                        del self._recycle_deadlines[ip]
             if ipv6_blocks:
                 ipv6_blocks_deleted.extend(
                     self.ipv6_allocator.remove_ip_blocks(
@@ -283,6 +310,7 @@ class IPAddressManager:
         """
 
         with self._lock:
+            self._wait_for_recycle(sid)
             # if an IP is reserved for the UE, this IP could be in the state of
             # ALLOCATED, RELEASED or REAPED.
             if sid in self._store.sid_ips_map:
@@ -307,6 +335,7 @@ class IPAddressManager:
                         IPState.ALLOCATED,
                     )
                     ip_desc.sid = sid
+                    self._recycle_deadlines.pop(old_ip_desc.ip, None)
                     logging.debug(
                         "SID %s IP %s RELEASED => ALLOCATED",
                         sid, old_ip_desc.ip,
@@ -317,6 +346,7 @@ class IPAddressManager:
                         IPState.ALLOCATED,
                     )
                     ip_desc.sid = sid
+                    self._recycle_deadlines.pop(old_ip_desc.ip, None)
                     logging.debug(
                         "SID %s IP %s REAPED => ALLOCATED",
                         sid, old_ip_desc.ip,
@@ -381,10 +411,7 @@ class IPAddressManager:
 
     def get_sid_for_ip(self, requested_ip: ip_address) -> Optional[str]:
         """ If ip is associated with an sid, return the sid, else None """
-        for sid, ip_desc in self._store.sid_ips_map.items():
-            if requested_ip == ip_desc.ip:
-                return sid
-        return None
+        return self._store.sid_ips_map.get_sid(requested_ip)
 
     def is_ip_in_state(self, ip_addr: ip_address, state: IPState):
         """
@@ -401,8 +428,8 @@ class IPAddressManager:
         """ Release an IP address.
 
         A released IP is moved to a released list. Released IPs are recycled
-        periodically to the free list. SID IP mappings are removed at the
-        recycling time.
+        to the free list once their recycle deadline passes. SID IP mappings
+        are removed at the recycling time.
 
         Args:
             sid (string): universal subscriber id
@@ -437,7 +464,7 @@ class IPAddressManager:
 
             if version == IPAddress.IPV4:
                 self._store.ip_state_map.mark_ip_state(ip, IPState.RELEASED)
-                self._try_set_recycle_timer()  # start the timer to recycle
+                self._schedule_recycle(ip)
             elif version == IPAddress.IPV6:
                 # For IPv6, no recycling logic
                 ip_desc = self._store.ipv6_state_map.mark_ip_state(
@@ -456,58 +483,122 @@ class IPAddressManager:
         with self._lock:
             self._store.dhcp_gw_info.update_mac(ip, info.mac, info.vlan)
 
-    def _recycle_reaped_ips(self):
-        """ Periodically called to recycle the given IPs
+    def _schedule_recycle(self, ip: ip_address):
+        """ Set the recycle deadline of a released IP
+
+        With a zero recycling interval the IP is recycled right away, and
+        with no interval it's never recycled.
+        """
+        if self._recycling_interval_seconds is None:
+            return
+        with self._lock:
+            deadline = time.monotonic() + self._recycling_interval_seconds
+            self._recycle_deadlines[ip] = deadline
+            heapq.heappush(self._recycle_heap, (deadline, ip))
+            if self._recycling_interval_seconds:
+                self._set_recycle_timer(deadline)
+                return
+            while self._recycle_expired_ips():
+                pass
+
+    def _set_recycle_timer(self, deadline: float):
+        """ Make sure the recycle timer goes off by deadline """
+        with self._lock:
+            if self._recycle_timer is not None and \
+                    self._recycle_timer_deadline <= deadline:
+                return
+            if self._recycle_timer is not None:
+                self._recycle_timer.cancel()
+            self._recycle_timer_deadline = deadline
+            self._recycle_timer = threading.Timer(
+                max(deadline - time.monotonic(), 0),
+                self._on_recycle_timer,
+            )
+            self._recycle_timer.start()
+
+    def _on_recycle_timer(self):
+        """ Free a slice of the expired IPs, then set the timer for the
+        next slice or deadline
 
         *** It is highly not recommended to call this function directly, even
         in tests. ***
-
-        Recycling depends on the period, T = self._recycling_interval_seconds,
-        which is set at construction time.
-
         """
         with self._lock:
-            for ip in self._store.ip_state_map.list_ips(IPState.REAPED):
-                ip_desc = self._store.ip_state_map.mark_ip_state(
-                    ip,
-                    IPState.FREE,
-                )
-                logging.debug("Release Reaped IP: %s", ip_desc)
+            self._recycle_timer = None
+        self._recycle_expired_ips()
+        with self._lock:
+            if self._recycle_heap:
+                self._set_recycle_timer(self._recycle_heap[0][0])
 
-                self.ip_allocator.release_ip(ip_desc)
-                # update SID-IP map
-                del self._store.sid_ips_map[ip_desc.sid]
+    def _wait_for_recycle(self, sid: str):
+        """ Wait until the IP of sid isn't being freed by a recycle pass.
+        Must be called with the manager lock held """
+        while sid in self._store.sid_ips_map and \
+                self._store.sid_ips_map[sid].ip in self._recycling:
+            self._recycle_done.wait()
 
-            # Set timer for the next round of recycling
-            self._recycle_timer = None
-            if not self._store.ip_state_map.is_ip_state_map_empty(
-                    IPState.RELEASED,
-            ):
-                self._try_set_recycle_timer()
-
-    def _try_set_recycle_timer(self):
-        """ Try set the recycle timer and move RELEASED IPs to the REAPED state
-
-        self._try_set_recycle_timer is called in two places:
-            1) at the end of self.release_ip_address, we are guaranteed that
-            some IPs exist in RELEASED state, so we attempt to initiate a timer
-            then.
-            2) at the end of self._recycle_reaped_ips, the call to
-            self._try_set_recycle_timer serves as a callback for setting the
-            next timer, if any IPs have been released since the current timer
-            was initiated.
+    def _recycle_expired_ips(self) -> bool:
+        """ Free up to RECYCLE_SLICE_SIZE IPs whose deadline has passed
+
+        Returns True if expired IPs are left for another pass.
         """
+        now = time.monotonic()
         with self._lock:
-            # check if auto recycling is enabled and no timer has been set
-            if self._recycling_interval_seconds is not None \
-                    and not self._recycle_timer:
-                for ip in self._store.ip_state_map.list_ips(IPState.RELEASED):
-                    self._store.ip_state_map.mark_ip_state(ip, IPState.REAPED)
-                if self._recycling_interval_seconds:
-                    self._recycle_timer = threading.Timer(
-                        self._recycling_interval_seconds,
-                        self._recycle_reaped_ips,
-                    )
-                    self._recycle_timer.start()
-                else:
-                    self._recycle_reaped_ips()
+            ips = []
+            while self._recycle_heap and self._recycle_heap[0][0] <= now \
+                    and len(ips) < RECYCLE_SLICE_SIZE:
+                deadline, ip = heapq.heappop(self._recycle_heap)
+                # Skip IPs re-allocated or released again since
+                if self._recycle_deadlines.get(ip) != deadline:
+                    continue
+                del self._recycle_deadlines[ip]
+                ips.append(ip)
+            self._recycling.update(ips)
+
+        ip_descs = []
+        try:
+            if ips:
+                ip_descs = self._remove_released_ips(ips)
+        finally:
+            with self._lock:
+                self._free_ips(ip_descs)
+                self._recycling.difference_update(ips)
+                self._recycle_done.notify_all()
+
+        with self._lock:
+            return bool(self._recycle_heap) and \
+                self._recycle_heap[0][0] <= now
+
+    def _remove_released_ips(self, ips: List[ip_address]) -> List[IPDesc]:
+        """ Remove IPs being recycled from the RELEASED and REAPED states,
+        and their SID mappings, batching the Redis updates. Called without
+        the manager lock """
+        ip_descs = self._store.ip_state_map.remove_ips_from_state(
+            ips, IPState.RELEASED,
+        )
+        reaped_ips = [
+            ip for ip, ip_desc in zip(ips, ip_descs) if ip_desc is None
+        ]
+        if reaped_ips:
+            ip_descs.extend(
+                self._store.ip_state_map.remove_ips_from_state(
+                    reaped_ips, IPState.REAPED,
+                ),
+            )
+        # IPs not found in either state were removed with their IP block
+        ip_descs = [ip_desc for ip_desc in ip_descs if ip_desc is not None]
+        # update SID-IP map
+        self._store.sid_ips_map.delete_many(
+            [ip_desc.sid for ip_desc in ip_descs],
+        )
+        return ip_descs
+
+    def _free_ips(self, ip_descs: List[IPDesc]):
+        """ Hand recycled IPs back to the allocator. Must be called with the
+        manager lock held """
+        for ip_desc in ip_descs:
+            # The allocator owns free IPs, so they aren't added to the
+            # FREE state
+            ip_desc.state = IPState.FREE
+            logging.debug("Release Reaped IP: %s", ip_desc)
+            self.ip_allocator.release_ip(ip_desc)
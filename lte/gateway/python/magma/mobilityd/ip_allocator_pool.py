@@ -13,6 +13,17 @@ limitations under the License.
 This is one of ip allocator for ip address manager.
 The IP allocator accepts IP blocks (range of IP addresses), and supports
 allocating and releasing IP addresses from the assigned IP blocks.
+
+Free addresses aren't stored one by one: each block keeps its free space as
+a sorted list of address ranges, and IPDesc records are only created for
+addresses that are reserved, allocated, released or reaped.
+
+This changes the persisted format: free pool addresses used to have a FREE
+record each, and no longer do. The free ranges are rebuilt on startup from
+the records of the addresses in use, and FREE pool records written by
+earlier releases are migrated then, see _migrate_free_ips. A release that
+expects FREE records finds none after the migration, so rolling back needs
+the IP blocks to be removed and added again.
 """
 
 from __future__ import (
@@ -23,9 +34,11 @@ from __future__ import (
 )
 
 import logging
+from bisect import bisect_right
+from collections import defaultdict
 from copy import deepcopy
 from ipaddress import ip_address, ip_network
-from typing import List
+from typing import Dict, List, Optional, Set, Tuple
 
 from magma.mobilityd.ip_descriptor import IPDesc, IPState, IPType
 
@@ -38,6 +51,9 @@ from .ip_allocator_base import (
 from .mobility_store import MobilityStore
 
 DEFAULT_IP_RECYCLE_INTERVAL = 15
+# TODO(oramadan) t23793559 HACK reserve the GW address for
+#  gtp_br0 iface and test VM
+NUM_RESERVED_ADDRESSES = 11
 
 
 class IpAllocatorPool(IPAllocator):
@@ -46,6 +62,9 @@ class IpAllocatorPool(IPAllocator):
         """ Initializes a new IP allocator
         """
         self._store = store  # mobilityd storage instance
+        # Free address ranges of each block added by this allocator
+        self._free_ranges = {}  # type: Dict[ip_network, _IPRanges]
+        self._load_free_ranges()
 
     def add_ip_block(self, ipblock: ip_network):
         """ Add a block of IP addresses to the free IP list
@@ -66,20 +85,20 @@ class IpAllocatorPool(IPAllocator):
                 raise OverlappedIPBlocksError(ipblock)
 
         self._store.assigned_ip_blocks.add(ipblock)
-        # TODO(oramadan) t23793559 HACK reserve the GW address for
-        #  gtp_br0 iface and test VM
-        num_reserved_addresses = 11
-        for ip in ipblock.hosts():
-            state = IPState.RESERVED if num_reserved_addresses > 0 \
-                else IPState.FREE
+        first, last = _get_host_range(ipblock)
+        for ip in range(first, min(first + NUM_RESERVED_ADDRESSES, last + 1)):
             ip_desc = IPDesc(
-                ip=ip, state=state,
+                ip=ip_address(ip), state=IPState.RESERVED,
                 ip_block=ipblock, sid=None,
                 ip_type=IPType.IP_POOL,
             )
-            self._store.ip_state_map.add_ip_to_state(ip, ip_desc, state)
-            if num_reserved_addresses > 0:
-                num_reserved_addresses -= 1
+            self._store.ip_state_map.add_ip_to_state(
+                ip_desc.ip, ip_desc,
+                IPState.RESERVED,
+            )
+        free_ranges = _IPRanges()
+        free_ranges.add_range(first + NUM_RESERVED_ADDRESSES, last)
+        self._free_ranges[ipblock] = free_ranges
 
     def remove_ip_blocks(
         self, ipblocks: List[ip_network],
@@ -132,31 +151,33 @@ class IpAllocatorPool(IPAllocator):
             remove_blocks -= allocated_ip_block_set
             del allocated_ip_block_set
 
-        # Remove the associated IP addresses
-        remove_ips = \
-            (ip for block in remove_blocks for ip in block.hosts())
-        for ip in remove_ips:
-            for state in (IPState.FREE, IPState.RELEASED, IPState.REAPED):
-                self._store.ip_state_map.remove_ip_from_state(ip, state)
-            if force:
-                self._store.ip_state_map.remove_ip_from_state(
-                    ip,
-                    IPState.ALLOCATED,
-                )
-            else:
-                assert not self._store.ip_state_map.test_ip_state(
-                    ip,
-                    IPState.ALLOCATED,
-                ), \
+        # Remove the associated IP addresses. Only addresses in use have a
+        # record, free ones just go away with the block's free ranges
+        remove_states = [IPState.FREE, IPState.RELEASED, IPState.REAPED]
+        if force:
+            remove_states.append(IPState.ALLOCATED)
+        for state in remove_states:
+            for ip in self._store.ip_state_map.list_ips(state):
+                if any(ip in block for block in remove_blocks):
+                    self._store.ip_state_map.remove_ip_from_state(ip, state)
+        if not force:
+            for ip in self._store.ip_state_map.list_ips(IPState.ALLOCATED):
+                assert not any(ip in block for block in remove_blocks), \
                     "Unexpected ALLOCATED IP %s from a soft IP block " \
                     "removal "
 
-            # Clean up SID maps
+        # Clean up SID maps
+        if any(
+            first <= last for first, last in
+            map(_get_host_range, remove_blocks)
+        ):
             for sid in list(self._store.sid_ips_map):
                 self._store.sid_ips_map.pop(sid)
 
         # Remove the IP blocks
         self._store.assigned_ip_blocks -= remove_blocks
+        for block in remove_blocks:
+            self._free_ranges.pop(block, None)
 
         # Can't use generators here
         remove_sids = tuple(
@@ -196,10 +217,10 @@ class IpAllocatorPool(IPAllocator):
             logging.error("Listing an unknown IP block: %s", ipblock)
             raise IPBlockNotFoundError(ipblock)
 
-        res = [
-            ip for ip in ipblock
-            if self._store.ip_state_map.test_ip_state(ip, IPState.ALLOCATED)
-        ]
+        res = sorted(
+            ip for ip in self._store.ip_state_map.list_ips(IPState.ALLOCATED)
+            if ip in ipblock
+        )
         return res
 
     def alloc_ip_address(self, sid: str, vlan: int) -> IPDesc:
@@ -220,14 +241,148 @@ class IpAllocatorPool(IPAllocator):
         TODO: Add support of per APN IP-POOL
         """
         # if an IP is not yet allocated for the UE, allocate a new IP
-        ip_desc = self._store.ip_state_map.pop_ip_from_state(IPState.FREE)
-        if ip_desc:
-            ip_desc.sid = sid
-            ip_desc.state = IPState.ALLOCATED
-            return ip_desc
-        else:
-            logging.error("Run out of available IP addresses")
-            raise NoAvailableIPError("No available IP addresses")
+        for ipblock, free_ranges in self._free_ranges.items():
+            ip = free_ranges.pop()
+            if ip is not None:
+                return IPDesc(
+                    ip=ip_address(ip), state=IPState.ALLOCATED,
+                    ip_block=ipblock, sid=sid,
+                    ip_type=IPType.IP_POOL,
+                )
+        logging.error("Run out of available IP addresses")
+        raise NoAvailableIPError("No available IP addresses")
 
     def release_ip(self, ip_desc: IPDesc):
-        pass
+        """
+        Return a recycled IP to the free ranges of its block. The IP is
+        dropped from the FREE state, since free IPs don't have a record.
+        """
+        self._store.ip_state_map.remove_ip_from_state(ip_desc.ip, IPState.FREE)
+        free_ranges = self._free_ranges.get(ip_desc.ip_block)
+        if free_ranges is not None:
+            free_ranges.add_range(int(ip_desc.ip), int(ip_desc.ip))
+
+    def _load_free_ranges(self):
+        """
+        Rebuild the free ranges of the blocks added by this allocator from
+        the persisted IP states, i.e. every host of a block that isn't in
+        use.
+        """
+        used_ips = defaultdict(list)
+        for state in IPState:
+            if state == IPState.FREE:
+                continue
+            for ip_desc in self._store.ip_state_map.list_ip_descs(state):
+                if ip_desc.type == IPType.IP_POOL:
+                    used_ips[ip_desc.ip_block].append(int(ip_desc.ip))
+        for ipblock in self._migrate_free_ips():
+            used_ips.setdefault(ipblock, [])
+
+        for ipblock, ips in used_ips.items():
+            if ipblock not in self._store.assigned_ip_blocks:
+                continue
+            free_ranges = _IPRanges()
+            first, last = _get_host_range(ipblock)
+            for ip in sorted(ips):
+                free_ranges.add_range(first, ip - 1)
+                first = max(first, ip + 1)
+            free_ranges.add_range(first, last)
+            self._free_ranges[ipblock] = free_ranges
+
+    def _migrate_free_ips(self) -> Set[ip_network]:
+        """
+        Remove the FREE records of pool IPs, written for every free address
+        by releases before free ranges, or left by a restart mid recycle.
+        Their addresses are free in the rebuilt ranges anyway. FREE records
+        of other allocators are kept.
+
+        Returns:
+            the blocks of the removed records
+        """
+        ip_descs = self._store.ip_state_map.list_ip_descs(IPState.FREE)
+        pool_ip_descs = [
+            ip_desc for ip_desc in ip_descs
+            if ip_desc.type == IPType.IP_POOL
+        ]
+        if not pool_ip_descs:
+            return set()
+
+        logging.info(
+            "Migrating %d FREE IP pool records to free ranges",
+            len(pool_ip_descs),
+        )
+        if len(pool_ip_descs) == len(ip_descs):
+            self._store.ip_state_map.clear_ip_state(IPState.FREE)
+        else:
+            for ip_desc in pool_ip_descs:
+                self._store.ip_state_map.remove_ip_from_state(
+                    ip_desc.ip,
+                    IPState.FREE,
+                )
+        return {ip_desc.ip_block for ip_desc in pool_ip_descs}
+
+
+class _IPRanges:
+    """
+    Set of IPs, as integers, stored as sorted, disjoint and non-adjacent
+    [start, end] ranges
+
+    The ranges are plain lists: finding where a range goes is a binary
+    search, but inserting or merging it shifts the ranges after it, so
+    add_range is linear in the number of ranges. pop is constant time.
+    There is one range per run of consecutive free IPs.
+    """
+
+    def __init__(self):
+        self._starts = []  # type: List[int]
+        self._ends = []  # type: List[int]
+
+    def add_range(self, start: int, end: int):
+        """ Add the IPs in [start, end], which must not be in the set. Linear
+        in the number of ranges """
+        if start > end:
+            return
+        i = bisect_right(self._starts, start)
+        # Merge with the ranges on either side when they're adjacent
+        if i > 0 and self._ends[i - 1] == start - 1:
+            i -= 1
+            start = self._starts[i]
+            del self._starts[i]
+            del self._ends[i]
+        if i < len(self._starts) and self._starts[i] == end + 1:
+            end = self._ends[i]
+            del self._starts[i]
+            del self._ends[i]
+        self._starts.insert(i, start)
+        self._ends.insert(i, end)
+
+    def pop(self) -> Optional[int]:
+        """ Remove and return the highest IP, or None if the set is empty """
+        if not self._ends:
+            return None
+        ip = self._ends[-1]
+        if ip == self._starts[-1]:
+            self._starts.pop()
+            self._ends.pop()
+        else:
+            self._ends[-1] = ip - 1
+        return ip
+
+    def __len__(self) -> int:
+        return sum(
+            end - start + 1 for start, end in zip(self._starts, self._ends)
+        )
+
+
+def _get_host_range(ipblock: ip_network) -> Tuple[int, int]:
+    """
+    Return the first and last host of ipblock as integers. The range is
+    empty, i.e. first > last, if the block has no hosts.
+    """
+    if ipblock.num_addresses > 2:
+        return int(ipblock.network_address) + 1, \
+            int(ipblock.broadcast_address) - 1
+    hosts = list(ipblock.hosts())
+    if not hosts:
+        return 0, -1
+    return int(hosts[0]), int(hosts[-1])
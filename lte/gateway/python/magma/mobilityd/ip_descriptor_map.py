@@ -76,6 +76,22 @@ class IpDescriptorMap:
         ip_desc = self.ip_states[state].pop(ip.exploded, None)
         return ip_desc
 
+    def remove_ips_from_state(
+        self, ips: List[ip_address],
+        state: IPState,
+    ) -> List[Optional[IPDesc]]:
+        """ Remove IPs from a internal dict in one batch. The IPDesc of an
+        IP that isn't in the state is None """
+        assert state in IPState, "unknown state %s" % state
+
+        ip_descs = self.ip_states[state]
+        keys = [ip.exploded for ip in ips]
+        # Redis backed states remove all the IPs in one round trip
+        pop_many = getattr(ip_descs, 'pop_many', None)
+        if pop_many is not None:
+            return pop_many(keys)
+        return [ip_descs.pop(key, None) for key in keys]
+
     def pop_ip_from_state(self, state: IPState) -> Optional[IPDesc]:
         """ Pop an IP from a internal dict """
         assert state in IPState, "unknown state %s" % state
@@ -116,6 +132,18 @@ class IpDescriptorMap:
 
         return [ip_address(ip) for ip in self.ip_states[state]]
 
+    def list_ip_descs(self, state: IPState) -> List[IPDesc]:
+        """ return a list of IPDescs in state X """
+        assert state in IPState, "unknown state %s" % state
+
+        return list(self.ip_states[state].values())
+
+    def clear_ip_state(self, state: IPState):
+        """ Remove all IPs from state X """
+        assert state in IPState, "unknown state %s" % state
+
+        self.ip_states[state].clear()
+
     def mark_ip_state(self, ip: ip_address, state: IPState) -> IPDesc:
         """ Remove, mark, add: move IP to a new state """
         assert state in IPState, "unknown state %s" % state
@@ -11,6 +11,8 @@ See the License for the specific language governing permissions and
 limitations under the License.
 """
 from collections import defaultdict
+from ipaddress import ip_address
+from typing import Dict, Iterator, List, MutableMapping, Optional
 
 import redis
 from lte.protos.mobilityd_pb2 import GWInfo
@@ -50,7 +52,7 @@ class MobilityStore(object):
             self.ip_state_map = IpDescriptorMap(defaultdict(dict))
             self.ipv6_state_map = IpDescriptorMap(defaultdict(dict))
             self.assigned_ip_blocks = set()  # {ip_block}
-            self.sid_ips_map = defaultdict(IPDesc)  # {SID=>IPDesc}
+            self.sid_ips_map = SidIpsMap(defaultdict(IPDesc))  # {SID=>IPDesc}
             self.dhcp_gw_info = UplinkGatewayInfo(defaultdict(GWInfo))
             self.dhcp_store = {}  # mac => DHCP_State
             self.allocated_iid = {}  # {ipv6 interface identifiers}
@@ -67,7 +69,7 @@ class MobilityStore(object):
                 defaultdict_key(lambda key: ip_states(client, key)),
             )
             self.assigned_ip_blocks = AssignedIpBlocksSet(client)
-            self.sid_ips_map = IPDescDict(client)
+            self.sid_ips_map = SidIpsMap(IPDescDict(client))
             self.dhcp_gw_info = UplinkGatewayInfo(GatewayInfoMap())
             self.dhcp_store = MacToIP()  # mac => DHCP_State
             self.allocated_iid = AllocatedIID()
@@ -84,6 +86,83 @@ class AssignedIpBlocksSet(RedisSet):
         )
 
 
+class SidIpsMap(MutableMapping[str, IPDesc]):
+    """
+    SID => IPDesc map that keeps a reverse IP => SID index in memory, so
+    looking up the SID an IP is assigned to doesn't scan every SID. The
+    index is rebuilt from the backing map on startup.
+    """
+
+    def __init__(self, sid_ips: MutableMapping[str, IPDesc]):
+        self._sid_ips = sid_ips
+        self._sid_by_ip = {}  # type: Dict[ip_address, str]
+        for sid, ip_desc in sid_ips.items():
+            self._add_to_index(sid, ip_desc)
+
+    def get_sid(self, ip: ip_address) -> Optional[str]:
+        """ Return the SID ip is assigned to, or None """
+        return self._sid_by_ip.get(ip)
+
+    def __getitem__(self, sid: str) -> IPDesc:
+        return self._sid_ips[sid]
+
+    def __setitem__(self, sid: str, ip_desc: IPDesc):
+        old_ip_desc = self._sid_ips.get(sid)
+        if old_ip_desc is not None:
+            self._remove_from_index(sid, old_ip_desc)
+        self._sid_ips[sid] = ip_desc
+        self._add_to_index(sid, ip_desc)
+
+    def __delitem__(self, sid: str):
+        ip_desc = self._sid_ips[sid]
+        del self._sid_ips[sid]
+        self._remove_from_index(sid, ip_desc)
+
+    def __contains__(self, sid) -> bool:
+        return sid in self._sid_ips
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self._sid_ips)
+
+    def __len__(self) -> int:
+        return len(self._sid_ips)
+
+    def get(self, sid: str, default=None) -> Optional[IPDesc]:
+        # Delegate, so a defaultdict backing map doesn't add missing SIDs
+        return self._sid_ips.get(sid, default)
+
+    def pop(self, sid: str, *default) -> IPDesc:
+        if sid not in self._sid_ips:
+            return self._sid_ips.pop(sid, *default)
+        ip_desc = self._sid_ips[sid]
+        del self[sid]
+        return ip_desc
+
+    def delete_many(self, sids: List[str]):
+        """ Remove all of sids, ignoring missing ones """
+        sids = [sid for sid in sids if sid in self._sid_ips]
+        for sid in sids:
+            self._remove_from_index(sid, self._sid_ips[sid])
+        # Redis backed maps delete all the SIDs in one round trip
+        delete_many = getattr(self._sid_ips, 'delete_many', None)
+        if delete_many is not None:
+            delete_many(sids)
+        else:
+            for sid in sids:
+                del self._sid_ips[sid]
+
+    def items(self):
+        return self._sid_ips.items()
+
+    def _add_to_index(self, sid: str, ip_desc: IPDesc):
+        if ip_desc.ip is not None:
+            self._sid_by_ip[ip_desc.ip] = sid
+
+    def _remove_from_index(self, sid: str, ip_desc: IPDesc):
+        if self._sid_by_ip.get(ip_desc.ip) == sid:
+            del self._sid_by_ip[ip_desc.ip]
+
+
 class IPDescDict(RedisFlatDict):
     def __init__(self, client):
         serde = RedisSerde(
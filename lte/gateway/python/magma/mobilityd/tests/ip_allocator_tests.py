@@ -19,11 +19,15 @@ from __future__ import (
 )
 
 import ipaddress
+import threading
 import time
 import unittest
+from unittest import mock
 
+import fakeredis
 from magma.common.redis.client import get_default_client
 from magma.mobilityd.ip_address_man import (
+    RECYCLE_SLICE_SIZE,
     IPAddressManager,
     IPNotInUseError,
     MappingNotFoundError,
@@ -33,8 +37,13 @@ from magma.mobilityd.ip_allocator_pool import (
     IPBlockNotFoundError,
     NoAvailableIPError,
 )
+from magma.mobilityd.ip_descriptor import IPDesc, IPState, IPType
 from magma.mobilityd.ipv6_allocator_pool import IPv6AllocatorPool
-from magma.mobilityd.mobility_store import MobilityStore
+from magma.mobilityd.mobility_store import (
+    IPDescDict,
+    MobilityStore,
+    SidIpsMap,
+)
 
 # If the preallocated IP addresses in ip_address_man.py code
 # changes, then the test cases must be updated
@@ -191,6 +200,112 @@ class IPAllocatorTests(unittest.TestCase):
             self._allocator.get_sid_for_ip(ipaddress.ip_address('1.1.1.1')),
         )
 
+    def test_get_sid_for_recycled_ip(self):
+        """ Released IPs map to their SID until they're recycled """
+        self._new_ip_allocator(0)  # recycle on release
+        ip0, _ = self._allocator.alloc_ip_address('SID0')
+        ip1, _ = self._allocator.alloc_ip_address('SID1')
+
+        self._allocator.release_ip_address('SID0', ip0)
+        self.assertIsNone(self._allocator.get_sid_for_ip(ip0))
+        self.assertEqual('SID1', self._allocator.get_sid_for_ip(ip1))
+
+        self._allocator.remove_ip_blocks(self._block, force=True)
+        self.assertIsNone(self._allocator.get_sid_for_ip(ip1))
+
+    def test_sid_ips_map_rebuild(self):
+        """ The IP => SID index is rebuilt from the persisted map """
+        client = fakeredis.FakeStrictRedis()
+        block = ipaddress.ip_network('10.0.0.0/24')
+        ip0, ip1, ip2 = block[1], block[2], block[3]
+
+        def ip_desc(ip, sid):
+            return IPDesc(
+                ip=ip, state=IPState.ALLOCATED, sid=sid, ip_block=block,
+                ip_type=IPType.IP_POOL,
+            )
+
+        sid_ips_map = SidIpsMap(IPDescDict(client))
+        sid_ips_map['SID0'] = ip_desc(ip0, 'SID0')
+        sid_ips_map['SID1'] = ip_desc(ip2, 'SID1')
+        sid_ips_map['SID1'] = ip_desc(ip1, 'SID1')
+        self.assertEqual('SID0', sid_ips_map.get_sid(ip0))
+        self.assertEqual('SID1', sid_ips_map.get_sid(ip1))
+        self.assertIsNone(sid_ips_map.get_sid(ip2))
+
+        sid_ips_map = SidIpsMap(IPDescDict(client))
+        self.assertEqual('SID0', sid_ips_map.get_sid(ip0))
+        self.assertEqual('SID1', sid_ips_map.get_sid(ip1))
+        sid_ips_map.pop('SID0')
+        self.assertIsNone(sid_ips_map.get_sid(ip0))
+        with self.assertRaises(KeyError):
+            sid_ips_map.pop('SID0')
+
+    def test_free_ranges_after_restart(self):
+        """ Free ranges are rebuilt from the persisted IP states """
+        client = fakeredis.FakeStrictRedis()
+        block = ipaddress.ip_network('10.0.0.0/24')
+        store = MobilityStore(client, True, 3980)
+        allocator = IPAddressManager(
+            IpAllocatorPool(store), None, store, None,
+        )
+        allocator.add_ip_block(block)
+        ip0, _ = allocator.alloc_ip_address('SID0')
+        ip1, _ = allocator.alloc_ip_address('SID1')
+        allocator.release_ip_address('SID0', ip0)
+        # Only the reserved and in use IPs have records
+        self.assertEqual(
+            13,
+            sum(len(store.ip_state_map.list_ips(state)) for state in IPState),
+        )
+
+        store = MobilityStore(client, True, 3980)
+        allocator = IPAddressManager(
+            IpAllocatorPool(store), None, store, None,
+        )
+        ips = {
+            allocator.alloc_ip_address('SID%d' % i)[0] for i in range(2, 243)
+        }
+        self.assertNotIn(ip0, ips)
+        self.assertNotIn(ip1, ips)
+        self.assertEqual(241, len(ips))
+        self.assertTrue(all(ip in block for ip in ips))
+        with self.assertRaises(NoAvailableIPError):
+            allocator.alloc_ip_address('SID243')
+
+    def test_free_ranges_from_free_ips(self):
+        """ FREE pool records of earlier releases are migrated to ranges """
+        block = ipaddress.ip_network('10.0.0.0/28')
+        store = MobilityStore(fakeredis.FakeStrictRedis(), True, 3980)
+        store.assigned_ip_blocks.add(block)
+        for i, ip in enumerate(block.hosts()):
+            state = IPState.RESERVED if i < 11 else IPState.FREE
+            ip_desc = IPDesc(
+                ip=ip, state=state, ip_block=block,
+                ip_type=IPType.IP_POOL,
+            )
+            store.ip_state_map.add_ip_to_state(ip, ip_desc, state)
+        # FREE records of other allocators are left alone
+        static_ip = ipaddress.ip_address('10.1.0.1')
+        store.ip_state_map.add_ip_to_state(
+            static_ip,
+            IPDesc(
+                ip=static_ip, state=IPState.FREE,
+                ip_block=ipaddress.ip_network('10.1.0.1/32'),
+                ip_type=IPType.STATIC,
+            ),
+            IPState.FREE,
+        )
+
+        allocator = IpAllocatorPool(store)
+        self.assertEqual(
+            [static_ip], store.ip_state_map.list_ips(IPState.FREE),
+        )
+        self.assertEqual(
+            {block[12], block[13], block[14]},
+            {allocator.alloc_ip_address('SID%d' % i, 0).ip for i in range(3)},
+        )
+
     def test_allocate_allocate(self):
         """ Duplicated IP requests for the same UE returns same IP """
         ip0, _ = self._allocator.alloc_ip_address('SID0')
@@ -245,6 +360,128 @@ class IPAllocatorTests(unittest.TestCase):
         ip5, _ = self._allocator.alloc_ip_address('SID5')
         self.assertEqual(ip2, ip5)
 
+    @mock.patch('magma.mobilityd.ip_address_man.threading.Timer')
+    @mock.patch('magma.mobilityd.ip_address_man.time.monotonic')
+    def test_release_reallocate_release(self, monotonic, _timer):
+        """ A second release of an IP gets a full recycle interval """
+        monotonic.return_value = 1000
+        self._new_ip_allocator(10)
+        ip0, _ = self._allocator.alloc_ip_address('SID0')
+        self._allocator.release_ip_address('SID0', ip0)
+        monotonic.return_value += 6
+        self._allocator.alloc_ip_address('SID0')
+        self._allocator.release_ip_address('SID0', ip0)
+
+        # First release's deadline has passed, second's hasn't
+        monotonic.return_value += 6
+        self.assertFalse(self._allocator._recycle_expired_ips())
+        self.assertTrue(self._allocator.is_ip_in_state(ip0, IPState.RELEASED))
+        self.assertEqual(ip0, self._allocator.get_ip_for_sid('SID0'))
+
+        monotonic.return_value += 4
+        self.assertFalse(self._allocator._recycle_expired_ips())
+        self.assertFalse(self._allocator.is_ip_in_state(ip0, IPState.RELEASED))
+        self.assertIsNone(self._allocator.get_ip_for_sid('SID0'))
+
+    @mock.patch('magma.mobilityd.ip_address_man.threading.Timer')
+    @mock.patch('magma.mobilityd.ip_address_man.time.monotonic')
+    def test_alloc_during_recycle(self, monotonic, _timer):
+        """ Other SIDs get IPs while the Redis updates of a recycle pass are
+        in flight, and the SIDs of the IPs being freed wait for the pass """
+        monotonic.return_value = 1000
+        self._new_ip_allocator(10)
+        ip0, _ = self._allocator.alloc_ip_address('SID0')
+        self._allocator.release_ip_address('SID0', ip0)
+        ip_state_map = self._allocator._store.ip_state_map
+        remove_ips_from_state = ip_state_map.remove_ips_from_state
+        in_redis = threading.Event()
+        resume = threading.Event()
+
+        def slow_remove_ips_from_state(*args):
+            in_redis.set()
+            resume.wait(5)
+            return remove_ips_from_state(*args)
+
+        monotonic.return_value += 10
+        recycle = threading.Thread(
+            target=self._allocator._recycle_expired_ips,
+        )
+        realloc = threading.Thread(
+            target=self._allocator.alloc_ip_address, args=('SID0',),
+        )
+        with mock.patch.object(
+            ip_state_map, 'remove_ips_from_state',
+            side_effect=slow_remove_ips_from_state,
+        ):
+            recycle.start()
+            self.assertTrue(in_redis.wait(5))
+            ip1, _ = self._allocator.alloc_ip_address('SID1')
+            self.assertNotEqual(ip0, ip1)
+            realloc.start()
+            realloc.join(0.1)
+            self.assertTrue(realloc.is_alive())
+            resume.set()
+            recycle.join(5)
+            realloc.join(5)
+        self.assertFalse(realloc.is_alive())
+        self.assertFalse(self._allocator.is_ip_in_state(ip0, IPState.RELEASED))
+        self.assertTrue(
+            self._allocator.is_ip_in_state(
+                self._allocator.get_ip_for_sid('SID0'), IPState.ALLOCATED,
+            ),
+        )
+
+    def test_recycle_in_slices(self):
+        """ Expired IPs are freed at most RECYCLE_SLICE_SIZE at a time """
+        self._block = ipaddress.ip_network('10.0.0.0/23')
+        self._new_ip_allocator(1000)
+        num_ips = 2 * RECYCLE_SLICE_SIZE + 10
+        ips = [
+            self._allocator.alloc_ip_address('SID%d' % i)[0]
+            for i in range(num_ips)
+        ]
+        for i, ip in enumerate(ips):
+            self._allocator.release_ip_address('SID%d' % i, ip)
+        self._allocator._recycle_timer.cancel()
+        ip_state_map = self._allocator._store.ip_state_map
+
+        with mock.patch(
+            'magma.mobilityd.ip_address_man.time.monotonic',
+            return_value=time.monotonic() + 1000,
+        ):
+            self.assertTrue(self._allocator._recycle_expired_ips())
+            self.assertEqual(
+                num_ips - RECYCLE_SLICE_SIZE,
+                len(ip_state_map.list_ips(IPState.RELEASED)),
+            )
+            self.assertTrue(self._allocator._recycle_expired_ips())
+            self.assertFalse(self._allocator._recycle_expired_ips())
+        self.assertTrue(
+            ip_state_map.is_ip_state_map_empty(IPState.RELEASED),
+        )
+        self.assertEqual([], self._allocator.get_sid_ip_table())
+
+    def test_recycle_released_ips_after_restart(self):
+        """ IPs persisted as RELEASED are recycled after a restart """
+        client = fakeredis.FakeStrictRedis()
+        store = MobilityStore(client, True, 3980)
+        allocator = IPAddressManager(
+            IpAllocatorPool(store), None, store, None,
+        )
+        allocator.add_ip_block(self._block)
+        ip0, _ = allocator.alloc_ip_address('SID0')
+        allocator.release_ip_address('SID0', ip0)
+        self.assertEqual(ip0, allocator.get_ip_for_sid('SID0'))
+
+        store = MobilityStore(client, True, 3980)
+        allocator = IPAddressManager(
+            IpAllocatorPool(store), None, store, 0,
+        )
+        self.assertIsNone(allocator.get_ip_for_sid('SID0'))
+        self.assertTrue(
+            store.ip_state_map.is_ip_state_map_empty(IPState.RELEASED),
+        )
+
     def test_allocate_unrecycled_IP(self):
         """ Allocation should fail before IP recycling """
         ip0, _ = self._allocator.alloc_ip_address('SID0')
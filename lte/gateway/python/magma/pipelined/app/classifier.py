@@ -14,6 +14,8 @@ import ipaddress
 import socket
 import subprocess
 from collections import namedtuple
+from functools import partial
+from typing import Optional
 
 from lte.protos.mobilityd_pb2 import IPAddress
 from lte.protos.pipelined_pb2 import (
@@ -35,8 +37,9 @@ from magma.pipelined.openflow.registers import (TUN_PORT_REG,
 from magma.pipelined.policy_converters import (get_eth_type,
                                                get_ue_ip_match_args)
 from magma.pipelined.utils import Utils
-from ryu.controller import ofp_event
+from ryu.controller import dpset, ofp_event
 from ryu.controller.handler import MAIN_DISPATCHER, set_ev_cls
+from ryu.lib import hub
 from ryu.lib.packet import ether_types, ipv4, packet
 from ryu.ofproto import ofproto_v1_0_parser
 from ryu.ofproto.ofproto_v1_4 import OFPP_LOCAL
@@ -46,6 +49,7 @@ from lte.protos.subscriberdb_pb2 import SubscriberID
 
 GTP_PORT_MAC = "02:00:00:00:00:01"
 TUNNEL_OAM_FLAG = 1
+GTP_PORT_PREFIX = "g_"
 
 class Classifier(MagmaController):
     """
@@ -53,6 +57,13 @@ class Classifier(MagmaController):
     This controller is used for install the default tunnel entry,
     add tunnel flows for gtp_port/local_port/mtr_port and delete
     tunnel flows for gtp_port/local_port/mtr_port into OVS table 0.
+
+    With multi tunnel, each eNodeB has its own GTP tunnel port. Their
+    ofports are cached, from the bridge's ports on connect and then from
+    the port add, modify and delete events, so flows for known eNodeBs are
+    installed without OVSDB round trips. The port of a new eNodeB is
+    created in the background, and its flows are installed once it
+    appears.
     """
     APP_NAME = "classifier"
     APP_TYPE = ControllerType.SPECIAL
@@ -75,8 +86,11 @@ class Classifier(MagmaController):
         self._clean_restart = kwargs['config']['clean_restart']
         self._sessiond_setinterface = \
                    kwargs['rpc_stubs']['sessiond_setinterface']
-        if self.config.multi_tunnel_flag:
-            self._ovs_multi_tunnel_init()
+        self.ovs_gtp_type = None
+        # GTP port name -> ofport
+        self._gtp_ofports = {}
+        # GTP port name -> flow changes waiting for the port to be created
+        self._parked_gtp_flows = {}
         self.paging_flag = 0
 
     def _get_config(self, config_dict):
@@ -121,7 +135,7 @@ class Classifier(MagmaController):
 
     def _ip_addr_to_gtp_port_name(self, enodeb_ip_addr: str):
         ip_no = hex(socket.htonl(int(ipaddress.ip_address(enodeb_ip_addr))))
-        buf = "g_{}".format(ip_no[2:])
+        buf = GTP_PORT_PREFIX + ip_no[2:]
         return buf
 
     def _get_ofport(self, port_name):
@@ -144,28 +158,104 @@ class Classifier(MagmaController):
 
         return port_no
 
-    def _add_gtp_port(self, gnb_ip):
-        if not self.config.multi_tunnel_flag:
+    def _get_gtp_ofport(self, gnb_ip):
+        """
+        Return the ofport of the GTP port for gnb_ip, or None if the port
+        isn't known yet
+        """
+        if not gnb_ip or not self.config.multi_tunnel_flag:
             return self.config.gtp_port
+        return self._gtp_ofports.get(self._ip_addr_to_gtp_port_name(gnb_ip))
 
+    def _park_until_gtp_port(self, gnb_ip, apply_flows, done=None):
+        """
+        Call apply_flows once the GTP port for gnb_ip exists, creating it
+        in the background. Parked flow changes are applied in order, and
+        done, if given, is called with the result of apply_flows, or with
+        False if the port can't be added.
+        """
         port_name = self._ip_addr_to_gtp_port_name(gnb_ip)
-        # If GTP port already exists, returns OFPort number
-        gtpport = self._get_ofport(port_name)
-        if gtpport is not None:
-            return gtpport
-
+        parked = self._parked_gtp_flows.get(port_name)
+        if parked is None:
+            parked = []
+            self._parked_gtp_flows[port_name] = parked
+            hub.spawn(self._add_gtp_port, port_name, gnb_ip)
+        parked.append((apply_flows, done))
+
+    def _add_gtp_port(self, port_name, gnb_ip):
         ovs = Utils.get_ovs_bridge(self._datapath)
         if ovs is None:
-            return None
+            self._drop_parked_gtp_flows(port_name)
+            return
 
-        port_name = self._ip_addr_to_gtp_port_name(gnb_ip)
-        ovs.add_tunnel_port(port_name, self.ovs_gtp_type,
-                            gnb_ip, key="flow")
-
-        return self._get_ofport(port_name)
+        if self.ovs_gtp_type is None:
+            self._ovs_multi_tunnel_init()
+        try:
+            ovs.add_tunnel_port(port_name, self.ovs_gtp_type,
+                                gnb_ip, key="flow")
+        except Exception as e:     #pylint: disable=broad-except
+            # The port may exist, e.g. from before a restart
+            self.logger.debug('Cannot add GTP port %s: %s', port_name, e)
+
+        # The port event may have been handled meanwhile
+        if port_name not in self._parked_gtp_flows:
+            return
+        port_no = self._get_ofport(port_name)
+        if port_no is None:
+            self._drop_parked_gtp_flows(port_name)
+            return
+        self._set_gtp_ofport(port_name, port_no)
+
+    def _drop_parked_gtp_flows(self, port_name):
+        parked = self._parked_gtp_flows.pop(port_name, [])
+        self.logger.error('Failed adding GTP port %s, dropping %d flow '
+                          'changes', port_name, len(parked))
+        for _, done in parked:
+            if done is not None:
+                done(False)
+
+    def _set_gtp_ofport(self, port_name, port_no):
+        self._gtp_ofports[port_name] = port_no
+        for apply_flows, done in self._parked_gtp_flows.pop(port_name, []):
+            res = apply_flows()
+            if done is not None:
+                done(res)
+
+    def _get_gtp_port_name(self, datapath, port):
+        if not self.config.multi_tunnel_flag or \
+                datapath.id != self._datapath_id:
+            return None
+        port_name = port.name
+        if isinstance(port_name, bytes):
+            port_name = port_name.decode('utf-8', 'ignore')
+        if not port_name.startswith(GTP_PORT_PREFIX):
+            return None
+        return port_name
+
+    def _load_gtp_ofports(self, datapath):
+        self._gtp_ofports.clear()
+        for port in (datapath.ports or {}).values():
+            port_name = self._get_gtp_port_name(datapath, port)
+            if port_name:
+                self._set_gtp_ofport(port_name, port.port_no)
+
+    @set_ev_cls(dpset.EventPortAdd, MAIN_DISPATCHER)
+    @set_ev_cls(dpset.EventPortModify, MAIN_DISPATCHER)
+    def _gtp_port_add_handler(self, ev):
+        port_name = self._get_gtp_port_name(ev.dp, ev.port)
+        if port_name:
+            self._set_gtp_ofport(port_name, ev.port.port_no)
+
+    @set_ev_cls(dpset.EventPortDelete, MAIN_DISPATCHER)
+    def _gtp_port_delete_handler(self, ev):
+        port_name = self._get_gtp_port_name(ev.dp, ev.port)
+        if port_name:
+            self._gtp_ofports.pop(port_name, None)
 
     def initialize_on_connect(self, datapath):
         self._datapath = datapath
+        if self.config.multi_tunnel_flag:
+            self._load_gtp_ofports(datapath)
         if self._clean_restart:
             self._delete_all_flows()
 
@@ -179,6 +269,7 @@ class Classifier(MagmaController):
         flows.delete_all_flows_from_table(self._datapath, self.tbl_num)
 
     def cleanup_on_disconnect(self, datapath):
+        self._gtp_ofports.clear()
         if self._clean_restart:
             self._delete_all_flows()
 
@@ -291,15 +382,24 @@ class Classifier(MagmaController):
                          ng_flag: bool = True,
                          unused_ue_ipv6_address: IPAddress = None,
                          unused_apn: str = None, unused_vlan: int = 0,
-                         ip_flow_dl: IPFlowDL = None) -> bool:
-
-        priority = Utils.get_of_priority(precedence)
+                         ip_flow_dl: IPFlowDL = None,
+                         done=None) -> Optional[bool]:
+        """
+        Add the tunnel flows of a session. Returns None if the flows wait
+        for the GTP port of enodeb_ip_addr to be added, done is then called
+        with the result once they are installed.
+        """
         # Add flow for gtp port
-        if enodeb_ip_addr:
-            gtp_portno = self._add_gtp_port(enodeb_ip_addr)
-        else:
-            gtp_portno = self.config.gtp_port
+        gtp_portno = self._get_gtp_ofport(enodeb_ip_addr)
+        if gtp_portno is None:
+            self._park_until_gtp_port(enodeb_ip_addr, partial(
+                self.add_tunnel_flows, precedence, i_teid, o_teid,
+                ue_ip_adr, enodeb_ip_addr, sid, ng_flag,
+                ip_flow_dl=ip_flow_dl,
+            ), done)
+            return None
 
+        priority = Utils.get_of_priority(precedence)
         # Add flow for gtp port for Uplink Tunnel
         if i_teid:
             self._install_uplink_tunnel_flows(priority, i_teid, gtp_portno, sid)
@@ -385,13 +485,20 @@ class Classifier(MagmaController):
 
     def delete_tunnel_flows(self, i_teid: int, ue_ip_adr: IPAddress,
                             enodeb_ip_addr: str = None,
-                            ip_flow_dl: IPFlowDL = None) -> bool:
-
+                            ip_flow_dl: IPFlowDL = None,
+                            done=None) -> Optional[bool]:
+        """
+        Delete the tunnel flows of a session. Returns None if the flows
+        wait for the GTP port of enodeb_ip_addr, like add_tunnel_flows.
+        """
         # Delete flow for gtp port
-        if enodeb_ip_addr:
-            gtp_portno = self._add_gtp_port(enodeb_ip_addr)
-        else:
-            gtp_portno = self.config.gtp_port
+        gtp_portno = self._get_gtp_ofport(enodeb_ip_addr)
+        if gtp_portno is None:
+            self._park_until_gtp_port(enodeb_ip_addr, partial(
+                self.delete_tunnel_flows, i_teid, ue_ip_adr, enodeb_ip_addr,
+                ip_flow_dl,
+            ), done)
+            return None
 
         if i_teid:
             self._delete_uplink_tunnel_flows(i_teid, gtp_portno)
@@ -644,15 +751,23 @@ class Classifier(MagmaController):
                             ng_flag: bool = True,
                             unused_ue_ipv6_address: IPAddress = None,
                             unused_vlan: int = 0,
-                            ip_flow_dl: IPFlowDL = None) -> bool:
-
-        priority = Utils.get_of_priority(precedence)
+                            ip_flow_dl: IPFlowDL = None,
+                            done=None) -> Optional[bool]:
+        """
+        Add the S8 tunnel flows of a session. Returns None if the flows
+        wait for the GTP port of enodeb_ip_addr, like add_tunnel_flows.
+        """
         # Add flow for gtp port
-        if enodeb_ip_addr:
-            gtp_portno = self._add_gtp_port(enodeb_ip_addr)
-        else:
-            gtp_portno = self.config.gtp_port
+        gtp_portno = self._get_gtp_ofport(enodeb_ip_addr)
+        if gtp_portno is None:
+            self._park_until_gtp_port(enodeb_ip_addr, partial(
+                self.add_s8_tunnel_flows, precedence, i_teid, o_teid,
+                ue_ip_adr, enodeb_ip_addr, sid, pgw_ip_addr, pgw_gtp_port,
+                ng_flag, ip_flow_dl=ip_flow_dl,
+            ), done)
+            return None
 
+        priority = Utils.get_of_priority(precedence)
         self._install_uplink_s8_tunnel_flows(priority, i_teid, o_teid,
                                              pgw_ip_addr, gtp_portno, sid, pgw_gtp_port)
 
@@ -710,13 +825,20 @@ class Classifier(MagmaController):
 
     def delete_s8_tunnel_flows(self, i_teid: int, ue_ip_adr: IPAddress,
                                enodeb_ip_addr: str = None, pgw_gtp_port: int = 0,
-                               ip_flow_dl: IPFlowDL = None) -> bool:
-
+                               ip_flow_dl: IPFlowDL = None,
+                               done=None) -> Optional[bool]:
+        """
+        Delete the S8 tunnel flows of a session. Returns None if the flows
+        wait for the GTP port of enodeb_ip_addr, like add_tunnel_flows.
+        """
         # Delete flow for gtp port
-        if enodeb_ip_addr:
-            gtp_portno = self._add_gtp_port(enodeb_ip_addr)
-        else:
-            gtp_portno = self.config.gtp_port
+        gtp_portno = self._get_gtp_ofport(enodeb_ip_addr)
+        if gtp_portno is None:
+            self._park_until_gtp_port(enodeb_ip_addr, partial(
+                self.delete_s8_tunnel_flows, i_teid, ue_ip_adr,
+                enodeb_ip_addr, pgw_gtp_port, ip_flow_dl,
+            ), done)
+            return None
 
         if i_teid:
             self._delete_uplink_tunnel_flows(i_teid, gtp_portno)
@@ -739,16 +861,19 @@ class Classifier(MagmaController):
 
         return True
 
-    def process_mme_tunnel_request(self, request: UESessionSet,
-                                  ) -> UESessionContextResponse:
+    def process_mme_tunnel_request(self, request: UESessionSet, done=None,
+                                  ) -> Optional[UESessionContextResponse]:
 
         """Do process the mme tunnel message and send response
         Entry point to MME session creation in UPF
 
         Args:
                tunnel_msg: Tunnel Creation/Modification/Deletion message
+               done: called with the response if the tunnel flows wait
+                     for the GTP port of the eNodeB
         Returns:
-               UESessionContextResponse: Tunnel ops result
+               UESessionContextResponse: Tunnel ops result, or None if
+               the response is passed to done once the flows are installed
         """
         cause_ie = CauseIE.REQUEST_ACCEPTED
         result = True
@@ -756,6 +881,21 @@ class Classifier(MagmaController):
         ue_ipv4_address = None
         ue_ipv6_address = None
 
+        def response(res):
+            cause = cause_ie
+            if res == False:
+                cause = CauseIE.RULE_CREATION_OR_MODIFICATION_FAILURE
+            return UESessionContextResponse(
+                ue_ipv4_address=request.ue_ipv4_address,
+                ue_ipv6_address=request.ue_ipv6_address,
+                operation_type=request.ue_session_state.ue_config_state,
+                cause_info=CauseIE(cause_ie=cause),
+            )
+
+        def flows_done(res):
+            if done is not None:
+                done(response(res))
+
         if request.ue_ipv4_address.address:
             addr_str = socket.inet_ntop(
                socket.AF_INET,
@@ -788,14 +928,16 @@ class Classifier(MagmaController):
                                                    ipaddress.ip_address(request.enb_ip_address.address),
                                                    encode_imsi(request.subscriber_id.id),
                                                    False, ue_ipv6_address,
-                                                   request.apn, request.vlan, request.ip_flow_dl)
+                                                   request.apn, request.vlan, request.ip_flow_dl,
+                                                   flows_done)
 
         elif (request.ue_session_state.ue_config_state == \
                                       UESessionState.UNREGISTERED):
             res = self.delete_tunnel_flows(request.in_teid,
                                                            ue_ipv4_address,
                                                            ipaddress.ip_address(request.enb_ip_address.address),
-                                                           request.ip_flow_dl)
+                                                           request.ip_flow_dl,
+                                                           flows_done)
 
         elif (request.ue_session_state.ue_config_state == \
                                       UESessionState.UNINSTALL_IDLE):
@@ -819,13 +961,9 @@ class Classifier(MagmaController):
                                                              ue_ipv4_address,
                                                              request.ip_flow_dl)
 
-        if res == False:
-            cause_ie = CauseIE.RULE_CREATION_OR_MODIFICATION_FAILURE
-
-        return(UESessionContextResponse(ue_ipv4_address=request.ue_ipv4_address,
-                                         ue_ipv6_address=request.ue_ipv6_address,
-                                         operation_type=request.ue_session_state.ue_config_state,
-                                         cause_info=CauseIE(cause_ie=cause_ie)))
+        if res is None:
+            return None
+        return response(res)
 
     def _validate_ue_session(self, tunnel_msg:UESessionSet) ->  bool :
 
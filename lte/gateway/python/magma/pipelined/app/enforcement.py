@@ -182,10 +182,10 @@ class EnforcementController(PolicyMixin, RestartMixin, MagmaController):
                 raise err
         return flow_adds
 
-    def _install_flow_for_rule(self, imsi, msisdn: bytes, uplink_tunnel: int, ip_addr, apn_ambr, rule, version):
+    def _get_rule_install_msgs(self, imsi, msisdn: bytes, uplink_tunnel: int, ip_addr, apn_ambr, rule, version):
         """
-        Install a flow to get stats for a particular rule. Flows will match on
-        IMSI, cookie (the rule num), in/out direction
+        Get the flow msgs to install a rule, redirect rules are installed
+        right away.
 
         Args:
             imsi (string): subscriber to install rule for
@@ -195,18 +195,33 @@ class EnforcementController(PolicyMixin, RestartMixin, MagmaController):
             rule (PolicyRule): policy rule proto
         """
         if rule.redirect.support == rule.redirect.ENABLED:
-            return self._install_redirect_flow(imsi, ip_addr, rule, version)
+            return [], self._install_redirect_flow(imsi, ip_addr, rule, version)
 
         if not rule.flow_list:
             self.logger.error('The flow list for imsi %s, rule.id - %s'
                               'is empty, this shoudn\'t happen', imsi, rule.id)
-            return RuleModResult.FAILURE
+            return [], RuleModResult.FAILURE
 
-        flow_adds = []
         try:
-            flow_adds = self._get_rule_match_flow_msgs(imsi, msisdn, uplink_tunnel, ip_addr, apn_ambr, rule, version)
+            return self._get_rule_match_flow_msgs(imsi, msisdn, uplink_tunnel, ip_addr, apn_ambr, rule, version), None
         except FlowMatchError:
-            return RuleModResult.FAILURE
+            return [], RuleModResult.FAILURE
+
+    def _install_flow_for_rule(self, imsi, msisdn: bytes, uplink_tunnel: int, ip_addr, apn_ambr, rule, version):
+        """
+        Install a flow to get stats for a particular rule. Flows will match on
+        IMSI, cookie (the rule num), in/out direction
+
+        Args:
+            imsi (string): subscriber to install rule for
+            msisdn (bytes): subscriber MSISDN
+            uplink_tunnel (int): tunnel ID of the subscriber.
+            ip_addr (string): subscriber session ipv4 address
+            rule (PolicyRule): policy rule proto
+        """
+        flow_adds, res = self._get_rule_install_msgs(imsi, msisdn, uplink_tunnel, ip_addr, apn_ambr, rule, version)
+        if res is not None:
+            return res
 
         try:
             chan = self._msg_hub.send(flow_adds, self._datapath)
@@ -94,6 +94,20 @@ class EnforcementStatsController(PolicyMixin, RestartMixin, MagmaController):
         self._last_report_timestamp = datetime.now()
         self._bridge_name = kwargs['config']['bridge_name']
         self._periodic_stats_reporting = kwargs['config']['enforcement'].get('periodic_stats_reporting', True)
+        # With more than one partition, every interval polls the flows of a
+        # single cookie partition of the table. The records of the other
+        # partitions are reported from their last poll, so usage reaches
+        # sessiond stats_poll_partitions intervals apart.
+        self._stats_poll_partitions = kwargs['config']['enforcement'].get('stats_poll_partitions', 1)
+        if self._stats_poll_partitions < 1 or \
+                self._stats_poll_partitions & (self._stats_poll_partitions - 1):
+            self.logger.error('stats_poll_partitions must be a power of 2, '
+                              'polling the whole table instead')
+            self._stats_poll_partitions = 1
+        self._next_poll_partition = 0
+        self._partitions_by_xid = {}  # Partition polled by each stats request
+        # Rule records from the last poll of each partition
+        self._records_by_partition = {}
         if self._print_grpc_payload is None:
             self._print_grpc_payload = \
                 kwargs['config'].get('magma_print_grpc_payload', False)
@@ -109,6 +123,8 @@ class EnforcementStatsController(PolicyMixin, RestartMixin, MagmaController):
         self.unhandled_stats_msgs = []
         self.total_usage = {}
         self._unmatched_bytes = 0
+        self._partitions_by_xid = {}
+        self._records_by_partition = {}
 
     def initialize_on_connect(self, datapath):
         """
@@ -146,6 +162,25 @@ class EnforcementStatsController(PolicyMixin, RestartMixin, MagmaController):
         if self._clean_restart:
             self.delete_all_flows(datapath)
 
+    def _get_rule_install_msgs(self, imsi, msisdn: bytes, uplink_tunnel: int, ip_addr, apn_ambr, rule, version):
+        """
+        Get the flow msgs to get stats for a particular rule.
+        """
+        return self._get_rule_match_flow_msgs(imsi, msisdn, uplink_tunnel, ip_addr, apn_ambr, rule, version), None
+
+    def _cleanup_failed_rule(self, imsi, ip_addr, rule_id, version):
+        """
+        Remove the stats flows of a rule that failed to install in a batch.
+        The version check when polling stats keeps them, as the version
+        mapper already holds the rule's new version.
+        """
+        try:
+            self._delete_flow(imsi, ip_addr, rule_id, version)
+        except MagmaOFError as e:
+            self.logger.error(
+                'Failed to remove stats flows of rule %s for subscriber %s '
+                '(version: %s): %s', rule_id, imsi, version, e)
+
     def _install_flow_for_rule(self, imsi, msisdn: bytes, uplink_tunnel: int, ip_addr, apn_ambr, rule, version):
         """
         Install a flow to get stats for a particular rule. Flows will match on
@@ -164,7 +199,7 @@ class EnforcementStatsController(PolicyMixin, RestartMixin, MagmaController):
                 rule.id, imsi, err)
             return RuleModResult.FAILURE
 
-        msgs = self._get_rule_match_flow_msgs(imsi, msisdn, uplink_tunnel, ip_addr, apn_ambr, rule, version)
+        msgs, _ = self._get_rule_install_msgs(imsi, msisdn, uplink_tunnel, ip_addr, apn_ambr, rule, version)
 
         try:
             chan = self._msg_hub.send(msgs, self._datapath)
@@ -188,6 +223,8 @@ class EnforcementStatsController(PolicyMixin, RestartMixin, MagmaController):
 
     @set_ev_cls(ofp_event.EventOFPErrorMsg, MAIN_DISPATCHER)
     def _handle_error(self, ev):
+        if self._partitions_by_xid.pop(ev.msg.xid, None) is not None:
+            self.logger.warning('Stats request of partition failed')
         self._msg_hub.handle_error(ev)
 
     # pylint: disable=protected-access,unused-argument
@@ -324,21 +361,46 @@ class EnforcementStatsController(PolicyMixin, RestartMixin, MagmaController):
             self._last_poll_time = now
             self.logger.debug('Started polling: %s',
                               now.strftime("%H:%M:%S"))
-            self._poll_stats(self._datapath)
+            if self._stats_poll_partitions > 1:
+                self._poll_next_partition()
+            else:
+                self._poll_stats(self._datapath)
+
+    def _poll_next_partition(self):
+        """
+        Poll the flows whose cookie falls in the next partition. Flows of the
+        same rule share a cookie so a rule record is always fully contained
+        in one partition.
+        """
+        partition = self._next_poll_partition
+        self._next_poll_partition = \
+            (partition + 1) % self._stats_poll_partitions
+        # A reply still pending from the last poll of the partition is lost
+        for xid, pending in list(self._partitions_by_xid.items()):
+            if pending == partition:
+                self.logger.warning('No stats reply for partition %d',
+                                    partition)
+                del self._partitions_by_xid[xid]
+        req = self._poll_stats(self._datapath, partition,
+                               self._stats_poll_partitions - 1)
+        if req is not None:
+            self._partitions_by_xid[req.xid] = partition
 
     def _poll_stats(self, datapath, cookie: int = 0, cookie_mask: int = 0):
         """
-        Send a FlowStatsRequest message to the datapath
+        Send a FlowStatsRequest message to the datapath, returns the sent
+        request or None if it couldn't be sent
         Raises:
         MagmaOFError: if we can't poll datapath stats
         """
         try:
-            flows.send_stats_request(datapath, self.tbl_num,
-                                     cookie, cookie_mask)
+            return flows.send_stats_request(datapath, self.tbl_num,
+                                            cookie, cookie_mask)
         except MagmaOFError as e:
             self.logger.warning("Couldn't poll datapath stats: %s", e)
         except Exception as e: # pylint: disable=broad-except
             self.logger.warning("Couldn't poll datapath stats: %s", e)
+        return None
 
     @set_ev_cls(ofp_event.EventOFPFlowStatsReply, MAIN_DISPATCHER)
     def _flow_stats_reply_handler(self, ev):
@@ -359,8 +421,17 @@ class EnforcementStatsController(PolicyMixin, RestartMixin, MagmaController):
             # Wait for more multi-part responses thats received for the
             # single stats request.
             return
-        self.loop.call_soon_threadsafe(
-            self._handle_flow_stats, self.unhandled_stats_msgs)
+        if self._stats_poll_partitions > 1:
+            partition = self._partitions_by_xid.pop(ev.msg.xid, None)
+            if partition is None:
+                self.logger.debug('Ignoring stats reply of unknown request')
+            else:
+                self.loop.call_soon_threadsafe(
+                    self._handle_partition_flow_stats,
+                    self.unhandled_stats_msgs, partition)
+        else:
+            self.loop.call_soon_threadsafe(
+                self._handle_flow_stats, self.unhandled_stats_msgs)
         self.unhandled_stats_msgs = []
 
     def _handle_flow_stats(self, stats_msgs):
@@ -391,6 +462,30 @@ class EnforcementStatsController(PolicyMixin, RestartMixin, MagmaController):
         # This is done primarily for CWF integration tests, TODO rm
         self.total_usage = current_usage
 
+    def _handle_partition_flow_stats(self, stats_msgs, partition):
+        """
+        Aggregate the flow stats of a polled partition by rule, and report
+        them to session manager along with the records of the last poll of
+        every other partition. Sessiond still sees all the active rules in
+        every report, and a rule whose flows are gone drops out of the
+        report once its partition is polled again.
+        """
+        flow_stats = []
+        for partition_flow_stats in stats_msgs:
+            flow_stats += partition_flow_stats
+        try:
+            self._records_by_partition[partition] = \
+                self._get_usage_from_flow_stat(flow_stats)
+        except ConnectionError:
+            self.logger.error('Failed processing stats, redis unavailable')
+            return
+
+        current_usage = _merge_records(self._records_by_partition.values())
+        self._report_usage(current_usage)
+
+        # This is done primarily for CWF integration tests, TODO rm
+        self.total_usage = current_usage
+
     def deactivate_default_flow(self, imsi, ip_addr):
         if self._datapath is None:
             self.logger.error('Datapath not initialized')
@@ -608,6 +703,28 @@ def _generate_rule_match(imsi, ip_addr, rule_num, version, direction):
                       direction=direction, rule_num=rule_num,
                       rule_version=version, **ip_match)
 
+def _merge_records(records_by_partition):
+    """
+    Merge the rule records of several partitions, adding up the usage of
+    records with the same key.
+    """
+    merged = {}
+    for records in records_by_partition:
+        for key, record in records.items():
+            merged_record = merged.get(key)
+            if merged_record is None:
+                merged[key] = record
+                continue
+            total = RuleRecord()
+            total.CopyFrom(merged_record)
+            total.bytes_rx += record.bytes_rx
+            total.bytes_tx += record.bytes_tx
+            total.dropped_rx += record.dropped_rx
+            total.dropped_tx += record.dropped_tx
+            merged[key] = total
+    return merged
+
+
 def _get_sid(flow):
     if IMSI_REG not in flow.match:
         return None
@@ -157,10 +157,10 @@ class GYController(PolicyMixin, RestartMixin, MagmaController):
         self._qos_mgr.remove_subscriber_qos(imsi, num)
         self._remove_he_flows(ip_addr, rule_id)
 
-    def _install_flow_for_rule(self, imsi, msisdn:bytes, uplink_tunnel: int, ip_addr, apn_ambr, rule, version):
+    def _get_rule_install_msgs(self, imsi, msisdn: bytes, uplink_tunnel: int, ip_addr, apn_ambr, rule, version):
         """
-        Install a flow to get stats for a particular rule. Flows will match on
-        IMSI, cookie (the rule num), in/out direction
+        Get the flow msgs to install a rule, redirect rules are installed
+        right away.
 
         Args:
             imsi (string): subscriber to install rule for
@@ -170,18 +170,32 @@ class GYController(PolicyMixin, RestartMixin, MagmaController):
         """
         if rule.redirect.support == rule.redirect.ENABLED:
             self._install_redirect_flow(imsi, ip_addr, rule, version)
-            return RuleModResult.SUCCESS
+            return [], RuleModResult.SUCCESS
 
         if not rule.flow_list:
             self.logger.error('The flow list for imsi %s, rule.id - %s'
                               'is empty, this shoudn\'t happen', imsi, rule.id)
-            return RuleModResult.FAILURE
+            return [], RuleModResult.FAILURE
 
-        flow_adds = []
         try:
-            flow_adds = self._get_rule_match_flow_msgs(imsi, msisdn, uplink_tunnel, ip_addr, apn_ambr, rule, version)
+            return self._get_rule_match_flow_msgs(imsi, msisdn, uplink_tunnel, ip_addr, apn_ambr, rule, version), None
         except FlowMatchError:
-            return RuleModResult.FAILURE
+            return [], RuleModResult.FAILURE
+
+    def _install_flow_for_rule(self, imsi, msisdn:bytes, uplink_tunnel: int, ip_addr, apn_ambr, rule, version):
+        """
+        Install a flow to get stats for a particular rule. Flows will match on
+        IMSI, cookie (the rule num), in/out direction
+
+        Args:
+            imsi (string): subscriber to install rule for
+            ip_addr (string): subscriber session ipv4 address
+            apn_ambr (integer): maximum bandwidth for non-GBR EPS bearers
+            rule (PolicyRule): policy rule proto
+        """
+        flow_adds, res = self._get_rule_install_msgs(imsi, msisdn, uplink_tunnel, ip_addr, apn_ambr, rule, version)
+        if res is not None:
+            return res
 
         chan = self._msg_hub.send(flow_adds, self._datapath)
         return self._wait_for_rule_responses(imsi, ip_addr, rule, chan)
@@ -13,15 +13,17 @@ limitations under the License.
 import ipaddress
 import threading
 from collections import namedtuple
+from typing import List
 
-from lte.protos.mobilityd_pb2 import IPAddress
+from lte.protos.mobilityd_pb2 import GWInfo
 from magma.pipelined.app.base import MagmaController
 from magma.pipelined.app.li_mirror import LIMirrorController
 from magma.pipelined.app.restart_mixin import DefaultMsgsMap, RestartMixin
+from magma.pipelined.arp_prober import ArpProber
 from magma.pipelined.bridge_util import BridgeTools, DatapathLookupError
 from magma.pipelined.mobilityd_client import (
     get_mobilityd_gw_info,
-    set_mobilityd_gw_info,
+    set_mobilityd_gw_info_list,
 )
 from magma.pipelined.openflow import flows
 from magma.pipelined.openflow.magma_match import MagmaMatch
@@ -39,11 +41,6 @@ from ryu.controller.handler import MAIN_DISPATCHER, set_ev_cls
 from ryu.lib import hub
 from ryu.lib.packet import ether_types
 from ryu.ofproto.ofproto_v1_4 import OFPP_LOCAL
-from scapy.arch import get_if_addr, get_if_hwaddr
-from scapy.data import ETH_P_ALL, ETHER_BROADCAST
-from scapy.error import Scapy_Exception
-from scapy.layers.l2 import ARP, Dot1Q, Ether
-from scapy.sendrecv import srp1
 
 # ingress and egress service names -- used by other controllers
 
@@ -72,6 +69,8 @@ class InOutController(RestartMixin, MagmaController):
          'setup_type', 'uplink_gw_mac', 'he_proxy_port', 'he_proxy_eth_mac'],
     )
     ARP_PROBE_FREQUENCY = 300
+    # Time to wait for the uplink gateways to answer a probe, in seconds
+    GW_PROBE_TIMEOUT = 1
     NON_NAT_ARP_EGRESS_PORT = 'dhcp0'
     UPLINK_OVS_BRIDGE_NAME = 'uplink_br0'
 
@@ -99,6 +98,11 @@ class InOutController(RestartMixin, MagmaController):
                       self._egress_tbl_num]
         self._gw_mac_monitor = None
         self._current_upstream_mac_map = {}  # maps vlan to upstream gw mac
+        # maps vlan to the gw mac its egress flows were last installed with,
+        # since the datapath connected
+        self._gw_flow_mac_map = {}
+        self._arp_prober = ArpProber(self.config.non_nat_arp_egress_port,
+                                     self.GW_PROBE_TIMEOUT)
         self._clean_restart = kwargs['config']['clean_restart']
         self._msg_hub = MessageHub(self.logger)
         self._datapath = None
@@ -156,6 +160,7 @@ class InOutController(RestartMixin, MagmaController):
 
     def initialize_on_connect(self, datapath):
         self._datapath = datapath
+        self._gw_flow_mac_map = {}
         self._setup_non_nat_monitoring()
         # TODO possibly investigate stateless XWF(no sessiond)
         if self.config.setup_type == 'XWF':
@@ -401,86 +406,82 @@ class InOutController(RestartMixin, MagmaController):
 
         return msgs
 
-    def _get_gw_mac_address(self, ip: IPAddress, vlan: str = "") -> str:
-        try:
-            gw_ip = ipaddress.ip_address(ip.address)
-            self.logger.debug("sending arp via egress: %s",
-                              self.config.non_nat_arp_egress_port)
-            eth_mac_src = get_if_hwaddr(self.config.non_nat_arp_egress_port)
-            psrc = "0.0.0.0"
-            egress_port_ip = get_if_addr(self.config.non_nat_arp_egress_port)
-            if egress_port_ip:
-                psrc = egress_port_ip
-
-            pkt = Ether(dst=ETHER_BROADCAST, src=eth_mac_src)
-            if vlan.isdigit():
-                pkt /= Dot1Q(vlan=int(vlan))
-            pkt /= ARP(op="who-has", pdst=gw_ip, hwsrc=eth_mac_src, psrc=psrc)
-            self.logger.debug("ARP Req pkt %s", pkt.show(dump=True))
-
-            res = srp1(pkt,
-                       type=ETH_P_ALL,
-                       iface=self.config.non_nat_arp_egress_port,
-                       timeout=1,
-                       verbose=0,
-                       nofilter=1,
-                       promisc=0)
-
-            if res is not None:
-                self.logger.debug("ARP Res pkt %s", res.show(dump=True))
-                if str(res[ARP].psrc) != str(gw_ip):
-                    self.logger.warning("Unexpected IP in ARP response. expected: %s pkt: %s",
-                                        str(gw_ip),
-                                        res.show(dump=True))
-                    return ""
-                if vlan.isdigit():
-                    if Dot1Q in res and str(res[Dot1Q].vlan) == vlan:
-                        mac = res[ARP].hwsrc
-                    else:
-                        self.logger.warning("Unexpected vlan in ARP response. expected: %s pkt: %s",
-                                            vlan,
-                                            res.show(dump=True))
-                        return ""
-                else:
-                    mac = res[ARP].hwsrc
-                return mac
-            else:
-                self.logger.debug("Got Null response")
-                return ""
+    def _probe_gw_mac_addresses(self, gw_info_list) -> List[str]:
+        """
+        ARP probe the gateways of gw_info_list all at once.
 
-        except Scapy_Exception as ex:
+        Returns:
+            MAC address of each gateway, or "" for those which didn't answer
+        """
+        targets = []
+        for gw_info in gw_info_list:
+            target = None
+            try:
+                gw_ip = ipaddress.ip_address(gw_info.ip.address)
+                if gw_ip.version == 4:
+                    target = (str(gw_ip), gw_info.vlan)
+                else:
+                    self.logger.debug("No ARP probe for GW %s", gw_ip)
+            except ValueError:
+                self.logger.warning("Invalid GW Ip address: [%s] or vlan %s",
+                                    str(gw_info.ip), gw_info.vlan)
+            targets.append(target)
+
+        self.logger.debug("sending arp via egress: %s",
+                          self.config.non_nat_arp_egress_port)
+        try:
+            macs = self._arp_prober.probe(
+                [target for target in targets if target is not None])
+        except OSError as ex:
             self.logger.warning("Error in probing Mac address: err %s", ex)
-            return ""
-        except ValueError:
-            self.logger.warning("Invalid GW Ip address: [%s] or vlan %s",
-                                str(ip), vlan)
-            return ""
+            macs = {}
+        return [macs.get(target, "") for target in targets]
 
     def _monitor_and_update(self):
         while True:
-            gw_info_list = get_mobilityd_gw_info()
-            for gw_info in gw_info_list:
-                if gw_info and gw_info.ip:
-                    latest_mac_addr = self._get_gw_mac_address(gw_info.ip, gw_info.vlan)
-                    self.logger.debug("mac [%s] for vlan %s", latest_mac_addr, gw_info.vlan)
-                    if latest_mac_addr == "":
-                        latest_mac_addr = gw_info.mac
-
-                    msgs = self._get_default_egress_flow_msgs(self._datapath,
-                                                              latest_mac_addr,
-                                                              gw_info.vlan)
-                    chan = self._msg_hub.send(msgs, self._datapath)
-                    self._wait_for_responses(chan, len(msgs))
-
-                    if latest_mac_addr != "":
-                        set_mobilityd_gw_info(gw_info.ip,
-                                              latest_mac_addr,
-                                              gw_info.vlan)
-                else:
-                    self.logger.warning("No default GW found.")
-
+            self._update_gw_macs()
             hub.sleep(self.config.non_nat_gw_probe_frequency)
 
+    def _update_gw_macs(self):
+        """
+        Probe the uplink gateways, and install the egress flows of those
+        whose MAC address changed. Changed MAC addresses are pushed to
+        mobilityd together.
+        """
+        gw_info_list = [gw_info for gw_info in get_mobilityd_gw_info()
+                        if gw_info and gw_info.ip]
+        if not gw_info_list:
+            self.logger.warning("No default GW found.")
+            return
+
+        msgs = []
+        updated_gw_info_list = []
+        macs = self._probe_gw_mac_addresses(gw_info_list)
+        for gw_info, latest_mac_addr in zip(gw_info_list, macs):
+            self.logger.debug("mac [%s] for vlan %s", latest_mac_addr,
+                              gw_info.vlan)
+            if latest_mac_addr == "":
+                latest_mac_addr = gw_info.mac
+            elif latest_mac_addr != gw_info.mac:
+                updated_gw_info_list.append(GWInfo(ip=gw_info.ip,
+                                                   mac=latest_mac_addr,
+                                                   vlan=gw_info.vlan))
+
+            if gw_info.vlan in self._gw_flow_mac_map and \
+                    latest_mac_addr in ("",
+                                        self._gw_flow_mac_map[gw_info.vlan]):
+                continue
+            self._gw_flow_mac_map[gw_info.vlan] = latest_mac_addr
+            msgs.extend(self._get_default_egress_flow_msgs(self._datapath,
+                                                           latest_mac_addr,
+                                                           gw_info.vlan))
+
+        if msgs:
+            chan = self._msg_hub.send(msgs, self._datapath)
+            self._wait_for_responses(chan, len(msgs))
+        if updated_gw_info_list:
+            set_mobilityd_gw_info_list(updated_gw_info_list)
+
     def _setup_non_nat_monitoring(self):
         """
         Setup egress flow to forward traffic to internet GW.
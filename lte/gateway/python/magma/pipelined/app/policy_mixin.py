@@ -11,6 +11,7 @@ See the License for the specific language governing permissions and
 limitations under the License.
 """
 from abc import ABCMeta, abstractmethod
+from collections import namedtuple
 from typing import List
 
 from lte.protos.mobilityd_pb2 import IPAddress
@@ -23,6 +24,7 @@ from lte.protos.policydb_pb2 import PolicyRule
 from magma.pipelined.app.dpi import UNCLASSIFIED_PROTO_ID, get_app_id
 from magma.pipelined.imsi import encode_imsi
 from magma.pipelined.openflow import flows
+from magma.pipelined.openflow.exceptions import MagmaDPDisconnectedError
 from magma.pipelined.openflow.messages import MsgChannel
 from magma.pipelined.openflow.registers import (
     RULE_NUM_REG,
@@ -45,6 +47,12 @@ PROCESS_STATS = 0x0
 IGNORE_STATS = 0x1
 DROP_FLOW_STATS = 0x2
 
+# Policies to activate for a single subscriber session, see activate_rules
+PolicyActivation = namedtuple(
+    'PolicyActivation',
+    ['imsi', 'msisdn', 'uplink_tunnel', 'ip_addr', 'apn_ambr', 'policies'],
+)
+
 
 class PolicyMixin(metaclass=ABCMeta):
     """
@@ -98,6 +106,85 @@ class PolicyMixin(metaclass=ABCMeta):
             policy_results=policy_results,
         )
 
+    def activate_rules_batch(self, activations: List[PolicyActivation]) \
+            -> List[ActivateFlowsResult]:
+        """
+        Activate the flows for multiple subscriber sessions at once. All flow
+        msgs of the batch are sent together followed by a single barrier, the
+        results are returned in the same order as the activations.
+
+        Args:
+            activations (PolicyActivation []): subscriber sessions and their
+                versioned policies to activate
+        """
+        if self._datapath is None:
+            self.logger.error('Datapath not initialized for adding flows')
+            return [ActivateFlowsResult(
+                policy_results=[RuleModResult(
+                    rule_id=policy.rule.id,
+                    version=policy.version,
+                    result=RuleModResult.FAILURE,
+                ) for policy in activation.policies],
+            ) for activation in activations]
+
+        # Results of rules which were handled without sending flow msgs are
+        # known right away, the rest are filled in once OVS replies
+        results = []
+        msgs_by_txn = []
+        for i, activation in enumerate(activations):
+            activation_results = []
+            for j, policy in enumerate(activation.policies):
+                msgs, res = self._get_rule_install_msgs(
+                    activation.imsi, activation.msisdn,
+                    activation.uplink_tunnel, activation.ip_addr,
+                    activation.apn_ambr, policy.rule, policy.version)
+                if res is None and msgs:
+                    msgs_by_txn.append(((i, j), msgs))
+                activation_results.append(res)
+            results.append(activation_results)
+
+            # Install a base flow for when no rule is matched.
+            default_msgs = self._get_default_flow_msgs_for_subscriber(
+                activation.imsi, activation.ip_addr)
+            if default_msgs:
+                msgs_by_txn.append(((i, None), default_msgs))
+
+        errors = {}
+        if msgs_by_txn:
+            try:
+                chan = self._msg_hub.send_batch(msgs_by_txn, self._datapath)
+                errors = self._wait_for_batch_responses(chan, msgs_by_txn)
+            except MagmaDPDisconnectedError as err:
+                errors = {txn_id: err for txn_id, _ in msgs_by_txn}
+
+        for (i, j), _ in msgs_by_txn:
+            activation = activations[i]
+            err = errors.get((i, j))
+            if j is None:
+                if err is not None:
+                    self.logger.error(
+                        "Failed to install default flow for subscriber "
+                        "%s: %s", activation.imsi, err)
+                continue
+            if err is None:
+                results[i][j] = RuleModResult.SUCCESS
+                continue
+            policy = activation.policies[j]
+            self.logger.error(
+                "Failed to install rule %s for subscriber %s: %s",
+                policy.rule.id, activation.imsi, err)
+            self._cleanup_failed_rule(activation.imsi, activation.ip_addr,
+                                      policy.rule.id, policy.version)
+            results[i][j] = RuleModResult.FAILURE
+
+        return [ActivateFlowsResult(
+            policy_results=[RuleModResult(
+                rule_id=policy.rule.id,
+                version=policy.version,
+                result=RuleModResult.SUCCESS if res is None else res,
+            ) for policy, res in zip(activation.policies, results[i])],
+        ) for i, activation in enumerate(activations)]
+
     def _remove_he_flows(self, ip_addr: IPAddress, rule_id: str = "",
                          rule_num: int = -1):
         if self.proxy_controller:
@@ -121,6 +208,32 @@ class PolicyMixin(metaclass=ABCMeta):
                 return fail(result.exception())
         return RuleModResult.SUCCESS
 
+    def _wait_for_batch_responses(self, chan, msgs_by_txn):
+        """
+        Collect the replies of a batch sent with MessageHub.send_batch.
+        Returns the first error of every failed transaction, keyed by txn_id.
+        """
+        remaining = {txn_id: len(msgs) for txn_id, msgs in msgs_by_txn}
+        errors = {}
+        for _ in range(sum(remaining.values())):
+            try:
+                result = chan.get()
+            except MsgChannel.Timeout:
+                break
+            remaining[result.txn_id] -= 1
+            if not result.ok():
+                errors.setdefault(result.txn_id, result.exception())
+        for txn_id, count in remaining.items():
+            if count:
+                errors.setdefault(txn_id, "No response from OVS")
+        return errors
+
+    def _cleanup_failed_rule(self, imsi, ip_addr, rule_id, version):
+        """
+        Remove the flows of a rule that failed to install in a batch.
+        """
+        self._deactivate_flow_for_rule(imsi, ip_addr, rule_id)
+
     def _wait_for_responses(self, chan, response_count):
         def fail(err):
             #TODO need to rework setup to return all rule specific success/fails
@@ -341,6 +454,24 @@ class PolicyMixin(metaclass=ABCMeta):
                          self.proxy_controller)
 
 
+    @abstractmethod
+    def _get_rule_install_msgs(self, imsi, msisdn: bytes, uplink_tunnel: int,
+                               ip_addr, apn_ambr, rule, version):
+        """
+        Get the flow msgs needed to install a rule. Subclass should implement
+        this. Rules that are not installed through flow msgs (e.g. redirect
+        rules) or are invalid are handled right away.
+
+        Args:
+            imsi (string): subscriber to install rule for
+            ip_addr (string): subscriber session ipv4 address
+            rule (PolicyRule): policy rule proto
+        Returns:
+            (msgs, result): the flow msgs to send, result is the
+            RuleModResult if the rule was already handled and None otherwise
+        """
+        raise NotImplementedError
+
     @abstractmethod
     def _install_flow_for_rule(self, imsi, msisdn: bytes, uplink_tunnel: int, ip_addr, apn_ambr, rule, version):
         """
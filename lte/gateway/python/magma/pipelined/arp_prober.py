@@ -0,0 +1,183 @@
+"""
+Copyright 2020 The Magma Authors.
+
+This source code is licensed under the BSD-style license found in the
+LICENSE file in the root directory of this source tree.
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+import ctypes
+import select
+import socket
+import struct
+import time
+from typing import Dict, List, Optional, Tuple
+
+from scapy.arch import get_if_addr
+
+ETH_P_ALL = 0x0003
+ETH_P_ARP = 0x0806
+ETH_P_8021Q = 0x8100
+ETHER_BROADCAST = b'\xff' * 6
+ETH_HEADER = struct.Struct('!6s6sH')
+VLAN_TAG = struct.Struct('!HH')
+# Ethernet/IPv4 ARP: hardware and protocol types and address lengths,
+# operation, sender and target addresses
+ARP = struct.Struct('!HHBBH6s4s6s4s')
+ARP_REQUEST = 1
+ARP_REPLY = 2
+VLAN_VID_MASK = 0x0fff
+
+# From linux/if_packet.h. The kernel moves the VLAN tag of received frames
+# to the auxdata, rather than leaving it in the frame. Sockets of a given
+# protocol get tagged frames with their tag cleared, so the prober reads
+# all frames, filtering ARP ones in the kernel.
+SOL_PACKET = 263
+PACKET_AUXDATA = 8
+TP_STATUS_VLAN_VALID = 1 << 4
+# tp_status, tp_len, tp_snaplen, tp_mac, tp_net, tp_vlan_tci, tp_vlan_tpid
+TPACKET_AUXDATA = struct.Struct('=IIIHHHH')
+RECV_SIZE = 2048
+
+# Classic BPF program accepting ARP frames, untagged or with their VLAN tag
+# in the frame: ldh [12]; jeq ARP; jeq 802.1Q; ldh [16]; jeq ARP
+SO_ATTACH_FILTER = 26
+BPF_INSN = struct.Struct('HBBI')
+ARP_FILTER = (
+    (0x28, 0, 0, 12),
+    (0x15, 3, 0, ETH_P_ARP),
+    (0x15, 0, 3, ETH_P_8021Q),
+    (0x28, 0, 0, 16),
+    (0x15, 0, 1, ETH_P_ARP),
+    (0x06, 0, 0, 0x40000),
+    (0x06, 0, 0, 0),
+)
+
+
+class ArpProber(object):
+    """
+    Resolves the MAC addresses of IPv4 gateways, each reached untagged or on
+    its own VLAN, through one raw socket of the egress interface.
+
+    The requests of all the gateways are sent at once, and the replies are
+    collected as they arrive until every gateway answered or the timeout
+    expired, so a probe takes at most the timeout however many gateways
+    there are. The socket is only read once readable, which yields to the
+    other green threads when eventlet is patched in.
+    """
+
+    def __init__(self, iface: str, timeout: float = 1):
+        self._iface = iface
+        self._timeout = timeout
+
+    def probe(self, targets: List[Tuple[str, str]]) -> Dict[Tuple[str, str], str]:
+        """
+        Resolve the MAC address of each (gateway IPv4 address, vlan) of
+        targets. Targets whose vlan isn't a VLAN id are probed untagged.
+
+        Returns:
+            MAC address of the targets which answered, by target
+
+        Raises:
+            OSError if the interface can't be probed
+        """
+        # (packed IP, VLAN id or None) => target
+        pending = {}
+        for ip, vlan in targets:
+            vlan_id = int(vlan) if vlan.isdigit() else None
+            pending[(socket.inet_aton(ip), vlan_id)] = (ip, vlan)
+        macs = {}
+        if not pending:
+            return macs
+
+        sock = socket.socket(
+            socket.AF_PACKET, socket.SOCK_RAW, socket.htons(ETH_P_ALL),
+        )
+        try:
+            _attach_arp_filter(sock)
+            sock.bind((self._iface, ETH_P_ALL))
+            sock.setsockopt(SOL_PACKET, PACKET_AUXDATA, 1)
+            src_mac = sock.getsockname()[4]
+            src_ip = socket.inet_aton(get_if_addr(self._iface) or '0.0.0.0')
+            for ip, vlan_id in pending:
+                sock.send(_arp_request(src_mac, src_ip, ip, vlan_id))
+
+            deadline = time.monotonic() + self._timeout
+            while pending:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                readable, _, _ = select.select([sock], [], [], remaining)
+                if not readable:
+                    break
+                try:
+                    data, ancdata, _, _ = sock.recvmsg(
+                        RECV_SIZE, socket.CMSG_SPACE(TPACKET_AUXDATA.size),
+                    )
+                except BlockingIOError:
+                    continue
+                reply = _parse_arp_reply(data, ancdata)
+                if reply is None:
+                    continue
+                key, mac = reply
+                target = pending.pop(key, None)
+                if target is not None:
+                    macs[target] = mac
+        finally:
+            sock.close()
+        return macs
+
+
+def _attach_arp_filter(sock: socket.socket):
+    insns = ctypes.create_string_buffer(
+        b''.join(BPF_INSN.pack(*insn) for insn in ARP_FILTER),
+    )
+    # struct sock_fprog: instruction count and pointer
+    prog = struct.pack('HL', len(ARP_FILTER), ctypes.addressof(insns))
+    sock.setsockopt(socket.SOL_SOCKET, SO_ATTACH_FILTER, prog)
+
+
+def _arp_request(
+    src_mac: bytes, src_ip: bytes, dst_ip: bytes,
+    vlan_id: Optional[int],
+) -> bytes:
+    if vlan_id is None:
+        eth = ETH_HEADER.pack(ETHER_BROADCAST, src_mac, ETH_P_ARP)
+    else:
+        eth = ETH_HEADER.pack(ETHER_BROADCAST, src_mac, ETH_P_8021Q) + \
+            VLAN_TAG.pack(vlan_id & VLAN_VID_MASK, ETH_P_ARP)
+    return eth + ARP.pack(
+        1, 0x0800, 6, 4, ARP_REQUEST, src_mac, src_ip, bytes(6), dst_ip,
+    )
+
+
+def _parse_arp_reply(data: bytes, ancdata) -> Optional[Tuple[Tuple, str]]:
+    """
+    Return ((sender IP, VLAN id or None), sender MAC) of an ARP reply frame
+    """
+    vlan_id = None
+    for level, cmsg_type, cmsg_data in ancdata:
+        if level == SOL_PACKET and cmsg_type == PACKET_AUXDATA and \
+                len(cmsg_data) >= TPACKET_AUXDATA.size:
+            status, _, _, _, _, tci, _ = TPACKET_AUXDATA.unpack_from(cmsg_data)
+            if status & TP_STATUS_VLAN_VALID:
+                vlan_id = tci & VLAN_VID_MASK
+    offset = ETH_HEADER.size
+    if len(data) < offset:
+        return None
+    ethertype = ETH_HEADER.unpack_from(data)[2]
+    # Tag left in the frame, e.g. when the kernel didn't strip it
+    if ethertype == ETH_P_8021Q and len(data) >= offset + VLAN_TAG.size:
+        tci, ethertype = VLAN_TAG.unpack_from(data, offset)
+        vlan_id = tci & VLAN_VID_MASK
+        offset += VLAN_TAG.size
+    if ethertype != ETH_P_ARP or len(data) < offset + ARP.size:
+        return None
+    _, ptype, hlen, plen, op, sha, spa, _, _ = ARP.unpack_from(data, offset)
+    if op != ARP_REPLY or ptype != 0x0800 or hlen != 6 or plen != 4:
+        return None
+    return (spa, vlan_id), ':'.join('%02x' % b for b in sha)
@@ -15,7 +15,15 @@ import logging
 import re
 import subprocess
 from collections import defaultdict
-from typing import TYPE_CHECKING, Dict, List, Optional
+from typing import TYPE_CHECKING, Dict, Iterator, List, Optional
+
+from magma.pipelined.ovs_client import (
+    OfFlowDump,
+    OvsClientError,
+    OvsdbClient,
+    ovsdb_set,
+    select_op,
+)
 
 # Prevent circular import
 if TYPE_CHECKING:
@@ -30,48 +38,55 @@ class BridgeTools:
     """
     BridgeTools
 
-    Use ovs-vsctl commands to get bridge info and setup bridges for testing.
+    Read bridge info from the OVS database and dump flows in-process, and
+    use ovs-vsctl commands to setup bridges for testing.
     """
     TABLE_NUM_REGEX = r'table=(\d+)'
 
+    # Kept connection to ovsdb-server, opened on first use
+    ovsdb = OvsdbClient()
+
     @staticmethod
     def get_datapath_id(bridge_name):
         """
         Gets the datapath_id by bridge_name
 
-        Hacky, call vsctl, decode output to str, strip '\n', remove '' around
-        the output, convert to int.
-
         This gives the integer datapath_id that we want to run apps on, this is
         needed when 2 bridges are setup, gtp_br0(main bridge) and testing_br)
         """
         try:
-            output = subprocess.check_output(["ovs-vsctl", "get", "bridge",
-                                              bridge_name, "datapath_id"])
-            output_str = str(output, 'utf-8').strip()[1:-1]
-            output_hex = int(output_str, 16)
-        except subprocess.CalledProcessError as e:
+            rows = BridgeTools.ovsdb.select(
+                'Bridge', [['name', '==', bridge_name]], ['datapath_id'],
+            )
+            datapath_ids = ovsdb_set(rows[0]['datapath_id']) if rows else []
+            if not datapath_ids:
+                raise OvsClientError('bridge has no datapath id')
+            return int(datapath_ids[0], 16)
+        except OvsClientError as e:
             raise DatapathLookupError(
-                'Error: ovs-vsctl bridge({}) datapath id lookup: {}'.format(
+                'Error: ovsdb bridge({}) datapath id lookup: {}'.format(
                     bridge_name, e
                 )
             )
-        return output_hex
 
     @staticmethod
     def port_is_in_bridge(bridge, interface_name) -> bool:
         """
-        check if port is part of the switch using ofctl cmd.
+        check if port is part of the switch.
         """
         if not interface_name or interface_name == "":
             return False
-        dump1 = subprocess.Popen(["ovs-ofctl", "show", bridge],
-                                 stdout=subprocess.PIPE)
-        for line1 in dump1.stdout.readlines():
-            if interface_name not in str(line1):
-                continue
-            return True
-        return False
+        try:
+            bridges, ports = BridgeTools.ovsdb.transact([
+                select_op('Bridge', [['name', '==', bridge]], ['ports']),
+                select_op('Port', [['name', '==', interface_name]], ['_uuid']),
+            ])
+        except OvsClientError as e:
+            logging.warning("Error while looking up bridge ports: %s", e)
+            return False
+        if not bridges or not ports:
+            return False
+        return ports[0]['_uuid'] in ovsdb_set(bridges[0]['ports'])
 
     @staticmethod
     def get_ofport(interface_name):
@@ -79,15 +94,19 @@ class BridgeTools:
         Gets the ofport name ofport number of a interface
         """
         try:
-            port_num = subprocess.check_output(["ovs-vsctl", "get", "interface",
-                                                interface_name, "ofport"])
-        except subprocess.CalledProcessError as e:
+            rows = BridgeTools.ovsdb.select(
+                'Interface', [['name', '==', interface_name]], ['ofport'],
+            )
+            ofports = ovsdb_set(rows[0]['ofport']) if rows else []
+            if not ofports:
+                raise OvsClientError('interface has no ofport')
+        except OvsClientError as e:
             raise DatapathLookupError(
-                'Error: ovs-vsctl interface({}) of port lookup: {}'.format(
+                'Error: ovsdb interface({}) of port lookup: {}'.format(
                     interface_name, e
                 )
             )
-        return int(port_num)
+        return int(ofports[0])
 
     @staticmethod
     def create_internal_iface(bridge_name, iface_name, ip):
@@ -177,10 +196,18 @@ class BridgeTools:
 
     @staticmethod
     def get_controllers_for_bridge(bridge_name):
-        curr_controllers = subprocess.check_output(
-            ["ovs-vsctl", "get-controller", bridge_name],
-        ).decode("utf-8").replace(' ', '').split('\n')
-        return list(filter(None, curr_controllers))
+        bridges, controllers = BridgeTools.ovsdb.transact([
+            select_op('Bridge', [['name', '==', bridge_name]], ['controller']),
+            select_op('Controller', [], ['_uuid', 'target']),
+        ])
+        if not bridges:
+            return []
+        uuids = ovsdb_set(bridges[0]['controller'])
+        # Sorted like ovs-vsctl get-controller lists them
+        return sorted(
+            controller['target'] for controller in controllers
+            if controller['_uuid'] in uuids
+        )
 
     @staticmethod
     def add_controller_to_bridge(bridge_name, port_num):
@@ -209,7 +236,14 @@ class BridgeTools:
         """
         Returns a flow dump of the given bridge from ovs-ofctl. If table_num is
         specified, then only the flows for the table will be returned.
+
+        This forks ovs-ofctl and is only kept for its text format, which the
+        annotated dumps and the flow snapshots of the tests are based on.
+        Use iter_flows to walk the flows of a bridge otherwise.
         """
+        # TODO: dump in-process once format_flow prints the ovs-ofctl field
+        # and action names, e.g. nw_dst and load:, and the snapshots of
+        # magma/pipelined/tests/snapshots are regenerated with it
         if include_stats:
             set_cmd = ["ovs-ofctl", "dump-flows", bridge_name]
         else:
@@ -225,6 +259,25 @@ class BridgeTools:
                             flows))
         return flows
 
+    @staticmethod
+    def iter_flows(bridge_name: str,
+                   table_num: Optional[int] = None) -> Iterator:
+        """
+        Yields the flows of the given bridge as ryu OFPFlowStats, dumped over
+        its OpenFlow management socket. Flows are parsed from each reply as
+        it is received, so large tables can be walked in constant memory. If
+        table_num is specified, then only the flows for the table will be
+        returned.
+        """
+        return OfFlowDump(bridge_name).iter_flows(table_num)
+
+    @staticmethod
+    def get_flows(bridge_name: str, table_num: Optional[int] = None) -> List:
+        """
+        Returns the flows of the given bridge as ryu OFPFlowStats
+        """
+        return list(BridgeTools.iter_flows(bridge_name, table_num))
+
     @staticmethod
     def _get_annotated_name_by_table_num(
             table_assignments: 'Dict[str, Tables]') -> Dict[int, str]:
@@ -258,6 +311,8 @@ class BridgeTools:
         If apps is not None, then only the flows for the given apps will be
         returned.
         """
+        # TODO: same as get_flows_for_bridge, still forks ovs-ofctl for the
+        # snapshot format
         annotated_tables = cls._get_annotated_name_by_table_num(
             table_assignments)
 
@@ -35,6 +35,7 @@ from magma.pipelined.gtp_stats_collector import (
     GTPStatsCollector,
 )
 from magma.pipelined.ifaces import monitor_ifaces
+from magma.pipelined.qos.common import QosManager
 from magma.pipelined.rpc_servicer import PipelinedRpcServicer
 from magma.pipelined.service_manager import ServiceManager
 from ryu import cfg
@@ -212,6 +213,7 @@ def main():
     service.run()
 
     # Cleanup the service
+    QosManager.close()
     service.close()
 
 
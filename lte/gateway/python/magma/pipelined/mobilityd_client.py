@@ -67,6 +67,29 @@ def set_mobilityd_gw_info(ip: IPAddress, mac: str, vlan: str):
             err.details())
 
 
+def set_mobilityd_gw_info_list(gw_info_list: List[GWInfo]):
+    """
+    Make RPC calls to 'SetGatewayInfo' method of local mobilityD service for
+    each of gw_info_list, over one channel
+    """
+    try:
+        chan = ServiceRegistry.get_rpc_channel(SERVICE_NAME,
+                                               ServiceRegistry.LOCAL)
+    except ValueError:
+        logging.error('Cant get RPC channel to %s', SERVICE_NAME)
+        return
+
+    client = MobilityServiceStub(chan)
+    for gwinfo in gw_info_list:
+        try:
+            client.SetGatewayInfo(gwinfo)
+        except grpc.RpcError as err:
+            logging.error(
+                "SetGatewayInfo error[%s] %s",
+                err.code(),
+                err.details())
+
+
 def mobilityd_list_ip_blocks():
     """
     Make RPC call to query all ip-blocks.
@@ -613,6 +613,8 @@ def send_stats_request(datapath, tbl_num, cookie: hex = 0,
         cookie (hex): cookie value for the request
         cookie_mask (hex): cookie mask for the request
         retries (int): retry attempts on failure
+    Returns:
+        The sent request, its xid is set on the replies
     """
     ofproto, parser = datapath.ofproto, datapath.ofproto_parser
     req = parser.OFPFlowStatsRequest(
@@ -624,4 +626,5 @@ def send_stats_request(datapath, tbl_num, cookie: hex = 0,
         cookie_mask = cookie_mask,
     )
     logger.debug('flowmod: %s (table %d)', req, tbl_num)
-    messages.send_msg(datapath, req, retries)
\ No newline at end of file
+    messages.send_msg(datapath, req, retries)
+    return req
\ No newline at end of file
@@ -11,7 +11,8 @@ See the License for the specific language governing permissions and
 limitations under the License.
 """
 import logging
-from typing import Any, List, Optional
+from collections import defaultdict, deque
+from typing import Any, List, Optional, Tuple
 
 # there's a cyclic dependency in ryu
 import ryu.base.app_manager  # pylint: disable=unused-import
@@ -150,6 +151,28 @@ class MessageHub(object):
         Returns:
             The channel passed in or the one created if it wasn't passed
         """
+        return self.send_batch([(txn_id, msg_list)], datapath,
+                               timeout=timeout, channel=channel)
+
+    def send_batch(self,
+                   msgs_by_txn: List[Tuple[Any, List[MsgBase]]],
+                   datapath: Datapath,
+                   timeout: int=DEFAULT_TIMEOUT_SEC,
+                   channel: Optional[MsgChannel]=None) -> MsgChannel:
+        """
+        Send messages for multiple transactions to OVS followed by a single
+        barrier. Every reply put on the channel is marked with the txn_id of
+        the transaction its message belongs to.
+
+        Args:
+            msgs_by_txn: list of (txn_id, list of messages) pairs
+            datapath: datapath representing switch to send to
+            timeout: time before ignoring request
+            channel: optional channel to use for the result. If it's not
+                specified, one is created
+        Returns:
+            The channel passed in or the one created if it wasn't passed
+        """
         switch = self._switches.get(datapath.id, None)
 
         if switch is None:
@@ -161,8 +184,13 @@ class MessageHub(object):
             channel = MsgChannel()
 
         # set xids in all msgs
+        msg_list = []
+        txn_ids = []
+        for txn_id, msgs in msgs_by_txn:
+            msg_list.extend(msgs)
+            txn_ids.extend([txn_id] * len(msgs))
         msg_xids = [datapath.set_xid(msg) for msg in msg_list]
-        req = self._MsgRequest(txn_id, msg_xids, channel)
+        req = self._MsgRequest(txn_ids, msg_xids, channel)
 
         barrier = datapath.ofproto_parser.OFPBarrierRequest(datapath)
         datapath.set_xid(barrier)  # sets xid in the barrier
@@ -184,15 +212,24 @@ class MessageHub(object):
         """
         Returns a list of messages not found in the provided flow_list, also
         returns a list of remaining flows(not found in the msg_list)
+
+        The flow_list is indexed by flow fingerprint once, so every message
+        is matched in constant time instead of scanning the remaining flows.
         """
+        flow_index = defaultdict(deque)
+        for i, flow in enumerate(flow_list):
+            flow_index[self._get_flow_fingerprint(dp, flow)].append(i)
+
         msgs_to_send = []
-        remaining_flows = flow_list.copy()
+        matched = set()
         for msg in msg_list:
-            index = self._get_msg_index_in_flow_list(dp, msg, remaining_flows)
-            if index >= 0:
-                remaining_flows.pop(index)
+            indexes = flow_index.get(self._get_flow_fingerprint(dp, msg))
+            if indexes:
+                matched.add(indexes.popleft())
             else:
                 msgs_to_send.append(msg)
+        remaining_flows = [flow for i, flow in enumerate(flow_list)
+                           if i not in matched]
         return msgs_to_send, remaining_flows
 
     @staticmethod
@@ -217,11 +254,11 @@ class MessageHub(object):
             # could be from a different application
             return
         req.cancel_timeout()
-        for xid in req.msg_xids:
+        for txn_id, xid in zip(req.txn_ids, req.msg_xids):
             e = switch.results_by_msg.pop(xid, None)
             MessageHub._respond(
                 req,
-                MsgReply(txn_id=req.txn_id, exception=e),
+                MsgReply(txn_id=txn_id, exception=e),
             )
 
     def handle_error(self, ev):
@@ -240,69 +277,49 @@ class MessageHub(object):
         # for now, result is unused. Just return if there's an exception
         switch.results_by_msg[msg.xid] = MagmaOFError(ev.msg)
 
-    def _flow_matches_flowmsg(self, dp, flow, msg):
+    @staticmethod
+    def _get_flow_fingerprint(dp, flow) -> Tuple:
         """
-        Compare the flow and flow message based on match/instructions
+        Build a hashable fingerprint of a flow or flow message from its
+        match attributes and the reg loads, resubmits and outputs of its
+        action instructions. Two flows are considered equal if their
+        fingerprints are equal.
         """
-        reg_loads_match = True
-        resubmits_match = True
-        outputs_match = True
-        if len(flow.instructions) != len(msg.instructions):
-            return False
-        for j in range(0, len(flow.instructions)):
+        parser = dp.ofproto_parser
+        actions_fp = []
+        for j, instruction in enumerate(flow.instructions):
             # TODO add support for OFPInstructionMeter and others
-            if type(flow.instructions[j]) != dp.ofproto_parser.OFPInstructionActions:
-                continue
-            if type(msg.instructions[j]) != dp.ofproto_parser.OFPInstructionActions:
+            if type(instruction) != parser.OFPInstructionActions:
                 continue
-            # Strip _nxm to handle nicira as eth_dst_nxm is same as eth_dst
-            reg_loads_flow = {i.dst.replace('_nxm', ''): i.value for i in flow.instructions[j].actions
-                              if type(i) == dp.ofproto_parser.NXActionRegLoad2}
-            reg_loads_msg = {i.dst.replace('_nxm', ''): i.value for i in msg.instructions[j].actions
-                             if type(i) == dp.ofproto_parser.NXActionRegLoad2}
-
-            reg_loads_match = reg_loads_msg == reg_loads_flow
-
-            resubmits_flow = [i.table_id for i in flow.instructions[j].actions
-                              if type(i) == dp.ofproto_parser.NXActionResubmitTable]
-            resubmits_msg = [i.table_id for i in msg.instructions[j].actions
-                             if type(i) == dp.ofproto_parser.NXActionResubmitTable]
-            resubmits_match = sorted(resubmits_flow) == sorted(resubmits_msg)
-
-            outputs_flow = [i.port for i in flow.instructions[j].actions
-                            if type(i) == dp.ofproto_parser.OFPActionOutput]
-            outputs_msg = [i.port for i in msg.instructions[j].actions
-                           if type(i) == dp.ofproto_parser.OFPActionOutput]
-            outputs_match = sorted(outputs_flow) == sorted(outputs_msg)
-
-        match_flow = {key: flow.match.get(key) for key in MATCH_ATTRIBUTES
-                      if key in flow.match}
-        match_msg = {key: msg.match.get(key, None) for key in MATCH_ATTRIBUTES
-                     if key in msg.match}
-
-        def strip_common(match_dict):
-            """
-            Filter out args that break equality
-                - ('0.0.0.0', '0.0.0.0') is the same as unset
-            """
-            for key in list(match_dict.keys()):
-                if match_dict[key] == ('0.0.0.0', '0.0.0.0'):
-                    del match_dict[key]
-            return match_dict
-        flow_match = strip_common(match_flow) == strip_common(match_msg)
-
-        return flow_match and reg_loads_match and resubmits_match and \
-               outputs_match
-
-    def _get_msg_index_in_flow_list(self, dp, msg, flow_list):
-        for i in range(len(flow_list)):
-            if self._flow_matches_flowmsg(dp, msg, flow_list[i]):
-                return i
-        return -1
+            reg_loads = []
+            resubmits = []
+            outputs = []
+            for action in instruction.actions:
+                if type(action) == parser.NXActionRegLoad2:
+                    # Strip _nxm to handle nicira as eth_dst_nxm is same as
+                    # eth_dst
+                    reg_loads.append((action.dst.replace('_nxm', ''),
+                                      _freeze(action.value)))
+                elif type(action) == parser.NXActionResubmitTable:
+                    resubmits.append(action.table_id)
+                elif type(action) == parser.OFPActionOutput:
+                    outputs.append(action.port)
+            actions_fp.append((j,
+                               frozenset(dict(reg_loads).items()),
+                               tuple(sorted(resubmits)),
+                               tuple(sorted(outputs))))
+
+        # ('0.0.0.0', '0.0.0.0') is the same as unset
+        match_fp = frozenset(
+            (key, _freeze(flow.match.get(key))) for key in MATCH_ATTRIBUTES
+            if key in flow.match and
+            flow.match.get(key) != ('0.0.0.0', '0.0.0.0'))
+
+        return len(flow.instructions), match_fp, tuple(actions_fp)
 
     class _MsgRequest(object):
-        def __init__(self, txn_id, msg_xids, channel=None):
-            self.txn_id = txn_id
+        def __init__(self, txn_ids, msg_xids, channel=None):
+            self.txn_ids = txn_ids
             self.msg_xids = msg_xids
             self.channel = channel
             self._timeout_thread = None
@@ -334,3 +351,12 @@ class MessageHub(object):
         def __init__(self):
             self.requests_by_barrier = {}
             self.results_by_msg = {}
+
+
+def _freeze(value):
+    """
+    Convert list values (e.g. masked fields) into tuples so they can be hashed
+    """
+    if isinstance(value, list):
+        return tuple(_freeze(v) for v in value)
+    return value
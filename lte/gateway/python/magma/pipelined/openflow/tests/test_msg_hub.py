@@ -37,6 +37,33 @@ class MockMessage(object):
         self.xid = xid
 
 
+class MockInstructionActions(object):
+    def __init__(self, actions):
+        self.actions = actions
+
+
+class MockRegLoad(object):
+    def __init__(self, dst, value):
+        self.dst = dst
+        self.value = value
+
+
+class MockResubmit(object):
+    def __init__(self, table_id):
+        self.table_id = table_id
+
+
+class MockOutput(object):
+    def __init__(self, port):
+        self.port = port
+
+
+class MockFlow(object):
+    def __init__(self, match, actions):
+        self.match = match
+        self.instructions = [MockInstructionActions(actions)]
+
+
 class MockDatapath(object):
     def __init__(self, id):
         self._curr_xid = 1
@@ -47,6 +74,10 @@ class MockDatapath(object):
 
         self.ofproto_parser = Mock()
         self.ofproto_parser.OFPBarrierRequest = MockBarrierRequest
+        self.ofproto_parser.OFPInstructionActions = MockInstructionActions
+        self.ofproto_parser.NXActionRegLoad2 = MockRegLoad
+        self.ofproto_parser.NXActionResubmitTable = MockResubmit
+        self.ofproto_parser.OFPActionOutput = MockOutput
 
     def set_xid(self, msg):
         xid = self._curr_xid
@@ -124,6 +155,29 @@ class MessageHubTest(unittest.TestCase):
                 num_throws += 1
         self.assertEqual(num_throws, 1)
 
+    def test_send_batch(self):
+        """
+        Test sending messages of multiple transactions with a single barrier
+        """
+        msgs_by_txn = [
+            ("1", [MockMessage(), MockMessage()]),
+            ("2", [MockMessage()]),
+        ]
+        chan = self._msg_sender.send_batch(msgs_by_txn, self._mock_datapath)
+        # 3 calls for messages, 1 for barrier
+        self.assertEqual(self._mock_datapath.send_msg.call_count, 4)
+
+        error_ev = self._get_error_event()
+        self._msg_sender.handle_error(error_ev)
+        ev = self._get_barrier_event()
+        self._msg_sender.handle_barrier(ev)
+
+        self._check_reply(chan, "1")
+        self._check_reply(chan, "1")
+        reply = chan.get(timeout=1)
+        self.assertEqual(reply.txn_id, "2")
+        self.assertFalse(reply.ok())
+
     def test_send_msg_in_parallel(self):
         """
         Test sending messages twice without receiving a barrier
@@ -154,6 +208,35 @@ class MessageHubTest(unittest.TestCase):
         self.assertEqual(len(switch.results_by_msg), 0)
         self.assertEqual(len(switch.requests_by_barrier), 0)
 
+    def test_filter_msgs_if_not_in_flow_list(self):
+        """
+        Test that messages already installed as flows are filtered out and
+        that unmatched flows are returned in their original order
+        """
+        flow_list = [
+            MockFlow({'reg1': 1, 'ipv4_dst': ('0.0.0.0', '0.0.0.0')},
+                     [MockRegLoad('eth_dst_nxm', 5), MockResubmit(3)]),
+            MockFlow({'reg1': 2}, [MockOutput(1)]),
+            MockFlow({'reg1': 1}, [MockResubmit(3), MockRegLoad('eth_dst', 5)]),
+            MockFlow({'reg1': 3}, [MockOutput(2)]),
+        ]
+        msg_list = [
+            # matches flow 0, the unset ipv4 match is stripped
+            MockFlow({'reg1': 1}, [MockRegLoad('eth_dst', 5),
+                                   MockResubmit(3)]),
+            # duplicate matches flow 2
+            MockFlow({'reg1': 1}, [MockRegLoad('eth_dst', 5),
+                                   MockResubmit(3)]),
+            # different output port, not installed yet
+            MockFlow({'reg1': 2}, [MockOutput(2)]),
+        ]
+
+        msgs, remaining = self._msg_sender.filter_msgs_if_not_in_flow_list(
+            self._mock_datapath, msg_list, flow_list)
+
+        self.assertEqual(msgs, [msg_list[2]])
+        self.assertEqual(remaining, [flow_list[1], flow_list[3]])
+
     def _get_barrier_event(self):
         barrier_msg = Mock()
         barrier_msg.xid = self._mock_datapath.prev_barrier_xid
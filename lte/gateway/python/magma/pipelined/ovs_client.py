@@ -0,0 +1,390 @@
+"""
+Copyright 2020 The Magma Authors.
+
+This source code is licensed under the BSD-style license found in the
+LICENSE file in the root directory of this source tree.
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+import codecs
+import json
+import os
+import socket
+import struct
+import threading
+from typing import Any, Dict, Iterator, List, Optional
+
+from ryu.ofproto import ofproto_parser, ofproto_protocol, ofproto_v1_3, \
+    ofproto_v1_4
+
+OVS_RUNDIR = '/var/run/openvswitch'
+OVSDB_SOCKET = os.path.join(OVS_RUNDIR, 'db.sock')
+OVSDB_DATABASE = 'Open_vSwitch'
+# Time to wait for ovsdb-server or ovs-vswitchd to answer, in seconds
+TIMEOUT = 10
+RECV_SIZE = 65536
+
+# OpenFlow versions the flow dump negotiates, highest first
+OFP_VERSIONS = (ofproto_v1_4.OFP_VERSION, ofproto_v1_3.OFP_VERSION)
+OFP_HEADER = struct.Struct(ofproto_v1_4.OFP_HEADER_PACK_STR)
+OFPT_HELLO = 0
+OFPT_ERROR = 1
+OFPT_ECHO_REQUEST = 2
+OFPT_ECHO_REPLY = 3
+OFPT_MULTIPART_REPLY = 19
+
+
+class OvsClientError(Exception):
+    pass
+
+
+def ovsdb_set(value: Any) -> List:
+    """
+    Return the members of an OVSDB set value. Sets of one member are sent
+    as the member itself.
+    """
+    if isinstance(value, list) and value and value[0] == 'set':
+        return value[1]
+    return [value]
+
+
+def select_op(table: str, where: List, columns: List[str]) -> Dict:
+    """
+    Return an OVSDB select operation, for OvsdbClient.transact
+    """
+    return {
+        'op': 'select',
+        'table': table,
+        'where': where,
+        'columns': columns,
+    }
+
+
+class OvsdbClient(object):
+    """
+    OVSDB JSON-RPC (RFC 7047) client of ovsdb-server, reading the
+    Open_vSwitch database like ovs-vsctl does without forking it.
+
+    The connection is opened on the first transaction and kept for the next
+    ones. Transactions are serialized, and retried once on a new connection
+    if the kept one was closed.
+    """
+
+    def __init__(self, path: str = OVSDB_SOCKET, timeout: float = TIMEOUT):
+        self._path = path
+        self._timeout = timeout
+        self._sock = None
+        self._buf = ''
+        self._utf8 = codecs.getincrementaldecoder('utf-8')()
+        self._decoder = json.JSONDecoder()
+        self._id = 0
+        self._lock = threading.Lock()
+
+    def select(
+        self, table: str, where: List, columns: List[str],
+    ) -> List[Dict[str, Any]]:
+        """
+        Return the columns of the rows of table matching the where
+        conditions, e.g. [['name', '==', 'gtp_br0']]
+        """
+        return self.transact([select_op(table, where, columns)])[0]
+
+    def transact(self, ops: List[Dict]) -> List[List[Dict[str, Any]]]:
+        """
+        Run the select operations ops in one transaction, and return the
+        rows each of them selected
+        """
+        params = [OVSDB_DATABASE] + ops
+        with self._lock:
+            for attempt in range(2):
+                reused = self._sock is not None
+                try:
+                    reply = self._transact(params)
+                    break
+                except OSError as e:
+                    self._close()
+                    # ovsdb-server may have closed the kept connection
+                    if attempt or not reused:
+                        raise OvsClientError(
+                            'ovsdb transaction on %s failed: %s' % (
+                                self._path, e,
+                            ),
+                        )
+        if reply.get('error') is not None:
+            raise OvsClientError(
+                'ovsdb transaction error: %s' % reply['error'],
+            )
+        results = []
+        for result in reply['result']:
+            if 'error' in result:
+                raise OvsClientError(
+                    'ovsdb operation error: %s: %s' % (
+                        result['error'], result.get('details', ''),
+                    ),
+                )
+            results.append(result.get('rows', []))
+        return results
+
+    def close(self):
+        with self._lock:
+            self._close()
+
+    def _close(self):
+        if self._sock is not None:
+            self._sock.close()
+            self._sock = None
+            self._buf = ''
+            self._utf8.reset()
+
+    def _transact(self, params: List) -> Dict:
+        if self._sock is None:
+            sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            sock.settimeout(self._timeout)
+            self._sock = sock
+            sock.connect(self._path)
+        self._id += 1
+        request_id = self._id
+        self._send({'method': 'transact', 'params': params, 'id': request_id})
+        while True:
+            msg = self._recv()
+            if msg.get('method') == 'echo':
+                # Keepalive from ovsdb-server
+                self._send({
+                    'result': msg['params'], 'error': None, 'id': msg['id'],
+                })
+            elif msg.get('id') == request_id:
+                return msg
+
+    def _send(self, msg: Dict):
+        self._sock.sendall(json.dumps(msg).encode())
+
+    def _recv(self) -> Dict:
+        """
+        Receive the next JSON-RPC message. Messages aren't delimited, so
+        data is read until it holds a whole JSON object.
+        """
+        while True:
+            buf = self._buf.lstrip()
+            if buf:
+                try:
+                    msg, end = self._decoder.raw_decode(buf)
+                    self._buf = buf[end:]
+                    return msg
+                except ValueError:
+                    pass
+            data = self._sock.recv(RECV_SIZE)
+            if not data:
+                raise ConnectionResetError('connection closed')
+            self._buf = buf + self._utf8.decode(data)
+
+
+class OfFlowDump(object):
+    """
+    Flow dump of a bridge over its OpenFlow management socket, the one
+    ovs-ofctl connects to. Flows are returned as ryu OFPFlowStats, parsed
+    from each multipart reply as it is received, so very large tables are
+    dumped without holding them in memory.
+    """
+
+    def __init__(
+        self, bridge_name: str, rundir: str = OVS_RUNDIR,
+        timeout: float = TIMEOUT,
+    ):
+        self._path = os.path.join(rundir, '%s.mgmt' % bridge_name)
+        self._timeout = timeout
+        self._xid = 0
+
+    def iter_flows(self, table_num: Optional[int] = None) -> Iterator:
+        """
+        Yield the flows of table_num, or of all tables if it's None
+        """
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        sock.settimeout(self._timeout)
+        try:
+            sock.connect(self._path)
+            datapath = self._handshake(sock)
+            ofp = datapath.ofproto
+            req = datapath.ofproto_parser.OFPFlowStatsRequest(
+                datapath,
+                table_id=ofp.OFPTT_ALL if table_num is None else table_num,
+            )
+            xid = self._send(sock, req)
+            while True:
+                msg = self._recv_msg(sock, datapath)
+                if msg.xid != xid:
+                    continue
+                yield from msg.body
+                if not msg.flags & ofp.OFPMPF_REPLY_MORE:
+                    return
+        except OSError as e:
+            raise OvsClientError('flow dump of %s failed: %s' % (self._path, e))
+        finally:
+            sock.close()
+
+    def _handshake(self, sock: socket.socket):
+        version = max(OFP_VERSIONS)
+        datapath = ofproto_protocol.ProtocolDesc(version)
+        self._send(sock, datapath.ofproto_parser.OFPHello(datapath))
+        while True:
+            msg_version, msg_type, _, _, _ = _recv_raw(sock)
+            if msg_type == OFPT_HELLO:
+                break
+        version = min(version, msg_version)
+        if version not in OFP_VERSIONS:
+            raise OvsClientError(
+                'OpenFlow version 0x%02x of %s is not supported' % (
+                    msg_version, self._path,
+                ),
+            )
+        return ofproto_protocol.ProtocolDesc(version)
+
+    def _send(self, sock: socket.socket, msg) -> int:
+        self._xid = (self._xid + 1) & 0xFFFFFFFF
+        msg.set_xid(self._xid)
+        msg.serialize()
+        sock.sendall(msg.buf)
+        return self._xid
+
+    def _recv_msg(self, sock: socket.socket, datapath):
+        """
+        Receive the next multipart reply, answering echo requests and
+        skipping other messages meanwhile. Error messages are raised.
+        """
+        while True:
+            version, msg_type, length, xid, data = _recv_raw(sock)
+            if msg_type == OFPT_ECHO_REQUEST:
+                sock.sendall(
+                    OFP_HEADER.pack(version, OFPT_ECHO_REPLY, length, xid) +
+                    data[OFP_HEADER.size:],
+                )
+                continue
+            if msg_type not in (OFPT_ERROR, OFPT_MULTIPART_REPLY):
+                continue
+            msg = ofproto_parser.msg(
+                datapath, version, msg_type, length, xid, data,
+            )
+            if msg_type == OFPT_ERROR:
+                raise OvsClientError(
+                    'OpenFlow error from %s: type %d code %d' % (
+                        self._path, msg.type, msg.code,
+                    ),
+                )
+            return msg
+
+
+# Names ovs-ofctl prints for the reserved OpenFlow ports
+PORT_NAMES = {
+    ofproto_v1_4.OFPP_IN_PORT: 'IN_PORT',
+    ofproto_v1_4.OFPP_TABLE: 'TABLE',
+    ofproto_v1_4.OFPP_NORMAL: 'NORMAL',
+    ofproto_v1_4.OFPP_FLOOD: 'FLOOD',
+    ofproto_v1_4.OFPP_ALL: 'ALL',
+    ofproto_v1_4.OFPP_LOCAL: 'LOCAL',
+    ofproto_v1_4.OFPP_ANY: 'ANY',
+}
+
+
+def format_flow(flow) -> str:
+    """
+    Format a ryu OFPFlowStats like a line of ovs-ofctl dump-flows: cookie,
+    duration, table, counters and priority, then the match and actions.
+    Match fields keep their OpenFlow names, e.g. ipv4_dst for nw_dst.
+    """
+    match = ['priority=%d' % flow.priority] + [
+        '%s=%s' % (field, _format_value(value))
+        for field, value in flow.match.items()
+    ]
+    actions = [
+        action for instruction in flow.instructions
+        for action in _format_instruction(instruction)
+    ]
+    return (
+        'cookie=%#x, duration=%d.%03ds, table=%d, n_packets=%d, '
+        'n_bytes=%d, %s actions=%s' % (
+            flow.cookie, flow.duration_sec, flow.duration_nsec // 1000000,
+            flow.table_id, flow.packet_count, flow.byte_count,
+            ','.join(match), ','.join(actions) or 'drop',
+        )
+    )
+
+
+def _format_value(value) -> str:
+    if isinstance(value, tuple):
+        return '/'.join(_format_value(v) for v in value)
+    if isinstance(value, int) and value > 0xFFFF:
+        return '%#x' % value
+    return str(value)
+
+
+def _format_instruction(instruction) -> List[str]:
+    name = type(instruction).__name__
+    if name == 'OFPInstructionGotoTable':
+        return ['goto_table:%d' % instruction.table_id]
+    if name == 'OFPInstructionWriteMetadata':
+        return ['write_metadata:%#x/%#x' % (
+            instruction.metadata, instruction.metadata_mask,
+        )]
+    if name == 'OFPInstructionMeter':
+        return ['meter:%d' % instruction.meter_id]
+    if name == 'OFPInstructionActions':
+        actions = [_format_action(action) for action in instruction.actions]
+        if instruction.type == ofproto_v1_4.OFPIT_WRITE_ACTIONS:
+            return ['write_actions(%s)' % ','.join(actions)]
+        if instruction.type == ofproto_v1_4.OFPIT_CLEAR_ACTIONS:
+            return ['clear_actions']
+        return actions
+    return [name]
+
+
+def _format_action(action) -> str:
+    name = type(action).__name__
+    if name == 'OFPActionOutput':
+        if action.port == ofproto_v1_4.OFPP_CONTROLLER:
+            return 'CONTROLLER:%d' % action.max_len
+        return PORT_NAMES.get(action.port, 'output:%d' % action.port)
+    if name == 'OFPActionSetField':
+        return 'set_field:%s->%s' % (_format_value(action.value), action.key)
+    if name == 'NXActionResubmit':
+        return 'resubmit:%d' % action.in_port
+    if name == 'NXActionResubmitTable':
+        in_port = '' if action.in_port == ofproto_v1_4.OFPP_IN_PORT \
+            else action.in_port
+        return 'resubmit(%s,%d)' % (in_port, action.table_id)
+    if name == 'NXActionNote':
+        return 'note:%s' % '.'.join('%02x' % b for b in action.note)
+    if name == 'OFPActionGroup':
+        return 'group:%d' % action.group_id
+    if name == 'OFPActionPopVlan':
+        return 'pop_vlan'
+    if name == 'OFPActionPushVlan':
+        return 'push_vlan:%#x' % action.ethertype
+    return name
+
+
+def _recv_raw(sock: socket.socket):
+    """
+    Receive an OpenFlow message, as its version, type, length, xid and
+    data including the header
+    """
+    header = _recv_exact(sock, OFP_HEADER.size)
+    version, msg_type, length, xid = OFP_HEADER.unpack(header)
+    if length < OFP_HEADER.size:
+        raise OvsClientError('invalid OpenFlow message length %d' % length)
+    data = header + _recv_exact(sock, length - OFP_HEADER.size)
+    return version, msg_type, length, xid, data
+
+
+def _recv_exact(sock: socket.socket, size: int) -> bytes:
+    buf = bytearray(size)
+    view = memoryview(buf)
+    received = 0
+    while received < size:
+        num = sock.recv_into(view[received:])
+        if not num:
+            raise OvsClientError('OpenFlow connection closed')
+        received += num
+    return bytes(buf)
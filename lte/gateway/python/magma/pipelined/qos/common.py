@@ -14,8 +14,9 @@ import json
 import logging
 import threading
 import traceback
+from contextlib import contextmanager
 from enum import Enum
-from typing import Dict, List  # noqa
+from typing import Dict, Iterable, List  # noqa
 
 from lte.protos.policydb_pb2 import FlowMatch
 from magma.configuration.service_configs import load_service_config
@@ -90,6 +91,10 @@ class SubscriberState(object):
         self.imsi = imsi
         self.rules = {}  # rule -> qos handle
         self.sessions = {}  # IP -> [sessions(ip, qos_argumets, rule_no), ...]
+        # qos handle -> number of rule directions using it. AMBR roots are
+        # owned by the sessions and not counted
+        self.qid_refs = {}  # type: Dict[int, int]
+        self._rule_sessions = {}  # rule -> IP of the session with the rule
         self._redis_store = qos_store
 
     def check_empty(self, ) -> bool:
@@ -106,12 +111,22 @@ class SubscriberState(object):
         del self.sessions[ip_addr]
 
     def find_session_with_rule(self, rule_num: int) -> SubscriberSession:
-        session_with_rule = None
-        for session in self.sessions.values():
-            if rule_num in session.rules:
-                session_with_rule = session
-                break
-        return session_with_rule
+        ip_addr = self._rule_sessions.get(rule_num)
+        if ip_addr is None:
+            return None
+        return self.sessions.get(ip_addr)
+
+    @staticmethod
+    def get_rule_qids(qos_data) -> List[int]:
+        """
+        Return the qos handles a rule direction uses, except the AMBR root
+        """
+        _, qid, ambr, leaf = get_data(qos_data)
+        if ambr == qid:
+            return []
+        if leaf and leaf != qid:
+            return [qid, leaf]
+        return [qid]
 
     def _update_rules_map(self, ip_addr: str, rule_num: int, d: FlowMatch.Direction,
                     qos_data) -> None:
@@ -121,7 +136,10 @@ class SubscriberState(object):
 
         session = self.get_or_create_session(ip_addr)
         session.rules.add(rule_num)
+        self._rule_sessions[rule_num] = ip_addr
         self.rules[rule_num].append((d, qos_data))
+        for qid in self.get_rule_qids(qos_data):
+            self.qid_refs[qid] = self.qid_refs.get(qid, 0) + 1
 
     def update_rule(self, ip_addr: str, rule_num: int, d: FlowMatch.Direction,
                     qos_handle: int, ambr: int, leaf: int) -> None:
@@ -132,17 +150,45 @@ class SubscriberState(object):
 
         self._update_rules_map(ip_addr, rule_num, d, qos_data)
 
-    def remove_rule(self, rule_num: int) -> None:
-        session_with_rule = self.find_session_with_rule(rule_num)
-        if session_with_rule:
-            for (d, _) in self.rules[rule_num]:
-                k = get_subscriber_key(self.imsi, session_with_rule.ip_addr,
-                                       rule_num, d)
-                if get_key_json(k) in self._redis_store:
-                    del self._redis_store[get_key_json(k)]
+    def restore_rule(self, ip_addr: str, rule_num: int, d: FlowMatch.Direction,
+                     qos_handle: int, ambr: int, leaf: int) -> None:
+        """
+        Add a rule read from the qos store, without writing it back
+        """
+        qos_data = get_data_json(get_subscriber_data(qos_handle, ambr, leaf))
+        self._update_rules_map(ip_addr, rule_num, d, qos_data)
 
-        del self.rules[rule_num]
-        session_with_rule.rules.remove(rule_num)
+    def remove_rule(self, rule_num: int) -> Dict[int, int]:
+        return self.remove_rules([rule_num])
+
+    def remove_rules(self, rule_nums: Iterable[int]) -> Dict[int, int]:
+        """
+        Remove rules, and their entries from the qos store in one batch.
+
+        Returns:
+            direction of each qos handle no rule uses anymore
+        """
+        released = {}
+        keys = []
+        for rule_num in rule_nums:
+            ip_addr = self._rule_sessions.pop(rule_num, None)
+            for (d, qos_data) in self.rules.pop(rule_num, []):
+                for qid in self.get_rule_qids(qos_data):
+                    refs = self.qid_refs.get(qid, 0) - 1
+                    if refs > 0:
+                        self.qid_refs[qid] = refs
+                        continue
+                    self.qid_refs.pop(qid, None)
+                    released[qid] = d
+                if ip_addr is not None:
+                    keys.append(get_key_json(get_subscriber_key(
+                        self.imsi, ip_addr, rule_num, d,
+                    )))
+            session = self.sessions.get(ip_addr)
+            if session:
+                session.rules.discard(rule_num)
+        delete_from_store(self._redis_store, keys)
+        return released
 
     def find_rule(self, rule_num: int):
         return self.rules.get(rule_num)
@@ -163,10 +209,34 @@ class SubscriberState(object):
         return 0
 
 
+def delete_from_store(qos_store: Dict, keys: List[str]) -> None:
+    """ Delete keys from the qos store, in one round trip if Redis backed """
+    if not keys:
+        return
+    pop_many = getattr(qos_store, 'pop_many', None)
+    if pop_many is not None:
+        pop_many(keys)
+        return
+    for k in keys:
+        qos_store.pop(k, None)
+
+
+class _SubscriberLock(object):
+    """
+    Lock of a subscriber's QoS state, and number of threads holding or
+    waiting for it
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.users = 0
+
+
 class QosManager(object):
     # TODO: convert QosManager to singleton class.
     qos_mgr = None
-    # protect QoS object create and delete across all QoSManager Objects.
+    # protect QoS setup across all QoSManager Objects. Adding and removing
+    # QoS only lock the subscriber's state.
     lock = threading.Lock()
 
     @staticmethod
@@ -178,6 +248,16 @@ class QosManager(object):
         QosManager.qos_mgr.setup()
         return QosManager.qos_mgr
 
+    @staticmethod
+    def close():
+        """
+        Release the resources held by the QoS implementation, on service
+        shutdown
+        """
+        if QosManager.qos_mgr and QosManager.qos_mgr._qos_enabled:
+            QosManager.qos_mgr.impl.close()
+        QosManager.qos_mgr = None
+
     @staticmethod
     def get_impl(datapath, loop, config):
         try:
@@ -242,6 +322,8 @@ class QosManager(object):
         LOG.info("QoS: apn_ambr_enabled: %s", self._apn_ambr_enabled)
         self._clean_restart = config["clean_restart"]
         self._subscriber_state = {}
+        self._subscriber_locks = {}  # type: Dict[str, _SubscriberLock]
+        self._subscriber_locks_lock = threading.Lock()
         self._loop = loop
         self.impl = QosManager.get_impl(datapath, loop, config)
         self._redis_store = QosStore(self.__class__.__name__)
@@ -314,14 +396,13 @@ class QosManager(object):
                     _, imsi, ip_addr, rule_num, direction = get_key(rule)
 
                     subscriber = self._get_or_create_subscriber(imsi)
-                    subscriber.update_rule(ip_addr, rule_num, direction, qid, ambr, leaf)
+                    subscriber.restore_rule(ip_addr, rule_num, direction, qid, ambr, leaf)
                     session = subscriber.get_or_create_session(ip_addr)
                     session.set_ambr(direction, ambr, leaf)
 
                 # purge entries from qos_store
-                for rule in purge_store_set:
-                    LOG.debug("purging qos_store entry %s", rule)
-                    del self._redis_store[rule]
+                LOG.debug("purging qos_store entries %s", purge_store_set)
+                delete_from_store(self._redis_store, list(purge_store_set))
 
                 # purge unreferenced qos configs from system
                 # Step 1. Delete child nodes
@@ -363,6 +444,27 @@ class QosManager(object):
             self._subscriber_state[imsi] = subscriber_state
         return subscriber_state
 
+    @contextmanager
+    def _lock_subscriber(self, imsi: str):
+        """
+        Hold the lock of imsi's QoS state. Locks are dropped once no thread
+        uses them, so they don't pile up as subscribers come and go.
+        """
+        with self._subscriber_locks_lock:
+            subscriber_lock = self._subscriber_locks.get(imsi)
+            if subscriber_lock is None:
+                subscriber_lock = _SubscriberLock()
+                self._subscriber_locks[imsi] = subscriber_lock
+            subscriber_lock.users += 1
+        try:
+            with subscriber_lock.lock:
+                yield
+        finally:
+            with self._subscriber_locks_lock:
+                subscriber_lock.users -= 1
+                if not subscriber_lock.users:
+                    del self._subscriber_locks[imsi]
+
     def add_subscriber_qos(
             self,
             imsi: str,
@@ -373,16 +475,15 @@ class QosManager(object):
             qos_info: QosInfo,
             cleanup_rule=None
     ):
-        with QosManager.lock:
-            if not self._qos_enabled or not self._initialized:
-                LOG.debug("add_subscriber_qos: not enabled or initialized")
-                return None, None
-
-            LOG.debug("adding qos for imsi %s rule_num %d direction %d apn_ambr %d, %s",
-                      imsi, rule_num, direction, apn_ambr, qos_info)
+        if not self._qos_enabled or not self._initialized:
+            LOG.debug("add_subscriber_qos: not enabled or initialized")
+            return None, None
 
-            imsi = normalize_imsi(imsi)
+        LOG.debug("adding qos for imsi %s rule_num %d direction %d apn_ambr %d, %s",
+                  imsi, rule_num, direction, apn_ambr, qos_info)
 
+        imsi = normalize_imsi(imsi)
+        with self._lock_subscriber(imsi):
             # ip_addr identifies a specific subscriber session, each subscriber session
             # must be associated with a default bearer and can be associated with dedicated
             # bearers. APN AMBR specifies the aggregate max bit rate for a specific
@@ -454,63 +555,36 @@ class QosManager(object):
             return None, None
 
     def remove_subscriber_qos(self, imsi: str = "", del_rule_num: int = -1):
-        with QosManager.lock:
-            if not self._qos_enabled or not self._initialized:
-                LOG.debug("remove_subscriber_qos: not enabled or initialized")
-                return
+        if not self._qos_enabled or not self._initialized:
+            LOG.debug("remove_subscriber_qos: not enabled or initialized")
+            return
 
-            LOG.debug("removing Qos for imsi %s del_rule_num %d", imsi, del_rule_num)
-            if not imsi:
-                LOG.error('imsi %s invalid, failed removing', imsi)
-                return
+        LOG.debug("removing Qos for imsi %s del_rule_num %d", imsi, del_rule_num)
+        if not imsi:
+            LOG.error('imsi %s invalid, failed removing', imsi)
+            return
 
-            imsi = normalize_imsi(imsi)
+        imsi = normalize_imsi(imsi)
+        with self._lock_subscriber(imsi):
             subscriber_state = self._subscriber_state.get(imsi)
             if not subscriber_state:
                 LOG.debug('imsi %s not found, nothing to remove ', imsi)
                 return
 
-            to_be_deleted_rules = set()
-            qid_to_remove = {}
-            qid_in_use = set()
             if del_rule_num == -1:
                 # deleting all rules for the subscriber
-                rules = subscriber_state.get_all_rules()
-                for (rule_num, rule) in rules.items():
-                    for (d, qos_data) in rule:
-                        _, qid, ambr, leaf = get_data(qos_data)
-                        if ambr != qid:
-                            qid_to_remove[qid] = d
-                            if leaf and leaf != qid:
-                                qid_to_remove[leaf] = d
-
-                    to_be_deleted_rules.add(rule_num)
+                to_be_deleted_rules = list(subscriber_state.get_all_rules())
+            elif subscriber_state.find_rule(del_rule_num):
+                LOG.debug("removing rule %s %s ", imsi, del_rule_num)
+                to_be_deleted_rules = [del_rule_num]
             else:
-                rule = subscriber_state.find_rule(del_rule_num)
-                if rule:
-                    rules = subscriber_state.get_all_rules()
-                    for (rule_num, rule) in rules.items():
-                        for (d, qos_data) in rule:
-                            _, qid, ambr, leaf = get_data(qos_data)
-                            if rule_num == del_rule_num:
-                                if ambr != qid:
-                                    qid_to_remove[qid] = d
-                                    if leaf and leaf != qid:
-                                        qid_to_remove[leaf] = d
-                            else:
-                                qid_in_use.add(qid)
-
-                    LOG.debug("removing rule %s %s ", imsi, del_rule_num)
-                    to_be_deleted_rules.add(del_rule_num)
-                else:
-                    LOG.debug("unable to find rule_num %d for imsi %s", del_rule_num, imsi)
+                LOG.debug("unable to find rule_num %d for imsi %s", del_rule_num, imsi)
+                to_be_deleted_rules = []
 
+            # qos handles still used by other rules are kept
+            qid_to_remove = subscriber_state.remove_rules(to_be_deleted_rules)
             for (qid, d) in qid_to_remove.items():
-                if qid not in qid_in_use:
-                    self.impl.remove_qos(qid, d)
-
-            for rule_num in to_be_deleted_rules:
-                subscriber_state.remove_rule(rule_num)
+                self.impl.remove_qos(qid, d)
 
             # purge sessions with no rules
             for session in subscriber_state.get_all_empty_sessions():
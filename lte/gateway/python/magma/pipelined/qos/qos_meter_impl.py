@@ -46,6 +46,9 @@ class MeterManager(object):
         LOG.info("Destroying all meters")
         MeterClass.del_all_meters(self._datapath)
 
+    def close(self,):
+        pass
+
     def get_action_instruction(self, meter_id: int):
         if self._qos_impl_broken:
             raise RuntimeError(BROKEN_KERN_ERROR_MSG)
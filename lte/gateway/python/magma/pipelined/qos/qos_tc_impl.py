@@ -16,6 +16,7 @@ from typing import Optional  # noqa
 
 from lte.protos.policydb_pb2 import FlowMatch
 
+from .tc_ops_batch import TcOpsBatch
 from .tc_ops_cmd import TcOpsCmd, argSplit, run_cmd
 from .tc_ops_pyroute2 import TcOpsPyRoute2
 from .types import QosInfo
@@ -212,6 +213,10 @@ class TCManager(object):
     rate limited based on configured value.
     Traffic to flows with no QoS configuration are sent to a
     default queue and are not rate limited.
+
+    With qos.enable_netlink_batch, classes are created and deleted by a
+    TcOpsBatch worker, in batched netlink requests, and read back with
+    netlink dumps.
     """
 
     def __init__(self,
@@ -224,6 +229,9 @@ class TCManager(object):
         self._downlink = config['enodeb_iface']
         self._max_rate = config["qos"]["max_rate"]
         self._enable_pyroute2 = config["qos"].get('enable_pyroute2', False)
+        self._tc_batch = None
+        if config["qos"].get('enable_netlink_batch', False):
+            self._tc_batch = TcOpsBatch()
         self._start_idx, self._max_idx = (config['qos']['linux_tc']['min_idx'],
                                           config['qos']['linux_tc']['max_idx'])
         self._id_manager = IdManager(self._start_idx, self._max_idx)
@@ -236,15 +244,21 @@ class TCManager(object):
         # ensure ordering during deletion of classes, children should be deleted
         # prior to the parent class ids
         for intf in [self._uplink, self._downlink]:
-            qid_list = TrafficClass.read_all_classes(intf)
+            qid_list = self._read_all_classes(intf)
             for qid_tuple in qid_list:
                 (qid, pqid) = qid_tuple
                 if self._start_idx <= qid < (self._max_idx - 1):
                     LOG.info("Attemting to delete class idx %d", qid)
-                    TrafficClass.delete_class(intf, qid)
+                    self._delete_class(intf, qid)
                 if self._start_idx <= pqid < (self._max_idx - 1):
                     LOG.info("Attemting to delete parent class idx %d", pqid)
-                    TrafficClass.delete_class(intf, pqid)
+                    self._delete_class(intf, pqid)
+        if self._tc_batch:
+            self._tc_batch.flush()
+
+    def close(self, ):
+        if self._tc_batch:
+            self._tc_batch.close()
 
     def setup(self, ):
         # initialize new qdisc
@@ -279,12 +293,39 @@ class TCManager(object):
 
         LOG.debug("create done: qid %d err %s", qid, err_no)
 
+    def create_class_batch(self, d: FlowMatch.Direction, qos_info: QosInfo,
+                           qid, parent, skip_filter, cleanup_rule):
+        intf = self._uplink if d == FlowMatch.UPLINK else self._downlink
+        parent_qid = parent or ROOT_QID
+        if parent_qid == qid:
+            LOG.error('parent and self qid equal, setting parent_qid to root')
+            parent_qid = ROOT_QID
+
+        def on_created(err_no):
+            if err_no < 0:
+                if cleanup_rule:
+                    self._loop.call_soon_threadsafe(cleanup_rule)
+                LOG.error("qos create error: qid %d err %d", qid, err_no)
+                return
+            LOG.debug("create done: qid %d", qid)
+
+        self._tc_batch.create_class(intf, qid, qos_info.mbr,
+                                    qos_info.gbr or DEFAULT_RATE,
+                                    parent_qid,
+                                    skip_filter=skip_filter,
+                                    callback=on_created)
+
     def add_qos(self, d: FlowMatch.Direction, qos_info: QosInfo,
                 cleanup_rule=None, parent=None, skip_filter=False) -> int:
         LOG.debug("add QoS: %s", qos_info)
         qid = self._id_manager.allocate_idx()
-        self._loop.call_soon_threadsafe(self.create_class_async, d, qos_info,
-                                        qid, parent, skip_filter, cleanup_rule)
+        if self._tc_batch:
+            self.create_class_batch(d, qos_info, qid, parent, skip_filter,
+                                    cleanup_rule)
+        else:
+            self._loop.call_soon_threadsafe(self.create_class_async, d,
+                                            qos_info, qid, parent,
+                                            skip_filter, cleanup_rule)
         LOG.debug("assigned qid: %d", qid)
         return qid
 
@@ -300,19 +341,37 @@ class TCManager(object):
         LOG.debug("deleting qos_handle %s, skip_filter %s", qid, skip_filter)
         intf = self._uplink if d == FlowMatch.UPLINK else self._downlink
 
+        if self._tc_batch:
+            # Runs on the worker, releasing is a thread-safe deque append
+            self._tc_batch.delete_class(intf, qid, skip_filter,
+                                        callback=lambda err: self._on_deleted(qid, err))
+            return
         err = TrafficClass.delete_class(intf, qid, skip_filter)
+        self._on_deleted(qid, err)
+
+    def _on_deleted(self, qid: int, err: int):
         if err == 0:
             self._id_manager.release_idx(qid)
         else:
-            LOG.error('error deleting class %d, not releasing idx', qid)
-        return
+            LOG.error("error deleting class %d (%s), not releasing idx", qid, err)
+
+    def _read_all_classes(self, intf: str):
+        if self._tc_batch:
+            return self._tc_batch.read_all_classes(intf)
+        return TrafficClass.read_all_classes(intf)
+
+    def _delete_class(self, intf: str, qid: int):
+        if self._tc_batch:
+            self._tc_batch.delete_class(intf, qid)
+        else:
+            TrafficClass.delete_class(intf, qid)
 
     def read_all_state(self, ):
         LOG.debug("read_all_state")
         st = {}
         apn_qid_list = set()
-        ul_qid_list = TrafficClass.read_all_classes(self._uplink)
-        dl_qid_list = TrafficClass.read_all_classes(self._downlink)
+        ul_qid_list = self._read_all_classes(self._uplink)
+        dl_qid_list = self._read_all_classes(self._downlink)
         for (d, qid_list) in ((FlowMatch.UPLINK, ul_qid_list),
                               (FlowMatch.DOWNLINK, dl_qid_list)):
             for qid_tuple in qid_list:
@@ -0,0 +1,402 @@
+"""
+Copyright 2020 The Magma Authors.
+
+This source code is licensed under the BSD-style license found in the
+LICENSE file in the root directory of this source tree.
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+
+import errno
+import logging
+import queue
+import socket
+import struct
+import threading
+from typing import Callable, Dict, List, Optional, Tuple
+
+from pyroute2 import IPBatch, IPRoute, NetlinkError
+from pyroute2.netlink import NLM_F_ACK, NLM_F_REQUEST
+from pyroute2.netlink.rtnl import RTM_DELTCLASS, RTM_DELTFILTER
+
+from .tc_ops_pyroute2 import PARENT_ID, PROTOCOL
+
+LOG = logging.getLogger('pipelined.qos.tc_batch')
+
+# Operations taken from the queue at once, and size of the netlink message
+# buffers they are sent in. HTB class requests carry rate tables, of ~2.5KB.
+MAX_BATCH = 256
+MAX_BATCH_BYTES = 128 * 1024
+# Time to wait for the kernel to acknowledge a batch, in seconds
+ACK_TIMEOUT = 5
+RCVBUF_SIZE = 1024 * 1024
+
+# Compiled requests kept, by command and constant arguments
+MAX_TEMPLATES = 1024
+
+NLMSG_ERROR = 2
+NLMSG_HEADER = struct.Struct('=IHHII')
+NLMSG_SEQ_OFFSET = 8
+NLMSG_ERRNO = struct.Struct('=i')
+# ifindex, handle and parent of the tcmsg following the netlink header
+TCMSG_IDS = struct.Struct('=iII')
+TCMSG_IDS_OFFSET = 20
+U32 = struct.Struct('=I')
+# classid compiled in templates, located to be replaced by the request's
+CLASSID_PLACEHOLDER = 0x5A5AA5A5
+TC_H_ROOT = 0xFFFFFFFF
+# pyroute2 sets NLM_F_CREATE and NLM_F_EXCL on its 'del-class' and
+# 'del-filter' requests, which recent kernels reject
+DEL_CLASS = (RTM_DELTCLASS, NLM_F_REQUEST | NLM_F_ACK)
+DEL_FILTER = (RTM_DELTFILTER, NLM_F_REQUEST | NLM_F_ACK)
+
+
+class _TcOp(object):
+    """
+    Netlink requests applying one class operation, and the callback
+    receiving their result
+    """
+
+    def __init__(
+        self, iface: str, qid: int,
+        callback: Optional[Callable[[int], None]],
+    ):
+        self.iface = iface
+        self.qid = qid
+        # (command, kind, iface, handle, kwargs, check_error)
+        self.requests = []
+        # Requests sent once all of the above succeeded
+        self.next_requests = []
+        self.callback = callback
+        self.err = 0
+
+
+class TcOpsBatch(object):
+    """
+    Applies HTB class and fw filter creates and deletes through netlink
+    from a worker thread.
+
+    Callers queue class operations, which return right away. The worker
+    compiles all the operations queued meanwhile into a single netlink
+    message buffer, sends it in one call and matches the kernel's acks to
+    the operations by sequence number. The result of each operation is
+    passed to its callback, on the worker thread. Operations are applied in
+    the order they are queued.
+
+    The fw filter of a class is sent in a second message buffer, once the
+    kernel acknowledged the class, so a failed create leaves no filter
+    behind.
+    """
+
+    def __init__(self, max_batch: int = MAX_BATCH):
+        self._max_batch = max_batch
+        self._queue = queue.Queue()
+        self._ipr = IPRoute()
+        self._ipr_lock = threading.Lock()
+        self._iface_if_index = {}  # type: Dict[str, int]
+        self._sock = socket.socket(
+            socket.AF_NETLINK, socket.SOCK_RAW, socket.NETLINK_ROUTE,
+        )
+        self._sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, RCVBUF_SIZE)
+        self._sock.bind((0, 0))
+        self._sock.settimeout(ACK_TIMEOUT)
+        self._seq = 0
+        self._templates = {}  # type: Dict[Tuple, Tuple[bytes, Optional[int]]]
+        self._worker = threading.Thread(
+            target=self._run, name='tc_batch', daemon=True,
+        )
+        self._worker.start()
+        LOG.info("initialized")
+
+    def create_class(
+        self, iface: str, qid: int, max_bw: int, rate: str,
+        parent_qid: int, skip_filter: bool = False,
+        callback: Optional[Callable[[int], None]] = None,
+    ):
+        """
+        Queue the creation of an HTB class, and of the fw filter sending
+        packets marked with qid to it unless skip_filter is set.
+
+        Args:
+            iface: egress interface name
+            qid: class id
+            max_bw: ceiling in bits per sec
+            rate: guaranteed rate
+            parent_qid: parent class id
+            skip_filter: don't create the filter
+            callback: called with zero, or the error of the first request
+                which failed
+        """
+        op = _TcOp(iface, qid, callback)
+        # API needs ceiling in bytes per sec.
+        op.requests.append((
+            'add-class', 'htb', iface, PARENT_ID | qid, {
+                'parent': PARENT_ID | parent_qid,
+                'rate': str(rate).lower(),
+                'ceil': max_bw / 8,
+                'prio': 1,
+            }, True,
+        ))
+        if not skip_filter:
+            op.next_requests.append(
+                ('add-filter', 'fw', iface, qid, self._filter_args(qid), True),
+            )
+        self._queue.put(op)
+
+    def delete_class(
+        self, iface: str, qid: int, skip_filter: bool = False,
+        callback: Optional[Callable[[int], None]] = None,
+    ):
+        """
+        Queue the deletion of an HTB class, and of its fw filter unless
+        skip_filter is set. Only errors deleting the class are passed to
+        callback.
+        """
+        op = _TcOp(iface, qid, callback)
+        if not skip_filter:
+            op.requests.append(
+                (DEL_FILTER, 'fw', iface, qid, self._filter_args(qid), False),
+            )
+        op.requests.append(
+            (DEL_CLASS, 'htb', iface, PARENT_ID | qid, {'parent': 0}, True),
+        )
+        self._queue.put(op)
+
+    def flush(self):
+        """
+        Wait until all the queued operations are applied
+        """
+        self._queue.join()
+
+    def close(self):
+        """
+        Apply the queued operations, stop the worker and release its
+        netlink sockets
+        """
+        if not self._worker.is_alive():
+            return
+        self._queue.put(None)
+        self._worker.join()
+        self._sock.close()
+        with self._ipr_lock:
+            self._ipr.close()
+        LOG.info("closed")
+
+    def read_all_classes(self, iface: str) -> List[Tuple[int, int]]:
+        """
+        Dump the HTB classes of iface, once the queued operations are
+        applied.
+
+        Returns:
+            list of (qid, parent qid) of the classes, except the root ones
+        """
+        self.flush()
+        qid_list = []
+        try:
+            with self._ipr_lock:
+                classes = self._ipr.get_classes(self._get_if_index(iface))
+        except (ValueError, NetlinkError) as ex:
+            LOG.error('failed dumping classes of %s: %s', iface, ex)
+            return qid_list
+        for tc_class in classes:
+            if tc_class.get_attr('TCA_KIND') != 'htb':
+                continue
+            if tc_class['parent'] == TC_H_ROOT:
+                continue
+            qid = tc_class['handle'] & 0xFFFF
+            pqid = tc_class['parent'] & 0xFFFF
+            qid_list.append((qid, pqid))
+            LOG.debug("TC-dump: qid %d pqid %d", qid, pqid)
+        return qid_list
+
+    @staticmethod
+    def _filter_args(qid: int):
+        return {
+            'parent': PARENT_ID,
+            'prio': 1,
+            'protocol': PROTOCOL,
+            'classid': PARENT_ID | qid,
+        }
+
+    def _get_if_index(self, iface: str) -> int:
+        if_index = self._iface_if_index.get(iface)
+        if if_index is None:
+            if_indexes = self._ipr.link_lookup(ifname=iface)
+            if not if_indexes:
+                raise ValueError('interface %s not found' % iface)
+            if_index = if_indexes[0]
+            self._iface_if_index[iface] = if_index
+        return if_index
+
+    def _run(self):
+        running = True
+        while running:
+            ops = [self._queue.get()]
+            while len(ops) < self._max_batch and ops[-1] is not None:
+                try:
+                    ops.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            if ops[-1] is None:
+                # Queued by close()
+                running = False
+                ops.pop()
+                self._queue.task_done()
+            for chunk in self._split_by_class(ops):
+                self._apply_chunk(chunk)
+            for op in ops:
+                if op.callback is not None:
+                    try:
+                        op.callback(op.err)
+                    except Exception as ex:  # pylint: disable=broad-except
+                        LOG.error('tc batch callback error: %s', ex)
+                self._queue.task_done()
+
+    @staticmethod
+    def _split_by_class(ops: List[_TcOp]) -> List[List[_TcOp]]:
+        """
+        Split ops so that each class is changed at most once in a chunk.
+        Filters are sent after all the classes of their chunk, which keeps
+        them ordered with later operations on the same class.
+        """
+        chunks = []
+        chunk = []
+        classes = set()
+        for op in ops:
+            if (op.iface, op.qid) in classes:
+                chunks.append(chunk)
+                chunk = []
+                classes = set()
+            classes.add((op.iface, op.qid))
+            chunk.append(op)
+        if chunk:
+            chunks.append(chunk)
+        return chunks
+
+    def _apply_chunk(self, ops: List[_TcOp]):
+        try:
+            self._apply(ops, [op.requests for op in ops])
+            created = [op for op in ops if op.next_requests and not op.err]
+            if created:
+                self._apply(created, [op.next_requests for op in created])
+        except Exception as ex:  # pylint: disable=broad-except
+            LOG.error('failed applying tc batch: %s', ex)
+            LOG.debug(ex, exc_info=True)
+
+    def _apply(self, ops: List[_TcOp], requests: List[List[Tuple]]):
+        ipb = IPBatch()
+        pending = {}  # type: Dict[int, Tuple[_TcOp, bool]]
+        for op, op_requests in zip(ops, requests):
+            for command, kind, iface, handle, kwargs, check in op_requests:
+                try:
+                    with self._ipr_lock:
+                        if_index = self._get_if_index(iface)
+                    offset = len(ipb.batch)
+                    self._compile(
+                        ipb.batch, command, kind, if_index, handle, kwargs,
+                    )
+                except (ValueError, NetlinkError) as ex:
+                    LOG.error('%s error : %s', command, ex)
+                    if check and not op.err:
+                        op.err = -errno.EINVAL
+                    continue
+                # Stamp each request, to match it with its ack
+                self._seq = (self._seq + 1) & 0xFFFFFFFF
+                struct.pack_into(
+                    '=I', ipb.batch, offset + NLMSG_SEQ_OFFSET, self._seq,
+                )
+                pending[self._seq] = (op, check)
+                if len(ipb.batch) >= MAX_BATCH_BYTES:
+                    self._send(ipb.batch, pending)
+                    ipb.reset()
+                    pending = {}
+        if pending:
+            self._send(ipb.batch, pending)
+
+    def _compile(
+        self, batch: bytearray, command, kind: str, if_index: int,
+        handle: int, kwargs: Dict,
+    ):
+        """
+        Append a tc request to batch. pyroute2 takes milliseconds to
+        compile HTB rate tables, so the request is compiled once for each
+        set of constant arguments and the ids are patched into the copies.
+        """
+        key = (command, kind) + tuple(sorted(
+            (name, value) for name, value in kwargs.items()
+            if name not in ('parent', 'classid')
+        ))
+        template = self._templates.get(key)
+        if template is None:
+            template = self._build_template(command, kind, kwargs)
+            if len(self._templates) >= MAX_TEMPLATES:
+                self._templates.clear()
+            self._templates[key] = template
+        data, classid_offset = template
+        offset = len(batch)
+        batch += data
+        TCMSG_IDS.pack_into(
+            batch, offset + TCMSG_IDS_OFFSET,
+            if_index, handle, kwargs['parent'],
+        )
+        if classid_offset is not None:
+            U32.pack_into(batch, offset + classid_offset, kwargs['classid'])
+
+    @staticmethod
+    def _build_template(command, kind: str, kwargs: Dict):
+        ipb = IPBatch()
+        template_kwargs = dict(kwargs)
+        if 'classid' in kwargs:
+            template_kwargs['classid'] = CLASSID_PLACEHOLDER
+        ipb.tc(command, kind, 0, 0, **template_kwargs)
+        data = bytes(ipb.batch)
+        classid_offset = None
+        if 'classid' in kwargs:
+            placeholder = U32.pack(CLASSID_PLACEHOLDER)
+            classid_offset = data.find(placeholder, TCMSG_IDS_OFFSET + 12)
+            if classid_offset < 0 or \
+                    data.count(placeholder) != 1:
+                raise ValueError('classid not found in %s request' % kind)
+        return data, classid_offset
+
+    def _send(self, batch: bytearray, pending: Dict[int, Tuple[_TcOp, bool]]):
+        try:
+            self._sock.sendto(batch, (0, 0))
+            while pending:
+                self._read_acks(self._sock.recv(RCVBUF_SIZE), pending)
+        except socket.timeout:
+            LOG.error('%d tc requests were not acknowledged', len(pending))
+            self._fail(pending, -errno.ETIMEDOUT)
+        except OSError as ex:
+            LOG.error('failed sending tc batch: %s', ex)
+            self._fail(pending, -ex.errno)
+
+    @staticmethod
+    def _fail(pending: Dict[int, Tuple[_TcOp, bool]], err: int):
+        for op, check in pending.values():
+            if check and not op.err:
+                op.err = err
+
+    @staticmethod
+    def _read_acks(data: bytes, pending: Dict[int, Tuple[_TcOp, bool]]):
+        offset = 0
+        while offset + NLMSG_HEADER.size <= len(data):
+            length, msg_type, _, seq, _ = NLMSG_HEADER.unpack_from(
+                data, offset,
+            )
+            if msg_type == NLMSG_ERROR and seq in pending:
+                op, check = pending.pop(seq)
+                err = NLMSG_ERRNO.unpack_from(
+                    data, offset + NLMSG_HEADER.size,
+                )[0]
+                if err:
+                    LOG.debug('tc request %d error : %d', seq, err)
+                if err and check and not op.err:
+                    op.err = err
+            if length < NLMSG_HEADER.size:
+                break
+            offset += (length + 3) & ~3
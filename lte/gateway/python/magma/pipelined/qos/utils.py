@@ -12,6 +12,7 @@ limitations under the License.
 """
 
 import logging
+import threading
 from collections import deque
 
 from magma.common.redis.client import get_default_client
@@ -26,7 +27,7 @@ LOG = logging.getLogger('pipelined.qos.id_manager')
 
 class IdManager(object):
     """
-    Simple utility class to manage IDs
+    Simple utility class to manage IDs, safe to use from several threads
     """
     def __init__(self, start_idx, max_idx):
         self._start_idx = start_idx
@@ -34,14 +35,16 @@ class IdManager(object):
         self._counter = start_idx
         self._free_idx_list = deque()
         self._restore_done = False
+        self._lock = threading.Lock()
 
     def allocate_idx(self,) -> int:
-        idx = self._get_free_idx()
-        if idx is None:
-            idx = self._counter
-            if idx == self._max_idx:
-                raise ValueError("maximum id allocation exceeded")
-            self._counter += 1
+        with self._lock:
+            idx = self._get_free_idx()
+            if idx is None:
+                idx = self._counter
+                if idx == self._max_idx:
+                    raise ValueError("maximum id allocation exceeded")
+                self._counter += 1
         LOG.debug("allocating idx %d ", idx)
         return idx
 
@@ -59,11 +62,12 @@ class IdManager(object):
         if not id_set:
             return
 
-        self._counter = min(self._max_idx, max(id_set) + 1)
-        for idx in range(self._start_idx, self._counter):
-            if idx not in id_set:
-                self._free_idx_list.append(idx)
-        self._restore_done = True
+        with self._lock:
+            self._counter = min(self._max_idx, max(id_set) + 1)
+            for idx in range(self._start_idx, self._counter):
+                if idx not in id_set:
+                    self._free_idx_list.append(idx)
+            self._restore_done = True
 
     def _get_free_idx(self) -> int:
         if self._free_idx_list:
@@ -23,10 +23,14 @@ from lte.protos import pipelined_pb2_grpc
 from lte.protos.apn_pb2 import AggregatedMaximumBitrate
 from lte.protos.mobilityd_pb2 import IPAddress
 from lte.protos.pipelined_pb2 import (
+    ActivateFlowsBatchRequest,
+    ActivateFlowsBatchResult,
     ActivateFlowsRequest,
     ActivateFlowsResult,
     AllTableAssignments,
     CauseIE,
+    DeactivateFlowsBatchRequest,
+    DeactivateFlowsBatchResult,
     DeactivateFlowsRequest,
     DeactivateFlowsResult,
     FlowResponse,
@@ -53,6 +57,7 @@ from magma.pipelined.app.enforcement import EnforcementController
 from magma.pipelined.app.enforcement_stats import EnforcementStatsController
 from magma.pipelined.app.ipfix import IPFIXController
 from magma.pipelined.app.ng_services import NGServiceController
+from magma.pipelined.app.policy_mixin import PolicyActivation
 from magma.pipelined.app.tunnel_learn import TunnelLearnController
 from magma.pipelined.app.ue_mac import UEMacAddressController
 from magma.pipelined.app.vlan_learn import VlanLearnController
@@ -424,6 +429,129 @@ class PipelinedRpcServicer(pipelined_pb2_grpc.PipelinedServicer):
         # TODO: add metrics
         return gy_res
 
+    def ActivateFlowsBatch(self, request, context):
+        """
+        Activate flows for multiple subscribers based on the pre-defined rules
+        """
+        self._log_grpc_payload(request)
+        if not self._service_manager.is_app_enabled(
+                EnforcementController.APP_NAME,
+        ):
+            context.set_code(grpc.StatusCode.UNAVAILABLE)
+            context.set_details('Service not enabled!')
+            return None
+
+        for controller in [
+            self._gy_app, self._enforcer_app,
+            self._enforcement_stats,
+        ]:
+            if not controller.is_controller_ready():
+                context.set_code(grpc.StatusCode.UNAVAILABLE)
+                context.set_details('Enforcement service not initialized!')
+                return ActivateFlowsBatchResult()
+
+        fut = Future()  # type: Future[ActivateFlowsBatchResult]
+        self._loop.call_soon_threadsafe(
+            self._activate_flows_batch, request,
+            fut,
+        )
+        try:
+            return fut.result(timeout=self._call_timeout)
+        except concurrent.futures.TimeoutError:
+            logging.error("ActivateFlowsBatch request processing timed out")
+            deactivate_req = DeactivateFlowsBatchRequest(
+                requests=[get_deactivate_req(req) for req in request.requests],
+            )
+            self._loop.call_soon_threadsafe(
+                self._deactivate_flows_batch,
+                deactivate_req,
+            )
+            return ActivateFlowsBatchResult()
+
+    def _activate_flows_batch(
+        self, request: ActivateFlowsBatchRequest,
+        fut: 'Future[ActivateFlowsBatchResult]',
+    ) -> None:
+        """
+        Activate flows for all requests of the batch. Each app installs the
+        flows of the whole batch with a single barrier, enforcement_stats
+        flows are installed first as in _install_flows_gx/_install_flows_gy.
+        """
+        # (request index, ip address) of every session to activate
+        sessions = []
+        for i, req in enumerate(request.requests):
+            if self._service_config['setup_type'] == 'CWF' or req.ip_addr:
+                sessions.append((i, convert_ipv4_str_to_ip_proto(req.ip_addr)))
+            if req.ipv6_addr:
+                self._update_ipv6_prefix_store(req.ipv6_addr)
+                sessions.append(
+                    (i, convert_ipv6_bytes_to_ip_proto(req.ipv6_addr)),
+                )
+            if req.uplink_tunnel and req.downlink_tunnel:
+                self._update_tunnel_map_store(
+                    req.uplink_tunnel,
+                    req.downlink_tunnel,
+                )
+
+        for i, ip_address in sessions:
+            self._update_version(request.requests[i], ip_address)
+
+        # Install rules in enforcement stats
+        failed_results = [[] for _ in sessions]
+        if self._service_manager.is_app_enabled(
+                EnforcementStatsController.APP_NAME,
+        ):
+            stats_results = self._enforcement_stats.activate_rules_batch([
+                _get_policy_activation(request.requests[i], ip_address,
+                                       request.requests[i].policies)
+                for i, ip_address in sessions
+            ])
+            for k, (i, _) in enumerate(sessions):
+                _report_enforcement_stats_failures(
+                    stats_results[k], request.requests[i].sid.id,
+                )
+                failed_results[k] = _retrieve_failed_results(stats_results[k])
+
+        # Do not install any rules that failed to install in enforcement_stats.
+        gx_sessions = []
+        gy_sessions = []
+        for k, (i, ip_address) in enumerate(sessions):
+            req = request.requests[i]
+            activation = _get_policy_activation(
+                req, ip_address,
+                _filter_failed_policies(req, failed_results[k]),
+            )
+            if req.request_origin.type == RequestOriginType.GX:
+                gx_sessions.append((k, activation))
+            else:
+                gy_sessions.append((k, activation))
+
+        session_results = [None] * len(sessions)
+        if gx_sessions:
+            gx_results = self._enforcer_app.activate_rules_batch(
+                [activation for _, activation in gx_sessions],
+            )
+            for (k, activation), res in zip(gx_sessions, gx_results):
+                _report_enforcement_failures(res, activation.imsi)
+                session_results[k] = res
+        if gy_sessions:
+            gy_results = self._gy_app.activate_rules_batch(
+                [activation for _, activation in gy_sessions],
+            )
+            for (k, _), res in zip(gy_sessions, gy_results):
+                session_results[k] = res
+
+        ret = ActivateFlowsBatchResult(
+            results=[ActivateFlowsResult() for _ in request.requests],
+        )
+        for k, (i, _) in enumerate(sessions):
+            ret.results[i].policy_results.extend(
+                session_results[k].policy_results,
+            )
+            # Include the failed rules from enforcement_stats in the response.
+            ret.results[i].policy_results.extend(failed_results[k])
+        fut.set_result(ret)
+
     def DeactivateFlows(self, request, context):
         """
         Deactivate flows for a subscriber
@@ -468,6 +596,36 @@ class PipelinedRpcServicer(pipelined_pb2_grpc.PipelinedServicer):
             if self._should_remove_from_gy(request):
                 self._deactivate_flows_gy(request, ipv6)
 
+    def DeactivateFlowsBatch(self, request, context):
+        """
+        Deactivate flows for multiple subscribers
+        """
+        self._log_grpc_payload(request)
+        if not self._service_manager.is_app_enabled(
+                EnforcementController.APP_NAME,
+        ):
+            context.set_code(grpc.StatusCode.UNAVAILABLE)
+            context.set_details('Service not enabled!')
+            return None
+
+        for controller in [
+            self._gy_app, self._enforcer_app,
+            self._enforcement_stats,
+        ]:
+            if not controller.is_controller_ready():
+                context.set_code(grpc.StatusCode.UNAVAILABLE)
+                context.set_details('Enforcement service not initialized!')
+                return DeactivateFlowsBatchResult()
+
+        self._loop.call_soon_threadsafe(self._deactivate_flows_batch, request)
+        return DeactivateFlowsBatchResult(
+            results=[DeactivateFlowsResult() for _ in request.requests],
+        )
+
+    def _deactivate_flows_batch(self, request: DeactivateFlowsBatchRequest):
+        for req in request.requests:
+            self._deactivate_flows(req)
+
     def _should_remove_from_gy(self, request: DeactivateFlowsRequest) -> bool:
         is_gy = request.request_origin.type == RequestOriginType.GY
         is_wildcard = request.request_origin.type == RequestOriginType.WILDCARD
@@ -557,8 +715,13 @@ class PipelinedRpcServicer(pipelined_pb2_grpc.PipelinedServicer):
             )
 
     def _setup_pg_tunnel_update(self, request: UESessionSet, fut: 'Future(UESessionContextResponse)'):
-        res = self._classifier_app.process_mme_tunnel_request(request)
-        fut.set_result(res)
+        # Tunnel flows waiting for the eNodeB's GTP port set fut once
+        # they're installed
+        res = self._classifier_app.process_mme_tunnel_request(
+            request, fut.set_result,
+        )
+        if res is not None:
+            fut.set_result(res)
 
     # --------------------------
     # IPFIX App
@@ -1022,6 +1185,21 @@ def _report_enforcement_stats_failures(
         ).inc()
 
 
+def _get_policy_activation(
+    request: ActivateFlowsRequest,
+    ip_address: IPAddress,
+    policies: List[VersionedPolicy],
+) -> PolicyActivation:
+    return PolicyActivation(
+        imsi=request.sid.id,
+        msisdn=request.msisdn,
+        uplink_tunnel=request.uplink_tunnel,
+        ip_addr=ip_address,
+        apn_ambr=request.apn_ambr,
+        policies=policies,
+    )
+
+
 def get_deactivate_req(request: ActivateFlowsRequest):
     versioned_policy_ids = [
         VersionedPolicyID(rule_id = p.rule.id, version=p.version) for
@@ -10,9 +10,7 @@ WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
 See the License for the specific language governing permissions and
 limitations under the License.
 """
-import json
 import threading
-from collections import namedtuple
 
 from lte.protos.mobilityd_pb2 import IPAddress
 from magma.common.redis.client import get_default_client
@@ -24,8 +22,6 @@ from magma.common.redis.serializers import (
 )
 from magma.pipelined.imsi import encode_imsi
 
-SubscriberRuleKey = namedtuple('SubscriberRuleKey', 'key_type imsi ip_addr rule_id')
-
 
 class RuleIDToNumMapper:
     """
@@ -82,6 +78,10 @@ class SessionRuleToVersionMapper:
     This class assigns version numbers to rule id & subscriber id combinations
     that can be used in an openflow register. The methods can be called from
     multiple threads.
+
+    Versions are indexed as imsi -> ip_addr -> rule_id -> version so that all
+    versions of a subscriber can be removed without scanning other
+    subscribers.
     """
 
     def __init__(self):
@@ -90,8 +90,9 @@ class SessionRuleToVersionMapper:
 
     def _save_version_unsafe(self, imsi: str, ip_addr: str, rule_id: str,
                              version):
-        key = self._get_json_key(encode_imsi(imsi), ip_addr, rule_id)
-        self._version_by_imsi_and_rule[key] = version
+        self._version_by_imsi_and_rule \
+            .setdefault(encode_imsi(imsi), {}) \
+            .setdefault(ip_addr, {})[rule_id] = version
 
     def remove_all_ue_versions(self, imsi: str, ip_addr: IPAddress):
         """
@@ -100,19 +101,17 @@ class SessionRuleToVersionMapper:
         incremented.
         """
         encoded_imsi = encode_imsi(imsi)
-        if ip_addr is None or ip_addr.address is None:
-            ip_addr_str = ""
-        else:
-            ip_addr_str = ip_addr.address.decode('utf-8').strip()
-        del_list = []
+        ip_addr_str = _get_ip_addr_str(ip_addr)
         with self._lock:
-            for k in self._version_by_imsi_and_rule.keys():
-                _, cur_imsi, cur_ip_addr_str, _ = SubscriberRuleKey(*json.loads(k))
-                if cur_imsi == encoded_imsi and (ip_addr_str == "" or
-                                                 ip_addr_str == cur_ip_addr_str):
-                    del_list.append(k)
-            for k in del_list:
-                del self._version_by_imsi_and_rule[k]
+            if ip_addr_str == "":
+                self._version_by_imsi_and_rule.pop(encoded_imsi, None)
+                return
+            versions_by_ip = self._version_by_imsi_and_rule.get(encoded_imsi)
+            if versions_by_ip is None:
+                return
+            versions_by_ip.pop(ip_addr_str, None)
+            if not versions_by_ip:
+                del self._version_by_imsi_and_rule[encoded_imsi]
 
     def save_version(self, imsi: str, ip_addr: IPAddress,
                      rule_id: [str], version: int):
@@ -121,10 +120,7 @@ class SessionRuleToVersionMapper:
         rule id is not specified, then all rules for the subscriber will be
         incremented.
         """
-        if ip_addr is None or ip_addr.address is None:
-            ip_addr_str = ""
-        else:
-            ip_addr_str = ip_addr.address.decode('utf-8').strip()
+        ip_addr_str = _get_ip_addr_str(ip_addr)
         with self._lock:
             self._save_version_unsafe(imsi, ip_addr_str, rule_id, version)
 
@@ -132,13 +128,12 @@ class SessionRuleToVersionMapper:
         """
         Returns the version number given a subscriber and a rule.
         """
-        if ip_addr is None or ip_addr.address is None:
-            ip_addr_str = ""
-        else:
-            ip_addr_str = ip_addr.address.decode('utf-8').strip()
-        key = self._get_json_key(encode_imsi(imsi), ip_addr_str, rule_id)
+        encoded_imsi = encode_imsi(imsi)
+        ip_addr_str = _get_ip_addr_str(ip_addr)
         with self._lock:
-            version = self._version_by_imsi_and_rule.get(key)
+            versions = self._get_rule_versions_unsafe(encoded_imsi,
+                                                      ip_addr_str)
+            version = versions.get(rule_id)
             if version is None:
                 version = -1
         return version
@@ -148,21 +143,33 @@ class SessionRuleToVersionMapper:
         Removed the element from redis if the passed version matches the
         current one
         """
-        if ip_addr is None or ip_addr.address is None:
-            ip_addr_str = ""
-        else:
-            ip_addr_str = ip_addr.address.decode('utf-8').strip()
-        key = self._get_json_key(encode_imsi(imsi), ip_addr_str, rule_id)
+        encoded_imsi = encode_imsi(imsi)
+        ip_addr_str = _get_ip_addr_str(ip_addr)
         with self._lock:
-            cur_version = self._version_by_imsi_and_rule.get(key)
             if version is None:
                 return
-            if cur_version == version:
-                del self._version_by_imsi_and_rule[key]
+            versions = self._get_rule_versions_unsafe(encoded_imsi,
+                                                      ip_addr_str)
+            if versions.get(rule_id) != version:
+                return
+            del versions[rule_id]
+            # Drop empty session and subscriber entries
+            if not versions:
+                versions_by_ip = self._version_by_imsi_and_rule[encoded_imsi]
+                del versions_by_ip[ip_addr_str]
+                if not versions_by_ip:
+                    del self._version_by_imsi_and_rule[encoded_imsi]
+
+    def _get_rule_versions_unsafe(self, encoded_imsi: str, ip_addr: str):
+        """ NOT thread safe """
+        return self._version_by_imsi_and_rule.get(encoded_imsi, {}) \
+            .get(ip_addr, {})
+
 
-    def _get_json_key(self, imsi: str, ip_addr: str, rule_id: str):
-        return json.dumps(SubscriberRuleKey('imsi_rule', imsi, ip_addr,
-                                            rule_id))
+def _get_ip_addr_str(ip_addr: IPAddress) -> str:
+    if ip_addr is None or ip_addr.address is None:
+        return ""
+    return ip_addr.address.decode('utf-8').strip()
 
 
 class RuleIDDict(RedisFlatDict):
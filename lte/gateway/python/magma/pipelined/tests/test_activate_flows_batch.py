@@ -0,0 +1,273 @@
+"""
+Copyright 2020 The Magma Authors.
+
+This source code is licensed under the BSD-style license found in the
+LICENSE file in the root directory of this source tree.
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+
+import unittest
+from unittest.mock import MagicMock
+
+from lte.protos.pipelined_pb2 import (
+    ActivateFlowsBatchRequest,
+    ActivateFlowsRequest,
+    ActivateFlowsResult,
+    DeactivateFlowsBatchRequest,
+    DeactivateFlowsRequest,
+    RequestOriginType,
+    RuleModResult,
+    VersionedPolicy,
+)
+from lte.protos.policydb_pb2 import PolicyRule
+from lte.protos.subscriberdb_pb2 import SubscriberID
+from magma.pipelined.app.enforcement_stats import EnforcementStatsController
+from magma.pipelined.app.policy_mixin import PolicyActivation
+from magma.pipelined.openflow.exceptions import MagmaDPDisconnectedError
+from magma.pipelined.openflow.messages import MsgChannel, MsgReply
+from magma.pipelined.policy_converters import convert_ipv4_str_to_ip_proto
+from magma.pipelined.rpc_servicer import PipelinedRpcServicer
+
+IMSI1 = 'IMSI001010000000013'
+IMSI2 = 'IMSI001010000000014'
+IP1 = '192.168.128.74'
+IP2 = '192.168.128.75'
+
+
+def _policy(rule_id, version=1):
+    return VersionedPolicy(rule=PolicyRule(id=rule_id), version=version)
+
+
+def _results(activate_flows_result):
+    return [(res.rule_id, res.version, res.result)
+            for res in activate_flows_result.policy_results]
+
+
+class ActivateRulesBatchTest(unittest.TestCase):
+    """
+    Tests PolicyMixin.activate_rules_batch, with the messages sent to the
+    datapath and their replies mocked
+    """
+
+    def setUp(self):
+        controller = EnforcementStatsController.__new__(
+            EnforcementStatsController)
+        controller.logger = MagicMock()
+        controller._datapath = MagicMock()
+        controller._msg_hub = MagicMock()
+        controller._delete_flow = MagicMock()
+        controller._get_default_flow_msgs_for_subscriber = \
+            MagicMock(return_value=[])
+
+        def get_rule_install_msgs(imsi, msisdn, uplink_tunnel, ip_addr,
+                                  apn_ambr, rule, version):
+            if rule.id == 'invalid':
+                return [], RuleModResult.FAILURE
+            return ['%s_in' % rule.id, '%s_out' % rule.id], None
+        controller._get_rule_install_msgs = get_rule_install_msgs
+        self.controller = controller
+
+        self.ip1 = convert_ipv4_str_to_ip_proto(IP1)
+        self.ip2 = convert_ipv4_str_to_ip_proto(IP2)
+        self.activations = [
+            PolicyActivation(IMSI1, b'', 0, self.ip1, None,
+                             [_policy('rule1'), _policy('invalid')]),
+            PolicyActivation(IMSI2, b'', 0, self.ip2, None,
+                             [_policy('rule2', 2), _policy('rule3', 3)]),
+        ]
+
+    def _reply(self, *replies):
+        chan = MagicMock()
+        chan.get.side_effect = list(replies) + [MsgChannel.Timeout()]
+        self.controller._msg_hub.send_batch.return_value = chan
+
+    def test_results_in_request_order(self):
+        """
+        Every activation gets the results of its rules in order, and only
+        the rule whose flows failed is cleaned up
+        """
+        self._reply(
+            MsgReply((0, 0)), MsgReply((0, 0)),
+            MsgReply((1, 0)), MsgReply((1, 0), Exception('error')),
+            MsgReply((1, 1)), MsgReply((1, 1)),
+        )
+        results = self.controller.activate_rules_batch(self.activations)
+
+        msgs_by_txn = self.controller._msg_hub.send_batch.call_args[0][0]
+        self.assertEqual(msgs_by_txn, [
+            ((0, 0), ['rule1_in', 'rule1_out']),
+            ((1, 0), ['rule2_in', 'rule2_out']),
+            ((1, 1), ['rule3_in', 'rule3_out']),
+        ])
+        self.assertEqual(len(results), 2)
+        self.assertEqual(_results(results[0]), [
+            ('rule1', 1, RuleModResult.SUCCESS),
+            ('invalid', 1, RuleModResult.FAILURE),
+        ])
+        self.assertEqual(_results(results[1]), [
+            ('rule2', 2, RuleModResult.FAILURE),
+            ('rule3', 3, RuleModResult.SUCCESS),
+        ])
+        self.controller._delete_flow.assert_called_once_with(
+            IMSI2, self.ip2, 'rule2', 2)
+
+    def test_missing_replies(self):
+        """
+        Rules without a reply for all their flows fail and are cleaned up
+        """
+        self._reply(
+            MsgReply((0, 0)), MsgReply((0, 0)), MsgReply((1, 0)),
+        )
+        results = self.controller.activate_rules_batch(self.activations)
+
+        self.assertEqual(_results(results[0])[0],
+                         ('rule1', 1, RuleModResult.SUCCESS))
+        self.assertEqual(_results(results[1]), [
+            ('rule2', 2, RuleModResult.FAILURE),
+            ('rule3', 3, RuleModResult.FAILURE),
+        ])
+        self.assertEqual(self.controller._delete_flow.call_count, 2)
+        self.controller._delete_flow.assert_any_call(
+            IMSI2, self.ip2, 'rule2', 2)
+        self.controller._delete_flow.assert_any_call(
+            IMSI2, self.ip2, 'rule3', 3)
+
+    def test_datapath_disconnected(self):
+        """
+        All the rules with flows fail when the batch can't be sent
+        """
+        self.controller._msg_hub.send_batch.side_effect = \
+            MagmaDPDisconnectedError()
+        results = self.controller.activate_rules_batch(self.activations)
+
+        self.assertEqual([res for _, _, res in _results(results[0])],
+                         [RuleModResult.FAILURE, RuleModResult.FAILURE])
+        self.assertEqual([res for _, _, res in _results(results[1])],
+                         [RuleModResult.FAILURE, RuleModResult.FAILURE])
+        self.assertEqual(self.controller._delete_flow.call_count, 3)
+
+
+class FlowsBatchServicerTest(unittest.TestCase):
+    """
+    Tests the ActivateFlowsBatch and DeactivateFlowsBatch RPCs, with the
+    apps mocked
+    """
+
+    def setUp(self):
+        loop = MagicMock()
+        loop.call_soon_threadsafe = lambda cmd, *args: cmd(*args)
+        self.enforcement_stats = MagicMock()
+        self.enforcer_app = MagicMock()
+        self.gy_app = MagicMock()
+        self.service_manager = MagicMock()
+        self.service_manager.is_app_enabled.return_value = True
+        self.servicer = PipelinedRpcServicer(
+            loop, self.gy_app, self.enforcer_app, self.enforcement_stats,
+            None, None, None, None, None, None, None, None, None,
+            {'setup_type': 'LTE'}, self.service_manager,
+        )
+
+    @staticmethod
+    def _request(imsi, ip_addr, policies, origin=RequestOriginType.GX):
+        return ActivateFlowsRequest(
+            sid=SubscriberID(id=imsi), ip_addr=ip_addr, policies=policies,
+            request_origin=RequestOriginType(type=origin),
+        )
+
+    @staticmethod
+    def _activate_result(policies, result):
+        return ActivateFlowsResult(policy_results=[
+            RuleModResult(rule_id=policy.rule.id, version=policy.version,
+                          result=result)
+            for policy in policies
+        ])
+
+    def test_activate_flows_batch(self):
+        """
+        Rules failing in enforcement_stats aren't installed in enforcement,
+        and every request gets its results at its index
+        """
+        request = ActivateFlowsBatchRequest(requests=[
+            self._request(IMSI1, IP1, [_policy('rule1'), _policy('rule2')]),
+            self._request(IMSI2, '', [_policy('rule3')]),
+            self._request(IMSI2, IP2, [_policy('rule4')],
+                          RequestOriginType.GY),
+        ])
+
+        def stats_results(activations):
+            results = []
+            for activation in activations:
+                results.append(ActivateFlowsResult(policy_results=[
+                    RuleModResult(
+                        rule_id=policy.rule.id, version=policy.version,
+                        result=RuleModResult.FAILURE
+                        if policy.rule.id == 'rule2'
+                        else RuleModResult.SUCCESS,
+                    ) for policy in activation.policies
+                ]))
+            return results
+        self.enforcement_stats.activate_rules_batch.side_effect = \
+            stats_results
+        self.enforcer_app.activate_rules_batch.side_effect = \
+            lambda activations: [
+                self._activate_result(activation.policies,
+                                      RuleModResult.SUCCESS)
+                for activation in activations
+            ]
+        self.gy_app.activate_rules_batch.side_effect = \
+            lambda activations: [
+                self._activate_result(activation.policies,
+                                      RuleModResult.FAILURE)
+                for activation in activations
+            ]
+
+        ret = self.servicer.ActivateFlowsBatch(request, MagicMock())
+
+        stats_activations = \
+            self.enforcement_stats.activate_rules_batch.call_args[0][0]
+        self.assertEqual([a.imsi for a in stats_activations], [IMSI1, IMSI2])
+        gx_activations = \
+            self.enforcer_app.activate_rules_batch.call_args[0][0]
+        self.assertEqual(len(gx_activations), 1)
+        self.assertEqual([p.rule.id for p in gx_activations[0].policies],
+                         ['rule1'])
+        self.assertEqual(gx_activations[0].ip_addr,
+                         convert_ipv4_str_to_ip_proto(IP1))
+
+        self.assertEqual(len(ret.results), 3)
+        self.assertEqual(_results(ret.results[0]), [
+            ('rule1', 1, RuleModResult.SUCCESS),
+            ('rule2', 1, RuleModResult.FAILURE),
+        ])
+        self.assertEqual(_results(ret.results[1]), [])
+        self.assertEqual(_results(ret.results[2]), [
+            ('rule4', 1, RuleModResult.FAILURE),
+        ])
+
+    def test_deactivate_flows_batch(self):
+        """
+        Every request of the batch is deactivated, in order
+        """
+        request = DeactivateFlowsBatchRequest(requests=[
+            DeactivateFlowsRequest(sid=SubscriberID(id=IMSI1), ip_addr=IP1),
+            DeactivateFlowsRequest(sid=SubscriberID(id=IMSI2), ip_addr=IP2),
+        ])
+        self.servicer._deactivate_flows = MagicMock()
+
+        ret = self.servicer.DeactivateFlowsBatch(request, MagicMock())
+
+        self.assertEqual(len(ret.results), 2)
+        self.assertEqual(
+            [args[0][0].sid.id
+             for args in self.servicer._deactivate_flows.call_args_list],
+            [IMSI1, IMSI2],
+        )
+
+
+if __name__ == "__main__":
+    unittest.main()
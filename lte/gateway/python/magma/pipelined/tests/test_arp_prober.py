@@ -0,0 +1,150 @@
+"""
+Copyright 2020 The Magma Authors.
+
+This source code is licensed under the BSD-style license found in the
+LICENSE file in the root directory of this source tree.
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+
+import os
+import select
+import socket
+import subprocess
+import threading
+import time
+import unittest
+
+from magma.pipelined.arp_prober import (
+    ARP,
+    ARP_REPLY,
+    ETH_HEADER,
+    ETH_P_8021Q,
+    ETH_P_ALL,
+    ETH_P_ARP,
+    PACKET_AUXDATA,
+    SOL_PACKET,
+    TP_STATUS_VLAN_VALID,
+    TPACKET_AUXDATA,
+    VLAN_TAG,
+    ArpProber,
+)
+
+IFACE = 'arp_probe0'
+GW_IFACE = 'arp_probe1'
+GW_MACS = {
+    ('10.0.0.1', None): 'b2:a0:cc:85:80:01',
+    ('10.0.11.1', 11): 'b2:a0:cc:85:80:11',
+    ('10.0.12.1', 12): 'b2:a0:cc:85:80:12',
+}
+
+
+def _run_gateways(ready, stop):
+    """
+    Answer the ARP requests for GW_MACS on GW_IFACE, with the VLAN tag of
+    the request in the reply
+    """
+    sock = socket.socket(
+        socket.AF_PACKET, socket.SOCK_RAW, socket.htons(ETH_P_ALL),
+    )
+    sock.bind((GW_IFACE, ETH_P_ALL))
+    sock.setsockopt(SOL_PACKET, PACKET_AUXDATA, 1)
+    ready.set()
+    with sock:
+        while not stop.is_set():
+            readable, _, _ = select.select([sock], [], [], 0.1)
+            if not readable:
+                continue
+            data, ancdata, _, _ = sock.recvmsg(
+                2048, socket.CMSG_SPACE(TPACKET_AUXDATA.size),
+            )
+            vlan_id = None
+            for _, _, cmsg_data in ancdata:
+                status, _, _, _, _, tci, _ = \
+                    TPACKET_AUXDATA.unpack_from(cmsg_data)
+                if status & TP_STATUS_VLAN_VALID:
+                    vlan_id = tci & 0xfff
+            dst, src, ethertype = ETH_HEADER.unpack_from(data)
+            offset = ETH_HEADER.size
+            if ethertype == ETH_P_8021Q:
+                tci, ethertype = VLAN_TAG.unpack_from(data, offset)
+                vlan_id = tci & 0xfff
+                offset += VLAN_TAG.size
+            if ethertype != ETH_P_ARP:
+                continue
+            arp = ARP.unpack_from(data, offset)
+            gw_ip = socket.inet_ntoa(arp[8])
+            mac = GW_MACS.get((gw_ip, vlan_id))
+            if mac is None or arp[4] == ARP_REPLY:
+                continue
+            gw_mac = bytes.fromhex(mac.replace(':', ''))
+            if vlan_id is None:
+                eth = ETH_HEADER.pack(src, gw_mac, ETH_P_ARP)
+            else:
+                eth = ETH_HEADER.pack(src, gw_mac, ETH_P_8021Q) + \
+                    VLAN_TAG.pack(vlan_id, ETH_P_ARP)
+            sock.send(eth + ARP.pack(
+                1, 0x0800, 6, 4, ARP_REPLY, gw_mac, arp[8], arp[5], arp[6],
+            ))
+
+
+@unittest.skipIf(os.getuid(), reason="needs root user")
+class ArpProberTest(unittest.TestCase):
+    def setUp(self):
+        subprocess.check_call([
+            'ip', 'link', 'add', IFACE, 'type', 'veth', 'peer', 'name',
+            GW_IFACE,
+        ])
+        self.addCleanup(subprocess.call, ['ip', 'link', 'del', IFACE])
+        subprocess.check_call(['ip', 'link', 'set', IFACE, 'up'])
+        subprocess.check_call(['ip', 'link', 'set', GW_IFACE, 'up'])
+        ready = threading.Event()
+        stop = threading.Event()
+        gateways = threading.Thread(
+            target=_run_gateways, args=(ready, stop),
+        )
+        gateways.start()
+        self.addCleanup(gateways.join)
+        self.addCleanup(stop.set)
+        ready.wait()
+
+    def test_probe(self):
+        prober = ArpProber(IFACE, timeout=1)
+        targets = [
+            ('10.0.0.1', ''),
+            ('10.0.11.1', '11'),
+            ('10.0.12.1', '12'),
+            # No gateway answers for these
+            ('10.0.11.1', '12'),
+            ('10.0.0.9', ''),
+        ]
+        start = time.monotonic()
+        macs = prober.probe(targets)
+        elapsed = time.monotonic() - start
+        self.assertEqual(macs, {
+            ('10.0.0.1', ''): 'b2:a0:cc:85:80:01',
+            ('10.0.11.1', '11'): 'b2:a0:cc:85:80:11',
+            ('10.0.12.1', '12'): 'b2:a0:cc:85:80:12',
+        })
+        # The gateways are probed at once, within a single timeout
+        self.assertLess(elapsed, 1.5)
+
+    def test_all_answered(self):
+        prober = ArpProber(IFACE, timeout=5)
+        start = time.monotonic()
+        macs = prober.probe([('10.0.0.1', ''), ('10.0.11.1', '11')])
+        self.assertEqual(len(macs), 2)
+        # Replies are collected as they arrive
+        self.assertLess(time.monotonic() - start, 1)
+
+    def test_no_iface(self):
+        with self.assertRaises(OSError):
+            ArpProber('arp_probe_none').probe([('10.0.0.1', '')])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -14,13 +14,16 @@ limitations under the License.
 import ipaddress
 import os
 import socket
+import time
 import unittest
 import warnings
 from concurrent.futures import Future
-from unittest.mock import MagicMock
+from unittest.mock import MagicMock, patch
 
 from lte.protos.mobilityd_pb2 import IPAddress
-from lte.protos.pipelined_pb2 import IPFlowDL
+from lte.protos.pipelined_pb2 import (CauseIE, IPFlowDL, UESessionSet,
+                                      UESessionState)
+from lte.protos.subscriberdb_pb2 import SubscriberID
 from magma.pipelined.app.classifier import Classifier
 from magma.pipelined.bridge_util import BridgeTools
 from magma.pipelined.tests.app.start_pipelined import (PipelinedController,
@@ -231,6 +234,27 @@ class ClassifierTest(unittest.TestCase):
         with snapshot_verifier:
             pass
 
+    def test_gtp_port_cache(self):
+        enodeb_ip = "192.168.60.191"
+        ip_no = hex(socket.htonl(int(ipaddress.ip_address(enodeb_ip))))
+        buf = "g_{}".format(ip_no[2:])
+
+        # Ports added to the bridge are cached from the port events
+        BridgeTools.create_veth_pair(buf, buf + "ns")
+        BridgeTools.add_ovs_port(self.BRIDGE, buf, "42")
+        for _ in range(50):
+            if buf in self.classifier_controller._gtp_ofports:
+                break
+            time.sleep(0.1)
+        self.assertEqual(self.classifier_controller._gtp_ofports.get(buf), 42)
+
+        # and looked up without OVSDB round trips
+        with patch('magma.pipelined.app.classifier.Utils.get_ovs_bridge') \
+                as get_ovs_bridge:
+            self.assertEqual(
+                self.classifier_controller._get_gtp_ofport(enodeb_ip), 42)
+        get_ovs_bridge.assert_not_called()
+
     def test_attach_tunnel_flows_ipv6(self):
 
         # Need to delete all default flows in table 0 before
@@ -377,5 +401,85 @@ class ClassifierTest(unittest.TestCase):
             pass
 
 
+class ParkedGtpFlowsTest(unittest.TestCase):
+    """
+    Tests the tunnel flow changes waiting for the GTP port of an eNodeB,
+    with the datapath and OVS mocked
+    """
+    EnodeB_IP = "192.168.60.191"
+
+    def setUp(self):
+        controller = Classifier.__new__(Classifier)
+        controller.config = MagicMock(multi_tunnel_flag=True)
+        controller.logger = MagicMock()
+        controller._datapath = MagicMock()
+        controller._uplink_port = 1
+        controller._gtp_ofports = {}
+        controller._parked_gtp_flows = {}
+        controller._install_uplink_tunnel_flows = MagicMock()
+        controller._install_downlink_tunnel_flows = MagicMock()
+        controller._install_downlink_arp_flows = MagicMock()
+        self.controller = controller
+        self.port_name = controller._ip_addr_to_gtp_port_name(self.EnodeB_IP)
+        self.ue_ip = IPAddress(version=IPAddress.IPV4,
+                               address="192.168.128.30".encode('utf-8'))
+
+    def _add_tunnel_flows(self, done):
+        with patch('magma.pipelined.app.classifier.hub.spawn') as spawn:
+            res = self.controller.add_tunnel_flows(
+                65525, 1, 10000, self.ue_ip, self.EnodeB_IP, 5000,
+                done=done,
+            )
+        spawn.assert_called_once()
+        return res
+
+    def test_parked_flows_installed(self):
+        done = MagicMock()
+        self.assertIsNone(self._add_tunnel_flows(done))
+        self.controller._install_uplink_tunnel_flows.assert_not_called()
+        done.assert_not_called()
+
+        self.controller._set_gtp_ofport(self.port_name, 42)
+        self.controller._install_uplink_tunnel_flows.assert_called_once()
+        done.assert_called_once_with(True)
+
+    def test_parked_flows_dropped(self):
+        done = MagicMock()
+        self.assertIsNone(self._add_tunnel_flows(done))
+
+        with patch('magma.pipelined.app.classifier.Utils.get_ovs_bridge',
+                   return_value=None):
+            self.controller._add_gtp_port(self.port_name, self.EnodeB_IP)
+        self.controller._install_uplink_tunnel_flows.assert_not_called()
+        done.assert_called_once_with(False)
+
+    def test_mme_tunnel_request_response_once_installed(self):
+        request = UESessionSet(
+            subscriber_id=SubscriberID(id="IMSI001010000000013"),
+            precedence=65525, in_teid=1, out_teid=10000,
+            ue_ipv4_address=IPAddress(
+                version=IPAddress.IPV4,
+                address=socket.inet_aton("192.168.128.30"),
+            ),
+            enb_ip_address=IPAddress(
+                version=IPAddress.IPV4,
+                address=socket.inet_aton(self.EnodeB_IP),
+            ),
+            ue_session_state=UESessionState(
+                ue_config_state=UESessionState.ACTIVE),
+        )
+        done = MagicMock()
+        with patch('magma.pipelined.app.classifier.hub.spawn'):
+            self.assertIsNone(
+                self.controller.process_mme_tunnel_request(request, done))
+        done.assert_not_called()
+
+        self.controller._set_gtp_ofport(self.port_name, 42)
+        response = done.call_args[0][0]
+        self.assertEqual(response.cause_info.cause_ie,
+                         CauseIE.REQUEST_ACCEPTED)
+        self.assertEqual(response.operation_type, UESessionState.ACTIVE)
+
+
 if __name__ == "__main__":
     unittest.main()
@@ -24,7 +24,9 @@ from lte.protos.policydb_pb2 import (
     PolicyRule,
     RedirectInformation,
 )
+from lte.protos.session_manager_pb2 import RuleRecord
 from magma.pipelined.app.enforcement import EnforcementController
+from magma.pipelined.app.enforcement_stats import EnforcementStatsController
 from magma.pipelined.bridge_util import BridgeTools
 from magma.pipelined.policy_converters import (
     convert_ipv4_str_to_ip_proto,
@@ -729,7 +731,99 @@ class EnforcementStatsTest(unittest.TestCase):
         self.assertEqual(stats[enf_stat_name].rule_id,'rule1')
         self.enforcement_stats_controller._poll_stats = original
         self.assertEqual(len(stats), 1)
-        
-        
+
+
+class EnforcementStatsPartitionTest(unittest.TestCase):
+    """
+    Tests the handling of partitioned stats polls, without a datapath
+    """
+
+    def setUp(self):
+        controller = EnforcementStatsController.__new__(
+            EnforcementStatsController)
+        controller.logger = MagicMock()
+        controller._datapath = MagicMock()
+        controller._msg_hub = MagicMock()
+        controller._stats_poll_partitions = 2
+        controller._next_poll_partition = 0
+        controller._partitions_by_xid = {}
+        controller._records_by_partition = {}
+        controller._get_usage_from_flow_stat = MagicMock()
+        controller._report_usage = MagicMock()
+        self.controller = controller
+
+    @staticmethod
+    def _record(rule_id, bytes_tx):
+        return RuleRecord(sid='IMSI001010000000013', rule_id=rule_id,
+                          bytes_tx=bytes_tx)
+
+    def _handle(self, partition, usage):
+        self.controller._get_usage_from_flow_stat.return_value = usage
+        self.controller._handle_partition_flow_stats([[MagicMock()]],
+                                                     partition)
+        return self.controller._report_usage.call_args[0][0]
+
+    def test_report_all_partitions(self):
+        """
+        Every report holds the last records of all the partitions, and a
+        rule drops out once its partition is polled without its flows
+        """
+        rule1 = self._record('rule1', 10)
+        rule2 = self._record('rule2', 20)
+        self.assertEqual(self._handle(0, {'rule1': rule1}),
+                         {'rule1': rule1})
+        self.assertEqual(self._handle(1, {'rule2': rule2}),
+                         {'rule1': rule1, 'rule2': rule2})
+        self.assertEqual(self._handle(0, {}), {'rule2': rule2})
+        self.assertEqual(self.controller.total_usage, {'rule2': rule2})
+
+    def test_merge_records(self):
+        """
+        Records with the same key polled in different partitions are added
+        up, without changing the stored records
+        """
+        self._handle(0, {'rule1': self._record('rule1', 10)})
+        report = self._handle(1, {'rule1': self._record('rule1', 5)})
+        self.assertEqual(report['rule1'].bytes_tx, 15)
+        self.assertEqual(report['rule1'].rule_id, 'rule1')
+        report = self._handle(1, {'rule1': self._record('rule1', 7)})
+        self.assertEqual(report['rule1'].bytes_tx, 17)
+
+    def test_redis_unavailable(self):
+        """
+        A partition whose records can't be built keeps its last records
+        """
+        rule1 = self._record('rule1', 10)
+        self._handle(0, {'rule1': rule1})
+        self.controller._report_usage.reset_mock()
+        self.controller._get_usage_from_flow_stat.side_effect = \
+            ConnectionError()
+        self.controller._handle_partition_flow_stats([[MagicMock()]], 0)
+        self.controller._report_usage.assert_not_called()
+        self.assertEqual(self.controller._records_by_partition,
+                         {0: {'rule1': rule1}})
+
+    def test_prune_lost_requests(self):
+        """
+        Requests without a reply are dropped when their partition is polled
+        again, or when the switch returns an error for them
+        """
+        controller = self.controller
+        controller._poll_stats = MagicMock(side_effect=[
+            MagicMock(xid=1), MagicMock(xid=2), MagicMock(xid=3),
+        ])
+        controller._poll_next_partition()
+        controller._poll_next_partition()
+        self.assertEqual(controller._partitions_by_xid, {1: 0, 2: 1})
+        controller._poll_next_partition()
+        self.assertEqual(controller._partitions_by_xid, {2: 1, 3: 0})
+
+        ev = MagicMock()
+        ev.msg.xid = 2
+        controller._handle_error(ev)
+        self.assertEqual(controller._partitions_by_xid, {3: 0})
+        controller._msg_hub.handle_error.assert_called_once_with(ev)
+
+
 if __name__ == "__main__":
     unittest.main()
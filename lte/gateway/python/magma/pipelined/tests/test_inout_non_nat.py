@@ -58,6 +58,11 @@ def mocked_set_mobilityd_gw_info(ip: IPAddress, mac: str, vlan: str):
         gw_info_map[vlan] = gw_info
 
 
+def mocked_set_mobilityd_gw_info_list(gw_info_list: List[GWInfo]):
+    for gw_info in gw_info_list:
+        mocked_set_mobilityd_gw_info(gw_info.ip, gw_info.mac, gw_info.vlan)
+
+
 @unittest.skip("needs more investigation.")
 class InOutNonNatTest(unittest.TestCase):
     BRIDGE = 'testing_br'
@@ -117,7 +122,7 @@ class InOutNonNatTest(unittest.TestCase):
         cls = self.__class__
         super(InOutNonNatTest, cls).setUpClass()
         inout.get_mobilityd_gw_info = mocked_get_mobilityd_gw_info
-        inout.set_mobilityd_gw_info = mocked_set_mobilityd_gw_info
+        inout.set_mobilityd_gw_info_list = mocked_set_mobilityd_gw_info_list
 
         warnings.simplefilter('ignore')
         cls.setup_uplink_br()
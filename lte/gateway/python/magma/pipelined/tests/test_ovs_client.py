@@ -0,0 +1,318 @@
+"""
+Copyright 2020 The Magma Authors.
+
+This source code is licensed under the BSD-style license found in the
+LICENSE file in the root directory of this source tree.
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+
+import json
+import os
+import socket
+import struct
+import tempfile
+import threading
+import unittest
+from unittest import mock
+
+from magma.pipelined.bridge_util import BridgeTools, DatapathLookupError
+from magma.pipelined.ovs_client import (
+    OFP_HEADER,
+    OfFlowDump,
+    OvsClientError,
+    OvsdbClient,
+    format_flow,
+)
+from ryu.ofproto import ofproto_v1_4, ofproto_v1_4_parser
+
+BRIDGE_UUID = ['uuid', '00000000-0000-0000-0000-000000000001']
+PORT_UUID = ['uuid', '00000000-0000-0000-0000-000000000002']
+CTLR_UUIDS = [
+    ['uuid', '00000000-0000-0000-0000-000000000003'],
+    ['uuid', '00000000-0000-0000-0000-000000000004'],
+]
+
+TABLES = {
+    'Bridge': [{
+        '_uuid': BRIDGE_UUID,
+        'name': 'gtp_br0',
+        'datapath_id': '0000aa2c4d8e1f40',
+        'ports': PORT_UUID,
+        'controller': ['set', CTLR_UUIDS],
+    }],
+    'Port': [{'_uuid': PORT_UUID, 'name': 'gtp0'}],
+    'Interface': [
+        {'name': 'gtp0', 'ofport': 32768},
+        {'name': 'eth1', 'ofport': ['set', []]},
+    ],
+    'Controller': [
+        {'_uuid': CTLR_UUIDS[0], 'target': 'tcp:127.0.0.1:6654'},
+        {'_uuid': CTLR_UUIDS[1], 'target': 'tcp:127.0.0.1:6633'},
+    ],
+}
+
+
+def _serve(path, handler):
+    """ Serve the connections to a unix socket at path on a thread """
+    server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    server.bind(path)
+    server.listen(4)
+
+    def run():
+        while True:
+            try:
+                conn, _ = server.accept()
+            except OSError:
+                return
+            with conn:
+                handler(conn)
+
+    threading.Thread(target=run, daemon=True).start()
+    return server
+
+
+def _close(server):
+    if server.fileno() < 0:
+        return
+    # Closing the socket alone doesn't wake the thread blocked in accept
+    server.shutdown(socket.SHUT_RDWR)
+    server.close()
+
+
+def _ovsdb_handler(conn):
+    """
+    Answer an OVSDB transaction of select operations from TABLES, then
+    close the connection like a restarted ovsdb-server
+    """
+    decoder = json.JSONDecoder()
+    buf = ''
+    while True:
+        data = conn.recv(65536)
+        if not data:
+            return
+        buf += data.decode()
+        try:
+            request, end = decoder.raw_decode(buf)
+        except ValueError:
+            continue
+        results = []
+        for op in request['params'][1:]:
+            rows = [
+                {column: row[column] for column in op['columns']}
+                for row in TABLES[op['table']]
+                if all(row[col] == value for col, _, value in op['where'])
+            ]
+            results.append({'rows': rows})
+        conn.sendall(json.dumps({
+            'id': request['id'], 'result': results, 'error': None,
+        }).encode())
+        return
+
+
+def _flow_stats(priority, cookie):
+    match = ofproto_v1_4_parser.OFPMatch(in_port=1, eth_type=0x0800)
+    match_buf = bytearray()
+    match.serialize(match_buf, 0)
+    inst = ofproto_v1_4_parser.OFPInstructionGotoTable(table_id=2)
+    inst_buf = bytearray()
+    inst.serialize(inst_buf, 0)
+    length = ofproto_v1_4.OFP_FLOW_STATS_0_SIZE + len(match_buf) + \
+        len(inst_buf)
+    return struct.pack(
+        ofproto_v1_4.OFP_FLOW_STATS_0_PACK_STR,
+        length, 1, 10, 0, priority, 0, 0, 0, 0, cookie, 5, 500,
+    ) + match_buf + inst_buf
+
+
+def _switch_handler(num_flows, flows_per_reply):
+    """
+    Answer the hello and flow stats request of a dump with num_flows flows,
+    in multipart replies of flows_per_reply flows. An echo request is sent
+    before the replies.
+    """
+
+    def handler(conn):
+        reader = conn.makefile('rb')
+        conn.sendall(OFP_HEADER.pack(
+            ofproto_v1_4.OFP_VERSION, ofproto_v1_4.OFPT_HELLO,
+            OFP_HEADER.size, 1,
+        ))
+        xid = None
+        while xid is None:
+            _, msg_type, length, msg_xid = OFP_HEADER.unpack(
+                reader.read(OFP_HEADER.size),
+            )
+            reader.read(length - OFP_HEADER.size)
+            if msg_type == ofproto_v1_4.OFPT_MULTIPART_REQUEST:
+                xid = msg_xid
+        conn.sendall(OFP_HEADER.pack(
+            ofproto_v1_4.OFP_VERSION, ofproto_v1_4.OFPT_ECHO_REQUEST,
+            OFP_HEADER.size, 2,
+        ))
+        for start in range(0, max(num_flows, 1), flows_per_reply):
+            end = min(start + flows_per_reply, num_flows)
+            body = b''.join(
+                _flow_stats(index, index) for index in range(start, end)
+            )
+            flags = ofproto_v1_4.OFPMPF_REPLY_MORE if end < num_flows else 0
+            conn.sendall(
+                OFP_HEADER.pack(
+                    ofproto_v1_4.OFP_VERSION,
+                    ofproto_v1_4.OFPT_MULTIPART_REPLY,
+                    ofproto_v1_4.OFP_MULTIPART_REPLY_SIZE + len(body), xid,
+                ) + struct.pack(
+                    ofproto_v1_4.OFP_MULTIPART_REPLY_PACK_STR,
+                    ofproto_v1_4.OFPMP_FLOW, flags,
+                ) + body,
+            )
+        # The echo reply is read before closing
+        reader.read(OFP_HEADER.size)
+
+    return handler
+
+
+class OvsdbClientTest(unittest.TestCase):
+    def setUp(self):
+        self._dir = tempfile.TemporaryDirectory()
+        path = os.path.join(self._dir.name, 'db.sock')
+        self._server = _serve(path, _ovsdb_handler)
+        self._ovsdb = OvsdbClient(path, timeout=1)
+        patcher = mock.patch.object(BridgeTools, 'ovsdb', self._ovsdb)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def tearDown(self):
+        self._ovsdb.close()
+        _close(self._server)
+        self._dir.cleanup()
+
+    def test_bridge_lookups(self):
+        self.assertEqual(
+            BridgeTools.get_datapath_id('gtp_br0'), 0xaa2c4d8e1f40,
+        )
+        self.assertEqual(BridgeTools.get_ofport('gtp0'), 32768)
+        self.assertTrue(BridgeTools.port_is_in_bridge('gtp_br0', 'gtp0'))
+        self.assertFalse(BridgeTools.port_is_in_bridge('gtp_br0', 'eth1'))
+        self.assertFalse(BridgeTools.port_is_in_bridge('uplink_br0', 'gtp0'))
+        self.assertEqual(
+            BridgeTools.get_controllers_for_bridge('gtp_br0'),
+            ['tcp:127.0.0.1:6633', 'tcp:127.0.0.1:6654'],
+        )
+
+    def test_lookup_errors(self):
+        with self.assertRaises(DatapathLookupError):
+            BridgeTools.get_datapath_id('testing_br')
+        with self.assertRaises(DatapathLookupError):
+            BridgeTools.get_ofport('eth1')
+        with self.assertRaises(DatapathLookupError):
+            BridgeTools.get_ofport('eth2')
+
+    def test_reconnect(self):
+        self.assertEqual(BridgeTools.get_ofport('gtp0'), 32768)
+        # The server closed the kept connection after the first transaction
+        self.assertEqual(BridgeTools.get_ofport('gtp0'), 32768)
+        _close(self._server)
+        with self.assertRaises(OvsClientError):
+            self._ovsdb.select('Interface', [], ['name'])
+
+
+class OfFlowDumpTest(unittest.TestCase):
+    def setUp(self):
+        self._dir = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self._dir.cleanup()
+
+    def _dump(self, num_flows, flows_per_reply=100, table_num=None):
+        server = _serve(
+            os.path.join(self._dir.name, 'gtp_br0.mgmt'),
+            _switch_handler(num_flows, flows_per_reply),
+        )
+        try:
+            dump = OfFlowDump('gtp_br0', rundir=self._dir.name, timeout=1)
+            return list(dump.iter_flows(table_num))
+        finally:
+            _close(server)
+            os.unlink(os.path.join(self._dir.name, 'gtp_br0.mgmt'))
+
+    def test_multipart_dump(self):
+        flows = self._dump(250, flows_per_reply=100)
+        self.assertEqual(len(flows), 250)
+        self.assertEqual([flow.priority for flow in flows], list(range(250)))
+        flow = flows[7]
+        self.assertEqual(flow.table_id, 1)
+        self.assertEqual(flow.cookie, 7)
+        self.assertEqual(flow.packet_count, 5)
+        self.assertEqual(flow.match['in_port'], 1)
+        self.assertEqual(flow.instructions[0].table_id, 2)
+
+    def test_format_dumped_flow(self):
+        flow = self._dump(1)[0]
+        self.assertEqual(
+            format_flow(flow),
+            'cookie=0x0, duration=10.000s, table=1, n_packets=5, '
+            'n_bytes=500, priority=0,in_port=1,eth_type=2048 '
+            'actions=goto_table:2',
+        )
+
+    def test_empty_dump(self):
+        self.assertEqual(self._dump(0, table_num=3), [])
+
+    def test_no_bridge(self):
+        dump = OfFlowDump('gtp_br0', rundir=self._dir.name, timeout=1)
+        with self.assertRaises(OvsClientError):
+            list(dump.iter_flows())
+
+
+class FormatFlowTest(unittest.TestCase):
+    def test_actions(self):
+        parser = ofproto_v1_4_parser
+        flow = parser.OFPFlowStats(
+            table_id=3, duration_sec=12, duration_nsec=345678901,
+            priority=10, cookie=0x1F, packet_count=2, byte_count=120,
+            match=parser.OFPMatch(
+                in_port=1, metadata=(0x12345678, 0xFFFFFFFF),
+            ),
+            instructions=[parser.OFPInstructionActions(
+                ofproto_v1_4.OFPIT_APPLY_ACTIONS, [
+                    parser.OFPActionSetField(eth_dst='aa:bb:cc:dd:ee:ff'),
+                    parser.NXActionNote(note=[0x61, 0x62, 0, 0, 0, 0]),
+                    parser.NXActionResubmitTable(
+                        in_port=ofproto_v1_4.OFPP_IN_PORT, table_id=4,
+                    ),
+                    parser.OFPActionOutput(
+                        ofproto_v1_4.OFPP_CONTROLLER, max_len=128,
+                    ),
+                ],
+            )],
+        )
+        self.assertEqual(
+            format_flow(flow),
+            'cookie=0x1f, duration=12.345s, table=3, n_packets=2, '
+            'n_bytes=120, priority=10,in_port=1,'
+            'metadata=0x12345678/0xffffffff '
+            'actions=set_field:aa:bb:cc:dd:ee:ff->eth_dst,'
+            'note:61.62.00.00.00.00,resubmit(,4),CONTROLLER:128',
+        )
+
+    def test_no_actions(self):
+        parser = ofproto_v1_4_parser
+        flow = parser.OFPFlowStats(
+            table_id=0, duration_sec=0, duration_nsec=0, priority=0,
+            cookie=0, packet_count=0, byte_count=0, match=parser.OFPMatch(),
+            instructions=[],
+        )
+        self.assertEqual(
+            format_flow(flow),
+            'cookie=0x0, duration=0.000s, table=0, n_packets=0, n_bytes=0, '
+            'priority=0 actions=drop',
+        )
+
+
+if __name__ == "__main__":
+    unittest.main()
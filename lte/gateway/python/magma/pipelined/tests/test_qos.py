@@ -254,6 +254,7 @@ get_action_instruction"
         qos_mgr.remove_subscriber_qos(imsi, rule_num)
         self.assertTrue(len(qos_mgr._redis_store) == 0)
         self.assertTrue(imsi not in qos_mgr._subscriber_state)
+        self.assertFalse(qos_mgr._subscriber_locks)
 
         if self.config["qos"]["impl"] == QosImplType.OVS_METER:
             self.verifyMeterRemoveQos(mock_meter_cls, FlowMatch.UPLINK, ul_exp_id)
@@ -1099,3 +1100,31 @@ class TestSubscriberState(unittest.TestCase):
         assert(len(session) == 1)
         subscriber_state.remove_session(session[0].ip_addr)
         assert(subscriber_state.check_empty())
+
+    def testSharedLeafRefCount(self, ):
+        ip_addr = '1.1.1.1'
+        d = FlowMatch.UPLINK
+        ambr_qos_handle, leaf_qos_handle = 5, 6
+        qos_store = {}
+
+        # two dedicated bearers under the same APN AMBR leaf
+        subscriber_state = SubscriberState('IMSI101', qos_store)
+        session = subscriber_state.get_or_create_session(ip_addr)
+        session.set_ambr(d, ambr_qos_handle, leaf_qos_handle)
+        subscriber_state.update_rule(ip_addr, 1, d, 10, ambr_qos_handle,
+                                     leaf_qos_handle)
+        subscriber_state.update_rule(ip_addr, 2, d, 20, ambr_qos_handle,
+                                     leaf_qos_handle)
+        self.assertEqual(subscriber_state.qid_refs, {6: 2, 10: 1, 20: 1})
+        self.assertEqual(len(qos_store), 2)
+
+        # leaf is still used by rule 2
+        self.assertEqual(subscriber_state.remove_rule(1), {10: d})
+        self.assertEqual(subscriber_state.qid_refs, {6: 1, 20: 1})
+        self.assertEqual(len(qos_store), 1)
+
+        self.assertEqual(subscriber_state.remove_rules([2]), {20: d, 6: d})
+        self.assertFalse(subscriber_state.qid_refs)
+        self.assertFalse(qos_store)
+        self.assertEqual(len(subscriber_state.get_all_empty_sessions()), 1)
+
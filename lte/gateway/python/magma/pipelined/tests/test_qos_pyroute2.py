@@ -1,4 +1,6 @@
+import errno
 import logging
+import os
 import pprint
 import socket
 import subprocess
@@ -8,6 +10,7 @@ import unittest
 
 from magma.pipelined.bridge_util import BridgeTools
 from magma.pipelined.qos.qos_tc_impl import TrafficClass
+from magma.pipelined.qos.tc_ops_batch import TcOpsBatch
 from magma.pipelined.qos.tc_ops_cmd import TcOpsCmd
 from magma.pipelined.qos.tc_ops_pyroute2 import TcOpsPyRoute2
 from pyroute2 import IPRoute, NetlinkError, protocols
@@ -18,6 +21,23 @@ QUEUE_PREFIX = '1:'
 PROTOCOL = 3
 
 
+def _cls_fw_available():
+    if os.path.isdir('/sys/module/cls_fw'):
+        return True
+    try:
+        return subprocess.call(
+            ['modprobe', '-q', 'cls_fw'], stderr=subprocess.DEVNULL,
+        ) == 0
+    except OSError:
+        return False
+
+
+skip_without_cls_fw = unittest.skipUnless(
+    os.geteuid() == 0 and _cls_fw_available(),
+    'requires root and the cls_fw kernel module',
+)
+
+
 class TcSetypTest(unittest.TestCase):
     BRIDGE = 'testing_qos'
     IFACE = 'dev_qos'
@@ -166,6 +186,74 @@ class TcSetypTest(unittest.TestCase):
         self.assertEqual(err, 0)
         self.assertEqual(err1, 0)
 
+    @skip_without_cls_fw
+    def test_batch(self):
+        cls = self.__class__
+        t1 = TcOpsBatch()
+        self.addCleanup(t1.close)
+        iface = cls.IFACE
+        max_bw = 10000
+        rate = 1000
+        errs = []
+
+        t1.create_class(iface, 0xae, max_bw, rate, 0xfffe, callback=errs.append)
+        t1.create_class(iface, 0x1ae, max_bw, rate, 0xae, callback=errs.append)
+        t1.flush()
+        self.assertEqual(errs, [0, 0])
+        self.assertTrue(self.check_qid_in_tc("0xae"))
+        self.assertTrue(self.check_qid_in_tc("0x1ae"))
+        classes = t1.read_all_classes(iface)
+        self.assertIn((0xae, 0xfffe), classes)
+        self.assertIn((0x1ae, 0xae), classes)
+
+        t1.delete_class(iface, 0x1ae, callback=errs.append)
+        t1.delete_class(iface, 0xae, callback=errs.append)
+        t1.flush()
+        self.assertEqual(errs, [0, 0, 0, 0])
+        self.assertFalse(self.check_qid_in_tc("0xae"))
+        self.assertFalse(self.check_qid_in_tc("0x1ae"))
+        self.assertNotIn((0xae, 0xfffe), t1.read_all_classes(iface))
+
+    @skip_without_cls_fw
+    def test_batch_error(self):
+        cls = self.__class__
+        t1 = TcOpsBatch()
+        self.addCleanup(t1.close)
+        iface = cls.IFACE
+        errs = []
+
+        # Second create of the same class, then delete of a missing class
+        t1.create_class(iface, 0xae, 10000, 1000, 0xfffe, callback=errs.append)
+        t1.create_class(iface, 0xae, 10000, 1000, 0xfffe, callback=errs.append)
+        t1.delete_class(iface, 0xae, callback=errs.append)
+        t1.delete_class(iface, 0xae, callback=errs.append)
+        t1.flush()
+        self.assertEqual(errs[0], 0)
+        self.assertEqual(errs[1], -errno.EEXIST)
+        self.assertEqual(errs[2], 0)
+        self.assertEqual(errs[3], -errno.ENOENT)
+
+    @skip_without_cls_fw
+    def test_batch_filter_after_class(self):
+        cls = self.__class__
+        t1 = TcOpsBatch()
+        self.addCleanup(t1.close)
+        iface = cls.IFACE
+        errs = []
+
+        # Missing parent, the class and so its filter aren't created
+        t1.create_class(iface, 0xae, 10000, 1000, 0xaf, callback=errs.append)
+        t1.flush()
+        self.assertEqual(errs, [-errno.ENOENT])
+        self.assertFalse(self.check_qid_in_tc("0xae"))
+
+        # Filter of a class created and deleted in the same batch
+        t1.create_class(iface, 0xae, 10000, 1000, 0xfffe, callback=errs.append)
+        t1.delete_class(iface, 0xae, callback=errs.append)
+        t1.flush()
+        self.assertEqual(errs[1:], [0, 0])
+        self.assertFalse(self.check_qid_in_tc("0xae"))
+
 
 if __name__ == "__main__":
     unittest.main()
@@ -104,5 +104,35 @@ class RuleMappersTest(unittest.TestCase):
                 imsi, None, rule_ids[1]),
             -1)
 
+    def test_session_rule_version_mapper_remove(self):
+        imsi = 'IMSI12345'
+        other_imsi = 'IMSI54321'
+        ip_addr1 = convert_ipv4_str_to_ip_proto('1.2.3.4')
+        ip_addr2 = convert_ipv4_str_to_ip_proto('1.2.3.5')
+        mapper = self._session_rule_version_mapper
+        mapper.save_version(imsi, ip_addr1, 'rule1', 1)
+        mapper.save_version(imsi, ip_addr2, 'rule1', 1)
+        mapper.save_version(other_imsi, ip_addr1, 'rule1', 1)
+
+        # Only remove the rule if the version matches
+        mapper.remove(imsi, ip_addr1, 'rule1', 2)
+        self.assertEqual(mapper.get_version(imsi, ip_addr1, 'rule1'), 1)
+        mapper.remove(imsi, ip_addr1, 'rule1', 1)
+        self.assertEqual(mapper.get_version(imsi, ip_addr1, 'rule1'), -1)
+        self.assertEqual(mapper.get_version(imsi, ip_addr2, 'rule1'), 1)
+
+        # Removing all versions of a session doesn't affect other sessions
+        mapper.save_version(imsi, ip_addr1, 'rule2', 1)
+        mapper.remove_all_ue_versions(imsi, ip_addr1)
+        self.assertEqual(mapper.get_version(imsi, ip_addr1, 'rule2'), -1)
+        self.assertEqual(mapper.get_version(imsi, ip_addr2, 'rule1'), 1)
+        self.assertEqual(mapper.get_version(other_imsi, ip_addr1, 'rule1'), 1)
+
+        # Removing without an ip removes all sessions of the subscriber
+        mapper.remove_all_ue_versions(imsi, None)
+        self.assertEqual(mapper.get_version(imsi, ip_addr2, 'rule1'), -1)
+        self.assertEqual(mapper.get_version(other_imsi, ip_addr1, 'rule1'), 1)
+
+
 if __name__ == "__main__":
     unittest.main()
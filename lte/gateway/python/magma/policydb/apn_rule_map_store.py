@@ -30,6 +30,7 @@ class ApnRuleAssignmentsDict(RedisHashDict):
           ie. IMSI1234 instead of 1234
     """
     _DICT_HASH = "policydb:apn_installed"
+    _NOTIFY_CHANNEL = "policydb:apn_installed:stream_update"
 
     def __init__(self):
         client = get_default_client()
@@ -40,3 +41,13 @@ class ApnRuleAssignmentsDict(RedisHashDict):
             get_proto_deserializer(SubscriberPolicySet),
         )
         self._clear()
+        # Bumped on each notification, see SessionPolicyIndex
+        self.update_version = 0
+
+    def send_update_notification(self):
+        """
+        Use Redis pub/sub channels to send notifications. Subscribers can listen
+        to this channel to know when an update is done
+        """
+        self.update_version += 1
+        self.redis.publish(self._NOTIFY_CHANNEL, "Stream Update")
@@ -37,12 +37,15 @@ class RatingGroupsDict(RedisHashDict):
             get_proto_serializer(),
             get_proto_deserializer(RatingGroup),
         )
+        # Bumped on each notification, see SessionPolicyIndex
+        self.update_version = 0
 
     def send_update_notification(self):
         """
         Use Redis pub/sub channels to send notifications. Subscribers can listen
         to this channel to know when an update is done to the policy store
         """
+        self.update_version += 1
         self.redis.publish(self._NOTIFY_CHANNEL, "Stream Update")
 
     def __missing__(self, key):
@@ -12,14 +12,10 @@ limitations under the License.
 """
 
 import logging
-from typing import List, Set
+from typing import List
 
 from lte.protos.mconfig import mconfigs_pb2
-from lte.protos.policydb_pb2 import (
-    ApnPolicySet,
-    RatingGroup,
-    SubscriberPolicySet,
-)
+from lte.protos.policydb_pb2 import RatingGroup
 from lte.protos.session_manager_pb2 import (
     CreateSessionRequest,
     CreateSessionResponse,
@@ -39,6 +35,7 @@ from magma.policydb.apn_rule_map_store import ApnRuleAssignmentsDict
 from magma.policydb.basename_store import BaseNameDict
 from magma.policydb.default_rules import get_allow_all_policy_rule
 from magma.policydb.rating_group_store import RatingGroupsDict
+from magma.policydb.session_policy_index import SessionPolicyIndex
 from orc8r.protos.common_pb2 import NetworkID
 
 
@@ -55,6 +52,9 @@ class SessionRpcServicer(CentralSessionControllerServicer):
 
     This limited PCRF/OCS is also used for enabling the Captive Portal
     feature.
+
+    The stores are looked up through a SessionPolicyIndex, so sessions are
+    created without Redis round trips between stream updates.
     """
 
     def __init__(
@@ -66,23 +66,21 @@ class SessionRpcServicer(CentralSessionControllerServicer):
     ):
         self._mconfig = mconfig
         self._network_id = NetworkID(id="_")
-        self._rating_groups_by_id = rating_groups_by_id
-        self._rules_by_basename = rules_by_basename
-        self._apn_rules_by_sid = apn_rules_by_sid
+        self._policy_index = SessionPolicyIndex(
+            rating_groups_by_id,
+            rules_by_basename,
+            apn_rules_by_sid,
+        )
 
     def get_infinite_credit_charging_keys(self) -> List[int]:
-        keys = []
-        for rating_group in self._rating_groups_by_id.values():
-            if rating_group.limit_type == RatingGroup.INFINITE_UNMETERED:
-                keys.append(rating_group.id)
-        return keys
+        return self._policy_index.get_charging_keys(
+            RatingGroup.INFINITE_UNMETERED,
+        )
 
     def _get_postpay_charging_keys(self) -> List[int]:
-        keys = []
-        for rating_group in self._rating_groups_by_id.values():
-            if rating_group.limit_type == RatingGroup.INFINITE_METERED:
-                keys.append(rating_group.id)
-        return keys
+        return self._policy_index.get_charging_keys(
+            RatingGroup.INFINITE_METERED,
+        )
 
     def add_to_server(self, server):
         """ Add the servicer to a gRPC server """
@@ -166,67 +164,16 @@ class SessionRpcServicer(CentralSessionControllerServicer):
         Get the list of static rules to be installed for a subscriber
         NOTE: Remove "IMSI" prefix from imsi argument.
         """
-        if imsi not in self._apn_rules_by_sid:
-            return []
-
-        sub_apn_policies = self._apn_rules_by_sid[imsi]
-        assigned_static_rules = []  # type: List[StaticRuleInstall]
-        # Add global rules
-        global_rules = self._get_global_static_rules(sub_apn_policies)
-        assigned_static_rules += \
-            list(
-                map(
-                    lambda id: StaticRuleInstall(rule_id=id),
-                    global_rules,
-                ),
-            )
-        # Add APN specific rules
-        for apn_policy_set in sub_apn_policies.rules_per_apn:
-            if apn_policy_set.apn != apn:
-                continue
-            # Only add rules if the APN matches
-            static_rule_ids = self._get_static_rules(apn_policy_set)
-            assigned_static_rules +=\
-                list(
-                    map(
-                        lambda id: StaticRuleInstall(rule_id=id),
-                        static_rule_ids,
-                    ),
-                )
-
-        return assigned_static_rules
-
-    def _get_global_static_rules(
-        self,
-        sub_apn_policies: SubscriberPolicySet,
-    ) -> Set[str]:
-        global_rules = set(sub_apn_policies.global_policies)
-        for basename in sub_apn_policies.global_base_names:
-            if basename not in self._rules_by_basename:
-                # Eventually, basename definition will be streamed from orc8r
-                continue
-            global_rules.update(
-                self._rules_by_basename[basename].RuleNames,
-            )
-        return global_rules
-
-    def _get_static_rules(
-        self,
-        policies: ApnPolicySet,
-    ) -> Set[str]:
-        desired_rules = set(policies.assigned_policies)
-        for basename in policies.assigned_base_names:
-            if basename not in self._rules_by_basename:
-                # Eventually, basename definition will be streamed from orc8r
-                continue
-            desired_rules.update(
-                self._rules_by_basename[basename].RuleNames,
-            )
-        return desired_rules
+        return [
+            StaticRuleInstall(rule_id=rule_id)
+            for rule_id in self._policy_index.get_static_rules(imsi, apn)
+        ]
 
     def _get_credits(self, sid: str) -> List[CreditUpdateResponse]:
         infinite_credit_keys = self.get_infinite_credit_charging_keys()
         postpay_keys = self._get_postpay_charging_keys()
+        infinite_unmetered = CreditLimitType.Value("INFINITE_UNMETERED")
+        infinite_metered = CreditLimitType.Value("INFINITE_METERED")
         credit_updates = []
         for charging_key in infinite_credit_keys:
             credit_updates.append(
@@ -234,7 +181,7 @@ class SessionRpcServicer(CentralSessionControllerServicer):
                     success=True,
                     sid=sid,
                     charging_key=charging_key,
-                    limit_type=CreditLimitType.Value("INFINITE_UNMETERED"),
+                    limit_type=infinite_unmetered,
                 ),
             )
         for charging_key in postpay_keys:
@@ -243,7 +190,7 @@ class SessionRpcServicer(CentralSessionControllerServicer):
                     success=True,
                     sid=sid,
                     charging_key=charging_key,
-                    limit_type=CreditLimitType.Value("INFINITE_METERED"),
+                    limit_type=infinite_metered,
                 ),
             )
         return credit_updates
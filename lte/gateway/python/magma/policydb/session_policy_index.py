@@ -0,0 +1,159 @@
+"""
+Copyright 2020 The Magma Authors.
+
+This source code is licensed under the BSD-style license found in the
+LICENSE file in the root directory of this source tree.
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+from collections import defaultdict
+from typing import Dict, List, Mapping, Optional, Tuple
+
+from lte.protos.policydb_pb2 import (
+    ChargingRuleNameSet,
+    RatingGroup,
+    SubscriberPolicySet,
+)
+
+
+def get_update_version(store: Mapping) -> Optional[int]:
+    """
+    Return the version the store's send_update_notification stamped it with,
+    or None if the store isn't versioned, e.g. a plain dict
+    """
+    return getattr(store, 'update_version', None)
+
+
+class _IndexSnapshot(object):
+    """
+    Contents of the policy stores at a set of versions
+    """
+
+    def __init__(
+        self,
+        charging_keys: Dict[int, List[int]],
+        rules_by_basename: Dict[str, ChargingRuleNameSet],
+        apn_rules_by_sid: Dict[str, SubscriberPolicySet],
+    ):
+        self.charging_keys = charging_keys
+        self.rules_by_basename = rules_by_basename
+        self.apn_rules_by_sid = apn_rules_by_sid
+        # (sid, apn) => static rule ids, filled on first lookup
+        self.static_rules = {}  # type: Dict[Tuple[str, str], List[str]]
+
+
+class SessionPolicyIndex(object):
+    """
+    In-memory index of the policy stores read on session creation: the
+    rating group ids by limit type, the rules of each base name and the
+    APN rule assignments of each subscriber.
+
+    The stores are read in full when the index is built, so lookups are
+    served without Redis round trips. The index is stamped with the update
+    versions of the stores, which their send_update_notification bumps once
+    a stream update is written, and is rebuilt on the first lookup after
+    any of them changed. Stores without versions are read on every lookup.
+    """
+
+    def __init__(
+        self,
+        rating_groups_by_id: Mapping[int, RatingGroup],
+        rules_by_basename: Mapping[str, ChargingRuleNameSet],
+        apn_rules_by_sid: Mapping[str, SubscriberPolicySet],
+    ):
+        self._rating_groups_by_id = rating_groups_by_id
+        self._rules_by_basename = rules_by_basename
+        self._apn_rules_by_sid = apn_rules_by_sid
+        self._versions = None
+        self._snapshot = None
+
+    def get_charging_keys(self, limit_type: int) -> List[int]:
+        """
+        Return the ids of the rating groups with limit_type
+        """
+        return self._get_snapshot().charging_keys.get(limit_type, [])
+
+    def get_static_rules(self, sid: str, apn: str) -> List[str]:
+        """
+        Return the ids of the static rules to install for a session of sid
+        on apn: the subscriber's global rules followed by those assigned for
+        apn, with base names expanded to their rules
+        """
+        snapshot = self._get_snapshot()
+        key = (sid, apn)
+        rule_ids = snapshot.static_rules.get(key)
+        if rule_ids is None:
+            rule_ids = self._build_static_rules(snapshot, sid, apn)
+            snapshot.static_rules[key] = rule_ids
+        return rule_ids
+
+    def _get_snapshot(self) -> _IndexSnapshot:
+        # Read the versions before the stores, so updates written while
+        # building are picked up by the next lookup
+        versions = (
+            get_update_version(self._rating_groups_by_id),
+            get_update_version(self._rules_by_basename),
+            get_update_version(self._apn_rules_by_sid),
+        )
+        snapshot = self._snapshot
+        if snapshot is None or None in versions or \
+                versions != self._versions:
+            snapshot = self._build_snapshot()
+            self._snapshot = snapshot
+            self._versions = versions
+        return snapshot
+
+    def _build_snapshot(self) -> _IndexSnapshot:
+        charging_keys = defaultdict(list)  # type: Dict[int, List[int]]
+        for rating_group in self._rating_groups_by_id.values():
+            if rating_group is not None:
+                charging_keys[rating_group.limit_type].append(rating_group.id)
+        return _IndexSnapshot(
+            dict(charging_keys),
+            dict(self._rules_by_basename.items()),
+            dict(self._apn_rules_by_sid.items()),
+        )
+
+    def _build_static_rules(
+        self,
+        snapshot: _IndexSnapshot,
+        sid: str,
+        apn: str,
+    ) -> List[str]:
+        sub_apn_policies = snapshot.apn_rules_by_sid.get(sid)
+        if sub_apn_policies is None:
+            return []
+        # Add global rules
+        rule_ids = list(
+            self._expand(
+                snapshot,
+                sub_apn_policies.global_policies,
+                sub_apn_policies.global_base_names,
+            ),
+        )
+        # Add APN specific rules
+        for apn_policy_set in sub_apn_policies.rules_per_apn:
+            if apn_policy_set.apn == apn:
+                rule_ids.extend(
+                    self._expand(
+                        snapshot,
+                        apn_policy_set.assigned_policies,
+                        apn_policy_set.assigned_base_names,
+                    ),
+                )
+        return rule_ids
+
+    @staticmethod
+    def _expand(snapshot: _IndexSnapshot, policies, basenames):
+        rule_ids = set(policies)
+        for basename in basenames:
+            rule_set = snapshot.rules_by_basename.get(basename)
+            if rule_set is None:
+                # Eventually, basename definition will be streamed from orc8r
+                continue
+            rule_ids.update(rule_set.RuleNames)
+        return rule_ids
@@ -12,7 +12,8 @@ limitations under the License.
 """
 
 import logging
-from typing import Any, List, Set
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, Hashable, List, Set
 
 import grpc
 from lte.protos.policydb_pb2 import (
@@ -38,6 +39,24 @@ from magma.policydb.rating_group_store import RatingGroupsDict
 from magma.policydb.rule_store import PolicyRuleDict
 from orc8r.protos.streamer_pb2 import DataUpdate
 
+# Bounds of the SessionRules pushed to sessiond in one SetSessionRules call,
+# so pushes of large networks complete within PUSH_TIMEOUT
+MAX_PUSH_SUBSCRIBERS = 1000
+MAX_PUSH_BYTES = 1024 * 1024
+PUSH_CONCURRENCY = 4
+PUSH_RETRIES = 2
+PUSH_TIMEOUT = 5
+
+
+def _send_update_notification(store):
+    """
+    Notify that a stream update was written to store, which invalidates the
+    SessionPolicyIndex. Plain dicts, as used in tests, have no notification.
+    """
+    send_update_notification = getattr(store, 'send_update_notification', None)
+    if send_update_notification is not None:
+        send_update_notification()
+
 
 class PolicyDBStreamerCallback(StreamerClient.Callback):
     """
@@ -105,12 +124,38 @@ class BaseNamesStreamerCallback(StreamerClient.Callback):
             basename = ChargingRuleNameSet()
             basename.ParseFromString(update.value)
             self._basenames[update.key] = basename
+        _send_update_notification(self._basenames)
+
+
+def get_policy_fingerprint(policies: SubscriberPolicySet) -> Hashable:
+    """
+    Return a fingerprint of a subscriber's APN policies, equal for policy
+    sets which only differ in the order of their repeated fields
+    """
+    return (
+        frozenset(policies.global_policies),
+        frozenset(policies.global_base_names),
+        frozenset(
+            (
+                apn_policy_set.apn,
+                frozenset(apn_policy_set.assigned_policies),
+                frozenset(apn_policy_set.assigned_base_names),
+            )
+            for apn_policy_set in policies.rules_per_apn
+        ),
+    )
 
 
 class ApnRuleMappingsStreamerCallback(StreamerClient.Callback):
     """
     Callback for the apn rule mappings streamer policy which persists
     the mapping of (imsi, subscriber) tuples -> rules
+
+    Subscribers are pushed to sessiond when their policies differ from
+    those sessiond last acknowledged, so subscribers which failed to be
+    pushed are pushed again on the next update. The rules are pushed in
+    size-bounded SetSessionRules calls, sent concurrently, and only the
+    failed calls are retried.
     """
 
     def __init__(
@@ -118,10 +163,25 @@ class ApnRuleMappingsStreamerCallback(StreamerClient.Callback):
         session_mgr_stub: LocalSessionManagerStub,
         rules_by_basename: BaseNameDict,
         apn_rules_by_sid: ApnRuleAssignmentsDict,
+        max_push_subscribers: int = MAX_PUSH_SUBSCRIBERS,
+        max_push_bytes: int = MAX_PUSH_BYTES,
+        push_concurrency: int = PUSH_CONCURRENCY,
+        push_retries: int = PUSH_RETRIES,
     ):
         self._session_mgr_stub = session_mgr_stub
         self._rules_by_basename = rules_by_basename
         self._apn_rules_by_sid = apn_rules_by_sid
+        self._max_push_subscribers = max_push_subscribers
+        self._max_push_bytes = max_push_bytes
+        self._push_retries = push_retries
+        self._push_executor = ThreadPoolExecutor(
+            max_workers=push_concurrency,
+            thread_name_prefix='apn_rules_push',
+        )
+        # imsi => fingerprint of the policies stored, and acknowledged by
+        # sessiond
+        self._stored_fingerprints = {}  # type: Dict[str, Hashable]
+        self._acked_fingerprints = {}  # type: Dict[str, Hashable]
 
     def get_request_args(self, stream_name: str) -> Any:
         return None
@@ -137,19 +197,25 @@ class ApnRuleMappingsStreamerCallback(StreamerClient.Callback):
             len(updates),
         )
         all_subscriber_rules = []  # type: List[RulesPerSubscriber]
+        fingerprints = {}  # type: Dict[str, Hashable]
         found_update = False
         for update in updates:
             imsi = update.key
             subApnPolicies = SubscriberPolicySet()
             subApnPolicies.ParseFromString(update.value)
-            is_updated = self._are_sub_policies_updated(imsi, subApnPolicies)
-            if is_updated:
+            fingerprint = get_policy_fingerprint(subApnPolicies)
+            if self._stored_fingerprints.get(imsi) != fingerprint:
                 found_update = True
+                self._apn_rules_by_sid[imsi] = subApnPolicies
+                self._stored_fingerprints[imsi] = fingerprint
+            if self._acked_fingerprints.get(imsi) != fingerprint:
                 all_subscriber_rules.append(
                     self._build_sub_rule_set(imsi, subApnPolicies),
                 )
-                self._apn_rules_by_sid[imsi] = subApnPolicies
-        if not found_update:
+                fingerprints[imsi] = fingerprint
+        if found_update:
+            _send_update_notification(self._apn_rules_by_sid)
+        if not all_subscriber_rules:
             logging.debug(
                 "No IMSIs with APN->Policy assignments found. "
                 "Not sending an update to SessionD",
@@ -159,23 +225,66 @@ class ApnRuleMappingsStreamerCallback(StreamerClient.Callback):
             'Updating %d IMSIs with new APN->policy assignments',
             len(all_subscriber_rules),
         )
-        update = SessionRules(rules_per_subscriber=all_subscriber_rules)
-        try:
-            self._session_mgr_stub.SetSessionRules(update, timeout=5)
-        except grpc.RpcError as e:
-            logging.error('Unable to apply apn->policy updates %s', str(e))
+        chunks = self._split_rules(all_subscriber_rules)
+        if len(chunks) == 1:
+            results = [self._push_rules(chunks[0])]
+        else:
+            results = list(self._push_executor.map(self._push_rules, chunks))
+        num_failed = 0
+        for chunk, is_pushed in zip(chunks, results):
+            if not is_pushed:
+                num_failed += len(chunk)
+                continue
+            for sub_rules in chunk:
+                self._acked_fingerprints[sub_rules.imsi] = \
+                    fingerprints[sub_rules.imsi]
+        if num_failed:
+            logging.error(
+                'Unable to apply apn->policy updates of %d IMSIs, they '
+                'will be pushed again on the next update', num_failed,
+            )
 
-    def _are_sub_policies_updated(
+    def _split_rules(
         self,
-        subscriber_id: str,
-        subApnPolicies: SubscriberPolicySet,
-    ) -> bool:
-        if subscriber_id not in self._apn_rules_by_sid:
-            return True
-        prev = self._apn_rules_by_sid[subscriber_id]
-        # TODO: (8/21/2020) repeated fields may not be ordered the same, use a
-        #       different method to compare later
-        return subApnPolicies.SerializeToString() != prev.SerializeToString()
+        all_subscriber_rules: List[RulesPerSubscriber],
+    ) -> List[List[RulesPerSubscriber]]:
+        """
+        Split the rules in chunks of at most max_push_subscribers
+        subscribers and max_push_bytes, unless a single subscriber's rules
+        are larger
+        """
+        chunks = []  # type: List[List[RulesPerSubscriber]]
+        chunk = []  # type: List[RulesPerSubscriber]
+        chunk_size = 0
+        for sub_rules in all_subscriber_rules:
+            size = sub_rules.ByteSize()
+            if chunk and (
+                len(chunk) >= self._max_push_subscribers
+                or chunk_size + size > self._max_push_bytes
+            ):
+                chunks.append(chunk)
+                chunk = []
+                chunk_size = 0
+            chunk.append(sub_rules)
+            chunk_size += size
+        if chunk:
+            chunks.append(chunk)
+        return chunks
+
+    def _push_rules(self, chunk: List[RulesPerSubscriber]) -> bool:
+        update = SessionRules(rules_per_subscriber=chunk)
+        for attempt in range(self._push_retries + 1):
+            try:
+                self._session_mgr_stub.SetSessionRules(
+                    update, timeout=PUSH_TIMEOUT,
+                )
+                return True
+            except grpc.RpcError as e:
+                logging.warning(
+                    'Unable to apply apn->policy updates of %d IMSIs '
+                    '(attempt %d): %s', len(chunk), attempt + 1, str(e),
+                )
+        return False
 
     def _build_sub_rule_set(
         self,
@@ -271,3 +380,4 @@ class RatingGroupsStreamerCallback(StreamerClient.Callback):
             rg = RatingGroup()
             rg.ParseFromString(update.value)
             self._rating_groups[update.key] = rg
+        _send_update_notification(self._rating_groups)
@@ -62,6 +62,22 @@ USR = '''
   }'''
 
 
+class VersionedDict(dict):
+    """ Dict with the update notification of the policydb stores """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.update_version = 0
+        self.num_reads = 0
+
+    def items(self):
+        self.num_reads += 1
+        return super().items()
+
+    def send_update_notification(self):
+        self.update_version += 1
+
+
 class SessionRpcServicerTest(unittest.TestCase):
     def setUp(self):
         rating_groups_by_id = {
@@ -237,6 +253,81 @@ class SessionRpcServicerTest(unittest.TestCase):
             'There should be an infinite, unmetered credit grant',
         )
 
+    def test_CreateSession_after_update(self):
+        """
+        Create sessions, update the stores and create sessions again
+
+        Assert:
+            The stores are only read again once they notify an update
+            Sessions created after the update get the updated rules and
+            credits
+        """
+        rating_groups_by_id = VersionedDict({
+            1: RatingGroup(id=1, limit_type=RatingGroup.INFINITE_UNMETERED),
+        })
+        basenames_dict = VersionedDict({
+            'bn1': ChargingRuleNameSet(RuleNames=['p5']),
+        })
+        apn_rules_by_sid = VersionedDict({
+            'IMSI1234': SubscriberPolicySet(
+                global_base_names=['bn1'],
+                rules_per_apn=[
+                    ApnPolicySet(apn='apn1', assigned_policies=['redirect']),
+                ],
+            ),
+        })
+        servicer = SessionRpcServicer(
+            self._get_mconfig(),
+            rating_groups_by_id,
+            basenames_dict,
+            apn_rules_by_sid,
+        )
+        msg = CreateSessionRequest(
+            session_id='1234',
+            common_context=CommonSessionContext(
+                sid=SubscriberID(id='IMSI1234'),
+                apn='apn1',
+            ),
+        )
+        for _ in range(3):
+            resp = servicer.CreateSession(msg, None)
+            self.assertEqual(
+                [rule.rule_id for rule in resp.static_rules],
+                ['p5', 'redirect'],
+            )
+            self.assertEqual(
+                [credit.charging_key for credit in resp.credits], [1],
+            )
+        self.assertEqual(basenames_dict.num_reads, 1)
+        self.assertEqual(apn_rules_by_sid.num_reads, 1)
+
+        basenames_dict['bn1'] = ChargingRuleNameSet(RuleNames=['p6'])
+        rating_groups_by_id[2] = RatingGroup(
+            id=2,
+            limit_type=RatingGroup.INFINITE_METERED,
+        )
+        # Not visible until the update is notified
+        resp = servicer.CreateSession(msg, None)
+        self.assertEqual(resp.static_rules[0].rule_id, 'p5')
+
+        basenames_dict.send_update_notification()
+        rating_groups_by_id.send_update_notification()
+        resp = servicer.CreateSession(msg, None)
+        self.assertEqual(
+            [rule.rule_id for rule in resp.static_rules],
+            ['p6', 'redirect'],
+        )
+        self.assertEqual(
+            [
+                (credit.charging_key, credit.limit_type)
+                for credit in resp.credits
+            ],
+            [
+                (1, CreditLimitType.Value('INFINITE_UNMETERED')),
+                (2, CreditLimitType.Value('INFINITE_METERED')),
+            ],
+        )
+
     def test_UpdateSession(self):
         """
         Update a session
@@ -15,6 +15,8 @@ import unittest
 from typing import Callable, List
 from unittest.mock import Mock
 
+import grpc
+
 from lte.protos.policydb_pb2 import (
     ApnPolicySet,
     ChargingRuleNameSet,
@@ -284,3 +286,106 @@ class ApnRuleMappingsStreamerCallbackTest(unittest.TestCase):
             called_with, expected_2.SerializeToString(),
             'SetSessionRules call has incorrect arguments',
         )
+
+    def test_ReorderedUpdate(self):
+        """
+        Test that policies which only differ in the order of their repeated
+        fields are not pushed again
+        """
+        stub = MockLocalSessionManagerStub()
+        stub_call_args = []  # type: List[SessionRules]
+        side_effect = get_SetSessionRules_side_effect(stub_call_args)
+        stub.SetSessionRules = Mock(side_effect=side_effect)
+        callback = ApnRuleMappingsStreamerCallback(stub, {}, {})
+
+        policies = SubscriberPolicySet(
+            global_policies=['g1', 'g2'],
+            rules_per_apn=[
+                ApnPolicySet(apn='apn1', assigned_policies=['p1', 'p2']),
+                ApnPolicySet(apn='apn2', assigned_base_names=['bn1']),
+            ],
+        )
+        reordered = SubscriberPolicySet(
+            global_policies=['g2', 'g1'],
+            rules_per_apn=[
+                ApnPolicySet(apn='apn2', assigned_base_names=['bn1']),
+                ApnPolicySet(apn='apn1', assigned_policies=['p2', 'p1']),
+            ],
+        )
+        callback.process_update(
+            "stream",
+            [DataUpdate(key='imsi_1', value=policies.SerializeToString())],
+            False,
+        )
+        callback.process_update(
+            "stream",
+            [DataUpdate(key='imsi_1', value=reordered.SerializeToString())],
+            False,
+        )
+        self.assertEqual(len(stub_call_args), 1)
+
+    def test_ChunkedUpdate(self):
+        """
+        Test that updates are pushed in chunks, that only the failed chunks
+        are retried and that subscribers which could not be pushed are
+        pushed again on the next update
+        """
+        stub = MockLocalSessionManagerStub()
+        stub_call_args = []  # type: List[SessionRules]
+        failing_imsis = {'imsi_4': 4}
+
+        def side_effect(session_rules: SessionRules, timeout: float) -> Void:
+            stub_call_args.append(session_rules)
+            for sub_rules in session_rules.rules_per_subscriber:
+                if failing_imsis.get(sub_rules.imsi, 0) > 0:
+                    failing_imsis[sub_rules.imsi] -= 1
+                    raise grpc.RpcError()
+            return Void()
+        stub.SetSessionRules = Mock(side_effect=side_effect)
+        callback = ApnRuleMappingsStreamerCallback(
+            stub, {}, {},
+            max_push_subscribers=2,
+            push_retries=2,
+        )
+
+        def get_updates(imsis):
+            return [
+                DataUpdate(
+                    key=imsi,
+                    value=SubscriberPolicySet(
+                        rules_per_apn=[
+                            ApnPolicySet(apn='apn1', assigned_policies=['p1']),
+                        ],
+                    ).SerializeToString(),
+                )
+                for imsi in imsis
+            ]
+
+        imsis = ['imsi_%d' % index for index in range(5)]
+        callback.process_update("stream", get_updates(imsis), False)
+
+        pushed = sorted(
+            [
+                sub_rules.imsi
+                for sub_rules in session_rules.rules_per_subscriber
+            ]
+            for session_rules in stub_call_args
+        )
+        # 3 chunks, the last one tried 3 times
+        self.assertEqual(
+            pushed, [
+                ['imsi_0', 'imsi_1'], ['imsi_2', 'imsi_3'],
+                ['imsi_4'], ['imsi_4'], ['imsi_4'],
+            ],
+        )
+
+        # Only the subscriber which was not acknowledged is pushed again
+        stub_call_args.clear()
+        callback.process_update("stream", get_updates(imsis), False)
+        self.assertEqual(len(stub_call_args), 2)
+        self.assertEqual(
+            stub_call_args[-1].rules_per_subscriber[0].imsi, 'imsi_4',
+        )
+        stub_call_args.clear()
+        callback.process_update("stream", get_updates(imsis), False)
+        self.assertEqual(len(stub_call_args), 0)
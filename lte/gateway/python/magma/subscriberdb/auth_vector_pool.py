@@ -0,0 +1,141 @@
+"""
+Copyright 2020 The Magma Authors.
+
+This source code is licensed under the BSD-style license found in the
+LICENSE file in the root directory of this source tree.
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+
+import itertools
+import threading
+from collections import OrderedDict, deque
+
+# Subscribers whose precomputed vectors are kept, least recently used first
+MAX_POOLED_SUBSCRIBERS = 10000
+
+
+class _PoolEntry(object):
+    """
+    Precomputed vectors of a subscriber, with their sequence numbers
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.version = None
+        self.vectors = deque()  # (seq, vector)
+        # Sequence number of the last vector served
+        self.last_seq = None
+
+
+class AuthVectorPool(object):
+    """
+    Per-subscriber pool of LTE auth vectors generated ahead of demand, so
+    the sequence numbers of several vectors are reserved with a single store
+    write and repeated authentications are served from memory.
+
+    Each entry is tagged with a version identifying the subscriber's auth
+    data (e.g. key, OPc and next sequence number) the vectors were generated
+    from. The vectors are dropped when they are requested with another
+    version, which happens when the subscriber is edited or resynced.
+
+    Vectors are served in sequence number order whatever network they are
+    requested for, so they must not depend on it: callers complete them for
+    the serving network.
+    """
+
+    def __init__(
+        self, low_watermark, high_watermark,
+        max_subscribers=MAX_POOLED_SUBSCRIBERS,
+    ):
+        """
+        Args:
+            low_watermark: the pool is refilled when serving a request would
+                leave fewer vectors than this
+            high_watermark: number of vectors left once refilled
+            max_subscribers: number of subscribers to keep vectors for
+        """
+        if not 0 <= low_watermark <= high_watermark:
+            raise ValueError(
+                "Invalid auth vector pool watermarks low=%d high=%d" %
+                (low_watermark, high_watermark),
+            )
+        self._low_watermark = low_watermark
+        self._high_watermark = high_watermark
+        self._max_subscribers = max_subscribers
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()  # imsi => _PoolEntry
+
+    def get_vectors(self, imsi, count, version, generate):
+        """
+        Returns count vectors for imsi, in sequence number order, refilling
+        the pool with generate if needed.
+
+        Args:
+            imsi: IMSI string
+            count: number of vectors to return
+            version: version of the subscriber's auth data in the store
+            generate: function taking a number of vectors to generate. It
+                returns the sequence number of the first one, the list of
+                vectors, and the version of the subscriber's auth data after
+                their generation.
+        Returns:
+            list of count vectors
+        """
+        entry = self._get_entry(imsi)
+        with entry.lock:
+            if entry.version != version:
+                entry.version = version
+                entry.vectors.clear()
+                entry.last_seq = None
+
+            num_left = len(entry.vectors) - count
+            if num_left < 0 or num_left < self._low_watermark:
+                seq, vectors, entry.version = generate(
+                    self._high_watermark - num_left,
+                )
+                entry.vectors.extend(zip(itertools.count(seq), vectors))
+            vectors = []
+            for _ in range(count):
+                entry.last_seq, vector = entry.vectors.popleft()
+                vectors.append(vector)
+            return vectors
+
+    def get_last_seq(self, imsi, version):
+        """
+        Returns the sequence number of the last vector served for imsi, or
+        None if none was served since the subscriber's auth data was at
+        version. The store's next sequence number is past the ones reserved
+        for the pooled vectors, so this is the one a UE last got.
+        """
+        with self._lock:
+            entry = self._entries.get(imsi)
+        if entry is None:
+            return None
+        with entry.lock:
+            if entry.version != version:
+                return None
+            return entry.last_seq
+
+    def invalidate(self, imsi):
+        """
+        Drops the vectors precomputed for imsi
+        """
+        with self._lock:
+            self._entries.pop(imsi, None)
+
+    def _get_entry(self, imsi):
+        with self._lock:
+            entry = self._entries.get(imsi)
+            if entry is None:
+                entry = _PoolEntry()
+                self._entries[imsi] = entry
+                if len(self._entries) > self._max_subscribers:
+                    self._entries.popitem(last=False)
+            else:
+                self._entries.move_to_end(imsi)
+            return entry
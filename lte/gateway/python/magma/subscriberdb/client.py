@@ -33,6 +33,7 @@ from magma.subscriberdb.metrics import (
     SUBSCRIBER_SYNC_LATENCY,
     SUBSCRIBER_SYNC_SUCCESS_TOTAL,
 )
+from magma.subscriberdb.sid import SIDUtils
 from magma.subscriberdb.store.sqlite import SqliteStore
 
 
@@ -178,52 +179,39 @@ class SubscriberDBCloudClient(SDWatchdogTask):
         self._store.update_digest(flat_digest.md5_base64_digest)
 
     def _process_subscribers(self, subscribers: SubscriberData) -> None:
-        active_subscriber_ids = []
-        sids = []
-        for subscriber in subscribers:
-            sids.append(subscriber.sid.id)
-            if subscriber.lte.state == LTESubscription.ACTIVE:
-                active_subscriber_ids.append(subscriber.sid.id)
-        old_sub_ids = self._store.list_subscribers()
-        # Only compare active subscribers against the database to decide
-        # what to detach.
-        self._detach_deleted_subscribers(old_sub_ids, active_subscriber_ids)
-        logging.debug("Resync with subscribers: %s", ','.join(sids))
-        self._store.resync(subscribers)
+        diff = self._store.resync(subscribers)
+        logging.debug(
+            "Subscribers added: %s, updated: %s, deleted: %s",
+            ','.join(diff.added), ','.join(diff.updated),
+            ','.join(diff.deleted),
+        )
+        # Only subscribers that were deleted or are no longer active can need
+        # a detach
+        inactive_ids = {
+            SIDUtils.to_str(subscriber.sid) for subscriber in subscribers
+            if subscriber.lte.state != LTESubscription.ACTIVE
+        }
+        self._detach_deleted_subscribers(
+            diff.deleted + [
+                sid for sid in diff.updated if sid in inactive_ids
+            ],
+        )
 
-    def _detach_deleted_subscribers(self, old_sub_ids, new_sub_ids):
+    def _detach_deleted_subscribers(self, deleted_sub_ids):
         """
-        Detach deleted subscribers from store and network.
+        Detach deleted subscribers from the network.
 
-        Compares current subscriber ids and new subscriber ids list
-        just streamed from the cloud to figure out the deleted subscribers.
-        Then send grpc DeleteSubscriber request to mme to detach all the
+        Send grpc DeleteSubscriber request to mme to detach all the
         deleted subscribers.
 
         Args:
-            old_sub_ids: a list of old subscriber ids in the store
-            new_sub_ids: a list of new active subscriber ids
+            deleted_sub_ids: a list of ids of the subscribers deleted or
+                deactivated in the store
 
         Returns:
             None
 
         """
-        # THIS IS A HACK UNTIL WE FIX THIS ON CLOUD
-        # We accept IMSIs with or without 'IMSI' prepended on cloud, but we
-        # always store IMSIs on local subscriberdb with IMSI prepended. If the
-        # cloud streams down subscriber IDs without 'IMSI' prepended,
-        # subscriberdb will try to delete all of the subscribers from MME every
-        # time it streams from cloud because the set membership will fail
-        # when comparing '12345' to 'IMSI12345'.
-        new_sub_ids = {
-            'IMSI{imsiVal}'.format(imsiVal=s) if not s.startswith('IMSI')
-            else s
-            for s in new_sub_ids
-        }
-        deleted_sub_ids = [
-            sub_id for sub_id in old_sub_ids
-            if sub_id not in set(new_sub_ids)
-        ]
         if not deleted_sub_ids:
             return
         # send detach request to mme for all deleted subscribers.
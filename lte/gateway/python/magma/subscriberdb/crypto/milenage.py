@@ -11,13 +11,23 @@ See the License for the specific language governing permissions and
 limitations under the License.
 """
 
+import functools
 import hmac
+from collections import namedtuple
 
 from Crypto.Cipher import AES
 from Crypto.Random import random
 
 from .lte import BaseLTEAuthAlgo
 
+# Subscriber keys whose AES key schedule is kept in memory
+CIPHER_CACHE_SIZE = 10000
+
+# E-UTRAN key vector before the KASME is derived for a serving network
+EutranKeys = namedtuple(
+    'EutranKeys', ['rand', 'xres', 'autn', 'ck', 'ik', 'sqn', 'ak'],
+)
+
 
 class Milenage(BaseLTEAuthAlgo):
     """
@@ -42,6 +52,22 @@ class Milenage(BaseLTEAuthAlgo):
             autn (bytes): 128 bit authentication token
             kasme (bytes): 256 bit base network authentication code
         """
+        return self.generate_eutran_vector_for_plmn(
+            self.generate_eutran_keys(key, opc, sqn), plmn,
+        )
+
+    def generate_eutran_keys(self, key, opc, sqn):
+        """
+        Generate the part of the E-UTRAN key vector that doesn't depend on
+        the serving network, so it can be computed ahead of knowing it.
+        Args:
+            key (bytes): 128 bit subscriber key
+            opc (bytes): 128 bit operator variant algorithm configuration field
+            sqn (int): 48 bit sequence number
+        Returns:
+            EutranKeys: the challenge, expected result and token, with the
+                keys and SQN the KASME is derived from
+        """
         sqn_bytes = bytearray.fromhex('{:012x}'.format(sqn))
         rand = Milenage.generate_rand()
 
@@ -51,8 +77,25 @@ class Milenage(BaseLTEAuthAlgo):
         ik = Milenage.f4(key, rand, opc)
 
         autn = Milenage.generate_autn(sqn_bytes, ak, mac_a, self.amf)
-        kasme = Milenage.generate_kasme(ck, ik, plmn, sqn_bytes, ak)
-        return rand, xres, autn, kasme
+        return EutranKeys(rand, xres, autn, ck, ik, sqn_bytes, ak)
+
+    @classmethod
+    def generate_eutran_vector_for_plmn(cls, keys, plmn):
+        """
+        Complete the E-UTRAN key vector of keys for a serving network.
+        Args:
+            keys (EutranKeys): keys from generate_eutran_keys
+            plmn (bytes): 24 bit network identifer
+        Returns:
+            rand (bytes): 128 bit random challenge
+            xres (bytes): 128 bit expected result
+            autn (bytes): 128 bit authentication token
+            kasme (bytes): 256 bit base network authentication code
+        """
+        kasme = cls.generate_kasme(
+            keys.ck, keys.ik, plmn, keys.sqn, keys.ak,
+        )
+        return keys.rand, keys.xres, keys.autn, kasme
 
     def generate_auts(self, key, opc, rand, sqn):
         """
@@ -314,8 +357,19 @@ class Milenage(BaseLTEAuthAlgo):
         Returns:
             encrypted output
         """
-        aes_cipher = AES.new(k, AES.MODE_CBC, IV)
-        return aes_cipher.encrypt(buf)
+        # CBC over a single block is ECB of the block XOR IV. ECB ciphers
+        # are stateless, so the expanded key can be reused across calls.
+        if IV != 16 * b'\x00':
+            buf = xor(buf, IV)
+        return _get_cipher(bytes(k)).encrypt(bytes(buf))
+
+
+@functools.lru_cache(maxsize=CIPHER_CACHE_SIZE)
+def _get_cipher(k):
+    """
+    Returns the AES-128 ECB cipher for key k
+    """
+    return AES.new(k, AES.MODE_ECB)
 
 
 def xor(s1, s2):
@@ -332,7 +386,9 @@ def xor(s1, s2):
     """
     if len(s1) != len(s2):
         raise ValueError('Input not equal length: %d %d' % (len(s1), len(s2)))
-    return bytes(a ^ b for a, b in zip(s1, s2))
+    return (
+        int.from_bytes(s1, 'big') ^ int.from_bytes(s2, 'big')
+    ).to_bytes(len(s1), 'big')
 
 
 def rotate(input_s, bytes_):
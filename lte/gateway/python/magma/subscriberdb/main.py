@@ -20,6 +20,7 @@ from lte.protos.subscriberdb_pb2_grpc import SubscriberDBCloudStub
 from magma.common.grpc_client_manager import GRPCClientManager
 from magma.common.sentry import sentry_init
 from magma.common.service import MagmaService
+from magma.subscriberdb.auth_vector_pool import AuthVectorPool
 from magma.subscriberdb.client import SubscriberDBCloudClient
 from magma.subscriberdb.processor import Processor
 from magma.subscriberdb.protocols.diameter.application import base, s6a
@@ -43,6 +44,17 @@ def main():
         sid_digits=service.config.get('sid_last_n'),
     )
 
+    # Precompute LTE auth vectors unless the pool is disabled
+    auth_vector_pool = None
+    pool_high_watermark = service.config.get(
+        'auth_vector_pool_high_watermark', 0,
+    )
+    if pool_high_watermark > 0:
+        auth_vector_pool = AuthVectorPool(
+            service.config.get('auth_vector_pool_low_watermark', 0),
+            pool_high_watermark,
+        )
+
     # Initialize the processor
     processor = Processor(
         store,
@@ -50,6 +62,7 @@ def main():
         service.mconfig.sub_profiles,
         service.mconfig.lte_auth_op,
         service.mconfig.lte_auth_amf,
+        auth_vector_pool=auth_vector_pool,
     )
 
     # Add all servicers to the server
@@ -62,3 +62,21 @@ SUBSCRIBER_SYNC_FAILURE_TOTAL = Counter(
     'Total number of failed subscriber'
     'syncs with cloud',
 )
+
+SUBSCRIBER_CACHE_HITS_TOTAL = Counter(
+    'subscriber_cache_hits',
+    'Total number of subscriber lookups served '
+    'from the cache',
+)
+
+SUBSCRIBER_CACHE_MISSES_TOTAL = Counter(
+    'subscriber_cache_misses',
+    'Total number of subscriber lookups read '
+    'from the persistent store',
+)
+
+SUBSCRIBER_CACHE_EVICTIONS_TOTAL = Counter(
+    'subscriber_cache_evictions',
+    'Total number of subscribers evicted from '
+    'the cache to make room',
+)
@@ -13,6 +13,7 @@ limitations under the License.
 """
 
 import abc
+import functools
 
 from lte.protos.subscriberdb_pb2 import (
     GSMSubscription,
@@ -25,6 +26,9 @@ from .crypto.gsm import UnsafePreComputedA3A8
 from .crypto.milenage import Milenage
 from .crypto.utils import CryptoError
 
+# Subscriber keys whose derived OPc is kept in memory
+OPC_CACHE_SIZE = 10000
+
 
 class GSMProcessor(metaclass=abc.ABCMeta):
     """
@@ -101,6 +105,23 @@ class LTEProcessor(metaclass=abc.ABCMeta):
         """
         raise NotImplementedError()
 
+    def generate_lte_auth_vectors(self, imsi, plmns):
+        """
+        Returns an E-UTRAN key vector for each of plmns, in order. Processors
+        can override this to reserve the sequence numbers of all the vectors
+        at once.
+
+        Args:
+            imsi: the subscriber identifier
+            plmns ([bytes]): 24 bit network identifers
+        Returns:
+            a list of (rand, xres, autn, kasme) tuples
+        Raises:
+            SubscriberNotFoundError if the subscriber is not present
+            CryptoError if the auth tuples couldn't be generated
+        """
+        return [self.generate_lte_auth_vector(imsi, plmn) for plmn in plmns]
+
 
 class Processor(GSMProcessor, LTEProcessor):
     """
@@ -110,7 +131,7 @@ class Processor(GSMProcessor, LTEProcessor):
 
     def __init__(
         self, store, default_sub_profile,
-        sub_profiles, op=None, amf=None,
+        sub_profiles, op=None, amf=None, auth_vector_pool=None,
     ):
         """
         Init the Processor with all the components.
@@ -118,12 +139,20 @@ class Processor(GSMProcessor, LTEProcessor):
         We use the UnsafePreComputedA3A8 crypto by default for
         GSM authentication. This requires the auth-tuple to be stored directly
         in the store as the key for the subscriber.
+
+        LTE auth vectors are served from auth_vector_pool, an AuthVectorPool,
+        if given. Otherwise they are generated on demand.
         """
         self._store = store
         self._op = op
         self._amf = amf
         self._default_sub_profile = default_sub_profile
         self._sub_profiles = sub_profiles
+        self._auth_vector_pool = auth_vector_pool
+        # OPc only depends on the subscriber key for a given OP
+        self._generate_opc = functools.lru_cache(maxsize=OPC_CACHE_SIZE)(
+            lambda key: Milenage.generate_opc(key, self._op),
+        )
         if len(op) != 16:
             raise ValueError("OP is invalid len=%d value=%s" % (len(op), op))
         if len(amf) != 2:
@@ -180,9 +209,68 @@ class Processor(GSMProcessor, LTEProcessor):
         Returns the lte auth vector for the subscriber by querying the store
         for the crypto algo and secret keys.
         """
+        return self.generate_lte_auth_vectors(imsi, [plmn])[0]
+
+    def generate_lte_auth_vectors(self, imsi, plmns):
+        """
+        Returns an lte auth vector for each of plmns, reserving the sequence
+        numbers of all the vectors with a single store update. With an auth
+        vector pool, the vectors come from the pool when it has enough of
+        them for the subscriber.
+        """
         sid = SIDUtils.to_str(SubscriberID(id=imsi, type=SubscriberID.IMSI))
         subs = self._store.get_subscriber_data(sid)
+        key = subs.lte.auth_key
+        opc = self._get_lte_opc(sid, subs)
+
+        if self._auth_vector_pool is None:
+            return self._reserve_lte_auth_vectors(imsi, key, opc, plmns)
+
+        # The pooled keys are only valid while the subscriber's keys and
+        # sequence number are the ones they were generated with. They don't
+        # depend on the PLMN, whose KASME is derived on each request.
+        version = (key, opc, subs.state.lte_auth_next_seq)
+        eutran_keys = self._auth_vector_pool.get_vectors(
+            imsi, len(plmns), version,
+            functools.partial(self._refill_lte_auth_keys, imsi, key, opc),
+        )
+        return [
+            Milenage.generate_eutran_vector_for_plmn(keys, plmn)
+            for keys, plmn in zip(eutran_keys, plmns)
+        ]
+
+    def _refill_lte_auth_keys(self, imsi, key, opc, count):
+        """
+        Generates the keys of count vectors for the auth vector pool,
+        returning the first sequence number reserved, the keys and the
+        version of the subscriber's auth data after the reservation
+        """
+        seq = self.get_next_lte_auth_seq(imsi, count)
+        milenage = Milenage(self._amf)
+        eutran_keys = [
+            milenage.generate_eutran_keys(key, opc, self.seq_to_sqn(seq + i))
+            for i in range(count)
+        ]
+        return seq, eutran_keys, (key, opc, seq + count)
+
+    def _reserve_lte_auth_vectors(self, imsi, key, opc, plmns):
+        """
+        Reserves a sequence number for each of plmns in one store update and
+        generates their vectors
+        """
+        seq = self.get_next_lte_auth_seq(imsi, len(plmns))
+        milenage = Milenage(self._amf)
+        return [
+            milenage.generate_eutran_vector(
+                key, opc, self.seq_to_sqn(seq + i), plmn,
+            ) for i, plmn in enumerate(plmns)
+        ]
 
+    def _get_lte_opc(self, sid, subs):
+        """
+        Checks the subscriber can do LTE auth and returns its OPc, deriving
+        it from the key if it isn't provisioned.
+        """
         if subs.lte.state != LTESubscription.ACTIVE:
             raise CryptoError("LTE service not active for %s" % sid)
 
@@ -196,18 +284,10 @@ class Processor(GSMProcessor, LTEProcessor):
             raise CryptoError("Subscriber key not valid for %s" % sid)
 
         if len(subs.lte.auth_opc) == 0:
-            opc = Milenage.generate_opc(subs.lte.auth_key, self._op)
+            return self._generate_opc(subs.lte.auth_key)
         elif len(subs.lte.auth_opc) != 16:
             raise CryptoError("Subscriber OPc is invalid length for %s" % sid)
-        else:
-            opc = subs.lte.auth_opc
-
-        sqn = self.seq_to_sqn(self.get_next_lte_auth_seq(imsi))
-        milenage = Milenage(self._amf)
-        return milenage.generate_eutran_vector(
-            subs.lte.auth_key,
-            opc, sqn, plmn,
-        )
+        return subs.lte.auth_opc
 
     def resync_lte_auth_seq(self, imsi, rand, auts):
         """
@@ -216,25 +296,7 @@ class Processor(GSMProcessor, LTEProcessor):
         """
         sid = SIDUtils.to_str(SubscriberID(id=imsi, type=SubscriberID.IMSI))
         subs = self._store.get_subscriber_data(sid)
-
-        if subs.lte.state != LTESubscription.ACTIVE:
-            raise CryptoError("LTE service not active for %s" % sid)
-
-        if subs.lte.auth_algo != LTESubscription.MILENAGE:
-            raise CryptoError(
-                "Unknown crypto (%s) for %s" %
-                (subs.lte.auth_algo, sid),
-            )
-
-        if len(subs.lte.auth_key) != 16:
-            raise CryptoError("Subscriber key not valid for %s" % sid)
-
-        if len(subs.lte.auth_opc) == 0:
-            opc = Milenage.generate_opc(subs.lte.auth_key, self._op)
-        elif len(subs.lte.auth_opc) != 16:
-            raise CryptoError("Subscriber OPc is invalid length for %s" % sid)
-        else:
-            opc = subs.lte.auth_opc
+        opc = self._get_lte_opc(sid, subs)
 
         dummy_amf = b'\x00\x00'  # Use dummy AMF for re-synchronization
         milenage = Milenage(dummy_amf)
@@ -248,7 +310,15 @@ class Processor(GSMProcessor, LTEProcessor):
 
         # current_seq_number was the seq number the network sent
         # to the mobile station as part of the original auth request.
+        # With the auth vector pool, the store's next seq is past the ones
+        # reserved for the pooled vectors, so the pool's last one is used.
         current_seq_number = subs.state.lte_auth_next_seq - 1
+        if self._auth_vector_pool is not None:
+            last_seq = self._auth_vector_pool.get_last_seq(
+                imsi, (subs.lte.auth_key, opc, subs.state.lte_auth_next_seq),
+            )
+            if last_seq is not None:
+                current_seq_number = last_seq
         if seq_ms >= current_seq_number:
             self.set_next_lte_auth_seq(imsi, seq_ms + 1)
         else:
@@ -262,9 +332,11 @@ class Processor(GSMProcessor, LTEProcessor):
                     "auth: %d" % seq_delta,
                 )
 
-    def get_next_lte_auth_seq(self, imsi):
+    def get_next_lte_auth_seq(self, imsi, count=1):
         """
-        Returns the sequence number for the next auth operation.
+        Returns the sequence number for the next auth operation. With count,
+        reserves that many consecutive sequence numbers and returns the
+        first one.
         """
         sid = SIDUtils.to_str(SubscriberID(id=imsi, type=SubscriberID.IMSI))
 
@@ -274,7 +346,7 @@ class Processor(GSMProcessor, LTEProcessor):
         # between USIM and HSS when it happens.
         with self._store.edit_subscriber(sid) as subs:
             seq = subs.state.lte_auth_next_seq
-            subs.state.lte_auth_next_seq += 1
+            subs.state.lte_auth_next_seq += count
         return seq
 
     def set_next_lte_auth_seq(self, imsi, seq):
@@ -285,6 +357,9 @@ class Processor(GSMProcessor, LTEProcessor):
 
         with self._store.edit_subscriber(sid) as subs:
             subs.state.lte_auth_next_seq = seq
+        # Vectors generated ahead with the old sequence numbers are stale
+        if self._auth_vector_pool is not None:
+            self._auth_vector_pool.invalidate(imsi)
 
     def get_sub_data(self, imsi):
         """
@@ -13,6 +13,8 @@ limitations under the License.
 
 import abc
 
+from magma.subscriberdb.protocols.diameter import avp
+
 
 class Application(metaclass=abc.ABCMeta):
     """
@@ -41,6 +43,26 @@ class Application(metaclass=abc.ABCMeta):
         self.realm = realm
         self.host_ip = host_ip
         self._loop = loop
+        self._origin_avps = {}  # state_id => pre-encoded origin AVPs
+
+    def _get_origin_avps(self, state_id):
+        """
+        Return the Origin-Host, Origin-Realm and Origin-State-Id AVPs of
+        the answers sent for state_id, encoded once per state_id
+        """
+        origin_avps = self._origin_avps.get(state_id)
+        if origin_avps is None:
+            origin_avps = [
+                avp.PreEncodedAVP.from_avp(avp.AVP('Origin-Host', self.host)),
+                avp.PreEncodedAVP.from_avp(
+                    avp.AVP('Origin-Realm', self.realm),
+                ),
+                avp.PreEncodedAVP.from_avp(
+                    avp.AVP('Origin-State-Id', state_id),
+                ),
+            ]
+            self._origin_avps[state_id] = origin_avps
+        return origin_avps
 
     def set_writer(self, writer):
         """ Set a writer when a connection is made """
@@ -76,6 +76,8 @@ class BaseApplication(abc.Application):
         """
         super(BaseApplication, self).__init__(realm, host, host_ip)
         self.applications = []
+        # Pre-encoded body of the capabilities exchange answers
+        self._capabilities_avps = None
 
     def validate_message(self, state_id, msg):
         """
@@ -117,6 +119,7 @@ class BaseApplication(abc.Application):
         if not issubclass(type(application), abc.Application):
             raise TypeError('Not a valid application')
         self.applications.append(application)
+        self._capabilities_avps = None
 
     def handle_msg(self, state_id, msg):
         """
@@ -159,10 +162,12 @@ class BaseApplication(abc.Application):
             body_avps = []
         resp_msg = message.Message.create_response_msg(msg)
 
-        resp_msg.append_avp(avp.AVP('Result-Code', result_code))
-        resp_msg.append_avp(avp.AVP('Origin-Host', self.host))
-        resp_msg.append_avp(avp.AVP('Origin-Realm', self.realm))
-        resp_msg.append_avp(avp.AVP('Origin-State-Id', state_id))
+        resp_msg.append_avp(
+            avp.RESULT_CODE_AVPS.get(result_code)
+            or avp.AVP('Result-Code', result_code),
+        )
+        for origin_avp in self._get_origin_avps(state_id):
+            resp_msg.append_avp(origin_avp)
 
         # Add body AVPs
         for body_avp in body_avps:
@@ -181,17 +186,22 @@ class BaseApplication(abc.Application):
             None
         """
         if self.validate_message(state_id, msg):
-            # Generate the capabilities body
-            body_avps = [avp.AVP('Host-IP-Address', self.host_ip)]
-            body_avps.extend(self.CAPABILITIES_EXCHANGE_AVPS)
-            for application in self.applications:
-                body_avps.extend(application.CAPABILITIES_EXCHANGE_AVPS)
-            body_avps.append(avp.AVP('Product-Name', avp.PRODUCT_NAME))
+            if self._capabilities_avps is None:
+                # Generate the capabilities body
+                body_avps = [avp.AVP('Host-IP-Address', self.host_ip)]
+                body_avps.extend(self.CAPABILITIES_EXCHANGE_AVPS)
+                for application in self.applications:
+                    body_avps.extend(application.CAPABILITIES_EXCHANGE_AVPS)
+                body_avps.append(avp.AVP('Product-Name', avp.PRODUCT_NAME))
+                self._capabilities_avps = [
+                    avp.PreEncodedAVP.from_avp(body_avp)
+                    for body_avp in body_avps
+                ]
             DIAMETER_CEX_TOTAL.inc()
             resp = self._gen_response(
                 state_id, msg,
                 avp.ResultCode.DIAMETER_SUCCESS,
-                body_avps,
+                self._capabilities_avps,
             )
             self.writer.send_msg(resp)
 
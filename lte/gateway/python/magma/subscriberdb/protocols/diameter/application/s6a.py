@@ -11,7 +11,10 @@ See the License for the specific language governing permissions and
 limitations under the License.
 """
 
+import asyncio
+import functools
 import logging
+from concurrent.futures import ThreadPoolExecutor
 from enum import IntEnum, unique
 
 from magma.subscriberdb.crypto.utils import CryptoError
@@ -21,10 +24,14 @@ from magma.subscriberdb.metrics import (
     S6A_LUR_TOTAL,
 )
 from magma.subscriberdb.protocols.diameter import avp, message
+from magma.subscriberdb.protocols.diameter.exception import CodecException
 from magma.subscriberdb.store.base import SubscriberNotFoundError
 
 from . import abc
 
+# Threads generating auth vectors off the event loop
+AUTH_EXECUTOR_WORKERS = 8
+
 
 @unique
 class S6AApplicationCommands(IntEnum):
@@ -54,6 +61,76 @@ class S6AApplication(abc.Application):
             ],
         ),
     ]
+    # Auth-Session-State is NO_STATE_MAINTAINED (1)
+    AUTH_SESSION_STATE_AVP = avp.PreEncodedAVP.from_avp(
+        avp.AVP('Auth-Session-State', 1),
+    )
+    ULA_FLAGS_AVP = avp.PreEncodedAVP.from_avp(avp.AVP('ULA-Flags', 1))
+    # Authentication-Info of an AIA, with the vector patched in
+    AUTH_INFO_TEMPLATE = avp.AVPTemplate(
+        avp.AVP(
+            'Authentication-Info', [
+                avp.AVP(
+                    'E-UTRAN-Vector', [
+                        avp.AVP('RAND', bytes(16)),
+                        avp.AVP('XRES', bytes(8)),
+                        avp.AVP('AUTN', bytes(16)),
+                        avp.AVP('KASME', bytes(32)),
+                    ],
+                ),
+            ],
+        ),
+        ['RAND', 'XRES', 'AUTN', 'KASME'],
+    )
+    # Stubbed out Subscription Data from OAI, with the AMBR patched in
+    SUBSCRIPTION_DATA_TEMPLATE = avp.AVPTemplate(
+        avp.AVP(
+            'Subscription-Data', [
+                avp.AVP('MSISDN', b'333608050011'),
+                avp.AVP('Access-Restriction-Data', 47),
+                avp.AVP('Subscriber-Status', 0),
+                avp.AVP('Network-Access-Mode', 2),
+                avp.AVP(
+                    'AMBR', [
+                        avp.AVP('Max-Requested-Bandwidth-UL', 0),
+                        avp.AVP('Max-Requested-Bandwidth-DL', 0),
+                    ],
+                ),
+                avp.AVP(
+                    'APN-Configuration-Profile', [
+                        avp.AVP('Context-Identifier', 0),
+                        avp.AVP('All-APN-Configurations-Included-Indicator', 0),
+                        avp.AVP(
+                            'APN-Configuration', [
+                                avp.AVP('Context-Identifier', 0),
+                                avp.AVP('PDN-Type', 0),
+                                avp.AVP('Service-Selection', 'oai.ipv4'),
+                                avp.AVP(
+                                    'EPS-Subscribed-QoS-Profile', [
+                                        avp.AVP('QoS-Class-Identifier', 9),
+                                        avp.AVP(
+                                            'Allocation-Retention-Priority', [
+                                                avp.AVP('Priority-Level', 15),
+                                                avp.AVP('Pre-emption-Capability', 1),
+                                                avp.AVP('Pre-emption-Vulnerability', 0),
+                                            ],
+                                        ),
+                                    ],
+                                ),
+                                avp.AVP(
+                                    'AMBR', [
+                                        avp.AVP('Max-Requested-Bandwidth-UL', 0),
+                                        avp.AVP('Max-Requested-Bandwidth-DL', 0),
+                                    ],
+                                ),
+                            ],
+                        ),
+                    ],
+                ),
+            ],
+        ),
+        ['Max-Requested-Bandwidth-UL', 'Max-Requested-Bandwidth-DL'],
+    )
     # Required fields for requests of each command type
     REQUIRED_FIELDS = {
         S6AApplicationCommands.AUTHENTICATION_INFORMATION:
@@ -75,7 +152,10 @@ class S6AApplication(abc.Application):
             ],
     }
 
-    def __init__(self, lte_processor, realm, host, host_ip, loop=None):
+    def __init__(
+        self, lte_processor, realm, host, host_ip, loop=None,
+        auth_workers=AUTH_EXECUTOR_WORKERS,
+    ):
         """Each application has access to a write stream and a collection of
         settings, currently limited to realm and host
 
@@ -84,9 +164,16 @@ class S6AApplication(abc.Application):
             realm: the realm the application should serve
             host: the host name the application should serve
             host_ip: the IP address of the host
+            loop: asyncio loop the answers are written from
+            auth_workers: number of threads generating auth vectors
         """
         super(S6AApplication, self).__init__(realm, host, host_ip, loop)
         self.lte_processor = lte_processor
+        # Store I/O and Milenage for AIRs run here, off the event loop
+        self._auth_executor = ThreadPoolExecutor(max_workers=auth_workers)
+        # IMSI => AIRs received while one for the IMSI is being processed.
+        # An IMSI is present as long as it has an AIR in the executor.
+        self._pending_auths = {}
 
     def handle_msg(self, state_id, msg):
         """
@@ -160,22 +247,27 @@ class S6AApplication(abc.Application):
         for body_avp in body_avps:
             resp_msg.append_avp(body_avp)
 
-        # Auth-Session-State is NO_STATE_MAINTAINED (1)
-        resp_msg.append_avp(avp.AVP('Auth-Session-State', 1))
+        resp_msg.append_avp(self.AUTH_SESSION_STATE_AVP)
 
         # Host identifiers
-        resp_msg.append_avp(avp.AVP('Origin-Host', self.host))
-        resp_msg.append_avp(avp.AVP('Origin-Realm', self.realm))
-        resp_msg.append_avp(avp.AVP('Origin-State-Id', state_id))
+        for origin_avp in self._get_origin_avps(state_id):
+            resp_msg.append_avp(origin_avp)
 
         # Response result
-        resp_msg.append_avp(avp.AVP('Result-Code', result_code))
+        resp_msg.append_avp(
+            avp.RESULT_CODE_AVPS.get(result_code)
+            or avp.AVP('Result-Code', result_code),
+        )
         return resp_msg
 
     def _send_auth(self, state_id, msg):
         """
         Handles an incoming 3GPP-Authentication-Information-Request
-        and writes a 3GPP-Authentication-Information-Answer
+        and writes a 3GPP-Authentication-Information-Answer once the
+        auth vector has been generated in the auth executor
+
+        AIRs of an IMSI are processed one batch at a time, in the order they
+        were received, so their sequence numbers are reserved in order.
 
         Args:
             state_id: the server state id
@@ -186,17 +278,90 @@ class S6AApplication(abc.Application):
         # Validate the message
         if not self.validate_message(state_id, msg):
             return
-        imsi = ""
+        imsi = msg.find_avp(*avp.resolve('User-Name')).value
+        request = (state_id, msg, self.writer)
+        pending = self._pending_auths.get(imsi)
+        if pending is not None:
+            pending.append(request)
+            return
+        self._pending_auths[imsi] = []
+        self._process_auths(imsi, [request])
+
+    def _process_auths(self, imsi, requests):
+        """
+        Generate the answers to the AIRs of imsi in the auth executor
+        """
+        loop = self._loop or asyncio.get_event_loop()
+        future = loop.run_in_executor(
+            self._auth_executor, self._gen_auth_answers, imsi, requests,
+        )
+        future.add_done_callback(
+            functools.partial(self._auth_answers_done, imsi, requests),
+        )
+
+    def _auth_answers_done(self, imsi, requests, future):
+        """
+        Write the answers to the AIRs of imsi, then start on the AIRs for imsi
+        that were received in the meantime
+        """
         try:
-            imsi = msg.find_avp(*avp.resolve('User-Name')).value
-            plmn = msg.find_avp(*avp.resolve('Visited-PLMN-Id')).value
+            resps = future.result()
+        except Exception:  # pylint: disable=broad-except
+            logging.exception("Auth error for %s", imsi)
+            S6A_AUTH_FAILURE_TOTAL.labels(
+                code=avp.ResultCode.DIAMETER_UNABLE_TO_COMPLY,
+            ).inc(len(requests))
+            resps = [
+                self._gen_response(
+                    state_id, msg, avp.ResultCode.DIAMETER_UNABLE_TO_COMPLY,
+                ) for state_id, msg, _ in requests
+            ]
+        for (_, _, writer), resp in zip(requests, resps):
+            writer.send_msg(resp)
+
+        pending = self._pending_auths.pop(imsi)
+        if pending:
+            self._pending_auths[imsi] = []
+            self._process_auths(imsi, pending)
+
+    def _gen_auth_answers(self, imsi, requests):
+        """
+        Generate the answers to a batch of AIRs for imsi, in order. Runs in
+        the auth executor.
+
+        The batch is split before each AIR carrying resync info, and the auth
+        vectors of each part are generated together, so the subscriber's
+        sequence number is updated once per part rather than once per AIR.
+
+        Args:
+            imsi: the IMSI of the AIRs
+            requests: list of (state_id, msg, writer) of the AIRs
+        Returns:
+            the answer messages, in the order of requests
+        """
+        groups = []
+        for state_id, msg, _ in requests:
             request_eutran_info = msg.find_avp(
                 *avp.resolve('Requested-EUTRAN-Authentication-Info'),
             )
             re_sync_info = request_eutran_info.find_avp(
                 *avp.resolve('Re-Synchronization-Info'),
             )
+            if re_sync_info or not groups:
+                groups.append((re_sync_info, []))
+            groups[-1][1].append((state_id, msg))
 
+        resps = []
+        for re_sync_info, group in groups:
+            resps.extend(self._gen_auth_group(imsi, re_sync_info, group))
+        return resps
+
+    def _gen_auth_group(self, imsi, re_sync_info, group):
+        """
+        Generate the answers to AIRs of imsi whose vectors are generated
+        together, after resyncing the sequence number if re_sync_info is set
+        """
+        try:
             if re_sync_info:
                 # According to 29.272 7.3.15 this should be concatenation of
                 # RAND and AUTS but OAI only sends AUTS so hardcode till fixed
@@ -204,47 +369,70 @@ class S6AApplication(abc.Application):
                 auts = re_sync_info.value[16:]
                 self.lte_processor.resync_lte_auth_seq(imsi, rand, auts)
 
-            rand, xres, autn, kasme = \
-                self.lte_processor.generate_lte_auth_vector(imsi, plmn)
-
-            auth_info = avp.AVP(
-                'Authentication-Info', [
-                avp.AVP(
-                    'E-UTRAN-Vector', [
-                    avp.AVP('RAND', rand),
-                    avp.AVP('XRES', xres),
-                    avp.AVP('AUTN', autn),
-                    avp.AVP('KASME', kasme),
-                    ],
-                ),
-                ],
-            )
-
-            S6A_AUTH_SUCCESS_TOTAL.inc()
-            resp = self._gen_response(
-                state_id, msg,
-                avp.ResultCode.DIAMETER_SUCCESS,
-                [auth_info],
-            )
-            logging.info("Auth success: %s", imsi)
+            plmns = [
+                msg.find_avp(*avp.resolve('Visited-PLMN-Id')).value
+                for _, msg in group
+            ]
+            vectors = \
+                self.lte_processor.generate_lte_auth_vectors(imsi, plmns)
         except CryptoError as e:
             S6A_AUTH_FAILURE_TOTAL.labels(
                 code=avp.ResultCode.DIAMETER_AUTHENTICATION_REJECTED,
-            ).inc()
-            resp = self._gen_response(
-                state_id, msg, avp.ResultCode.DIAMETER_AUTHENTICATION_REJECTED,
-            )
+            ).inc(len(group))
             logging.error("Auth error for %s: %s", imsi, e)
+            return [
+                self._gen_response(
+                    state_id, msg,
+                    avp.ResultCode.DIAMETER_AUTHENTICATION_REJECTED,
+                ) for state_id, msg in group
+            ]
         except SubscriberNotFoundError as e:
             S6A_AUTH_FAILURE_TOTAL.labels(
                 code=avp.ResultCode.DIAMETER_ERROR_USER_UNKNOWN,
-            ).inc()
-            resp = self._gen_response(
-                state_id, msg, avp.ResultCode.DIAMETER_ERROR_USER_UNKNOWN,
-            )
+            ).inc(len(group))
             logging.warning("Subscriber not found: %s", e)
+            return [
+                self._gen_response(
+                    state_id, msg, avp.ResultCode.DIAMETER_ERROR_USER_UNKNOWN,
+                ) for state_id, msg in group
+            ]
+
+        resps = []
+        for (state_id, msg), vector in zip(group, vectors):
+            auth_info = self._gen_auth_info(*vector)
+            resps.append(
+                self._gen_response(
+                    state_id, msg,
+                    avp.ResultCode.DIAMETER_SUCCESS,
+                    [auth_info],
+                ),
+            )
+        S6A_AUTH_SUCCESS_TOTAL.inc(len(group))
+        logging.info("Auth success: %s", imsi)
+        return resps
 
-        self.writer.send_msg(resp)
+    def _gen_auth_info(self, rand, xres, autn, kasme):
+        """
+        Generate the Authentication-Info AVP of an E-UTRAN vector, from
+        AUTH_INFO_TEMPLATE unless the vector's XRES isn't 8 bytes
+        """
+        try:
+            return self.AUTH_INFO_TEMPLATE.fill({
+                'RAND': rand, 'XRES': xres, 'AUTN': autn, 'KASME': kasme,
+            })
+        except CodecException:
+            return avp.AVP(
+                'Authentication-Info', [
+                    avp.AVP(
+                        'E-UTRAN-Vector', [
+                            avp.AVP('RAND', rand),
+                            avp.AVP('XRES', xres),
+                            avp.AVP('AUTN', autn),
+                            avp.AVP('KASME', kasme),
+                        ],
+                    ),
+                ],
+            )
 
     def _send_location_request(self, state_id, msg):
         """
@@ -261,8 +449,6 @@ class S6AApplication(abc.Application):
         if not self.validate_message(state_id, msg):
             return
 
-        ula_flags = avp.AVP('ULA-Flags', 1)
-
         try:
             imsi = msg.find_avp(*avp.resolve('User-Name')).value
             profile = self.lte_processor.get_sub_profile(imsi)
@@ -273,63 +459,15 @@ class S6AApplication(abc.Application):
             logging.warning('Subscriber not found for ULR: %s', e)
             return
 
-        # Stubbed out Subscription Data from OAI
-        subscription_data = avp.AVP(
-            'Subscription-Data', [
-                avp.AVP('MSISDN', b'333608050011'),
-                avp.AVP('Access-Restriction-Data', 47),
-                avp.AVP('Subscriber-Status', 0),
-                avp.AVP('Network-Access-Mode', 2),
-                avp.AVP(
-                    'AMBR', [
-                        avp.AVP('Max-Requested-Bandwidth-UL', profile.max_ul_bit_rate),
-                        avp.AVP('Max-Requested-Bandwidth-DL', profile.max_dl_bit_rate),
-                    ],
-                ),
-                avp.AVP(
-                    'APN-Configuration-Profile', [
-                        avp.AVP('Context-Identifier', 0),
-                        avp.AVP('All-APN-Configurations-Included-Indicator', 0),
-                        avp.AVP(
-                            'APN-Configuration', [
-                                avp.AVP('Context-Identifier', 0),
-                                avp.AVP('PDN-Type', 0),
-                                avp.AVP('Service-Selection', 'oai.ipv4'),
-                                avp.AVP(
-                                    'EPS-Subscribed-QoS-Profile', [
-                                        avp.AVP('QoS-Class-Identifier', 9),
-                                        avp.AVP(
-                                            'Allocation-Retention-Priority', [
-                                                avp.AVP('Priority-Level', 15),
-                                                avp.AVP('Pre-emption-Capability', 1),
-                                                avp.AVP('Pre-emption-Vulnerability', 0),
-                                            ],
-                                        ),
-                                    ],
-                                ),
-                                avp.AVP(
-                                    'AMBR', [
-                                        avp.AVP(
-                                            'Max-Requested-Bandwidth-UL',
-                                            profile.max_ul_bit_rate,
-                                        ),
-                                        avp.AVP(
-                                            'Max-Requested-Bandwidth-DL',
-                                            profile.max_dl_bit_rate,
-                                        ),
-                                    ],
-                                ),
-                            ],
-                        ),
-                    ],
-                ),
-            ],
-        )
+        subscription_data = self.SUBSCRIPTION_DATA_TEMPLATE.fill({
+            'Max-Requested-Bandwidth-UL': profile.max_ul_bit_rate,
+            'Max-Requested-Bandwidth-DL': profile.max_dl_bit_rate,
+        })
 
         S6A_LUR_TOTAL.inc()
         resp = self._gen_response(
             state_id, msg,
             avp.ResultCode.DIAMETER_SUCCESS,
-            [ula_flags, subscription_data],
+            [self.ULA_FLAGS_AVP, subscription_data],
         )
         self.writer.send_msg(resp)
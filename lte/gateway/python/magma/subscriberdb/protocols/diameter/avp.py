@@ -473,6 +473,10 @@ class UnknownAVP(BaseAVP):
         return bytearray(value)
 
 
+# Definition used for AVPs missing from the AVPDict
+_AVP_UNKNOWN = ('Unknown-AVP', UnknownAVP, 0)
+
+
 def AVP(ident, value=None, **kwargs):
     """
     Convenience method for constructing an AVP using an identifier. It will
@@ -492,23 +496,20 @@ def AVP(ident, value=None, **kwargs):
         ValueError: if a string AVP identifier was used and it wasn't found
         TypeError if an identifier of unknown type is used
     """
-    avp_unknown = ('Unknown-AVP', UnknownAVP, 0)
-    vendor = None
-    code = None
-    if isinstance(ident, int):
-        vendor = VendorId.DEFAULT
-        code = ident
-    elif isinstance(ident, tuple):
-        vendor = ident[0]
-        code = ident[1]
-    elif isinstance(ident, str):
-        vendor, code = resolve(ident)
+    if isinstance(ident, str):
+        vendor, code, avp_def = _lookup_name(ident)
     else:
-        raise TypeError('Invalid key type')
-    avp_def = AVPDict.get(vendor, {}).get(code, avp_unknown)
-    name = avp_def[0]
-    avp_type = avp_def[1]
-    flags = kwargs.pop('flags', avp_def[2])
+        if isinstance(ident, int):
+            vendor = VendorId.DEFAULT
+            code = ident
+        elif isinstance(ident, tuple):
+            vendor = ident[0]
+            code = ident[1]
+        else:
+            raise TypeError('Invalid key type')
+        avp_def = AVPDict.get(vendor, {}).get(code, _AVP_UNKNOWN)
+    name, avp_type, default_flags = avp_def
+    flags = kwargs.pop('flags', default_flags)
     return avp_type(
         code, value=value,
         vendor=vendor, flags=flags, name=name, **kwargs,
@@ -524,11 +525,18 @@ def resolve(name):
     Raises:
         ValueError if not found
     """
-    for vendor in AVPDict.keys():
-        for code in AVPDict[vendor].keys():
-            if AVPDict[vendor][code][0] == name:
-                return vendor, code
-    raise ValueError('AVP not found')
+    vendor, code, _ = _lookup_name(name)
+    return vendor, code
+
+
+def _lookup_name(name):
+    """
+    Look up the vendor, code and definition of an AVP by name
+    """
+    try:
+        return _NAME_INDEX[name]
+    except KeyError:
+        raise ValueError('AVP not found')
 
 
 def decode(payload):
@@ -542,33 +550,155 @@ def decode(payload):
     Raises:
         exception.CodecException if the AVP length was too short to decode
     """
+    code, vendor, flags, offset, length = decode_header(payload)
 
-    if len(payload) < HEADER_LEN:
-        raise exception.CodecException('AVP shorter than header length')
+    # Lookup the type of the AVP in our dictionary or use Unknown
+    name, avp_type, _ = AVPDict.get(vendor, {}).get(code, _AVP_UNKNOWN)
+    avp = avp_type(code, vendor=vendor, flags=flags, name=name)
 
-    offset = 0
+    # Set the payload
+    avp.payload = payload[offset:length]
+    return avp
+
+
+def decode_header(payload, begin=0):
+    """
+    Decodes the header of the AVP at begin in the payload, without decoding
+    the AVP itself
 
-    # Load the header
-    code, flags_and_length = struct.unpack_from('!II', payload, offset)
+    Args:
+        payload: AVP bytestream
+        begin: offset of the AVP in the payload
+    Return:
+        (code, vendor, flags, payload offset, length) tuple, where the
+        offsets are relative to begin and length excludes padding
+    Raises:
+        exception.CodecException if the AVP length was too short to decode
+    """
+    if len(payload) - begin < HEADER_LEN:
+        raise exception.CodecException('AVP shorter than header length')
+
+    code, flags_and_length = struct.unpack_from('!II', payload, begin)
     length = flags_and_length & 0x00FFFFFF
     flags = flags_and_length >> 24
-    offset += HEADER_LEN
 
     # Resolve the vendor
     if flags & FLAG_VENDOR != 0:
-        if len(payload) - HEADER_LEN < 4:
+        if len(payload) - begin - HEADER_LEN < 4:
             raise exception.CodecException('AVP too short to decode vendor')
-        vendor = struct.unpack_from('!I', payload, offset)[0]
-        offset += 4
-    else:
-        vendor = VendorId.DEFAULT
+        vendor = struct.unpack_from('!I', payload, begin + HEADER_LEN)[0]
+        return code, vendor, flags, HEADER_LEN + 4, length
+    return code, VendorId.DEFAULT, flags, HEADER_LEN, length
 
-    # Lookup the type of the AVP in our dictionary or use Unknown
-    avp = AVP((vendor, code), None, flags=flags)
 
-    # Set the payload
-    avp.payload = payload[offset:length]
-    return avp
+class PreEncodedAVP(object):
+    """
+    An AVP kept in its encoded form, so AVPs sent unchanged in many messages
+    are only encoded once. It can be appended to messages and grouped AVPs
+    in place of the AVP it encodes.
+    """
+
+    def __init__(self, encoded):
+        """
+        Args:
+            encoded: the encoded AVP bytes, including padding
+        """
+        self.encoded = bytes(encoded)
+        self.code, self.vendor, self.flags, _, _ = decode_header(self.encoded)
+        self.length = len(self.encoded)
+
+    @classmethod
+    def from_avp(cls, avp):
+        """
+        Encode an AVP instance
+
+        Raises:
+            CodecException: if encoding failed
+        """
+        buf = bytearray(avp.length)
+        avp.encode(buf, 0)
+        return cls(buf)
+
+    @property
+    def value(self):
+        return decode(self.encoded).value
+
+    def encode(self, buf, begin):
+        """
+        Write the AVP into a buffer at an offset
+
+            Returns: The number of bytes written
+        """
+        buf[begin:begin + self.length] = self.encoded
+        return self.length
+
+    def __repr__(self):
+        return repr(decode(self.encoded))
+
+    def __eq__(self, other):
+        return repr(self) == repr(other)
+
+
+class AVPTemplate(object):
+    """
+    A pre-encoded AVP, usually grouped, with some of the AVPs it contains
+    left as fields whose values are patched in for each message. Fields
+    must encode to a fixed length, e.g. Unsigned32 AVPs or Octet Strings
+    of a known size.
+    """
+
+    def __init__(self, avp, fields):
+        """
+        Args:
+            avp: the AVP to encode, where the AVPs of the fields hold
+                placeholder values of the encoded length of the field
+            fields: the names of the AVPs whose values are filled in. All
+                the AVPs of a name are filled with the same value.
+        """
+        self._encoded = PreEncodedAVP.from_avp(avp).encoded
+        self._fields = {}  # name => (AVP type, [(offset, length)])
+        self._find_fields(avp, 0, fields)
+        missing = set(fields) - set(self._fields)
+        if missing:
+            raise ValueError('Template fields not found: %s' % missing)
+
+    def _find_fields(self, avp, begin, fields):
+        """ Record the payload offsets of the fields in avp, at begin """
+        payload_begin = begin + HEADER_LEN
+        if avp.vendor_specific:
+            payload_begin += 4
+        if avp.name in fields:
+            _, offsets = self._fields.setdefault(
+                avp.name, (type(avp), []),
+            )
+            offsets.append((payload_begin, avp._payload_length()))
+        elif isinstance(avp, GroupedAVP):
+            offset = payload_begin
+            for child in avp.value:
+                self._find_fields(child, offset, fields)
+                offset += child.length
+
+    def fill(self, values):
+        """
+        Make an AVP from the template with the field values
+
+        Args:
+            values: dict of field name => value, for every field
+        Returns:
+            PreEncodedAVP instance
+        Raises:
+            CodecException: if a value doesn't encode to the field's length
+        """
+        buf = bytearray(self._encoded)
+        for name, (avp_type, offsets) in self._fields.items():
+            payload = avp_type.encode_value(values[name])
+            for offset, length in offsets:
+                if len(payload) != length:
+                    raise exception.CodecException(
+                        '%s must encode to %d bytes' % (name, length),
+                    )
+                buf[offset:offset + length] = payload
+        return PreEncodedAVP(buf)
 
 
 # The AVP dictionary the first level is the vendor identifier, and the second
@@ -725,3 +855,16 @@ AVPDict = {
         ),
     },
 }
+
+# Index of the AVPDict by name, the values are (vendor, code, definition)
+_NAME_INDEX = {
+    avp_def[0]: (vendor, code, avp_def)
+    for vendor, avp_defs in AVPDict.items()
+    for code, avp_def in avp_defs.items()
+}
+
+# Result-Code AVPs, encoded once as every answer carries one
+RESULT_CODE_AVPS = {
+    code: PreEncodedAVP.from_avp(AVP('Result-Code', code))
+    for code in ResultCode
+}
@@ -222,11 +222,18 @@ class Message(object):
     a list of AVPs. This provides utilities for decoding a message payload into its
     constituint components, and encoding it back. There are also convenience methods
     for adding and retreiving AVPs in the instance.
+
+    The AVPs of a decoded message are only decoded when they are looked up,
+    from an index of the AVP headers built while decoding.
     """
 
     def __init__(self, header=None):
         self.header = header if header else MessageHeader()
-        self._avps = []
+        self._avp_list = []
+        # Undecoded AVPs of a decoded message, and their
+        # [vendor, code, offset, AVP or None if not decoded yet] index
+        self._payload = None
+        self._avp_index = None
 
     @classmethod
     def create_response_msg(cls, msg):
@@ -248,6 +255,17 @@ class Message(object):
             )
         )
 
+    @property
+    def _avps(self):
+        """ The list of AVPs, decoding those not decoded yet """
+        if self._avp_index is not None:
+            self._avp_list = [
+                self._decode_avp(entry) for entry in self._avp_index
+            ]
+            self._payload = None
+            self._avp_index = None
+        return self._avp_list
+
     @property
     def length(self):
         """
@@ -256,8 +274,10 @@ class Message(object):
         Returns:
             the length of the encoded message in bytes
         """
+        if self._payload is not None:
+            return self.header.length + len(self._payload)
         length = self.header.length
-        for avp_ in self._avps:
+        for avp_ in self._avp_list:
             length += avp_.length
         return length
 
@@ -295,9 +315,14 @@ class Message(object):
         Return:
             an iterator on all AVPs that match
         """
+        if self._avp_index is not None:
+            return (
+                self._decode_avp(entry) for entry in self._avp_index
+                if entry[0] == vendor and entry[1] == code
+            )
         return filter(
             lambda element: element.vendor == vendor
-            and element.code == code, self._avps,
+            and element.code == code, self._avp_list,
         )
 
     def find_avp(self, vendor, code):
@@ -310,9 +335,7 @@ class Message(object):
         Return:
             the first AVP that matches or None if no match exists
         """
-        result = list(self.filter_avps(vendor, code))
-        if len(result):
-            return result[0]
+        return next(self.filter_avps(vendor, code), None)
 
     def has_fields(self, fields):
         """
@@ -323,16 +346,30 @@ class Message(object):
         Returns:
             True if the required fields are found in the message
         """
+        if self._avp_index is not None:
+            # Check the index, rather than decoding the AVPs
+            avp_ids = {(entry[0], entry[1]) for entry in self._avp_index}
+            return all(avp.resolve(name) in avp_ids for name in fields)
         for name in fields:
             if not self.find_avp(*avp.resolve(name)):
                 return False
         return True
 
+    def _decode_avp(self, entry):
+        """ Decode the AVP of an index entry, once """
+        if entry[3] is None:
+            entry[3] = avp.decode(self._payload[entry[2]:])
+        return entry[3]
+
 
 def decode(payload):
     """
     Decodes a diameter message from the wire
 
+    Only the AVP headers are decoded here, the AVPs are decoded when looked
+    up. The message keeps a reference to payload, which must not be modified
+    afterwards.
+
     Args:
         payload: the byte stream from the wire
     Return:
@@ -355,10 +392,17 @@ def decode(payload):
 
     msg = Message(MessageHeader.decode(payload))
 
-    offset = msg.header.length
-    while offset < length:
-        avp_entry = avp.decode(payload[offset:])
-        offset += avp_entry.length
-        msg.append_avp(avp_entry)
-
+    avps_payload = memoryview(payload)[HEADER_LEN:length]
+    avp_index = []
+    offset = 0
+    while offset < len(avps_payload):
+        code, vendor, _, payload_offset, avp_length = \
+            avp.decode_header(avps_payload, offset)
+        if not payload_offset <= avp_length <= len(avps_payload) - offset:
+            raise CodecException("Invalid AVP length")
+        avp_index.append([vendor, code, offset, None])
+        # Skip the padding
+        offset += (avp_length + 3) & ~3
+    msg._payload = avps_payload
+    msg._avp_index = avp_index
     return msg
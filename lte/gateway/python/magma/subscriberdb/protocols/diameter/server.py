@@ -69,10 +69,15 @@ class S6aServer(asyncio.Protocol):
             None
         """
         logging.debug("Bytes read: %s", data)
-        self._readbuf.extend(data)
+        if self._readbuf:
+            self._readbuf.extend(data)
+            data = self._readbuf
+        # Otherwise decode straight from data, which usually holds whole
+        # messages. The decoded messages keep references to the buffer, so
+        # it is never modified once decoded from.
 
         # Use memoryview to prevent copies when slicing
-        memview = memoryview(self._readbuf)
+        memview = memoryview(data)
         remain = len(memview)
         begin = 0  # beginning of message
 
@@ -85,8 +90,9 @@ class S6aServer(asyncio.Protocol):
                 begin += msg.length
                 remain -= msg.length
             except exception.TooShortException:
-                logging.error("Diameter message too short to decode")
-                return
+                # Wait for the rest of the message
+                logging.debug("Diameter message too short to decode")
+                break
             except Exception as exc:  # pylint: disable=broad-except
                 # Handle any exceptions with message handling, without
                 # affecting other messages/users
@@ -97,7 +103,7 @@ class S6aServer(asyncio.Protocol):
                 begin += length
                 remain -= length
 
-        # Get the unparsed bytes
+        # Keep the unparsed bytes, at most part of a message
         self._readbuf = bytearray(memview[begin:])
 
     def connection_lost(self, exc):
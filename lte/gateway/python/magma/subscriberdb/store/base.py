@@ -12,8 +12,12 @@ limitations under the License.
 """
 
 import abc
+from collections import namedtuple
 from contextlib import contextmanager
 
+# Subscriber ids added, updated and deleted by a resync or update
+SubscriberDiff = namedtuple('SubscriberDiff', ['added', 'updated', 'deleted'])
+
 
 class BaseStore(metaclass=abc.ABCMeta):
     """
@@ -81,6 +85,23 @@ class BaseStore(metaclass=abc.ABCMeta):
 
         Args:
             subscribers - list of subscribers to be in the store.
+        Returns:
+            SubscriberDiff of the subscriber ids changed by the resync
+        """
+        raise NotImplementedError()
+
+    @abc.abstractmethod
+    def upsert_subscribers(self, subscribers, deleted_ids=()):
+        """
+        Method that should add or replace the mentioned subscribers and
+        delete deleted_ids, leaving the other subscribers untouched. Like
+        resync, it leaves the current state of subscribers intact.
+
+        Args:
+            subscribers - list of subscribers to add or replace.
+            deleted_ids - ids of the subscribers to delete.
+        Returns:
+            SubscriberDiff of the subscriber ids changed by the update
         """
         raise NotImplementedError()
 
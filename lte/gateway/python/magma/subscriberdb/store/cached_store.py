@@ -11,27 +11,123 @@ See the License for the specific language governing permissions and
 limitations under the License.
 """
 
-import copy
 import threading
 from collections import OrderedDict
 from contextlib import contextmanager
 
+from magma.subscriberdb.metrics import (
+    SUBSCRIBER_CACHE_EVICTIONS_TOTAL,
+    SUBSCRIBER_CACHE_HITS_TOTAL,
+    SUBSCRIBER_CACHE_MISSES_TOTAL,
+)
 from magma.subscriberdb.sid import SIDUtils
 
 from .base import BaseStore, DuplicateSubscriberError
 from .onready import OnDataReady
 
+# Number of independently locked LRU caches the subscribers are spread over
+CACHE_SHARDS = 16
+
+
+class _CacheShard(object):
+    """
+    LRU cache of the subscribers hashed to a shard. The lock guards the
+    cache and the key locks, and is only held for in-memory operations.
+
+    generation is bumped whenever subscribers are dropped from the cache, so
+    a value read or written to the persistent store before that isn't
+    cached. The subscriber is dropped instead, as it may hold an older value.
+    """
+
+    def __init__(self, capacity):
+        self.lock = threading.Lock()
+        self.cache = OrderedDict()
+        self.capacity = capacity
+        self.generation = 0
+        self.key_locks = {}  # sid => [threading.Lock, number of users]
+
+    def get(self, sid):
+        """
+        Get from the LRU cache without taking the lock: dict lookups are
+        atomic. The hit entry is moved to the end unless the shard is busy,
+        in which case the LRU order is left approximate.
+        """
+        data = self.cache.get(sid)
+        if data is not None and self.lock.acquire(blocking=False):
+            try:
+                if sid in self.cache:
+                    self.cache.move_to_end(sid)
+            finally:
+                self.lock.release()
+        return data
+
+    def put(self, sid, data, generation=None):
+        """
+        Put to the LRU cache, unless generation is given and subscribers
+        were dropped since, in which case sid is dropped too. Evict the
+        first item if full.
+        """
+        with self.lock:
+            if generation is not None and generation != self.generation:
+                self.cache.pop(sid, None)
+                return
+            if sid not in self.cache and len(self.cache) >= self.capacity:
+                self.cache.popitem(last=False)
+                SUBSCRIBER_CACHE_EVICTIONS_TOTAL.inc()
+            self.cache[sid] = data
+            self.cache.move_to_end(sid)
+
+    def pop(self, sid):
+        with self.lock:
+            self.cache.pop(sid, None)
+            self.generation += 1
+
+    def clear(self):
+        with self.lock:
+            self.cache.clear()
+            self.generation += 1
+
+    @contextmanager
+    def key_lock(self, sid):
+        """
+        Context manager holding the lock of a single subscriber, so
+        operations on unrelated subscribers of the shard run concurrently
+        """
+        with self.lock:
+            entry = self.key_locks.get(sid)
+            if entry is None:
+                entry = [threading.Lock(), 0]
+                self.key_locks[sid] = entry
+            entry[1] += 1
+        try:
+            with entry[0]:
+                yield
+        finally:
+            with self.lock:
+                entry[1] -= 1
+                if entry[1] == 0:
+                    del self.key_locks[sid]
+
 
 class CachedStore(BaseStore):
     """
     A thread-safe cached persistent store of the subscriber database.
     Prerequisite: persistent_store need to be thread safe
+
+    The cache is split into shards keyed by the SID hash, each an LRU cache
+    holding its share of cache_capacity. Cache hits don't take any lock, and
+    edits only lock the subscriber edited, so requests for unrelated
+    subscribers never wait on each other.
     """
 
-    def __init__(self, persistent_store, cache_capacity=512, loop=None):
-        self._lock = threading.Lock()
-        self._cache = OrderedDict()
-        self._cache_capacity = cache_capacity
+    def __init__(
+        self, persistent_store, cache_capacity=512, loop=None,
+        num_shards=CACHE_SHARDS,
+    ):
+        shard_capacity = max(1, cache_capacity // num_shards)
+        self._shards = [
+            _CacheShard(shard_capacity) for _ in range(num_shards)
+        ]
         self._persistent_store = persistent_store
         self._on_ready = OnDataReady(loop=loop)
 
@@ -40,12 +136,13 @@ class CachedStore(BaseStore):
         Method that adds the subscriber.
         """
         sid = SIDUtils.to_str(subscriber_data.sid)
-        with self._lock:
-            if sid in self._cache:
+        shard = self._get_shard(sid)
+        with shard.key_lock(sid):
+            if sid in shard.cache:
                 raise DuplicateSubscriberError(sid)
 
             self._persistent_store.add_subscriber(subscriber_data)
-            self._cache_put(sid, subscriber_data)
+            shard.put(sid, subscriber_data)
         self._on_ready.add_subscriber(subscriber_data)
 
     @contextmanager
@@ -53,34 +150,28 @@ class CachedStore(BaseStore):
         """
         Context manager to modify the subscriber data.
         """
-        with self._lock:
-            if subscriber_id in self._cache:
-                data = self._cache_get(subscriber_id)
-                subscriber_data = copy.deepcopy(data)
-            else:
-                subscriber_data = \
-                    self._persistent_store.get_subscriber_data(subscriber_id)
-            yield subscriber_data
-            self._persistent_store.update_subscriber(subscriber_data)
-            self._cache_put(subscriber_id, subscriber_data)
+        shard = self._get_shard(subscriber_id)
+        with shard.key_lock(subscriber_id):
+            generation = shard.generation
+            with self._persistent_store.edit_subscriber(subscriber_id) as data:
+                yield data
+            shard.put(subscriber_id, data, generation)
 
     def delete_subscriber(self, subscriber_id):
         """
         Method that deletes a subscriber, if present.
         """
-        with self._lock:
-            if subscriber_id in self._cache:
-                del self._cache[subscriber_id]
-
+        shard = self._get_shard(subscriber_id)
+        with shard.key_lock(subscriber_id):
+            shard.pop(subscriber_id)
             self._persistent_store.delete_subscriber(subscriber_id)
 
     def delete_all_subscribers(self):
         """
         Method that removes all the subscribers from the store
         """
-        with self._lock:
-            self._cache_clear()
-            self._persistent_store.delete_all_subscribers()
+        self._persistent_store.delete_all_subscribers()
+        self._cache_clear()
 
     def resync(self, subscribers):
         """
@@ -90,24 +181,50 @@ class CachedStore(BaseStore):
 
         Args:
             subscribers - list of subscribers to be in the store.
+        Returns:
+            SubscriberDiff of the subscriber ids changed by the resync
         """
-        with self._lock:
-            self._cache_clear()
-            self._persistent_store.resync(subscribers)
+        diff = self._persistent_store.resync(subscribers)
+        self._cache_evict(diff)
         self._on_ready.resync(subscribers)
+        return diff
+
+    def upsert_subscribers(self, subscribers, deleted_ids=()):
+        """
+        Method that adds or replaces the mentioned subscribers and deletes
+        deleted_ids.
+
+        Args:
+            subscribers - list of subscribers to add or replace.
+            deleted_ids - ids of the subscribers to delete.
+        Returns:
+            SubscriberDiff of the subscriber ids changed by the update
+        """
+        diff = self._persistent_store.upsert_subscribers(
+            subscribers, deleted_ids,
+        )
+        self._cache_evict(diff)
+        if diff.added:
+            self._on_ready.add_subscriber(subscribers)
+        return diff
 
     def get_subscriber_data(self, subscriber_id):
         """
         Method that returns the subscriber data for the subscriber.
         """
-        with self._lock:
-            if subscriber_id in self._cache:
-                return self._cache_get(subscriber_id)
-            else:
-                subscriber_data = \
-                    self._persistent_store.get_subscriber_data(subscriber_id)
-                self._cache_put(subscriber_id, subscriber_data)
-                return subscriber_data
+        shard = self._get_shard(subscriber_id)
+        subscriber_data = shard.get(subscriber_id)
+        if subscriber_data is not None:
+            SUBSCRIBER_CACHE_HITS_TOTAL.inc()
+            return subscriber_data
+
+        SUBSCRIBER_CACHE_MISSES_TOTAL.inc()
+        with shard.key_lock(subscriber_id):
+            generation = shard.generation
+            subscriber_data = \
+                self._persistent_store.get_subscriber_data(subscriber_id)
+            shard.put(subscriber_id, subscriber_data, generation)
+        return subscriber_data
 
     def list_subscribers(self):
         """
@@ -120,23 +237,23 @@ class CachedStore(BaseStore):
     async def on_ready(self):
         return await self._on_ready.event.wait()
 
-    def _cache_get(self, k):
-        """
-        Get from the LRU cache. Move the last hit entry to the end.
-        """
-        self._cache.move_to_end(k)
-        return self._cache[k]
-
-    def _cache_put(self, k, v):
-        """
-        Put to the LRU cache. Evict the first item if full.
-        """
-        if self._cache_capacity == len(self._cache):
-            self._cache.popitem(last=False)
-        self._cache[k] = v
+    def _get_shard(self, sid):
+        return self._shards[hash(sid) % len(self._shards)]
 
     def _cache_list(self):
-        return list(self._cache.keys())
+        sids = []
+        for shard in self._shards:
+            with shard.lock:
+                sids.extend(shard.cache.keys())
+        return sids
 
     def _cache_clear(self):
-        self._cache.clear()
+        for shard in self._shards:
+            shard.clear()
+
+    def _cache_evict(self, diff):
+        """
+        Drop the subscribers changed by diff from the LRU cache.
+        """
+        for sid in diff.updated + diff.deleted:
+            self._get_shard(sid).pop(sid)
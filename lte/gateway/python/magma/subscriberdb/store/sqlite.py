@@ -11,23 +11,136 @@ See the License for the specific language governing permissions and
 limitations under the License.
 """
 
+import hashlib
 import logging
+import queue
 import sqlite3
+import threading
 from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
 from contextlib import contextmanager
 from datetime import datetime
 
 from lte.protos.subscriberdb_pb2 import SubscriberData
 from magma.subscriberdb.sid import SIDUtils
 
-from .base import BaseStore, DuplicateSubscriberError, SubscriberNotFoundError
+from .base import (
+    BaseStore,
+    DuplicateSubscriberError,
+    SubscriberDiff,
+    SubscriberNotFoundError,
+)
 from .onready import OnDataReady
 
+# Idle read connections kept open per shard
+READ_POOL_SIZE = 4
+# Threads applying resyncs and updates, one shard transaction each
+SYNC_WORKERS = 8
+
+# Statements are kept as constants so each connection's statement cache
+# compiles them once and reuses the prepared statement afterwards
+# hash is the content hash of the subscriber as last synced from the cloud,
+# NULL once the subscriber is edited locally
+_CREATE_SUBSCRIBER_TABLE = (
+    "CREATE TABLE IF NOT EXISTS subscriberdb"
+    "(subscriber_id text PRIMARY KEY, data text, hash blob)"
+)
+_TABLE_INFO = "PRAGMA table_info(subscriberdb)"
+_ADD_HASH_COLUMN = "ALTER TABLE subscriberdb ADD COLUMN hash blob"
+_CREATE_DIGEST_TABLE = (
+    "CREATE TABLE IF NOT EXISTS subscriber_digest"
+    "(digest string PRIMARY KEY, updated_at timestamp)"
+)
+_SELECT_DATA = "SELECT data FROM subscriberdb WHERE subscriber_id = ?"
+_SELECT_IDS = "SELECT subscriber_id FROM subscriberdb"
+_SELECT_HASH = "SELECT hash FROM subscriberdb WHERE subscriber_id = ?"
+_SELECT_HASHES = "SELECT subscriber_id, hash FROM subscriberdb"
+_INSERT = "INSERT INTO subscriberdb(subscriber_id, data) VALUES (?, ?)"
+_UPSERT = (
+    "INSERT OR REPLACE INTO subscriberdb(subscriber_id, data, hash) "
+    "VALUES (?, ?, ?)"
+)
+_UPDATE = "UPDATE subscriberdb SET data = ? WHERE subscriber_id = ?"
+_UPDATE_LOCAL = (
+    "UPDATE subscriberdb SET data = ?, hash = NULL WHERE subscriber_id = ?"
+)
+_DELETE = "DELETE FROM subscriberdb WHERE subscriber_id = ?"
+_DELETE_ALL = "DELETE FROM subscriberdb"
+_SELECT_DIGEST = "SELECT digest, updated_at FROM subscriber_digest"
+_INSERT_DIGEST = (
+    "INSERT INTO subscriber_digest(digest, updated_at) VALUES (?, ?)"
+)
+_DELETE_DIGEST = "DELETE FROM subscriber_digest"
+
+
+class _ShardConnections(object):
+    """
+    Long-lived connections to a single sqlite file in WAL mode. Writes go
+    through one writer connection serialized by a lock, while reads use a
+    pool of connections so they can run concurrently with each other and
+    with the writer.
+    """
+
+    def __init__(self, db_location: str, pool_size: int = READ_POOL_SIZE):
+        self._db_location = db_location
+        self._pool_size = pool_size
+        self._write_lock = threading.Lock()
+        self._writer = self._connect()
+        # WAL mode is persistent in the db file, so only the writer sets it
+        self._writer.execute("PRAGMA journal_mode=WAL")
+        self._writer.execute("PRAGMA synchronous=NORMAL")
+        self._readers = queue.LifoQueue(maxsize=pool_size)
+
+    def _connect(self) -> sqlite3.Connection:
+        # Connections move between the threads borrowing them
+        return sqlite3.connect(
+            self._db_location, uri=True, check_same_thread=False,
+        )
+
+    @contextmanager
+    def reader(self):
+        """
+        Borrow a read connection from the pool, opening one if none is idle.
+        """
+        try:
+            conn = self._readers.get_nowait()
+        except queue.Empty:
+            conn = self._connect()
+        try:
+            yield conn
+        finally:
+            try:
+                self._readers.put_nowait(conn)
+            except queue.Full:
+                conn.close()
+
+    @contextmanager
+    def writer(self):
+        """
+        Hold the writer connection inside a transaction, which is committed
+        on exit or rolled back if an exception is raised.
+        """
+        with self._write_lock:
+            with self._writer:
+                yield self._writer
+
+    def close(self) -> None:
+        with self._write_lock:
+            self._writer.close()
+        while True:
+            try:
+                self._readers.get_nowait().close()
+            except queue.Empty:
+                break
+
 
 class SqliteStore(BaseStore):
     """
     A thread-safe sqlite based implementation of the subscriber database.
 
+    Each shard keeps long-lived connections in WAL mode: a pool of read
+    connections and a single writer, see _ShardConnections.
+
     Processes using this store shouldn't be forked since the sqlite connections
     can't be shared by multiple processes.
     """
@@ -47,7 +160,9 @@ class SqliteStore(BaseStore):
             db_location = "/var/opt/magma/"
 
         # construct db_location items as:
-        # file:<path>subscriber<shard>.db?cache=shared
+        # file:<path>subscriber<shard>.db
+        # Shared cache isn't used, it would serialize the connections of a
+        # shard on table locks and defeat WAL's concurrent reads.
         db_location_list = []
 
         # file name is passed, use it as a base
@@ -57,41 +172,42 @@ class SqliteStore(BaseStore):
                 + db_location
                 + 'subscriber'
                 + str(shard)
-                + ".db?cache=shared",
+                + ".db",
             )
             logging.info("db location: %s", db_location_list[shard])
 
-        digest_db_location = 'file:' + db_location + \
-                             'subscriber-digest.db?cache=shared'
+        digest_db_location = 'file:' + db_location + 'subscriber-digest.db'
         logging.info("digest db location: %s", digest_db_location)
 
         return db_location_list, digest_db_location
 
     def _create_store(self) -> None:
         """
-        Create the sqlite table for subscribers and digest if they don't exist
-        already.
+        Open the shard connections and create the sqlite table for
+        subscribers and digest if they don't exist already.
         """
+        self._shards = []
         for db_location in self._db_locations:
-            conn = sqlite3.connect(db_location, uri=True)
-            try:
-                with conn:
-                    conn.execute(
-                        "CREATE TABLE IF NOT EXISTS subscriberdb"
-                        "(subscriber_id text PRIMARY KEY, data text)",
-                    )
-            finally:
-                conn.close()
-
-        conn = sqlite3.connect(self._digest_db_location, uri=True)
-        try:
-            with conn:
-                conn.execute(
-                    "CREATE TABLE IF NOT EXISTS subscriber_digest"
-                    "(digest string PRIMARY KEY, updated_at timestamp)",
-                )
-        finally:
-            conn.close()
+            shard = _ShardConnections(db_location)
+            with shard.writer() as conn:
+                conn.execute(_CREATE_SUBSCRIBER_TABLE)
+                # Tables created before the hash column was added
+                columns = [row[1] for row in conn.execute(_TABLE_INFO)]
+                if 'hash' not in columns:
+                    conn.execute(_ADD_HASH_COLUMN)
+            self._shards.append(shard)
+
+        self._digest_shard = _ShardConnections(self._digest_db_location)
+        with self._digest_shard.writer() as conn:
+            conn.execute(_CREATE_DIGEST_TABLE)
+
+    def close(self) -> None:
+        """
+        Close all the sqlite connections held by the store.
+        """
+        for shard in self._shards:
+            shard.close()
+        self._digest_shard.close()
 
     def add_subscriber(self, subscriber_data: SubscriberData):
         """
@@ -99,23 +215,10 @@ class SqliteStore(BaseStore):
         """
         sid = SIDUtils.to_str(subscriber_data.sid)
         data_str = subscriber_data.SerializeToString()
-        db_location = self._db_locations[self._sid2bucket(sid)]
-        conn = sqlite3.connect(db_location, uri=True)
-        try:
-            with conn:
-                res = conn.execute(
-                    "SELECT data FROM subscriberdb WHERE "
-                    "subscriber_id = ?", (sid,),
-                )
-                if res.fetchone():
-                    raise DuplicateSubscriberError(sid)
-
-                conn.execute(
-                    "INSERT INTO subscriberdb(subscriber_id, data) "
-                    "VALUES (?, ?)", (sid, data_str),
-                )
-        finally:
-            conn.close()
+        with self._shards[self._sid2bucket(sid)].writer() as conn:
+            if conn.execute(_SELECT_DATA, (sid,)).fetchone():
+                raise DuplicateSubscriberError(sid)
+            conn.execute(_INSERT, (sid, data_str))
         self._on_ready.add_subscriber(subscriber_data)
 
     @contextmanager
@@ -123,73 +226,49 @@ class SqliteStore(BaseStore):
         """
         Context manager to modify the subscriber data.
         """
-        db_location = self._db_locations[self._sid2bucket(subscriber_id)]
-        conn = sqlite3.connect(db_location, uri=True)
-        try:
-            with conn:
-                res = conn.execute(
-                    "SELECT data FROM subscriberdb WHERE " "subscriber_id = ?",
-                    (subscriber_id,),
-                )
-                row = res.fetchone()
-                if not row:
-                    raise SubscriberNotFoundError(subscriber_id)
-                subscriber_data = SubscriberData()
-                subscriber_data.ParseFromString(row[0])
-                yield subscriber_data
-                data_str = subscriber_data.SerializeToString()
-                conn.execute(
-                    "UPDATE subscriberdb SET data = ? "
-                    "WHERE subscriber_id = ?",
-                    (data_str, subscriber_id),
-                )
-        finally:
-            conn.close()
+        shard = self._shards[self._sid2bucket(subscriber_id)]
+        with shard.writer() as conn:
+            row = conn.execute(_SELECT_DATA, (subscriber_id,)).fetchone()
+            if not row:
+                raise SubscriberNotFoundError(subscriber_id)
+            subscriber_data = SubscriberData()
+            subscriber_data.ParseFromString(row[0])
+            original = SubscriberData()
+            original.CopyFrom(subscriber_data)
+            yield subscriber_data
+            data_str = subscriber_data.SerializeToString()
+            # Edits of more than the state no longer match the cloud's copy
+            original.state.CopyFrom(subscriber_data.state)
+            if original == subscriber_data:
+                conn.execute(_UPDATE, (data_str, subscriber_id))
+            else:
+                conn.execute(_UPDATE_LOCAL, (data_str, subscriber_id))
 
     def delete_subscriber(self, subscriber_id):
         """
         Delete a subscriber, if present.
         """
-        db_location = self._db_locations[self._sid2bucket(subscriber_id)]
-        conn = sqlite3.connect(db_location, uri=True)
-        try:
-            with conn:
-                conn.execute(
-                    "DELETE FROM subscriberdb WHERE " "subscriber_id = ?",
-                    (subscriber_id,),
-                )
-        finally:
-            conn.close()
+        shard = self._shards[self._sid2bucket(subscriber_id)]
+        with shard.writer() as conn:
+            conn.execute(_DELETE, (subscriber_id,))
 
     def delete_all_subscribers(self):
         """
         Remove all the subscribers from the store
         """
-        for db_location in self._db_locations:
-            conn = sqlite3.connect(db_location, uri=True)
-            try:
-                with conn:
-                    conn.execute("DELETE FROM subscriberdb")
-            finally:
-                conn.close()
+        for shard in self._shards:
+            with shard.writer() as conn:
+                conn.execute(_DELETE_ALL)
 
     def get_subscriber_data(self, subscriber_id):
         """
         Return the auth key for the subscriber.
         """
-        db_location = self._db_locations[self._sid2bucket(subscriber_id)]
-        conn = sqlite3.connect(db_location, uri=True)
-        try:
-            with conn:
-                res = conn.execute(
-                    "SELECT data FROM subscriberdb WHERE "
-                    "subscriber_id = ?", (subscriber_id,),
-                )
-                row = res.fetchone()
-                if not row:
-                    raise SubscriberNotFoundError(subscriber_id)
-        finally:
-            conn.close()
+        shard = self._shards[self._sid2bucket(subscriber_id)]
+        with shard.reader() as conn:
+            row = conn.execute(_SELECT_DATA, (subscriber_id,)).fetchone()
+        if not row:
+            raise SubscriberNotFoundError(subscriber_id)
         subscriber_data = SubscriberData()
         subscriber_data.ParseFromString(row[0])
         return subscriber_data
@@ -199,16 +278,9 @@ class SqliteStore(BaseStore):
         Return the list of subscribers stored
         """
         sub_list = []
-        for db_location in self._db_locations:
-            conn = sqlite3.connect(db_location, uri=True)
-            try:
-                with conn:
-                    res = conn.execute(
-                        "SELECT subscriber_id FROM subscriberdb",
-                    )
-                    sub_list.extend([row[0] for row in res])
-            finally:
-                conn.close()
+        for shard in self._shards:
+            with shard.reader() as conn:
+                sub_list.extend([row[0] for row in conn.execute(_SELECT_IDS)])
         return sub_list
 
     def update_subscriber(self, subscriber_data):
@@ -226,18 +298,10 @@ class SqliteStore(BaseStore):
         """
         sid = SIDUtils.to_str(subscriber_data.sid)
         data_str = subscriber_data.SerializeToString()
-        db_location = self._db_locations[self._sid2bucket(sid)]
-        conn = sqlite3.connect(db_location, uri=True)
-        try:
-            with conn:
-                res = conn.execute(
-                    "UPDATE subscriberdb SET data = ? "
-                    "WHERE subscriber_id = ?", (data_str, sid),
-                )
-                if not res.rowcount:
-                    raise SubscriberNotFoundError(sid)
-        finally:
-            conn.close()
+        with self._shards[self._sid2bucket(sid)].writer() as conn:
+            res = conn.execute(_UPDATE_LOCAL, (data_str, sid))
+            if not res.rowcount:
+                raise SubscriberNotFoundError(sid)
 
     def resync(self, subscribers):
         """
@@ -245,60 +309,116 @@ class SqliteStore(BaseStore):
         subscribers. The resync leaves the current state of subscribers
         intact.
 
+        Only the subscribers whose content hash differs from the one stored
+        are written, and only the subscribers missing from the list are
+        deleted. The shards are synced in parallel, each in a transaction.
+
         Args:
             subscribers - list of subscribers to be in the store.
+        Returns:
+            SubscriberDiff of the subscriber ids changed by the resync
+        """
+        diff = self._sync_shards(subscribers, (), True)
+        self._on_ready.resync(subscribers)
+        return diff
+
+    def upsert_subscribers(self, subscribers, deleted_ids=()):
+        """
+        Add or replace the mentioned subscribers whose content hash changed
+        and delete deleted_ids, leaving the current state of subscribers
+        intact.
+
+        Args:
+            subscribers - list of subscribers to add or replace.
+            deleted_ids - ids of the subscribers to delete.
+        Returns:
+            SubscriberDiff of the subscriber ids changed by the update
         """
+        diff = self._sync_shards(subscribers, deleted_ids, False)
+        if diff.added:
+            self._on_ready.add_subscriber(subscribers)
+        return diff
+
+    def _sync_shards(self, subscribers, deleted_ids, full_resync):
         bucket_subs = defaultdict(list)
         for sub in subscribers:
             sid = SIDUtils.to_str(sub.sid)
-            bucket_subs[self._sid2bucket(sid)].append(sub)
-
-        for i, db_location in enumerate(self._db_locations):
-            conn = sqlite3.connect(db_location, uri=True)
-            try:
-                with conn:
-                    # Capture the current state of the subscribers
-                    res = conn.execute(
-                        "SELECT subscriber_id, data FROM subscriberdb",
-                    )
-                    current_state = {}
-                    for row in res:
-                        sub = SubscriberData()
-                        sub.ParseFromString(row[1])
-                        current_state[row[0]] = sub.state
-
-                    # Clear all subscribers
-                    conn.execute("DELETE FROM subscriberdb")
-
-                    # Add the subscribers with the current state
-                    for sub in bucket_subs[i]:
-                        sid = SIDUtils.to_str(sub.sid)
-                        if sid in current_state:
-                            sub.state.CopyFrom(current_state[sid])
-                        data_str = sub.SerializeToString()
-                        conn.execute(
-                            "INSERT INTO subscriberdb(subscriber_id, data) "
-                            "VALUES (?, ?)", (sid, data_str),
-                        )
-            finally:
-                conn.close()
-        self._on_ready.resync(subscribers)
+            bucket_subs[self._sid2bucket(sid)].append((sid, sub))
+        bucket_deleted = defaultdict(list)
+        for sid in deleted_ids:
+            bucket_deleted[self._sid2bucket(sid)].append(sid)
+
+        if full_resync:
+            buckets = range(self._n_shards)
+        else:
+            buckets = set(bucket_subs) | set(bucket_deleted)
+        with ThreadPoolExecutor(max_workers=SYNC_WORKERS) as executor:
+            futures = [
+                executor.submit(
+                    self._sync_shard, self._shards[i], bucket_subs[i],
+                    bucket_deleted[i], full_resync,
+                ) for i in buckets
+            ]
+            added, updated, deleted = [], [], []
+            for future in futures:
+                diff = future.result()
+                added.extend(diff.added)
+                updated.extend(diff.updated)
+                deleted.extend(diff.deleted)
+        return SubscriberDiff(added, updated, deleted)
+
+    @staticmethod
+    def _sync_shard(shard, subs, deleted_ids, full_resync):
+        """
+        Upsert the (sid, subscriber) pairs of subs whose content hash
+        changed and delete deleted_ids from shard, or with full_resync all the
+        subscribers of the shard missing from subs.
+        """
+        with shard.writer() as conn:
+            if full_resync:
+                stored_hashes = dict(conn.execute(_SELECT_HASHES))
+            else:
+                stored_hashes = {}
+                for sid in [sid for sid, _ in subs] + list(deleted_ids):
+                    row = conn.execute(_SELECT_HASH, (sid,)).fetchone()
+                    if row:
+                        stored_hashes[sid] = row[0]
+
+            added, updated, rows = [], [], []
+            for sid, sub in subs:
+                content_hash = _content_hash(sub)
+                if sid not in stored_hashes:
+                    added.append(sid)
+                elif stored_hashes[sid] == content_hash:
+                    continue
+                else:
+                    # Keep the current state of the subscriber
+                    row = conn.execute(_SELECT_DATA, (sid,)).fetchone()
+                    current = SubscriberData()
+                    current.ParseFromString(row[0])
+                    sub.state.CopyFrom(current.state)
+                    updated.append(sid)
+                rows.append((sid, sub.SerializeToString(), content_hash))
+            conn.executemany(_UPSERT, rows)
+
+            if full_resync:
+                synced_ids = {sid for sid, _ in subs}
+                deleted = [
+                    sid for sid in stored_hashes if sid not in synced_ids
+                ]
+            else:
+                deleted = [sid for sid in deleted_ids if sid in stored_hashes]
+            conn.executemany(_DELETE, [(sid,) for sid in deleted])
+        return SubscriberDiff(added, updated, deleted)
 
     def get_current_digest(self) -> str:
         """
         Return the current subscriber digest stored in the db.
         """
-        conn = sqlite3.connect(self._digest_db_location, uri=True)
-        try:
-            with conn:
-                res = conn.execute(
-                    "SELECT digest, updated_at FROM subscriber_digest",
-                )
-                row = res.fetchone()
-                if not row:
-                    row = ["", None]
-        finally:
-            conn.close()
+        with self._digest_shard.reader() as conn:
+            row = conn.execute(_SELECT_DIGEST).fetchone()
+        if not row:
+            row = ["", None]
 
         digest = str(row[0])
         logging.info("get digest stored in gateway: %s", digest)
@@ -308,17 +428,9 @@ class SqliteStore(BaseStore):
         """
         Replace the old digest in the db with the new digest.
         """
-        conn = sqlite3.connect(self._digest_db_location, uri=True)
-        try:
-            with conn:
-                conn.execute("DELETE FROM subscriber_digest")
-
-                conn.execute(
-                    "INSERT INTO subscriber_digest(digest, updated_at) "
-                    "VALUES (?, ?)", (new_digest, datetime.now()),
-                )
-        finally:
-            conn.close()
+        with self._digest_shard.writer() as conn:
+            conn.execute(_DELETE_DIGEST)
+            conn.execute(_INSERT_DIGEST, (new_digest, datetime.now()))
 
         logging.info("update digest stored in gateway: %s", new_digest)
 
@@ -356,3 +468,17 @@ class SqliteStore(BaseStore):
             )
             bucket = 0
         return bucket
+
+
+def _content_hash(subscriber_data):
+    """
+    Hash of the subscriber's streamed fields, i.e. all but its local state
+    """
+    if subscriber_data.HasField('state'):
+        without_state = SubscriberData()
+        without_state.CopyFrom(subscriber_data)
+        without_state.ClearField('state')
+        subscriber_data = without_state
+    return hashlib.md5(  # noqa: S303
+        subscriber_data.SerializeToString(deterministic=True),
+    ).digest()
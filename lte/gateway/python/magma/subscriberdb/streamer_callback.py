@@ -19,6 +19,7 @@ from lte.protos.s6a_service_pb2_grpc import S6aServiceStub
 from lte.protos.subscriberdb_pb2 import LTESubscription, SubscriberData
 from magma.common.service_registry import ServiceRegistry
 from magma.common.streamer import StreamerClient
+from magma.subscriberdb.sid import SIDUtils
 
 
 class SubscriberDBStreamerCallback(StreamerClient.Callback):
@@ -35,69 +36,60 @@ class SubscriberDBStreamerCallback(StreamerClient.Callback):
 
     def process_update(self, stream_name, updates, resync):
         """
-        The cloud streams ALL subscribers registered, both active and inactive.
-        Since we don't have a good way of knowing whether a detach succeeds or
-        fails to update the local database correctly, we have to send down all
-        subscribers to keep trying to delete inactive subscribers.
-        TODO we can optimize a bit on the MME side to not detach already
-        detached subscribers.
+        The cloud streams ALL subscribers registered, both active and inactive,
+        on resync. The store only writes the subscribers that changed and
+        deletes the ones that are gone; those that were deleted or are no
+        longer active get detached.
+
+        Incremental updates carry the subscribers to add or replace, or just
+        the key of a subscriber to delete.
         """
         logging.info(
             "Processing %d subscriber updates (resync=%s)",
             len(updates), resync,
         )
 
+        # TODO:
+        # - handle database exceptions
+        subscribers = []
+        deleted_ids = []
+        for update in updates:
+            if not resync and not update.value:
+                deleted_ids.append(_with_imsi_prefix(update.key))
+                continue
+            sub = SubscriberData()
+            sub.ParseFromString(update.value)
+            subscribers.append(sub)
+
         if resync:
-            # TODO:
-            # - handle database exceptions
-            keys = []
-            subscribers = []
-            active_subscriber_ids = []
-            for update in updates:
-                sub = SubscriberData()
-                sub.ParseFromString(update.value)
-                subscribers.append(sub)
-                keys.append(update.key)
-                if sub.lte.state == LTESubscription.ACTIVE:
-                    active_subscriber_ids.append(update.key)
-            old_sub_ids = self._store.list_subscribers()
-            # Only compare active subscribers against the database to decide
-            # what to detach.
-            self.detach_deleted_subscribers(old_sub_ids, active_subscriber_ids)
-            logging.debug("Resync with subscribers: %s", ','.join(keys))
-            self._store.resync(subscribers)
+            diff = self._store.resync(subscribers)
         else:
-            # TODO: implement updates
-            pass
+            diff = self._store.upsert_subscribers(subscribers, deleted_ids)
+        logging.debug(
+            "Subscribers added: %s, updated: %s, deleted: %s",
+            ','.join(diff.added), ','.join(diff.updated),
+            ','.join(diff.deleted),
+        )
 
-    def detach_deleted_subscribers(self, old_sub_ids, new_sub_ids):
+        # Only subscribers that were active can need a detach
+        inactive_ids = {
+            SIDUtils.to_str(sub.sid) for sub in subscribers
+            if sub.lte.state != LTESubscription.ACTIVE
+        }
+        self.detach_deleted_subscribers(
+            diff.deleted + [
+                sid for sid in diff.updated if sid in inactive_ids
+            ],
+        )
+
+    def detach_deleted_subscribers(self, deleted_sub_ids):
         """
-        Compares current subscriber ids and new subscriber ids list
-        just streamed from the cloud to figure out the deleted subscribers.
-        Then send grpc DeleteSubscriber request to mme to detach all the
+        Send grpc DeleteSubscriber request to mme to detach all the
         deleted subscribers.
-        :param old_sub_ids: a list of old subscriber ids in the store.
-        :param new_sub_ids: a list of new active subscriber ids
-                just streamed from the cloud
+        :param deleted_sub_ids: a list of ids of the subscribers deleted or
+                deactivated in the store.
         :return: n/a
         """
-        # THIS IS A HACK UNTIL WE FIX THIS ON CLOUD
-        # We accept IMSIs with or without 'IMSI' prepended on cloud, but we
-        # always store IMSIs on local subscriberdb with IMSI prepended. If the
-        # cloud streams down subscriber IDs without 'IMSI' prepended,
-        # subscriberdb will try to delete all of the subscribers from MME every
-        # time it streams from cloud because the set membership will fail
-        # when comparing '12345' to 'IMSI12345'.
-        new_sub_ids = set(
-            map(
-                lambda s: 'IMSI' + s if not s.startswith('IMSI') else s,
-                new_sub_ids,
-            ),
-        )
-        deleted_sub_ids = [
-            sub_id for sub_id in old_sub_ids
-            if sub_id not in set(new_sub_ids)
-        ]
         if len(deleted_sub_ids) == 0:
             return
         # send detach request to mme for all deleted subscribers.
@@ -132,3 +124,11 @@ class SubscriberDBStreamerCallback(StreamerClient.Callback):
                 "Detach Deleted Subscribers Error! [%s] %s",
                 err.code(), err.details(),
             )
+
+
+def _with_imsi_prefix(sub_id):
+    """
+    We accept IMSIs with or without 'IMSI' prepended on cloud, but we always
+    store IMSIs on local subscriberdb with IMSI prepended.
+    """
+    return 'IMSI' + sub_id if not sub_id.startswith('IMSI') else sub_id
@@ -275,21 +275,13 @@ class SubscriberDBCloudClientTests(unittest.TestCase):
         s6a_service_mock_stub.side_effect = [mock]
 
         # Call with no samples
-        old_sub_ids = ["IMSI202", "IMSI101"]
-        new_sub_ids = ["IMSI101", "IMSI202"]
-        self.subscriberdb_cloud_client._detach_deleted_subscribers(
-            old_sub_ids,
-            new_sub_ids,
-        )
+        self.subscriberdb_cloud_client._detach_deleted_subscribers([])
         s6a_service_mock_stub.DeleteSubscriber.future.assert_not_called()
         self.subscriberdb_cloud_client._loop.stop()
 
-        # Call with one subscriber id deleted
-        old_sub_ids = ["IMSI202", "IMSI101", "IMSI303"]
-        new_sub_ids = ["IMSI202"]
+        # Call with two subscriber ids deleted
         self.subscriberdb_cloud_client._detach_deleted_subscribers(
-            old_sub_ids,
-            new_sub_ids,
+            ["IMSI101", "IMSI303"],
         )
 
         mock.DeleteSubscriber.future.assert_called_once_with(
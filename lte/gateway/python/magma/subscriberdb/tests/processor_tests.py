@@ -11,8 +11,10 @@ See the License for the specific language governing permissions and
 limitations under the License.
 """
 
+import contextlib
 import tempfile
 import unittest
+from unittest import mock
 
 from lte.protos.mconfig.mconfigs_pb2 import SubscriberDB
 from lte.protos.subscriberdb_pb2 import (
@@ -22,6 +24,7 @@ from lte.protos.subscriberdb_pb2 import (
     SubscriberState,
 )
 from magma.subscriberdb import processor
+from magma.subscriberdb.auth_vector_pool import AuthVectorPool
 from magma.subscriberdb.crypto.milenage import BaseLTEAuthAlgo, Milenage
 from magma.subscriberdb.crypto.utils import CryptoError
 from magma.subscriberdb.sid import SIDUtils
@@ -62,6 +65,13 @@ class FakeMilenage(BaseLTEAuthAlgo):
     def generate_eutran_vector(self, key, opc, sqn, plmn):
         return _dummy_eutran_vector()
 
+    def generate_eutran_keys(self, key, opc, sqn):
+        return None
+
+    @classmethod
+    def generate_eutran_vector_for_plmn(cls, keys, plmn):
+        return _dummy_eutran_vector()
+
     def generate_resync(self, auts, key, opc, rand):
         # AMF should be zeros for resync
         assert self.amf == b'\x00\x00'
@@ -100,6 +110,7 @@ class ProcessorTests(unittest.TestCase):
             max_ul_bit_rate=10000, max_dl_bit_rate=5000,
         )
 
+        self._store = store
         self._processor = processor.Processor(
             store, self._default_sub_profile, self._sub_profiles, op, amf,
         )
@@ -215,6 +226,123 @@ class ProcessorTests(unittest.TestCase):
             eutran_vector,
         )
 
+    def test_lte_auth_vectors(self):
+        """
+        Test if we get a vector per PLMN with consecutive seq numbers
+        reserved in one go
+        """
+        with mock.patch.object(
+            FakeMilenage, 'generate_eutran_vector',
+            return_value=_dummy_eutran_vector(),
+        ) as generate_eutran_vector:
+            vectors = self._processor.generate_lte_auth_vectors(
+                '11111',
+                3 * [3 * b'\x00'],
+            )
+        self.assertEqual(vectors, 3 * [_dummy_eutran_vector()])
+        self.assertEqual(
+            [call[0][2] for call in generate_eutran_vector.call_args_list],
+            [processor.Processor.seq_to_sqn(seq) for seq in (1, 2, 3)],
+        )
+        self.assertEqual(self._processor.get_next_lte_auth_seq('11111'), 4)
+
+    def test_lte_auth_vector_pool(self):
+        """
+        Test if pooled vectors are reserved in batches, served in seq order
+        and dropped once the subscriber is resynced or edited
+        """
+        self._processor._auth_vector_pool = AuthVectorPool(1, 4)
+        plmn = 3 * b'\x00'
+        with self._mock_pooled_vectors():
+            sqns = [
+                self._processor.generate_lte_auth_vector('11111', plmn)[0]
+                for _ in range(5)
+            ]
+            self.assertEqual(
+                sqns,
+                [processor.Processor.seq_to_sqn(seq) for seq in range(1, 6)],
+            )
+            # Two reservations: 5 seqs on the first call, then 4 more once
+            # serving would leave the pool below the low watermark
+            sub = self._processor.get_sub_data('11111')
+            self.assertEqual(sub.state.lte_auth_next_seq, 10)
+
+            self._processor.set_next_lte_auth_seq('11111', 100)
+            self.assertEqual(
+                self._processor.generate_lte_auth_vector('11111', plmn)[0],
+                processor.Processor.seq_to_sqn(100),
+            )
+
+            with self._store.edit_subscriber('IMSI11111') as sub:
+                sub.lte.auth_key = 16 * b'\x01'
+            self.assertEqual(
+                self._processor.generate_lte_auth_vector('11111', plmn)[0],
+                processor.Processor.seq_to_sqn(105),
+            )
+
+        with self.assertRaises(ValueError):
+            AuthVectorPool(2, 1)
+
+    def test_lte_auth_vector_pool_plmns(self):
+        """
+        Test if pooled vectors are served in seq order for alternating
+        PLMNs, without reserving more seqs
+        """
+        self._processor._auth_vector_pool = AuthVectorPool(1, 4)
+        plmns = [3 * b'\x00', 3 * b'\x01']
+        with self._mock_pooled_vectors():
+            vectors = [
+                self._processor.generate_lte_auth_vector('11111', plmns[i % 2])
+                for i in range(4)
+            ] + self._processor.generate_lte_auth_vectors('11111', plmns)
+        self.assertEqual(
+            vectors,
+            [
+                (processor.Processor.seq_to_sqn(seq), plmns[(seq - 1) % 2])
+                for seq in range(1, 7)
+            ],
+        )
+        # Two reservations of 5 seqs, as with a single PLMN
+        sub = self._processor.get_sub_data('11111')
+        self.assertEqual(sub.state.lte_auth_next_seq, 11)
+
+    def test_lte_resync_vector_pool(self):
+        """
+        Test if resync is checked against the last seq served from the pool,
+        rather than the last one reserved for it
+        """
+        self._processor._auth_vector_pool = AuthVectorPool(1, 4)
+        with self._mock_pooled_vectors():
+            self._processor.generate_lte_auth_vector('11111', 3 * b'\x00')
+        # seqs 1 to 5 are reserved, the UE got 1 and accepted it before
+        sub = self._processor.get_sub_data('11111')
+        self.assertEqual(sub.state.lte_auth_next_seq, 6)
+        with mock.patch.object(
+            FakeMilenage, 'generate_resync',
+            return_value=(processor.Processor.seq_to_sqn(1), 8 * b'\x00'),
+        ):
+            self._processor.resync_lte_auth_seq(
+                '11111', 16 * b'\x00', 14 * b'\x00',
+            )
+        self.assertEqual(self._processor.get_next_lte_auth_seq('11111'), 2)
+
+    def _mock_pooled_vectors(self):
+        """
+        Make the vectors of the pool (SQN, PLMN) tuples
+        """
+        generate_keys = mock.patch.object(
+            FakeMilenage, 'generate_eutran_keys',
+            side_effect=lambda key, opc, sqn: sqn,
+        )
+        for_plmn = mock.patch.object(
+            FakeMilenage, 'generate_eutran_vector_for_plmn',
+            side_effect=lambda keys, plmn: (keys, plmn),
+        )
+        stack = contextlib.ExitStack()
+        stack.enter_context(generate_keys)
+        stack.enter_context(for_plmn)
+        return stack
+
     def test_lte_auth_success_opc(self):
         """
         Test if we get the auth vector using passed OPc
@@ -528,3 +528,79 @@ class AVPConstructorTests(unittest.TestCase):
         # Lists are not supported and should cause an error
         with self.assertRaises(TypeError):
             avp.AVP([0, 3])
+
+
+class PreEncodedAVPTests(unittest.TestCase):
+    """
+    Tests for pre-encoded AVPs and AVP templates
+    """
+
+    def _encode(self, avp_val):
+        out_buf = bytearray(avp_val.length)
+        avp_val.encode(out_buf, 0)
+        return out_buf
+
+    def test_pre_encoded(self):
+        """
+        Tests a pre-encoded AVP encodes and reads as the AVP it encodes
+        """
+        avp_val = avp.AVP('Origin-Host', 'hss.magma.com')
+        pre_encoded = avp.PreEncodedAVP.from_avp(avp_val)
+        self.assertEqual(pre_encoded.length, avp_val.length)
+        self.assertEqual(self._encode(pre_encoded), self._encode(avp_val))
+        self.assertEqual(pre_encoded.code, 264)
+        self.assertEqual(pre_encoded.vendor, avp.VendorId.DEFAULT)
+        self.assertEqual(pre_encoded.value, 'hss.magma.com')
+        self.assertEqual(pre_encoded, avp_val)
+
+        # It can be grouped with other AVPs
+        group = avp.AVP('Experimental-Result', [pre_encoded])
+        self.assertEqual(
+            self._encode(group),
+            self._encode(avp.AVP('Experimental-Result', [avp_val])),
+        )
+
+    def test_template(self):
+        """
+        Tests filling a template patches all the AVPs of the fields
+        """
+        def ambr(ul, dl):
+            return avp.AVP(
+                'AMBR', [
+                    avp.AVP('Max-Requested-Bandwidth-UL', ul),
+                    avp.AVP('Max-Requested-Bandwidth-DL', dl),
+                ],
+            )
+
+        def subscription_data(rand, ul, dl):
+            return avp.AVP(
+                'Subscription-Data', [
+                    avp.AVP('RAND', rand),
+                    ambr(ul, dl),
+                    avp.AVP('APN-Configuration', [ambr(ul, dl)]),
+                ],
+            )
+
+        template = avp.AVPTemplate(
+            subscription_data(bytes(16), 0, 0),
+            ['RAND', 'Max-Requested-Bandwidth-UL', 'Max-Requested-Bandwidth-DL'],
+        )
+        filled = template.fill({
+            'RAND': b'\x01' * 16,
+            'Max-Requested-Bandwidth-UL': 1000,
+            'Max-Requested-Bandwidth-DL': 2000,
+        })
+        self.assertEqual(
+            self._encode(filled),
+            self._encode(subscription_data(b'\x01' * 16, 1000, 2000)),
+        )
+
+        # Values must keep the encoded length of the fields
+        with self.assertRaises(CodecException):
+            template.fill({
+                'RAND': b'\x01' * 8,
+                'Max-Requested-Bandwidth-UL': 1000,
+                'Max-Requested-Bandwidth-DL': 2000,
+            })
+        with self.assertRaises(ValueError):
+            avp.AVPTemplate(ambr(0, 0), ['RAND'])
@@ -404,6 +404,40 @@ class MessageCodecTests(unittest.TestCase):
                 b'\x00' * (message.HEADER_LEN),
             )
 
+    def test_lazy_decode(self):
+        """
+        AVPs of a decoded message are only decoded when looked up, and
+        zero length AVPs are rejected rather than looping on them
+        """
+        msg = message.Message()
+        msg.append_avp(avp.AVP('User-Name', 'hello'))
+        msg.append_avp(avp.AVP('Host-IP-Address', '127.0.0.1'))
+        msg_bytes = bytearray(msg.length)
+        msg.encode(msg_bytes, 0)
+
+        decoded_msg = message.decode(bytes(msg_bytes))
+        self.assertEqual(decoded_msg.length, msg.length)
+        self.assertTrue(decoded_msg.has_fields(['Host-IP-Address']))
+        self.assertFalse(decoded_msg.has_fields(['Session-Id']))
+        self.assertEqual(
+            [entry[3] for entry in decoded_msg._avp_index], [None, None],
+        )
+        self.assertEqual(decoded_msg.find_avp(0, 257).value, '127.0.0.1')
+        self.assertIsNone(decoded_msg._avp_index[0][3])
+
+        # Appending decodes the rest
+        decoded_msg.append_avp(avp.AVP('Session-Id', 'session'))
+        self.assertEqual(len(decoded_msg._avps), 3)
+        self.assertEqual(decoded_msg.find_avp(0, 1).value, 'hello')
+
+        with self.assertRaises(CodecException):
+            message.decode(
+                b'\x01' +  # Version
+                b'\x00\x00\x1c' +  # Length 28
+                b'\x00' * (message.HEADER_LEN - 4) +
+                b'\x00\x00\x00\x01\x00\x00\x00\x00',  # AVP length 0
+            )
+
     def test_respond(self):
         """
         Tests that we can use the convenience clone constructor
@@ -13,6 +13,7 @@ limitations under the License.
 
 # pylint:disable=protected-access
 
+import asyncio
 import unittest
 from unittest.mock import Mock
 
@@ -84,6 +85,7 @@ class S6AApplicationTests(unittest.TestCase):
     HOST_ADDR = "127.0.0.1"
 
     def setUp(self):
+        self._loop = asyncio.new_event_loop()
         base_manager = base.BaseApplication(
             self.REALM, self.HOST, self.HOST_ADDR,
         )
@@ -92,8 +94,10 @@ class S6AApplicationTests(unittest.TestCase):
             self.REALM,
             self.HOST,
             self.HOST_ADDR,
+            loop=self._loop,
         )
         base_manager.register(s6a_manager)
+        self._s6a_manager = s6a_manager
         self._server = server.S6aServer(
             base_manager,
             s6a_manager,
@@ -114,6 +118,14 @@ class S6AApplicationTests(unittest.TestCase):
         # Here goes nothing..
         self._server.connection_made(self._transport)
 
+    def tearDown(self):
+        self._loop.close()
+
+    def _wait_for_auths(self):
+        """ Run the loop until the AIRs in the auth executor are answered """
+        while self._s6a_manager._pending_auths:
+            self._loop.run_until_complete(asyncio.sleep(0.01))
+
     def _check_reply(self, req_bytes, resp_bytes):
         """
         Send data to the protocol in different step lengths to
@@ -132,6 +144,7 @@ class S6AApplicationTests(unittest.TestCase):
             while offset < len(req_bytes):
                 self._server.data_received(req_bytes[offset:offset + step])
                 offset += step
+            self._wait_for_auths()
             self._writes.assert_called_once_with(resp_bytes)
             self._writes.reset_mock()
 
@@ -250,11 +263,69 @@ class S6AApplicationTests(unittest.TestCase):
         processor = self._server._s6a_manager.lte_processor
         with unittest.mock.patch.object(processor, 'resync_lte_auth_seq'):
             self._server.data_received(req_buf)
+            self._wait_for_auths()
             processor.resync_lte_auth_seq.assert_called_once_with(
                 '1',
                 16 * b'\x00', 14 * b'\x00',
             )
 
+    def test_auth_ordering(self):
+        """
+        Test that AIRs for an IMSI received while one is being processed are
+        answered in order, with their auth vectors generated together
+        """
+        req_bufs = []
+        for i in range(3):
+            msg = message.Message()
+            msg.header.application_id = s6a.S6AApplication.APP_ID
+            msg.header.command_code = \
+                s6a.S6AApplicationCommands.AUTHENTICATION_INFORMATION
+            msg.header.request = True
+            msg.append_avp(avp.AVP('Session-Id', 'session%d' % i))
+            msg.append_avp(avp.AVP('Auth-Session-State', 1))
+            msg.append_avp(avp.AVP('User-Name', '1'))
+            msg.append_avp(avp.AVP('Visited-PLMN-Id', b'(Y'))
+            msg.append_avp(
+                avp.AVP(
+                    'Requested-EUTRAN-Authentication-Info', [
+                        avp.AVP('Number-Of-Requested-Vectors', 1),
+                        avp.AVP('Immediate-Response-Preferred', 0),
+                    ],
+                ),
+            )
+            req_buf = bytearray(msg.length)
+            msg.encode(req_buf, 0)
+            req_bufs.append(req_buf)
+
+        processor = self._server._s6a_manager.lte_processor
+        with unittest.mock.patch.object(
+            processor, 'generate_lte_auth_vectors',
+            side_effect=lambda imsi, plmns: [_dummy_eutran_vector()] * len(
+                plmns,
+            ),
+        ):
+            for req_buf in req_bufs:
+                self._server.data_received(req_buf)
+            self._wait_for_auths()
+            # The first AIR is sent to the executor on its own, the other
+            # two are queued behind it and processed as one batch
+            self.assertEqual(
+                processor.generate_lte_auth_vectors.call_args_list, [
+                    unittest.mock.call('1', [b'(Y']),
+                    unittest.mock.call('1', [b'(Y', b'(Y']),
+                ],
+            )
+
+        session_ids = []
+        for call in self._writes.call_args_list:
+            resp = message.decode(call[0][0])
+            session_ids.append(resp.find_avp(*avp.resolve('Session-Id')).value)
+            self.assertEqual(
+                resp.find_avp(*avp.resolve('Result-Code')).value,
+                avp.ResultCode.DIAMETER_SUCCESS,
+            )
+        self.assertEqual(session_ids, ['session0', 'session1', 'session2'])
+
     def test_auth_bad_key(self):
         """
         Test that we reject auth requests if the stored key is bad
@@ -16,7 +16,7 @@ limitations under the License.
 import unittest
 from unittest.mock import Mock
 
-from magma.subscriberdb.protocols.diameter import message, server
+from magma.subscriberdb.protocols.diameter import avp, message, server
 
 from .common import MockTransport
 
@@ -87,6 +87,24 @@ class ServerTests(unittest.TestCase):
         msg.encode(req_buf, 0)
         self._check_handler(req_buf, 0xfac3b00c)
 
+    def test_partial_message(self):
+        """Check that messages decoded before a partial one aren't handled
+        again when the rest of it is received"""
+        msg = message.Message()
+        msg.header.application_id = 0xfac3b00c
+        msg.header.request = True
+        msg.append_avp(avp.AVP('User-Name', 'hello'))
+        req_buf = bytearray(msg.length)
+        msg.encode(req_buf, 0)
+
+        # Past the header of the third message
+        self._server.data_received(bytes(req_buf * 2) + req_buf[:24])
+        self.assertEqual(self._server._handle_msg.call_count, 2)
+        self.assertEqual(len(self._server._readbuf), 24)
+        self._server.data_received(bytes(req_buf[24:]))
+        self.assertEqual(self._server._handle_msg.call_count, 3)
+        self.assertEqual(len(self._server._readbuf), 0)
+
     def test_too_short(self):
         """Check that if we didn't receive enough data
         we keep it in the buffer"""
@@ -13,6 +13,7 @@ limitations under the License.
 
 # pylint: disable=protected-access
 import tempfile
+import threading
 import unittest
 
 from lte.protos.subscriberdb_pb2 import SubscriberData
@@ -33,8 +34,9 @@ class StoreTests(unittest.TestCase):
     def setUp(self):
         cache_size = 3
         self._tmpfile = tempfile.TemporaryDirectory()
-        sqlite = SqliteStore(self._tmpfile.name + '/')
-        self._store = CachedStore(sqlite, cache_size)
+        self._sqlite = SqliteStore(self._tmpfile.name + '/')
+        # A single shard keeps the LRU order of all the subscribers
+        self._store = CachedStore(self._sqlite, cache_size, num_shards=1)
 
     def tearDown(self):
         self._tmpfile.cleanup()
@@ -65,6 +67,44 @@ class StoreTests(unittest.TestCase):
         self.assertEqual(self._store.list_subscribers(), [])
         self.assertEqual(self._store._cache_list(), [])
 
+    def test_sharded_cache(self):
+        """
+        Test if the cache capacity is split over the shards, and concurrent
+        edits of the subscribers are all applied
+        """
+        store = CachedStore(self._sqlite, 8, num_shards=4)
+        sids = ['IMSI%05d' % i for i in range(40)]
+        for sid in sids:
+            store.add_subscriber(SubscriberData(sid=SIDUtils.to_pb(sid)))
+        for shard in store._shards:
+            self.assertLessEqual(len(shard.cache), 2)
+
+        def bump_seqs(sid_list):
+            for _ in range(10):
+                for sid in sid_list:
+                    with store.edit_subscriber(sid) as subs:
+                        subs.state.lte_auth_next_seq += 1
+                    store.get_subscriber_data(sid)
+
+        threads = [
+            threading.Thread(target=bump_seqs, args=(sids[i % 2::2],))
+            for i in range(4)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        for sid in sids:
+            self.assertEqual(
+                store.get_subscriber_data(sid).state.lte_auth_next_seq,
+                20,
+            )
+            self.assertEqual(
+                self._sqlite.get_subscriber_data(sid).state.lte_auth_next_seq,
+                20,
+            )
+
     def test_subscriber_deletion(self):
         """
         Test if subscriber deletion works as expected
@@ -138,6 +178,37 @@ class StoreTests(unittest.TestCase):
             with self._store.edit_subscriber('IMSI3000') as subs:
                 pass
 
+    def test_edit_with_concurrent_eviction(self):
+        """
+        Test if an edit racing with the eviction of another subscriber of
+        the shard leaves no stale data of the edited subscriber cached
+        """
+        (sid1, _) = self._add_subscriber('IMSI11111')
+        (sid2, _) = self._add_subscriber('IMSI22222')
+        self.assertEqual(self._store._cache_list(), [sid1, sid2])
+
+        in_edit = threading.Event()
+        evicted = threading.Event()
+
+        def edit():
+            with self._store.edit_subscriber(sid1) as subs:
+                subs.state.lte_auth_next_seq = 7
+                in_edit.set()
+                evicted.wait(5)
+
+        edit_thread = threading.Thread(target=edit)
+        edit_thread.start()
+        self.assertTrue(in_edit.wait(5))
+        # Resyncs and upserts drop the subscribers they changed this way
+        self._store._get_shard(sid2).pop(sid2)
+        evicted.set()
+        edit_thread.join()
+
+        self.assertNotIn(sid1, self._store._cache_list())
+        self.assertEqual(
+            self._store.get_subscriber_data(sid1).state.lte_auth_next_seq, 7,
+        )
+
     def test_resync(self):
         """
         Test if resync works as expected
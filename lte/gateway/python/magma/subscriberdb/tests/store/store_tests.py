@@ -13,8 +13,13 @@ limitations under the License.
 
 import tempfile
 import unittest
+from concurrent.futures import ThreadPoolExecutor
 
-from lte.protos.subscriberdb_pb2 import SubscriberData
+from lte.protos.subscriberdb_pb2 import (
+    LTESubscription,
+    SubscriberData,
+    SubscriberState,
+)
 from magma.subscriberdb.sid import SIDUtils
 from magma.subscriberdb.store.base import (
     DuplicateSubscriberError,
@@ -34,6 +39,7 @@ class StoreTests(unittest.TestCase):
         self._store = SqliteStore(self._tmpfile.name + '/')
 
     def tearDown(self):
+        self._store.close()
         self._tmpfile.cleanup()
 
     def _add_subscriber(self, sid):
@@ -129,6 +135,78 @@ class StoreTests(unittest.TestCase):
         self._store.update_digest("digest_banana")
         self.assertEqual(self._store.get_current_digest(), "digest_banana")
 
+    def test_resync_diff(self):
+        """
+        Test if resync and upsert_subscribers only write the changed
+        subscribers and keep their state
+        """
+        subs = [
+            SubscriberData(sid=SIDUtils.to_pb('IMSI%05d' % i))
+            for i in range(3)
+        ]
+        diff = self._store.resync(subs)
+        self.assertEqual(diff.added, ['IMSI00000', 'IMSI00001', 'IMSI00002'])
+        self.assertEqual((diff.updated, diff.deleted), ([], []))
+
+        with self._store.edit_subscriber('IMSI00001') as sub:
+            sub.state.lte_auth_next_seq = 10
+
+        subs = [
+            SubscriberData(sid=SIDUtils.to_pb('IMSI%05d' % i))
+            for i in range(2)
+        ]
+        subs[1].lte.auth_key = b'1234'
+        diff = self._store.resync(subs)
+        self.assertEqual(
+            diff, ([], ['IMSI00001'], ['IMSI00002']),
+        )
+        self.assertEqual(
+            self._store.get_subscriber_data('IMSI00001'),
+            SubscriberData(
+                sid=SIDUtils.to_pb('IMSI00001'),
+                lte=LTESubscription(auth_key=b'1234'),
+                state=SubscriberState(lte_auth_next_seq=10),
+            ),
+        )
+
+        # A local edit makes the next resync rewrite the subscriber
+        with self._store.edit_subscriber('IMSI00000') as sub:
+            sub.lte.auth_key = b'5678'
+        self.assertEqual(self._store.resync(subs), ([], ['IMSI00000'], []))
+        self.assertEqual(
+            self._store.get_subscriber_data('IMSI00000').lte.auth_key, b'',
+        )
+
+        diff = self._store.upsert_subscribers(
+            [SubscriberData(sid=SIDUtils.to_pb('IMSI00003'))],
+            ['IMSI00001', 'IMSI00004'],
+        )
+        self.assertEqual(diff, (['IMSI00003'], [], ['IMSI00001']))
+        self.assertEqual(
+            self._store.list_subscribers(), ['IMSI00000', 'IMSI00003'],
+        )
+
+    def test_concurrent_access(self):
+        """
+        Test that lookups from several threads share the pooled connections
+        and see the writes made in between
+        """
+        sids = ['IMSI%05d' % i for i in range(200)]
+        with ThreadPoolExecutor(max_workers=8) as executor:
+            list(executor.map(self._add_subscriber, sids))
+            for sub in executor.map(self._store.get_subscriber_data, sids):
+                self.assertEqual(sub.lte.auth_key, b'')
+
+            def _edit(sid):
+                with self._store.edit_subscriber(sid) as subs:
+                    subs.lte.auth_key = sid.encode()
+            list(executor.map(_edit, sids))
+            for sid, sub in zip(
+                sids, executor.map(self._store.get_subscriber_data, sids),
+            ):
+                self.assertEqual(sub.lte.auth_key, sid.encode())
+        self.assertEqual(sorted(self._store.list_subscribers()), sids)
+
 
 if __name__ == "__main__":
     unittest.main()
@@ -19,9 +19,20 @@ import unittest
 import unittest.mock
 
 from lte.protos.s6a_service_pb2 import DeleteSubscriberRequest
+from lte.protos.subscriberdb_pb2 import LTESubscription, SubscriberData
 from magma.common.service_registry import ServiceRegistry
+from magma.subscriberdb.sid import SIDUtils
 from magma.subscriberdb.store.sqlite import SqliteStore
 from magma.subscriberdb.streamer_callback import SubscriberDBStreamerCallback
+from orc8r.protos.streamer_pb2 import DataUpdate
+
+
+def _sub_update(sid, state):
+    sub = SubscriberData(
+        sid=SIDUtils.to_pb(sid),
+        lte=LTESubscription(state=state),
+    )
+    return DataUpdate(key=sid, value=sub.SerializeToString())
 
 
 class MockFuture(object):
@@ -51,6 +62,7 @@ class SubscriberDBStreamerCallbackTests(unittest.TestCase):
         # Create sqlite3 database for testing
         self._tmpfile = tempfile.TemporaryDirectory()
         store = SqliteStore(self._tmpfile.name + '/')
+        self._store = store
         self._streamer_callback = \
             SubscriberDBStreamerCallback(store, loop=asyncio.new_event_loop())
         ServiceRegistry.add_service('test', '0.0.0.0', 0)
@@ -83,27 +95,55 @@ class SubscriberDBStreamerCallbackTests(unittest.TestCase):
         s6a_service_mock_stub.side_effect = [mock]
 
         # Call with no samples
-        old_sub_ids = ["IMSI202", "IMSI101"]
-        new_sub_ids = ["IMSI101", "IMSI202"]
-        self._streamer_callback.detach_deleted_subscribers(
-            old_sub_ids,
-            new_sub_ids,
-        )
+        self._streamer_callback.detach_deleted_subscribers([])
         s6a_service_mock_stub.DeleteSubscriber.future.assert_not_called()
         self._streamer_callback._loop.stop()
 
-        # Call with one subscriber id deleted
-        old_sub_ids = ["IMSI202", "IMSI101", "IMSI303"]
-        new_sub_ids = ["IMSI202"]
+        # Call with two subscriber ids deleted
         self._streamer_callback.detach_deleted_subscribers(
-            old_sub_ids,
-            new_sub_ids,
+            ["IMSI101", "IMSI303"],
         )
 
         mock.DeleteSubscriber.future.assert_called_once_with(
             DeleteSubscriberRequest(imsi_list=["101", "303"]),
         )
 
+    def test_process_update(self):
+        """
+        Test if resyncs and incremental updates only detach the subscribers
+        deleted or deactivated by the update
+        """
+        active = LTESubscription.ACTIVE
+        inactive = LTESubscription.INACTIVE
+        with unittest.mock.patch.object(
+            self._streamer_callback, 'detach_deleted_subscribers',
+        ) as detach:
+            self._streamer_callback.process_update(
+                'subscriberdb', [
+                    _sub_update('IMSI101', active),
+                    _sub_update('IMSI202', active),
+                ], True,
+            )
+            detach.assert_called_once_with([])
+            detach.reset_mock()
+
+            self._streamer_callback.process_update(
+                'subscriberdb', [_sub_update('IMSI101', inactive)], True,
+            )
+            detach.assert_called_once_with(['IMSI202', 'IMSI101'])
+            self.assertEqual(self._store.list_subscribers(), ['IMSI101'])
+            detach.reset_mock()
+
+            # An update without a value deletes the subscriber
+            self._streamer_callback.process_update(
+                'subscriberdb', [
+                    _sub_update('IMSI303', active),
+                    DataUpdate(key='101'),
+                ], False,
+            )
+            detach.assert_called_once_with(['IMSI101'])
+            self.assertEqual(self._store.list_subscribers(), ['IMSI303'])
+
 
 if __name__ == "__main__":
     unittest.main()
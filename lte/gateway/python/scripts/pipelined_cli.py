@@ -49,6 +49,7 @@ from magma.configuration.service_configs import load_service_config
 from magma.pipelined.app.enforcement import EnforcementController
 from magma.pipelined.app.enforcement_stats import EnforcementStatsController
 from magma.pipelined.bridge_util import BridgeTools
+from magma.pipelined.ovs_client import OvsClientError, format_flow
 from magma.pipelined.policy_converters import convert_ipv4_str_to_ip_proto
 from magma.pipelined.qos.common import QosManager
 from magma.pipelined.service_manager import Tables
@@ -545,15 +546,12 @@ def get_table_assignment(client, args):
 def display_raw_flows(_unused, args):
     pipelined_config = load_service_config('pipelined')
     bridge_name = pipelined_config['bridge_name']
+    table_num = int(args.table_num) if args.table_num else None
     try:
-        flows = BridgeTools.get_flows_for_bridge(bridge_name, args.table_num)
-    except subprocess.CalledProcessError as e:
-        if e.returncode == errno.EPERM:
-            print("Need to run as root to dump flows")
-        return
-
-    for flow in flows:
-        print(flow)
+        for flow in BridgeTools.iter_flows(bridge_name, table_num):
+            print(format_flow(flow))
+    except OvsClientError as e:
+        print("Failed to dump flows, may need to run as root: %s" % e)
 
 
 def _display_flows(client, apps=None):
@@ -11,7 +11,18 @@ See the License for the specific language governing permissions and
 limitations under the License.
 """
 from copy import deepcopy
-from typing import Any, Iterator, List, MutableMapping, Optional, TypeVar
+from typing import (
+    Any,
+    Dict,
+    Iterable,
+    Iterator,
+    List,
+    Mapping,
+    MutableMapping,
+    Optional,
+    Tuple,
+    TypeVar,
+)
 
 import redis
 import redis_collections
@@ -27,6 +38,67 @@ from redis.lock import Lock
 
 T = TypeVar('T')
 
+# Number of keys fetched per SCAN/MGET round trip by the bulk operations
+BULK_BATCH_SIZE = 500
+
+# Sets KEYS[1] to the RedisState serialized in ARGV[1], with its version set
+# to one more than the version currently stored under KEYS[1]. ARGV[1] must
+# be serialized with version 0, which proto3 omits from the wire format, so
+# the new version field can be appended to it. Returns the new version.
+_VERSIONED_SET_SCRIPT = """
+local function read_varint(s, pos)
+    local result, mult = 0, 1
+    while true do
+        local b = string.byte(s, pos)
+        if b == nil then
+            error('truncated RedisState varint')
+        end
+        pos = pos + 1
+        result = result + (b % 128) * mult
+        if b < 128 then
+            return result, pos
+        end
+        mult = mult * 128
+    end
+end
+
+local version = 0
+local old = redis.call('GET', KEYS[1])
+if old then
+    local pos, len = 1, string.len(old)
+    while pos <= len do
+        local tag, value
+        tag, pos = read_varint(old, pos)
+        local field, wire_type = math.floor(tag / 8), tag % 8
+        if wire_type == 0 then
+            value, pos = read_varint(old, pos)
+            if field == 2 then
+                version = value
+            end
+        elseif wire_type == 2 then
+            value, pos = read_varint(old, pos)
+            pos = pos + value
+        elseif wire_type == 1 then
+            pos = pos + 8
+        elseif wire_type == 5 then
+            pos = pos + 4
+        else
+            return redis.error_reply('unsupported RedisState wire type')
+        end
+    end
+end
+
+version = version + 1
+local v, encoded = version, {}
+while v >= 128 do
+    table.insert(encoded, string.char(v % 128 + 128))
+    v = math.floor(v / 128)
+end
+table.insert(encoded, string.char(v))
+redis.call('SET', KEYS[1], ARGV[1] .. '\\16' .. table.concat(encoded))
+return version
+"""
+
 
 class RedisList(redis_collections.List):
     """
@@ -173,6 +245,28 @@ class RedisHashDict(redis_collections.DefaultDict):
         if self.writeback:
             self.cache[key] = value
 
+    def pop_many(self, keys: List[Any]) -> List[Any]:
+        """Remove *keys* from the map with one HMGET and one HDEL round
+        trip, returning their values. The value of a missing key is None
+        """
+        if not keys:
+            return []
+        pickled_keys = [self._pickle_key(key) for key in keys]
+        pipe = self.redis.pipeline()
+        pipe.hmget(self.key, pickled_keys)
+        pipe.hdel(self.key, *pickled_keys)
+        pickled_values, _ = pipe.execute()
+
+        values = []
+        for key, pickled_value in zip(keys, pickled_values):
+            if self.writeback and key in self.cache:
+                values.append(self.cache.pop(key))
+            elif pickled_value is None:
+                values.append(None)
+            else:
+                values.append(self._unpickle(pickled_value))
+        return values
+
     def __copy__(self):
         return {key: self[key] for key in self}
 
@@ -219,6 +313,7 @@ class RedisFlatDict(MutableMapping[str, T]):
         self.serde = serde
         self.redis_type = serde.redis_type
         self.cache = {}
+        self._versioned_set = client.register_script(_VERSIONED_SET_SCRIPT)
         if self._writethrough:
             self._sync_cache()
 
@@ -231,27 +326,13 @@ class RedisFlatDict(MutableMapping[str, T]):
 
     def __iter__(self) -> Iterator[str]:
         """Return an iterator over the keys of the dictionary."""
-        type_pattern = self._get_redis_type_pattern()
-
         if self._writethrough:
             for k in self.cache:
                 split_key, _ = k.split(":", 1)
                 yield split_key
         else:
-            for k in self.redis.keys(pattern=type_pattern):
-                try:
-                    deserialized_key = k.decode('utf-8')
-                    split_key = deserialized_key.split(":", 1)
-                except AttributeError:
-                    split_key = k.split(":", 1)
-                # There could be a delete key in between KEYS and GET, so ignore
-                # invalid values for now
-                try:
-                    if self.is_garbage(split_key[0]):
-                        continue
-                except KeyError:
-                    continue
-                yield split_key[0]
+            for key, _ in self._scan_states(include_garbage=False):
+                yield key
 
     def __contains__(self, key: str) -> bool:
         """Return ``True`` if *key* is present and not garbage,
@@ -294,12 +375,16 @@ class RedisFlatDict(MutableMapping[str, T]):
         """Set ``d[key:type]`` to *value*."""
         if ':' in key:
             raise ValueError("Key %s cannot contain ':' char" % key)
-        version = self.get_version(key)
-        serialized_value = self.serde.serialize(value, version + 1)
         composite_key = self._make_composite_key(key)
+        # The version bump happens server side, so the value is serialized
+        # without one
+        serialized_value = self.serde.serialize(value, 0)
         if self._writethrough:
             self.cache[composite_key] = value
-        return self.redis.set(composite_key, serialized_value)
+        return self._versioned_set(
+            keys=[composite_key],
+            args=[serialized_value],
+        )
 
     def __delitem__(self, key: str) -> int:
         """Remove ``d[key:type]`` from dictionary.
@@ -315,6 +400,27 @@ class RedisFlatDict(MutableMapping[str, T]):
             raise KeyError(composite_key)
         return deleted_count
 
+    def delete_many(self, keys: Iterable[str]) -> int:
+        """Remove ``d[key:type]`` for all of *keys* with DELs of at most
+        BULK_BATCH_SIZE keys. Missing keys are ignored. Returns the number
+        of keys deleted
+        """
+        composite_keys = []
+        for key in keys:
+            if ':' in key:
+                raise ValueError("Key %s cannot contain ':' char" % key)
+            composite_key = self._make_composite_key(key)
+            if self._writethrough:
+                self.cache.pop(composite_key, None)
+            composite_keys.append(composite_key)
+
+        deleted_count = 0
+        for i in range(0, len(composite_keys), BULK_BATCH_SIZE):
+            deleted_count += self.redis.delete(
+                *composite_keys[i:i + BULK_BATCH_SIZE]
+            )
+        return deleted_count
+
     def get(self, key: str, default=None) -> Optional[T]:
         """Get ``d[key:type]`` from dictionary.
         Returns None if *key:type* is not in the map
@@ -324,6 +430,75 @@ class RedisFlatDict(MutableMapping[str, T]):
         except (KeyError, ValueError):
             return default
 
+    def get_many(self, keys: Iterable[str]) -> Dict[str, T]:
+        """Get the values of all the given keys with MGET round trips of
+        at most BULK_BATCH_SIZE keys. Keys that are not in the map or are
+        garbage are left out of the returned dict
+        """
+        values = {}
+        missing = []
+        for key in keys:
+            if ':' in key:
+                raise ValueError("Key %s cannot contain ':' char" % key)
+            if self._writethrough:
+                cached_value = self.cache.get(self._make_composite_key(key))
+                if cached_value is not None:
+                    values[key] = cached_value
+                    continue
+            missing.append(key)
+
+        for i in range(0, len(missing), BULK_BATCH_SIZE):
+            batch = missing[i:i + BULK_BATCH_SIZE]
+            serialized_values = self.redis.mget(
+                [self._make_composite_key(key) for key in batch],
+            )
+            for key, serialized_value in zip(batch, serialized_values):
+                if serialized_value is None or \
+                        _parse_redis_state(serialized_value).is_garbage:
+                    continue
+                values[key] = self.serde.deserialize(serialized_value)
+        return values
+
+    def set_many(self, values: Mapping[str, T]) -> Dict[str, int]:
+        """Set ``d[key:type]`` for every item of *values*, bumping each
+        version server side. All the writes are sent in one pipeline, which
+        isn't transactional, so a failure can leave some of them applied.
+        Returns the new version of every key
+        """
+        for key in values:
+            if ':' in key:
+                raise ValueError("Key %s cannot contain ':' char" % key)
+        if not values:
+            return {}
+
+        pipe = self.redis.pipeline(transaction=False)
+        for key, value in values.items():
+            composite_key = self._make_composite_key(key)
+            self._versioned_set(
+                keys=[composite_key],
+                args=[self.serde.serialize(value, 0)],
+                client=pipe,
+            )
+            if self._writethrough:
+                self.cache[composite_key] = value
+        return dict(zip(values.keys(), pipe.execute()))
+
+    def items(self) -> List[Tuple[str, T]]:
+        """Return a copy of the dictionary's list of (key, value) pairs,
+        fetched with SCAN and MGET rather than a GET per key
+        """
+        if self._writethrough:
+            return [
+                (k.split(":", 1)[0], value) for k, value in self.cache.items()
+            ]
+
+        return [
+            (key, self.serde.deserialize(serialized_value))
+            for key, serialized_value in self._scan_states(
+                include_garbage=False,
+            )
+        ]
+
     def clear(self) -> None:
         """
         Clear all keys in the dictionary. Objects are immediately deleted
@@ -331,9 +506,9 @@ class RedisFlatDict(MutableMapping[str, T]):
         """
         if self._writethrough:
             self.cache.clear()
-        for key in self.keys():
-            composite_key = self._make_composite_key(key)
-            self.redis.delete(composite_key)
+        keys = [self._make_composite_key(key) for key in self.keys()]
+        for i in range(0, len(keys), BULK_BATCH_SIZE):
+            self.redis.delete(*keys[i:i + BULK_BATCH_SIZE])
 
     def get_version(self, key: str) -> int:
         """Return the version of the value for key *key:type*. Returns 0 if
@@ -389,23 +564,10 @@ class RedisFlatDict(MutableMapping[str, T]):
         """Return a copy of the dictionary's list of keys that are garbage
         Note: for redis *key:type* key is returned
         """
-        garbage_keys = []
-        type_pattern = self._get_redis_type_pattern()
-        for k in self.redis.keys(pattern=type_pattern):
-            try:
-                deserialized_key = k.decode('utf-8')
-                split_key = deserialized_key.split(":", 1)
-            except AttributeError:
-                split_key = k.split(":", 1)
-            # There could be a delete key in between KEYS and GET, so ignore
-            # invalid values for now
-            try:
-                if not self.is_garbage(split_key[0]):
-                    continue
-            except KeyError:
-                continue
-            garbage_keys.append(split_key[0])
-        return garbage_keys
+        return [
+            key for key, serialized_value in self._scan_states()
+            if _parse_redis_state(serialized_value).is_garbage
+        ]
 
     def delete_garbage(self, key) -> bool:
         """Remove ``d[key:type]`` from dictionary iff the object is garbage
@@ -430,15 +592,55 @@ class RedisFlatDict(MutableMapping[str, T]):
         """
         Syncs write-through cache with redis data on store.
         """
-        type_pattern = self._get_redis_type_pattern()
-        for k in self.redis.keys(pattern=type_pattern):
-            composite_key = k.decode('utf-8')
-            serialized_value = self.redis.get(composite_key)
-            value = self.serde.deserialize(serialized_value)
-            self.cache[composite_key] = value
+        for key, serialized_value in self._scan_states():
+            composite_key = self._make_composite_key(key)
+            self.cache[composite_key] = self.serde.deserialize(serialized_value)
+
+    def _scan_states(
+        self, include_garbage: bool = True,
+    ) -> Iterator[Tuple[str, bytes]]:
+        """
+        Yields (key, serialized value) for every key of the dictionary's
+        type, walking the keyspace with a SCAN cursor and fetching the values
+        with one MGET per batch of keys.
+        """
+        batch = []
+        for k in self.redis.scan_iter(
+            match=self._get_redis_type_pattern(), count=BULK_BATCH_SIZE,
+        ):
+            batch.append(k)
+            if len(batch) >= BULK_BATCH_SIZE:
+                yield from self._get_batch_states(batch, include_garbage)
+                batch = []
+        if batch:
+            yield from self._get_batch_states(batch, include_garbage)
+
+    def _get_batch_states(
+        self, composite_keys: List[Any], include_garbage: bool,
+    ) -> Iterator[Tuple[str, bytes]]:
+        serialized_values = self.redis.mget(composite_keys)
+        for k, serialized_value in zip(composite_keys, serialized_values):
+            # There could be a delete in between SCAN and MGET, so ignore
+            # missing values
+            if serialized_value is None:
+                continue
+            if not include_garbage and \
+                    _parse_redis_state(serialized_value).is_garbage:
+                continue
+            try:
+                k = k.decode('utf-8')
+            except AttributeError:
+                pass
+            yield k.split(":", 1)[0], serialized_value
 
     def _get_redis_type_pattern(self):
         return "*:" + self.redis_type
 
     def _make_composite_key(self, key):
         return key + ":" + self.redis_type
+
+
+def _parse_redis_state(serialized_value: bytes) -> RedisState:
+    proto_wrapper = RedisState()
+    proto_wrapper.ParseFromString(serialized_value)
+    return proto_wrapper
@@ -10,12 +10,14 @@ WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
 See the License for the specific language governing permissions and
 limitations under the License.
 """
-from unittest import TestCase, main
+from unittest import TestCase, main, mock
 
 import fakeredis
 from magma.common.redis.containers import RedisFlatDict, RedisHashDict
 from magma.common.redis.serializers import (
     RedisSerde,
+    get_json_deserializer,
+    get_json_serializer,
     get_proto_deserializer,
     get_proto_serializer,
 )
@@ -174,6 +176,66 @@ class RedisDictTests(TestCase):
         with self.assertRaises(KeyError):
             self._flat_dict.mark_as_garbage(bad_key)
 
+    def test_flat_version_overflow(self):
+        # Versions past 127 take more than one varint byte server side
+        for i in range(300):
+            self._flat_dict['key1'] = LogVerbosity(verbosity=i)
+        self.assertEqual(300, self._flat_dict.get_version('key1'))
+        self.assertEqual(
+            LogVerbosity(verbosity=299),
+            self._flat_dict['key1'],
+        )
+
+    def test_flat_bulk_methods(self):
+        values = {
+            'key%d' % i: LogVerbosity(verbosity=i) for i in range(1200)
+        }
+        versions = self._flat_dict.set_many(values)
+        self.assertEqual({key: 1 for key in values}, versions)
+        self._flat_dict['key0'] = LogVerbosity(verbosity=100)
+        self._flat_dict.mark_as_garbage('key1')
+
+        expected = dict(values)
+        expected['key0'] = LogVerbosity(verbosity=100)
+        del expected['key1']
+        self.assertEqual(expected, dict(self._flat_dict.items()))
+        self.assertEqual(set(expected), set(self._flat_dict.keys()))
+        self.assertEqual(['key1'], self._flat_dict.garbage_keys())
+
+        actual = self._flat_dict.get_many(['key0', 'key1', 'key2', 'bad'])
+        self.assertEqual(
+            {'key0': expected['key0'], 'key2': expected['key2']},
+            actual,
+        )
+
+        versions = self._flat_dict.set_many({
+            'key0': LogVerbosity(verbosity=5),
+            'key1': LogVerbosity(verbosity=6),
+        })
+        self.assertEqual({'key0': 3, 'key1': 2}, versions)
+        self.assertFalse(self._flat_dict.is_garbage('key1'))
+        self.assertRaises(
+            ValueError, self._flat_dict.set_many,
+            {'bad:key': LogVerbosity(verbosity=2)},
+        )
+
+    def test_flat_writethrough_get_many(self):
+        serde = RedisSerde(
+            'json', get_json_serializer(), get_json_deserializer(),
+        )
+        flat_dict = RedisFlatDict(
+            fakeredis.FakeStrictRedis(), serde, writethrough=True,
+        )
+        flat_dict.set_many({'empty': '', 'zero': 0, 'one': 1})
+
+        # Falsy values are served from the cache too
+        with mock.patch.object(flat_dict.redis, 'mget') as mget:
+            self.assertEqual(
+                {'empty': '', 'zero': 0, 'one': 1},
+                flat_dict.get_many(['empty', 'zero', 'one']),
+            )
+            mget.assert_not_called()
+
 
 if __name__ == "__main__":
     main()
@@ -13,6 +13,7 @@ limitations under the License.
 
 import importlib
 import logging
+from typing import Iterator, Tuple
 
 from magma.common.redis.client import get_default_client
 from magma.common.redis.containers import RedisFlatDict
@@ -23,6 +24,7 @@ from magma.common.redis.serializers import (
     get_proto_deserializer,
     get_proto_serializer,
 )
+from orc8r.protos.redis_pb2 import RedisState
 
 PROTO_FORMAT = 0
 JSON_FORMAT = 1
@@ -40,6 +42,19 @@ class StateDict(RedisFlatDict):
         self.state_scope = state_scope
         self.state_format = state_format
 
+    def versioned_states(self) -> Iterator[Tuple[str, int, bytes]]:
+        """
+        Yields (key, version, serialized value) for every state that isn't
+        garbage. Only the RedisState wrapper is parsed, so callers can skip
+        deserializing the states whose version they've already seen.
+        """
+        for key, serialized_value in self._scan_states():
+            proto_wrapper = RedisState()
+            proto_wrapper.ParseFromString(serialized_value)
+            if proto_wrapper.is_garbage:
+                continue
+            yield key, proto_wrapper.version, serialized_value
+
 
 def get_proto_redis_dicts(config):
     redis_dicts = []
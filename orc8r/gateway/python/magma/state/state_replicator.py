@@ -12,8 +12,10 @@ limitations under the License.
 """
 # pylint: disable=broad-except
 
+import asyncio
 import json
 import logging
+from typing import List
 
 import grpc
 import jsonpickle
@@ -40,6 +42,9 @@ from orc8r.protos.state_pb2 import (
 # TODO: Make DEFAULT_SYNC_INTERVAL an mconfig parameter
 DEFAULT_SYNC_INTERVAL = 60
 DEFAULT_GRPC_TIMEOUT = 10
+# Keep reports well under gRPC's default 4MB message limit
+DEFAULT_MAX_REPORT_SIZE_BYTES = 1024 * 1024
+DEFAULT_MAX_CONCURRENT_REPORTS = 4
 GARBAGE_COLLECTION_ITERATION_INTERVAL = 2
 
 
@@ -60,6 +65,14 @@ class StateReplicator(SDWatchdogTask):
         )
         super().__init__(sync_interval, service.loop)
         self._service = service
+        # Upper bound on the serialized size of a single ReportStates request
+        self._max_report_size = service.config.get(
+            'max_report_size_bytes', DEFAULT_MAX_REPORT_SIZE_BYTES,
+        )
+        # Number of ReportStates requests that can be in flight at once
+        self._max_concurrent_reports = service.config.get(
+            'max_concurrent_reports', DEFAULT_MAX_CONCURRENT_REPORTS,
+        )
         # Garbage collector to propagate deletions back to Orchestrator
         self._garbage_collector = garbage_collector
         # In memory mapping of states to version
@@ -95,7 +108,7 @@ class StateReplicator(SDWatchdogTask):
                 return
         request = await self._collect_states_to_replicate()
         if request is not None:
-            await self._send_to_state_service(request)
+            await self._report_states(request)
         await self._cleanup_deleted_keys()
 
         self._replication_iteration += 1
@@ -108,8 +121,7 @@ class StateReplicator(SDWatchdogTask):
     async def _resync(self):
         states_to_sync = []
         for redis_dict in self._redis_dicts:
-            for key in redis_dict:
-                version = redis_dict.get_version(key)
+            for key, version, _ in redis_dict.versioned_states():
                 device_id = make_scoped_device_id(key, redis_dict.state_scope)
                 state_id = StateID(
                     type=redis_dict.redis_type,
@@ -148,27 +160,24 @@ class StateReplicator(SDWatchdogTask):
     async def _collect_states_to_replicate(self):
         states_to_report = []
         for redis_dict in self._redis_dicts:
-            for key in redis_dict:
-                redis_state = redis_dict.get(key)
+            # Versions are read from the RedisState wrappers, so only states
+            # that changed since they were last reported get deserialized
+            # and converted to JSON
+            for key, redis_version, serialized_value in \
+                    redis_dict.versioned_states():
                 device_id = make_scoped_device_id(key, redis_dict.state_scope)
-
                 in_mem_key = make_mem_key(device_id, redis_dict.redis_type)
-                if redis_state is None:
-                    logging.debug(
-                        "Content of key %s is empty, skipping", in_mem_key,
-                    )
-                    continue
-
-                redis_version = redis_dict.get_version(key)
                 self._state_keys_from_current_iteration.add(in_mem_key)
-                if in_mem_key in self._state_versions and \
-                        self._state_versions[in_mem_key] == redis_version:
+                if self._state_versions.get(in_mem_key) == redis_version:
                     logging.debug(
                         "key %s already read on this iteration, skipping", in_mem_key,
                     )
                     continue
 
                 try:
+                    redis_state = redis_dict.serde.deserialize(
+                        serialized_value,
+                    )
                     if redis_dict.state_format == PROTO_FORMAT:
                         state_to_serialize = MessageToDict(redis_state)
                         serialized_json_state = json.dumps(state_to_serialize)
@@ -202,6 +211,45 @@ class StateReplicator(SDWatchdogTask):
             return None
         return ReportStatesRequest(states=states_to_report)
 
+    async def _report_states(self, request: ReportStatesRequest):
+        """
+        Report the states of request in chunks of at most
+        max_report_size_bytes each, with up to max_concurrent_reports
+        chunks in flight at a time
+        """
+        semaphore = asyncio.Semaphore(self._max_concurrent_reports)
+
+        async def _send_chunk(chunk: ReportStatesRequest):
+            async with semaphore:
+                await self._send_to_state_service(chunk)
+
+        await asyncio.gather(
+            *(
+                _send_chunk(chunk) for chunk in
+                self._split_report(request)
+            )
+        )
+
+    def _split_report(
+        self, request: ReportStatesRequest,
+    ) -> List[ReportStatesRequest]:
+        chunks = []
+        states = []
+        chunk_size = 0
+        for state in request.states:
+            # A state larger than the limit still goes out, alone in its
+            # own chunk
+            state_size = state.ByteSize()
+            if states and chunk_size + state_size > self._max_report_size:
+                chunks.append(ReportStatesRequest(states=states))
+                states = []
+                chunk_size = 0
+            states.append(state)
+            chunk_size += state_size
+        if states:
+            chunks.append(ReportStatesRequest(states=states))
+        return chunks
+
     async def _send_to_state_service(self, request: ReportStatesRequest):
         state_client = self._grpc_client_manager.get_client()
         try:
@@ -476,3 +476,38 @@ class StateReplicatorTests(TestCase):
         # Cancel the replicator's loop so there are no other activities
         self.state_replicator._periodic_task.cancel()
         self.loop.run_until_complete(test())
+
+    @mock.patch('snowflake.snowflake', get_mock_snowflake)
+    @mock.patch('magma.magmad.state_reporter.ServiceRegistry.get_rpc_channel')
+    def test_chunked_report(self, get_grpc_mock):
+        async def test():
+            get_grpc_mock.return_value = self.channel
+            self.nid_client.clear()
+            self.idlist_client.clear()
+            self.log_client.clear()
+            self.foo_client.clear()
+
+            for i in range(10):
+                self.nid_client['id%d' % i] = NetworkID(id='foo%d' % i)
+            req = await self.state_replicator._collect_states_to_replicate()
+            self.assertEqual(10, len(req.states))
+
+            # Fit 3 states per chunk
+            state_size = req.states[0].ByteSize()
+            self.state_replicator._max_report_size = 3 * state_size
+            chunks = self.state_replicator._split_report(req)
+            self.assertEqual([3, 3, 3, 1], [len(c.states) for c in chunks])
+
+            await self.state_replicator._report_states(req)
+            self.assertEqual(10, len(self.state_replicator._state_versions))
+
+            # Only the updated state is serialized and reported again
+            self.nid_client['id3'] = NetworkID(id='bar')
+            req = await self.state_replicator._collect_states_to_replicate()
+            self.assertEqual(1, len(req.states))
+            self.assertEqual('id3', req.states[0].deviceID)
+            self.assertEqual(2, req.states[0].version)
+
+        # Cancel the replicator's loop so there are no other activities
+        self.state_replicator._periodic_task.cancel()
+        self.loop.run_until_complete(test())